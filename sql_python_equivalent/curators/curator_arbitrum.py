@@ -20,6 +20,13 @@
 # Signal sources:
 #   totalSignal     = Curation(vSignal) + GNS(vSignalCreated/Burnt)        [curation.ts + gns.ts]
 #   totalNameSignal = GNS(nSignalCreated/Burnt) only                       [gns.ts]
+#
+# The Curation half of every field (and signalCount / activeSignalCount)
+# is rolled up from signal_arbitrum, which must be built first; only the
+# GNS events are scanned here.  See pipeline/rollups.py.
+#
+# The GNS scan is checkpointed locally (pipeline/checkpoints.py); after a
+# failed upload, rerun with --resume to skip the query.
 
 # %%
 import sys
@@ -32,9 +39,17 @@ except NameError:
 project_root = os.path.abspath(os.path.join(script_dir, '..', '..'))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
+pipeline_root = os.path.abspath(os.path.join(script_dir, '..'))
+if pipeline_root not in sys.path:
+    sys.path.insert(0, pipeline_root)
 
 from nozzle.client import Client
 from nozzle.util import process_query, save_or_upload_parquet
+from pipeline.addresses import decode_columns, encode_columns
+from pipeline.checkpoints import CheckpointStore
+from pipeline.rollups import assert_consistent, name_signals_to_curators, signals_to_curators
+from pipeline.serving import serve
+from pipeline.tables import load_entity_table
 import pandas as pd
 import logging
 
@@ -43,6 +58,7 @@ logger = logging.getLogger(__name__)
 
 client_url = "grpc+tls://gateway.amp.staging.thegraph.com:443"
 client = Client(client_url)
+checkpoints = CheckpointStore.from_argv('curator_arbitrum')
 
 GNS_ADDRESS = "ec9A7fb6CbC2E41926127929c2dcE6e9c5D33Bec"
 CURATION_ADDRESS = "22d78fb4bc72e191C765807f8891B5e1785C8014"
@@ -51,214 +67,158 @@ logger.info("Starting curator arbitrum data processing...")
 
 # %%
 # ============================================================
-# Part 1: totalSignalledTokens, totalUnsignalledTokens, createdAt
+# Curation side: rolled up from the Signal table
 #
-# totalSignalledTokens comes from BOTH Curation and GNS events.
-# totalUnsignalledTokens comes from BOTH Curation and GNS events.
-# createdAt is the EARLIEST timestamp (set once on first creation).
+# signal_arbitrum already holds the per-(curator, deployment) Curation
+# state, so the curation totals, createdAt and signalCount /
+# activeSignalCount are derived from it instead of rescanning
+# Signalled/Burned.
 # ============================================================
-part_1 = f'''
-SELECT
-    combined.curator_id,
-    SUM(combined.signalled_tokens) / POWER(10, 18) AS total_signalled_tokens,
-    SUM(combined.unsignalled_tokens) / POWER(10, 18) AS total_unsignalled_tokens,
-    MIN(combined.timestamp) AS created_at
-FROM (
-    SELECT curator_id, (tokens - curation_tax) AS signalled_tokens, 0 AS unsignalled_tokens, timestamp
-    FROM "data_science/event_arbitrum_curation_signalled@0.0.2"."event_arbitrum_curation_signalled"
-    UNION ALL
-    SELECT curator_id, 0 AS signalled_tokens, tokens AS unsignalled_tokens, timestamp
-    FROM "data_science/event_arbitrum_curation_burned@0.0.2"."event_arbitrum_curation_burned"
-    UNION ALL
-    SELECT curator_id, tokens_deposited AS signalled_tokens, 0 AS unsignalled_tokens, timestamp
-    FROM "data_science/event_arbitrum_gns_signal_minted@0.0.2"."event_arbitrum_gns_signal_minted"
-    UNION ALL
-    SELECT curator_id, 0 AS signalled_tokens, tokens_received AS unsignalled_tokens, timestamp
-    FROM "data_science/event_arbitrum_gns_signal_burned@0.0.2"."event_arbitrum_gns_signal_burned"
-) AS combined
-GROUP BY combined.curator_id
-'''
-
-logger.info("Executing part 1 query...")
-part_1_res = process_query(client, part_1)
+signals = load_entity_table(
+    'signal_arbitrum',
+    ['curator_id', 'signalled_tokens', 'unsignalled_tokens', 'signal', 'created_at'],
+)
+encode_columns(signals, ['curator_id'])
+curation_res = signals_to_curators(signals)
 
 # %%
 # ============================================================
-# Part 2: totalNameSignalledTokens, totalNameUnsignalledTokens
+# GNS side: single scan over SignalMinted / SignalBurned / GRTWithdrawn
 #
-# These come ONLY from GNS events (SignalMinted, SignalBurned).
-# ============================================================
-part_2 = f'''
-SELECT
-    combined.curator_id,
-    SUM(combined.name_signalled_tokens) / POWER(10, 18) AS total_name_signalled_tokens,
-    SUM(combined.name_unsignalled_tokens) / POWER(10, 18) AS total_name_unsignalled_tokens
-FROM (
-    SELECT curator_id, tokens_deposited AS name_signalled_tokens, 0 AS name_unsignalled_tokens
-    FROM "data_science/event_arbitrum_gns_signal_minted@0.0.2"."event_arbitrum_gns_signal_minted"
-    UNION ALL
-    SELECT curator_id, 0 AS name_signalled_tokens, tokens_received AS name_unsignalled_tokens
-    FROM "data_science/event_arbitrum_gns_signal_burned@0.0.2"."event_arbitrum_gns_signal_burned"
-) AS combined
-GROUP BY combined.curator_id
-'''
-
-logger.info("Executing part 2 query...")
-part_2_res = process_query(client, part_2)
-
-# %%
-# ============================================================
-# Part 3: totalWithdrawnTokens, totalNameSignal
+# Each table is read exactly once.  Events are first reduced per
+# (curator, subgraph) -- the level nameSignalCount and
+# activeNameSignalCount need -- then rolled up per curator.
 #
-# totalWithdrawnTokens: from GRTWithdrawn events only (gns.ts).
-# totalNameSignal: CURRENT nSignal = SUM(nSignalCreated) - SUM(nSignalBurnt)
-#   from GNS SignalMinted/SignalBurned events.
+# totalNameSignalledTokens / totalNameUnsignalledTokens: GNS only.
+# totalWithdrawnTokens: GRTWithdrawn only (gns.ts).
+# gns_signal: CURRENT vSignal minted - burnt (added to totalSignal).
+# totalNameSignal: CURRENT nSignal = SUM(nSignalCreated) - SUM(nSignalBurnt).
+# activeNameSignalCount: net nSignal > 0; GRTWithdrawn does not change it.
 # ============================================================
-part_3 = f'''
-WITH
-name_signal_events AS (
-    SELECT curator_id, n_signal_created AS name_signal_delta
+query = f'''
+WITH events AS (
+    SELECT
+        curator_id, subgraph_id,
+        tokens_deposited AS name_signalled_tokens, 0 AS name_unsignalled_tokens, 0 AS withdrawn_tokens,
+        v_signal_created AS signal_delta, n_signal_created AS name_signal_delta,
+        1 AS signal_events, timestamp
     FROM "data_science/event_arbitrum_gns_signal_minted@0.0.2"."event_arbitrum_gns_signal_minted"
     UNION ALL
-    SELECT curator_id, -n_signal_burnt AS name_signal_delta
+    SELECT
+        curator_id, subgraph_id,
+        0 AS name_signalled_tokens, tokens_received AS name_unsignalled_tokens, 0 AS withdrawn_tokens,
+        -v_signal_burnt AS signal_delta, -n_signal_burnt AS name_signal_delta,
+        1 AS signal_events, timestamp
     FROM "data_science/event_arbitrum_gns_signal_burned@0.0.2"."event_arbitrum_gns_signal_burned"
+    UNION ALL
+    SELECT
+        curator_id, subgraph_id,
+        0 AS name_signalled_tokens, 0 AS name_unsignalled_tokens, withdrawn_grt AS withdrawn_tokens,
+        0 AS signal_delta, 0 AS name_signal_delta,
+        0 AS signal_events, NULL AS timestamp
+    FROM "data_science/event_arbitrum_gns_grt_withdrawn@0.0.2"."event_arbitrum_gns_grt_withdrawn"
 ),
-name_signal_totals AS (
-    SELECT curator_id, SUM(name_signal_delta) / POWER(10, 18) AS total_name_signal
-    FROM name_signal_events
-    GROUP BY 1
-),
-withdrawn_totals AS (
+pair_states AS (
     SELECT
         curator_id,
-        sum(withdrawn_grt) / POWER(10, 18) AS total_withdrawn_tokens
-    FROM "data_science/event_arbitrum_gns_grt_withdrawn@0.0.2"."event_arbitrum_gns_grt_withdrawn"
-    GROUP BY 1
+        subgraph_id,
+        SUM(name_signalled_tokens) AS name_signalled_tokens,
+        SUM(name_unsignalled_tokens) AS name_unsignalled_tokens,
+        SUM(withdrawn_tokens) AS withdrawn_tokens,
+        SUM(signal_delta) AS net_signal,
+        SUM(name_signal_delta) AS net_name_signal,
+        SUM(signal_events) AS signal_events,
+        MIN(timestamp) AS created_at
+    FROM events
+    GROUP BY 1, 2
 )
 
 SELECT
-    COALESCE(n.curator_id, w.curator_id) AS curator_id,
-    COALESCE(n.total_name_signal, 0) AS total_name_signal,
-    COALESCE(w.total_withdrawn_tokens, 0) AS total_withdrawn_tokens
-FROM name_signal_totals n
-FULL OUTER JOIN withdrawn_totals w ON n.curator_id = w.curator_id
+    curator_id,
+    MIN(created_at) AS gns_created_at,
+    SUM(name_signalled_tokens) / POWER(10, 18) AS total_name_signalled_tokens,
+    SUM(name_unsignalled_tokens) / POWER(10, 18) AS total_name_unsignalled_tokens,
+    SUM(net_name_signal) / POWER(10, 18) AS total_name_signal,
+    SUM(withdrawn_tokens) / POWER(10, 18) AS total_withdrawn_tokens,
+    SUM(net_signal) / POWER(10, 18) AS gns_signal,
+    COUNT(CASE WHEN signal_events > 0 THEN 1 END) AS name_signal_count,
+    COUNT(CASE WHEN net_name_signal > 0 THEN 1 END) AS active_name_signal_count
+FROM pair_states
+GROUP BY curator_id
 '''
 
-logger.info("Executing part 3 query...")
-part_3_res = process_query(client, part_3)
+logger.info("Executing GNS curator query...")
+gns_res = checkpoints.stage('gns', query, lambda: process_query(client, query))
+encode_columns(gns_res, ['curator_id'])
 
 # %%
 # ============================================================
-# Part 4: totalSignal (CURRENT summed vSignal)
+# Combine both sides
 #
-# vSignal comes from BOTH Curation (Signalled/Burned) and
-# GNS (SignalMinted/SignalBurned) events.
+# totalSignalledTokens   = Signal.signalledTokens + NameSignal tokensDeposited
+# totalUnsignalledTokens = Signal.unsignalledTokens + NameSignal tokensReceived
+# totalSignal            = Signal.signal + GNS vSignal
+# createdAt              = earliest of Signal.createdAt and first GNS event
 # ============================================================
-part_4 = f'''
-SELECT
-    combined.curator_id,
-    SUM(combined.signal_delta) / POWER(10, 18) AS total_signal
-FROM (
-    SELECT curator_id, signal AS signal_delta
-    FROM "data_science/event_arbitrum_curation_signalled@0.0.2"."event_arbitrum_curation_signalled"
-    UNION ALL
-    SELECT curator_id, -signal AS signal_delta
-    FROM "data_science/event_arbitrum_curation_burned@0.0.2"."event_arbitrum_curation_burned"
-    UNION ALL
-    SELECT curator_id, v_signal_created AS signal_delta
-    FROM "data_science/event_arbitrum_gns_signal_minted@0.0.2"."event_arbitrum_gns_signal_minted"
-    UNION ALL
-    SELECT curator_id, -v_signal_burnt AS signal_delta
-    FROM "data_science/event_arbitrum_gns_signal_burned@0.0.2"."event_arbitrum_gns_signal_burned"
-) AS combined
-GROUP BY combined.curator_id
-'''
+result = curation_res.merge(gns_res, on='curator_id', how='outer')
+
+numeric_cols = [c for c in result.columns if c not in ('curator_id', 'created_at', 'gns_created_at')]
+result[numeric_cols] = result[numeric_cols].fillna(0)
 
-logger.info("Executing part 4 query...")
-part_4_res = process_query(client, part_4)
+result['total_signalled_tokens'] = result['signalled_tokens'] + result['total_name_signalled_tokens']
+result['total_unsignalled_tokens'] = result['unsignalled_tokens'] + result['total_name_unsignalled_tokens']
+result['total_signal'] = result['signal'] + result['gns_signal']
+result['created_at'] = pd.concat(
+    [
+        pd.to_datetime(result['created_at'], utc=True),
+        pd.to_datetime(result['gns_created_at'], unit='s', utc=True),
+    ],
+    axis=1,
+).min(axis=1)
+
+result['signal_count'] = result['signal_count'].astype(int)
+result['active_signal_count'] = result['active_signal_count'].astype(int)
+result['name_signal_count'] = result['name_signal_count'].astype(int)
+result['active_name_signal_count'] = result['active_name_signal_count'].astype(int)
+result['combined_signal_count'] = result['signal_count'] + result['name_signal_count']
+result['active_combined_signal_count'] = result['active_signal_count'] + result['active_name_signal_count']
 
 # %%
 # ============================================================
-# Part 5: Signal counts
+# Consistency: the GNS scan must agree with the NameSignal table
 #
-# signalCount / activeSignalCount: per (curator, deployment) from
-#   Curation contract (Signalled/Burned).
-# nameSignalCount / activeNameSignalCount: per (curator, subgraph)
-#   from GNS contract (SignalMinted/SignalBurned).
-# combinedSignalCount = signalCount + nameSignalCount
-# activeCombinedSignalCount = activeSignalCount + activeNameSignalCount
+# name_signal_arbitrum is published earlier in the same run; allow a
+# small fraction of curators touched by blocks that landed in between.
 # ============================================================
-part_5 = f'''
-WITH curation_signal_states AS (
-    SELECT curator_id, subgraph_deployment_id, SUM(signal_delta) AS net_signal
-    FROM (
-        SELECT curator_id, subgraph_deployment_id, signal AS signal_delta
-        FROM "data_science/event_arbitrum_curation_signalled@0.0.2"."event_arbitrum_curation_signalled"
-        UNION ALL
-        SELECT curator_id, subgraph_deployment_id, -signal AS signal_delta
-        FROM "data_science/event_arbitrum_curation_burned@0.0.2"."event_arbitrum_curation_burned"
-    ) t
-    GROUP BY 1, 2
-),
-curation_counts AS (
-    SELECT
-        curator_id,
-        COUNT(*) AS signal_count,
-        COUNT(CASE WHEN net_signal > 0 THEN 1 END) AS active_signal_count
-    FROM curation_signal_states
-    GROUP BY 1
-),
-gns_signal_states AS (
-    SELECT curator_id, subgraph_id, SUM(name_signal_delta) AS net_name_signal
-    FROM (
-        SELECT curator_id, subgraph_id, n_signal_created AS name_signal_delta
-        FROM "data_science/event_arbitrum_gns_signal_minted@0.0.2"."event_arbitrum_gns_signal_minted"
-        UNION ALL
-        SELECT curator_id, subgraph_id, -n_signal_burnt AS name_signal_delta
-        FROM "data_science/event_arbitrum_gns_signal_burned@0.0.2"."event_arbitrum_gns_signal_burned"
-    ) t
-    GROUP BY 1, 2
-),
-gns_counts AS (
-    SELECT
-        curator_id,
-        COUNT(*) AS name_signal_count,
-        COUNT(CASE WHEN net_name_signal > 0 THEN 1 END) AS active_name_signal_count
-    FROM gns_signal_states
-    GROUP BY 1
+name_signals = load_entity_table(
+    'name_signal_arbitrum',
+    ['curator_id', 'signalled_tokens', 'unsignalled_tokens', 'withdrawn_tokens'],
+)
+encode_columns(name_signals, ['curator_id'])
+assert_consistent(
+    result,
+    name_signals_to_curators(name_signals),
+    key='curator_id',
+    columns={
+        'total_name_signalled_tokens': 'name_signalled_tokens',
+        'total_name_unsignalled_tokens': 'name_unsignalled_tokens',
+        'total_withdrawn_tokens': 'withdrawn_tokens',
+    },
+    label='Curator vs NameSignal',
+    max_mismatch_fraction=0.001,
 )
 
-SELECT
-    COALESCE(c.curator_id, g.curator_id) AS curator_id,
-    COALESCE(c.signal_count, 0) AS signal_count,
-    COALESCE(c.active_signal_count, 0) AS active_signal_count,
-    COALESCE(g.name_signal_count, 0) AS name_signal_count,
-    COALESCE(g.active_name_signal_count, 0) AS active_name_signal_count
-FROM curation_counts c
-FULL OUTER JOIN gns_counts g ON c.curator_id = g.curator_id
-'''
-
-logger.info("Executing part 5 query...")
-part_5_res = process_query(client, part_5)
-
-# %%
-# ============================================================
-# Merge all parts
-# ============================================================
-logger.info("Merging results...")
-result = part_1_res
-result = result.merge(part_2_res, on='curator_id', how='outer')
-result = result.merge(part_3_res, on='curator_id', how='outer')
-result = result.merge(part_4_res, on='curator_id', how='outer')
-result = result.merge(part_5_res, on='curator_id', how='outer')
-
-numeric_cols = [c for c in result.columns if c not in ('curator_id', 'created_at')]
-result[numeric_cols] = result[numeric_cols].fillna(0)
-
-result['combined_signal_count'] = result['signal_count'].astype(int) + result['name_signal_count'].astype(int)
-result['active_combined_signal_count'] = result['active_signal_count'].astype(int) + result['active_name_signal_count'].astype(int)
+decode_columns(result, ['curator_id'])
 
-result['created_at'] = pd.to_datetime(result['created_at'], unit='s', utc=True)
+result = result[[
+    'curator_id', 'created_at',
+    'total_signalled_tokens', 'total_unsignalled_tokens',
+    'total_name_signalled_tokens', 'total_name_unsignalled_tokens',
+    'total_withdrawn_tokens', 'total_signal', 'total_name_signal',
+    'signal_count', 'active_signal_count',
+    'name_signal_count', 'active_name_signal_count',
+    'combined_signal_count', 'active_combined_signal_count',
+]]
 
 # %%
 # ============================================================
@@ -278,5 +238,7 @@ save_or_upload_parquet(
     bucket_name='nozzle-data-science',
     project_id='graph-mainnet',
 )
+serve(result, 'curator_arbitrum')
+checkpoints.complete()
 
 logger.info("Curator arbitrum data processing completed successfully!")
@@ -6,15 +6,26 @@
 # NameSignal entity fields (schema.graphql lines 1373-1433):
 #   id (curatorAddress-subgraphID), curator, subgraph,
 #   signalledTokens, unsignalledTokens, withdrawnTokens,
-#   nameSignal, signal, lastNameSignalChange
+#   nameSignal, signal, lastNameSignalChange, realizedRewards,
+#   averageCostBasis, averageCostBasisPerSignal,
+#   nameSignalAverageCostBasis, nameSignalAverageCostBasisPerSignal,
+#   signalAverageCostBasis, signalAverageCostBasisPerSignal
 #
 # Sources (gns.ts):
 #   signalledTokens  = CUMULATIVE tokensDeposited from SignalMinted
 #   unsignalledTokens = CUMULATIVE tokensReceived from SignalBurned
 #   withdrawnTokens  = withdrawnGRT from GRTWithdrawn (SET, not cumulative — fires once per deprecated subgraph)
 #   nameSignal       = CURRENT nSignal = minted - burnt - withdrawn
-#   signal           = CURRENT vSignal = minted - burnt (reset to 0 on GRTWithdrawn; also recalculated on subgraph upgrade — not captured here)
+#   signal           = CURRENT vSignal = minted - burnt, reset to 0 on GRTWithdrawn (also recalculated on subgraph upgrade — not captured here)
+#   nameSignalAverageCostBasis = += tokensDeposited on mint; = nSignal * perSignal on burn; 0 on GRTWithdrawn
+#   signalAverageCostBasis     = the same over vSignal
+#   averageCostBasis / averageCostBasisPerSignal = the nameSignal pair
+#   realizedRewards  = never updated after createOrLoadNameSignal, so 0
 #   lastNameSignalChange = timestamp of last event
+#
+# The cost basis depends on event order, so every field is computed by
+# replaying each (curator, subgraph)'s events in (block_num, log_index)
+# order (pipeline/replay.py, handler steps in pipeline/curation.py).
 
 # %%
 import sys
@@ -27,9 +38,19 @@ except NameError:
 project_root = os.path.abspath(os.path.join(script_dir, '..', '..'))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
+pipeline_root = os.path.abspath(os.path.join(script_dir, '..'))
+if pipeline_root not in sys.path:
+    sys.path.insert(0, pipeline_root)
 
 from nozzle.client import Client
 from nozzle.util import process_query, save_or_upload_parquet, convert_bigint_subgraph_id_to_base58
+from pipeline.addresses import decode_columns, encode_columns
+from pipeline.curation import (
+    MINTED, NAME_BURNED, NAME_SIGNAL_EVENT_COLUMNS, NAME_SIGNAL_STATE, WITHDRAWN, name_signal_step,
+)
+from pipeline.replay import replay
+from pipeline.serving import serve
+import numpy as np
 import pandas as pd
 import logging
 
@@ -40,87 +61,125 @@ client_url = "grpc+tls://gateway.amp.staging.thegraph.com:443"
 client = Client(client_url)
 
 GNS_ADDRESS = "ec9A7fb6CbC2E41926127929c2dcE6e9c5D33Bec"
+MINTED_EVENT = 'SignalMinted(uint256 indexed subgraphID, address indexed curator, uint256 nSignalCreated, uint256 vSignalCreated, uint256 tokensDeposited)'
+BURNED_EVENT = 'SignalBurned(uint256 indexed subgraphID, address indexed curator, uint256 nSignalBurnt, uint256 vSignalBurnt, uint256 tokensReceived)'
+WITHDRAWN_EVENT = 'GRTWithdrawn(uint256 indexed subgraphID, address indexed curator, uint256 nSignalBurnt, uint256 withdrawnGRT)'
 
 logger.info("Starting name signal arbitrum data processing...")
 
 # %%
 # ============================================================
-# Query: all NameSignal fields per (curator, subgraph)
+# Query: every SignalMinted / SignalBurned / GRTWithdrawn event
 #
-# Uses pre-built tables for SignalMinted / SignalBurned.
-# Uses raw log decode for GRTWithdrawn (no pre-built table).
+# Decoded from the GNS contract's logs: the replay needs log_index to
+# order two events of one (curator, subgraph) in the same block.
 # ============================================================
 query = f'''
-WITH
-mint_events AS (
-    SELECT
-        curator_id,
-        subgraph_id,
-        n_signal_created AS name_signal_delta,
-        v_signal_created AS signal_delta,
-        tokens_deposited AS signalled_tokens,
-        0 AS unsignalled_tokens,
-        0 AS withdrawn_tokens,
-        timestamp FROM "data_science/event_arbitrum_gns_signal_minted@0.0.2"."event_arbitrum_gns_signal_minted"
+WITH gns_logs AS (
+    SELECT l.topic0, l.topic1, l.topic2, l.topic3, l.data, l.block_num, l.log_index, l.timestamp
+    FROM "edgeandnode/arbitrum_one@0.0.1".logs l
+    WHERE l.address = arrow_cast(x'{GNS_ADDRESS}', 'FixedSizeBinary(20)')
 ),
-burn_events AS (
-    SELECT
-        curator_id,
-        subgraph_id,
-        -n_signal_burnt AS name_signal_delta,
-        -v_signal_burnt AS signal_delta,
-        0 AS signalled_tokens,
-        tokens_received AS unsignalled_tokens,
-        0 AS withdrawn_tokens,
-        timestamp
-    FROM "data_science/event_arbitrum_gns_signal_burned@0.0.2"."event_arbitrum_gns_signal_burned"
+minted AS (
+    SELECT evm_decode(topic1, topic2, topic3, data, '{MINTED_EVENT}') AS event, block_num, log_index, timestamp
+    FROM gns_logs
+    WHERE topic0 = evm_topic('{MINTED_EVENT}')
 ),
-withdraw_events AS (
-    SELECT
-        curator_id AS curator_id,
-        subgraph_id,
-        -n_signal_burnt AS name_signal_delta,
-        0 AS signal_delta,
-        0 AS signalled_tokens,
-        0 AS unsignalled_tokens,
-        withdrawn_grt AS withdrawn_tokens,
-        timestamp
-    FROM "data_science/event_arbitrum_gns_grt_withdrawn@0.0.2"."event_arbitrum_gns_grt_withdrawn"
+burned AS (
+    SELECT evm_decode(topic1, topic2, topic3, data, '{BURNED_EVENT}') AS event, block_num, log_index, timestamp
+    FROM gns_logs
+    WHERE topic0 = evm_topic('{BURNED_EVENT}')
+),
+withdrawn AS (
+    SELECT evm_decode(topic1, topic2, topic3, data, '{WITHDRAWN_EVENT}') AS event, block_num, log_index, timestamp
+    FROM gns_logs
+    WHERE topic0 = evm_topic('{WITHDRAWN_EVENT}')
 )
-
 SELECT
-    curator_id,
-    subgraph_id,
-    SUM(name_signal_delta) / POWER(10, 18) AS name_signal,
-    SUM(signal_delta) / POWER(10, 18) AS signal,
-    SUM(signalled_tokens) / POWER(10, 18) AS signalled_tokens,
-    SUM(unsignalled_tokens) / POWER(10, 18) AS unsignalled_tokens,
-    SUM(withdrawn_tokens) / POWER(10, 18) AS withdrawn_tokens,
-    MAX(timestamp) AS last_name_signal_change
-FROM (
-    SELECT * FROM mint_events
-    UNION ALL
-    SELECT * FROM burn_events
-    UNION ALL
-    SELECT * FROM withdraw_events
-) all_events
-GROUP BY curator_id, subgraph_id
+    event['curator'] AS curator_id,
+    event['subgraphID'] AS subgraph_id,
+    {MINTED} AS kind,
+    arrow_cast(event['tokensDeposited'], 'Float64') AS tokens,
+    arrow_cast(event['nSignalCreated'], 'Float64') AS name_signal,
+    arrow_cast(event['vSignalCreated'], 'Float64') AS signal,
+    block_num, log_index, timestamp
+FROM minted
+UNION ALL
+SELECT
+    event['curator'] AS curator_id,
+    event['subgraphID'] AS subgraph_id,
+    {NAME_BURNED} AS kind,
+    arrow_cast(event['tokensReceived'], 'Float64') AS tokens,
+    arrow_cast(event['nSignalBurnt'], 'Float64') AS name_signal,
+    arrow_cast(event['vSignalBurnt'], 'Float64') AS signal,
+    block_num, log_index, timestamp
+FROM burned
+UNION ALL
+SELECT
+    event['curator'] AS curator_id,
+    event['subgraphID'] AS subgraph_id,
+    {WITHDRAWN} AS kind,
+    arrow_cast(event['withdrawnGRT'], 'Float64') AS tokens,
+    arrow_cast(event['nSignalBurnt'], 'Float64') AS name_signal,
+    0.0 AS signal,
+    block_num, log_index, timestamp
+FROM withdrawn
 '''
 
 logger.info("Executing query...")
-result = process_query(client, query)
+events = process_query(client, query)
+logger.info(f"Fetched {len(events)} GNS signal events")
 
 # %%
-# Convert subgraph_id from bigint to base58 and build the entity id
-result['subgraph_id'] = result['subgraph_id'].apply(
-    lambda x: convert_bigint_subgraph_id_to_base58(int(x)) if pd.notnull(x) else x
+# ============================================================
+# Replay each (curator, subgraph) in chain order
+#
+# Subgraph ids are factorized for the replay and converted to base58 once
+# per distinct id afterwards.
+# ============================================================
+encode_columns(events, ['curator_id'])
+subgraph_codes, subgraph_ids = pd.factorize(events['subgraph_id'])
+events['subgraph_id'] = subgraph_codes
+events['timestamp'] = events['timestamp'].astype('float64')
+result = replay(
+    events,
+    keys=['curator_id', 'subgraph_id'],
+    order=['block_num', 'log_index'],
+    step=name_signal_step,
+    state=NAME_SIGNAL_STATE,
+    columns=NAME_SIGNAL_EVENT_COLUMNS,
+)
+decode_columns(result, ['curator_id'])
+subgraph_names = np.array(
+    [convert_bigint_subgraph_id_to_base58(int(x)) for x in subgraph_ids], dtype=object
 )
+result['subgraph_id'] = subgraph_names[result['subgraph_id'].to_numpy()]
+
+token_cols = [
+    'name_signal', 'signal', 'signalled_tokens', 'unsignalled_tokens', 'withdrawn_tokens',
+    'name_signal_average_cost_basis', 'signal_average_cost_basis',
+]
+result[token_cols] = result[token_cols] / 10**18
+result['average_cost_basis'] = result['name_signal_average_cost_basis']
+result['average_cost_basis_per_signal'] = result['name_signal_average_cost_basis_per_signal']
+result['realized_rewards'] = 0.0
+
 result['id'] = result['curator_id'] + '-' + result['subgraph_id']
 
 result['last_name_signal_change'] = pd.to_datetime(
     result['last_name_signal_change'], unit='s', utc=True
 )
 
+result = result[[
+    'curator_id', 'subgraph_id',
+    'name_signal', 'signal',
+    'signalled_tokens', 'unsignalled_tokens', 'withdrawn_tokens',
+    'average_cost_basis', 'average_cost_basis_per_signal',
+    'name_signal_average_cost_basis', 'name_signal_average_cost_basis_per_signal',
+    'signal_average_cost_basis', 'signal_average_cost_basis_per_signal',
+    'realized_rewards', 'last_name_signal_change', 'id',
+]]
+
 logger.info(f"Produced {len(result)} NameSignal rows")
 
 # %%
@@ -139,5 +198,6 @@ save_or_upload_parquet(
     bucket_name='nozzle-data-science',
     project_id='graph-mainnet',
 )
+serve(result, 'name_signal_arbitrum')
 
 logger.info("Name signal arbitrum data processing completed successfully!")
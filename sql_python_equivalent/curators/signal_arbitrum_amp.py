@@ -6,14 +6,22 @@
 # Signal entity fields (schema.graphql lines 1334-1368):
 #   id (curatorAddress-subgraphDeploymentID), curator, subgraphDeployment,
 #   signalledTokens, unsignalledTokens, signal,
+#   averageCostBasis, averageCostBasisPerSignal, lastSignalChange, realizedRewards,
 #   createdAt, lastUpdatedAt
 #
 # Sources (curation.ts only — Signal is NOT touched by GNS):
 #   signalledTokens  = CUMULATIVE (tokens - curationTax) from Signalled events
 #   unsignalledTokens = CUMULATIVE tokens from Burned events
 #   signal           = CURRENT share balance = SUM(signal_minted) - SUM(signal_burned)
+#   averageCostBasis = += tokens on Signalled; = signal * averageCostBasisPerSignal on Burned
+#   averageCostBasisPerSignal = averageCostBasis / signal after Signalled; 0 once the basis is 0
+#   lastSignalChange, realizedRewards = never updated after createOrLoadSignal, so 0
 #   createdAt        = timestamp of first event per (curator, deployment)
 #   lastUpdatedAt    = timestamp of last event per (curator, deployment)
+#
+# The cost basis depends on event order, so every field is computed by
+# replaying each (curator, deployment)'s events in (block_num, log_index)
+# order (pipeline/replay.py, handler steps in pipeline/curation.py).
 
 # %%
 import sys
@@ -26,9 +34,16 @@ except NameError:
 project_root = os.path.abspath(os.path.join(script_dir, '..', '..'))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
+pipeline_root = os.path.abspath(os.path.join(script_dir, '..'))
+if pipeline_root not in sys.path:
+    sys.path.insert(0, pipeline_root)
 
 from nozzle.client import Client
 from nozzle.util import process_query, save_or_upload_parquet
+from pipeline.addresses import decode_columns, encode_columns
+from pipeline.curation import SIGNAL_EVENT_COLUMNS, SIGNAL_STATE, signal_events_query, signal_step
+from pipeline.replay import replay
+from pipeline.serving import serve
 import pandas as pd
 import logging
 
@@ -42,52 +57,53 @@ logger.info("Starting signal arbitrum data processing...")
 
 # %%
 # ============================================================
-# Query: all Signal fields per (curator, subgraph_deployment)
+# Query: every Signalled / Burned event with its position in the chain
 #
-# Uses pre-built tables for Signalled / Burned from Curation contract.
+# Decoded from the Curation contract's logs: the replay needs log_index to
+# order two events of one (curator, deployment) in the same block.
 # Signal entity is per (curator, deployment) — NOT aggregated across deployments.
 # ============================================================
-query = '''
-SELECT
-    curator_id,
-    subgraph_deployment_id,
-    SUM(signalled_tokens) / POWER(10, 18) AS signalled_tokens,
-    SUM(unsignalled_tokens) / POWER(10, 18) AS unsignalled_tokens,
-    SUM(signal_delta) / POWER(10, 18) AS signal,
-    MIN(timestamp) AS created_at,
-    MAX(timestamp) AS last_updated_at
-FROM (
-    SELECT
-        curator_id,
-        subgraph_deployment_id,
-        (tokens - curation_tax) AS signalled_tokens,
-        0 AS unsignalled_tokens,
-        signal AS signal_delta,
-        timestamp
-    FROM "data_science/event_arbitrum_curation_signalled@0.0.2"."event_arbitrum_curation_signalled"
-    UNION ALL
-    SELECT
-        curator_id,
-        subgraph_deployment_id,
-        0 AS signalled_tokens,
-        tokens AS unsignalled_tokens,
-        -signal AS signal_delta,
-        timestamp
-    FROM "data_science/event_arbitrum_curation_burned@0.0.2"."event_arbitrum_curation_burned"
-) all_events
-GROUP BY curator_id, subgraph_deployment_id
-'''
+query = signal_events_query()
 
 logger.info("Executing query...")
-result = process_query(client, query)
+events = process_query(client, query)
+logger.info(f"Fetched {len(events)} curation events")
 
 # %%
+# ============================================================
+# Replay each (curator, deployment) in chain order
+# ============================================================
+encode_columns(events, ['curator_id', 'subgraph_deployment_id'])
+events['timestamp'] = events['timestamp'].astype('float64')
+result = replay(
+    events,
+    keys=['curator_id', 'subgraph_deployment_id'],
+    order=['block_num', 'log_index'],
+    step=signal_step,
+    state=SIGNAL_STATE,
+    columns=SIGNAL_EVENT_COLUMNS,
+)
+decode_columns(result, ['curator_id', 'subgraph_deployment_id'])
+
+token_cols = ['signalled_tokens', 'unsignalled_tokens', 'signal', 'average_cost_basis']
+result[token_cols] = result[token_cols] / 10**18
+result['last_signal_change'] = 0
+result['realized_rewards'] = 0.0
+
 # Build the entity id: curatorAddress-subgraphDeploymentID
 result['id'] = result['curator_id'] + '-' + result['subgraph_deployment_id']
 
 result['created_at'] = pd.to_datetime(result['created_at'], unit='s', utc=True)
 result['last_updated_at'] = pd.to_datetime(result['last_updated_at'], unit='s', utc=True)
 
+result = result[[
+    'curator_id', 'subgraph_deployment_id',
+    'signalled_tokens', 'unsignalled_tokens', 'signal',
+    'average_cost_basis', 'average_cost_basis_per_signal',
+    'last_signal_change', 'realized_rewards',
+    'created_at', 'last_updated_at', 'id',
+]]
+
 logger.info(f"Produced {len(result)} Signal rows")
 
 # %%
@@ -106,5 +122,6 @@ save_or_upload_parquet(
     bucket_name='nozzle-data-science',
     project_id='graph-mainnet',
 )
+serve(result, 'signal_arbitrum')
 
 logger.info("Signal arbitrum data processing completed successfully!")
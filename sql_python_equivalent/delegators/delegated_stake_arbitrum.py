@@ -13,7 +13,16 @@
 # on delegation events (staking.ts:236-246):
 #   rate = (old_rate * old_shares + new_tokens) / (old_shares + new_shares)
 # It does NOT change on undelegation — the cost basis per remaining share stays.
-# This requires sequential event processing, done in Python below.
+# realizedRewards grows on each undelegation by
+#   shares * (indexer.delegationExchangeRate - personalExchangeRate)
+# with the indexer's rate just before the event, looked up in the indexer's
+# exchange-rate timeline (pipeline/delegation.py).  Both need each pair's
+# events in (block_num, log_index) order, replayed by pipeline/replay.py.
+#
+# With PIPELINE_MEMORY_BUDGET set, events are fetched in block ranges and
+# spilled to disk by (delegator, indexer), and the per-pair build runs one
+# batch of pairs at a time (pipeline/spill.py).  Output is the same.
+# The per-pair replay itself is sharded across cores (pipeline/shards.py).
 
 # %%
 import sys
@@ -26,10 +35,24 @@ except NameError:
 project_root = os.path.abspath(os.path.join(script_dir, '..', '..'))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
+pipeline_root = os.path.abspath(os.path.join(script_dir, '..'))
+if pipeline_root not in sys.path:
+    sys.path.insert(0, pipeline_root)
 
 from nozzle.client import Client
 from nozzle.util import process_query
 from nozzle.util import save_or_upload_parquet
+from pipeline.addresses import decode_columns, encode_columns
+from pipeline.delegation import (
+    DELEGATED_STAKE_EVENTS_QUERY, ExchangeRateTimeline, delegated_stake_metrics, position,
+)
+from pipeline.economics import ECONOMICS_TABLE, POOL_STREAM_COLUMNS
+from pipeline.executor import QueryExecutor
+from pipeline.partitioned import render_partition
+from pipeline.serving import serve
+from pipeline.shards import shard_by_key
+from pipeline.spill import MEMORY_BUDGET, ranged_chunks, run_by_key
+from pipeline.tables import load_entity_table
 import pandas as pd
 
 client_url = "grpc+tls://gateway.amp.staging.thegraph.com:443"
@@ -37,34 +60,61 @@ client = Client(client_url)
 
 # %%
 # ============================================================
-# Part 1: All delegation & undelegation events (ordered by time)
-# Used to compute personalExchangeRate, shareAmount, and
-# aggregate metrics per (delegator, indexer) pair in Python.
+# Part 1: All delegation & undelegation events, with their position
+# in the chain (block_num, log_index) for the ordered replay.
 # ============================================================
-events_query = f'''
-SELECT
-    delegator_id,
-    indexer_id,
-    tokens,
-    shares,
-    timestamp,
-    'delegated' AS event_type
-FROM "delegators/event_arbitrum_staking_stake_delegated@0.0.1"."event_arbitrum_staking_stake_delegated"
-
-UNION ALL
-
-SELECT
-    delegator_id,
-    indexer_id,
-    tokens,
-    shares,
-    timestamp,
-    'undelegated' AS event_type
-FROM "data_science/event_arbitrum_stake_delegated_locked@0.0.2"."event_arbitrum_stake_delegated_locked"
-
-ORDER BY delegator_id, indexer_id, timestamp
+# DELEGATED_STAKE_EVENTS_QUERY has {block_range} placeholders: rendered once
+# over every block in memory, or one block range at a time out of core.
+events_bounds_query = f'''
+SELECT MIN(lo) AS lo, MAX(hi) AS hi FROM (
+    SELECT MIN(block_num) AS lo, MAX(block_num) AS hi FROM arbitrum_staking.stake_delegated
+    UNION ALL
+    SELECT MIN(block_num) AS lo, MAX(block_num) AS hi FROM arbitrum_staking.stake_delegated_locked
+) b
 '''
-events_df = process_query(client, events_query)
+SPILL_CHUNKS = 64
+_OPEN_END = 1 << 62
+# build_delegated_stake's output, also for a batch without events.
+STAKE_COLUMNS = [
+    'delegator_id', 'indexer_id',
+    'personal_exchange_rate', 'share_amount',
+    'total_staked_tokens', 'total_unstaked_tokens', 'staked_tokens',
+    'realized_rewards', 'created_at', 'last_delegated_at', 'last_undelegated_at',
+    'current_delegation', 'locked_tokens',
+]
+
+
+# The indexer pool's exchange rate after every change, for the as-of lookup.
+# Rewards and rebates paid into the pool come from the economics stream
+# published by network/allocation_economics_arbitrum.py.
+economics_stream = load_entity_table(ECONOMICS_TABLE, columns=POOL_STREAM_COLUMNS)
+timeline = ExchangeRateTimeline.load(QueryExecutor(client_url), economics_stream)
+
+
+# The as-of rate is attached while indexers are still raw addresses, then
+# addresses are carried as int32 codes from here on (pipeline/addresses.py)
+# and decoded back to hex just before upload.
+def prepare_events(events):
+    events['exchange_rate'] = timeline.rate_before(
+        events['indexer_id'].to_numpy(), position(events['block_num'], events['log_index'])
+    )
+    events['timestamp'] = events['timestamp'].astype('float64')
+    encode_columns(events, ['delegator_id', 'indexer_id'])
+    return events
+
+
+def encoded_event_chunks():
+    executor = QueryExecutor(client_url)
+    bounds = executor.run(events_bounds_query)
+    for chunk in ranged_chunks(executor, DELEGATED_STAKE_EVENTS_QUERY, (int(bounds['lo'].iloc[0]), int(bounds['hi'].iloc[0])), SPILL_CHUNKS):
+        yield prepare_events(chunk)
+
+
+if MEMORY_BUDGET is None:
+    events_query = render_partition(DELEGATED_STAKE_EVENTS_QUERY, 0, _OPEN_END)
+    events_source = prepare_events(process_query(client, events_query))
+else:
+    events_source = encoded_event_chunks()
 
 # %%
 # ============================================================
@@ -90,87 +140,63 @@ FROM lock_events
 GROUP BY 1, 2
 '''
 locked_df = process_query(client, locked_query)
+encode_columns(locked_df, ['delegator_id', 'indexer_id'])
 
 # %%
 # ============================================================
-# Part 3: Compute per-(delegator, indexer) metrics in Python
+# Part 3: Replay each (delegator, indexer) in chain order
 #
 # personalExchangeRate: weighted average cost basis (tokens/share),
 #   only updated on delegation events.
 # shareAmount: running sum of share deltas.
 # stakedTokens / unstakedTokens: cumulative sums.
+# realizedRewards: gain over the cost basis on each undelegation.
+#
+# delegated_stake_metrics lives in pipeline/delegation.py so the shard
+# workers import it from there, never this script.
 # ============================================================
-def compute_stake_metrics(group):
-    rate = 1.0
-    shares = 0.0
-    total_staked = 0.0
-    total_unstaked = 0.0
-    created_at = None
-    last_delegated_at = None
-    last_undelegated_at = None
-
-    for _, ev in group.iterrows():
-        tokens = float(ev['tokens'])
-        ev_shares = float(ev['shares'])
-
-        if ev['event_type'] == 'delegated':
-            total_staked += tokens
-            new_total_shares = shares + ev_shares
-            if new_total_shares > 0:
-                rate = (rate * shares + tokens) / new_total_shares
-            shares = new_total_shares
-            last_delegated_at = ev['timestamp']
-            if created_at is None:
-                created_at = ev['timestamp']
-        else:
-            total_unstaked += tokens
-            shares -= ev_shares
-            last_undelegated_at = ev['timestamp']
-
-    return pd.Series({
-        'personal_exchange_rate': rate,
-        'share_amount': shares / 1e18,
-        'total_staked_tokens': total_staked / 1e18,
-        'total_unstaked_tokens': total_unstaked / 1e18,
-        'staked_tokens': (total_staked - total_unstaked) / 1e18,
-        'created_at': created_at,
-        'last_delegated_at': last_delegated_at,
-        'last_undelegated_at': last_undelegated_at,
-    })
-
-metrics_df = (
-    events_df
-    .groupby(['delegator_id', 'indexer_id'], sort=False)
-    .apply(compute_stake_metrics)
-    .reset_index()
-)
-
-metrics_df['current_delegation'] = (
-    metrics_df['personal_exchange_rate'] * metrics_df['share_amount']
+def build_delegated_stake(frames):
+    events = frames['events']
+    if events.empty:
+        return pd.DataFrame(columns=STAKE_COLUMNS)
+    metrics_df = shard_by_key(events, ['delegator_id', 'indexer_id'], delegated_stake_metrics)
+
+    metrics_df['current_delegation'] = (
+        metrics_df['personal_exchange_rate'] * metrics_df['share_amount']
+    )
+
+    # Merge with locked tokens
+    merged = metrics_df.merge(frames['locked'], on=['delegator_id', 'indexer_id'], how='left')
+    merged['locked_tokens'] = merged['locked_tokens'].fillna(0)
+    return merged[STAKE_COLUMNS]
+
+
+result = run_by_key(
+    {'events': events_source, 'locked': locked_df},
+    ['delegator_id', 'indexer_id'],
+    build_delegated_stake,
 )
 
 # %%
 # ============================================================
-# Merge with locked tokens and finalize
+# Finalize
 # ============================================================
-result = metrics_df.merge(locked_df, on=['delegator_id', 'indexer_id'], how='left')
-result['locked_tokens'] = result['locked_tokens'].fillna(0)
-
 result = result.rename(columns={
     'delegator_id': 'delegator',
     'indexer_id': 'indexer',
 })
 
 result['created_at'] = pd.to_datetime(result['created_at'], unit='s', utc=True)
+decode_columns(result, ['delegator', 'indexer'])
 
 result = result[[
     'indexer', 'delegator',
     'personal_exchange_rate', 'share_amount', 'current_delegation',
-    'created_at', 'last_delegated_at',
+    'realized_rewards', 'created_at', 'last_delegated_at',
     'locked_tokens', 'staked_tokens',
     'total_staked_tokens', 'total_unstaked_tokens',
     'last_undelegated_at',
-]]
+]].sort_values(['indexer', 'delegator'], ignore_index=True)
 
 # %%
 # ============================================================
@@ -186,3 +212,4 @@ destination_blob_name = 'path/in/bucket/delegated_stake_arbitrum.parquet'
 table_id = 'delegated_stake_arbitrum'
 project_id = 'graph-mainnet'
 save_or_upload_parquet(result, destination_blob_name, "upload", table_id, project_id=project_id)
+serve(result, table_id)
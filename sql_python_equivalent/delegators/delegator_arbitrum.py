@@ -28,10 +28,17 @@ except NameError:
 project_root = os.path.abspath(os.path.join(script_dir, '..', '..'))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
+pipeline_root = os.path.abspath(os.path.join(script_dir, '..'))
+if pipeline_root not in sys.path:
+    sys.path.insert(0, pipeline_root)
 
 from nozzle.client import Client
 from nozzle.util import process_query
 from nozzle.util import save_or_upload_parquet
+from pipeline.addresses import decode_columns, encode_columns
+from pipeline.rollups import delegated_stakes_to_delegators
+from pipeline.serving import serve
+from pipeline.tables import load_entity_table
 import pandas as pd
 
 client_url = "grpc+tls://gateway.amp.staging.thegraph.com:443"
@@ -168,15 +175,33 @@ INNER JOIN (
 last_del_res = process_query(client, last_delegation_query)
 last_del_res = last_del_res.drop_duplicates(subset='delegator_wallet', keep='last')
 
+# %%
+# ============================================================
+# Part 5: totalRealizedRewards, rolled up from DelegatedStake
+# (delegated_stake_arbitrum must be built first, see pipeline/rollups.py)
+# ============================================================
+rewards_res = delegated_stakes_to_delegators(
+    load_entity_table('delegated_stake_arbitrum', ['delegator', 'realized_rewards'])
+).rename(columns={'delegator': 'delegator_wallet'})
+
 # %%
 # ============================================================
 # Merge all parts
+#
+# delegator_wallet is merged as an int32 code (pipeline/addresses.py)
+# and decoded back to hex before building last_delegation.
 # ============================================================
+for frame in (metrics_res, active_res, name_res, last_del_res, rewards_res):
+    encode_columns(frame, ['delegator_wallet'])
+
 result = metrics_res.merge(active_res, on='delegator_wallet', how='left')
 result = result.merge(name_res, on='delegator_wallet', how='left')
 result = result.merge(last_del_res, on='delegator_wallet', how='left')
+result = result.merge(rewards_res, on='delegator_wallet', how='left')
 
 result['active_stakes_count'] = result['active_stakes_count'].fillna(0).astype(int)
+result['total_realized_rewards'] = result['total_realized_rewards'].fillna(0.0)
+decode_columns(result, ['delegator_wallet'])
 result['last_delegation'] = result.apply(
     lambda row: row['delegator_wallet'] + '-' + row['last_delegation_indexer_id']
     if pd.notna(row['last_delegation_indexer_id']) else None,
@@ -202,3 +227,4 @@ save_or_upload_parquet(
     table_id='delegator_arbitrum',
     bucket_name='nozzle-data-science',
     project_id='graph-mainnet')
+serve(result, 'delegator_arbitrum')
@@ -7,23 +7,37 @@ Fields covered (schema.graphql lines 1058-1126):
 - id: allocation/channel address (allocationID).
 - indexer: Indexer entity id (address).
 - subgraph_deployment: deployment id bytes32.
-- allocated_tokens: latest tokens bonded to the allocation (GRT).
+- allocated_tokens: tokens bonded to the allocation after its last create / resize (GRT).
 - created_at: timestamp when allocation opened (handleAllocationCreated / subgraphService.handleAllocationCreated).
-- closed_at: timestamp when allocation closed (staking.ts handleAllocationClosed + CobbDouglas variant).
-- status: 'Active' if no close recorded, otherwise 'Closed'.
+- closed_at: timestamp when allocation closed (staking.ts handleAllocationClosed + CobbDouglas variant;
+  subgraphService.ts handleAllocationClosed).
+- created_at_epoch / closed_at_epoch: epoch of the creation / close block (createOrLoadEpoch), mapped
+  through the published epoch_arbitrum table (pipeline/epochs.py); <NA> for blocks past the table's
+  synced_block, so run network/epoch_arbitrum.py first.
+- status: 'Closed' once the allocation's lifecycle interval is closed, otherwise 'Active'.
 - active_for_indexer: indexer id while allocation is open, null once closed.
-- query_fees_collected: cumulative query fees net of curator/protocol tax (AllocationCollected + RebateCollected).
-- query_fee_rebates: cumulative rebates claimed per allocation (RebateCollected + legacy RebateClaimed).
-
-Event sources:
-- allocation_created      → arbitrum_staking.allocation_created (staking.ts handleAllocationCreated).
-- allocation_closed       → arbitrum_staking.allocation_closed (horizon) + legacy L1 AllocationClosed logs.
-- allocation_collected    → arbitrum_staking.allocation_collected (staking.ts handleAllocationCollected).
-- rebate_collected        → arbitrum_staking.rebate_collected (staking.ts handleRebateCollected).
-- rebate_claimed          → arbitrum_staking.rebate_claimed (staking.ts handleRebateClaimed legacy path).
-
-Known limitation: AllocationResized (horizon) updates allocatedTokens mid-flight; this script currently
-uses the latest allocation_created tokens and does not replay resizes. This is surfaced in the verification table.
+- is_legacy: true for allocations created through legacy staking (Allocation.isLegacy).
+- query_fees_collected: cumulative query fees net of curator/protocol tax (AllocationCollected +
+  RebateCollected; QueryFeesCollected tokensRemaining).
+- curator_rewards: cumulative curationFees / tokensCurators.
+- query_fee_rebates: last RebateCollected.queryRebates / legacy RebateClaimed.tokens (SET), plus
+  the indexer's share of each QueryFeesCollected (added).
+- distributed_rebates: cumulative RebateCollected.queryRebates / QueryFeesCollected tokensRemaining.
+- delegation_fees: last RebateCollected.delegationRewards / RebateClaimed.delegationFees (SET), plus
+  the delegation pool's share of each QueryFeesCollected (added).
+- indexing_rewards, indexing_indexer_rewards, indexing_delegator_rewards: RewardsAssigned and
+  legacy-allocation HorizonRewardsAssigned split by the indexer's indexingRewardCut in effect at the
+  event (rewardsManager.ts); IndexingRewardsCollected as emitted (subgraphService.ts).
+
+Event source: allocation_economics_arbitrum (network/allocation_economics_arbitrum.py,
+pipeline/economics.py), which decodes the legacy staking / RewardsManager and Horizon
+SubgraphService events into one stream deduped on (tx_hash, log_index).  Its fee and
+reward rows are pivoted per allocation in a single groupby (pipeline/fees.py).
+
+The stream's creations, resizes and closes are replayed into one interval per allocation
+state (pipeline/lifecycle.py).  allocated_tokens, closed_at and status are read off each
+allocation's last interval, and the intervals are published as
+allocation_intervals_arbitrum for point-in-time lookups (AllocationLifecycle).
 """
 
 import logging
@@ -33,8 +47,7 @@ from typing import List, Dict
 
 import pandas as pd
 from google.cloud import bigquery
-from nozzle.client import Client
-from nozzle.util import process_query, save_or_upload_parquet
+from nozzle.util import save_or_upload_parquet
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -46,86 +59,25 @@ except NameError:  # pragma: no cover
 PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, "..", ".."))
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
+PIPELINE_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, ".."))
+if PIPELINE_ROOT not in sys.path:
+    sys.path.insert(0, PIPELINE_ROOT)
 
-CLIENT_URL = "grpc+tls://gateway.amp.staging.thegraph.com:443"
-client = Client(CLIENT_URL)
-
-STAKING_ADDRESS = "0x00669A4CF01450B64E8A2A20E9B1FCB71E61EF03"
-_STAKING_HEX = STAKING_ADDRESS.replace("0x", "")
+from pipeline.economics import ECONOMICS_TABLE, LEGACY, STREAM_COLUMNS, allocation_fee_events, lifecycle_events
+from pipeline.epochs import EpochTable
+from pipeline.fees import FEE_FIELDS, attribute_allocation_fees
+from pipeline.lifecycle import build_intervals
+from pipeline.serving import serve
+from pipeline.tables import load_entity_table
 
 logger.info("Starting Allocation extraction for Arbitrum.")
 
-allocation_created_query = """
-SELECT
-    event['allocationID'] AS allocation_id,
-    event['indexer'] AS indexer_id,
-    event['subgraphDeploymentID'] AS subgraph_deployment_id,
-    arrow_cast(event['tokens'], 'Float64') AS tokens_raw,
-    event['epoch'] AS created_epoch,
-    timestamp AS created_timestamp
-FROM arbitrum_staking.allocation_created
-"""
-
-logger.info("Querying allocation creations...")
-created_df = process_query(client, allocation_created_query)
-logger.info("Fetched %s allocation creation rows.", len(created_df))
-
-allocation_closed_query = f"""
-WITH legacy_closed AS (
-    SELECT
-        evm_decode(
-            l.topic1,
-            l.topic2,
-            l.topic3,
-            l.data,
-            'AllocationClosed(address indexed indexer, bytes32 indexed subgraphDeploymentID, uint256 epoch, uint256 tokens, address indexed allocationID, uint256 effectiveAllocation, address sender, bytes32 poi, bool isPublic)'
-        ) AS event,
-        l.timestamp
-    FROM "edgeandnode/arbitrum_one@0.0.1".logs l
-    WHERE l.address = arrow_cast(x'{_STAKING_HEX}', 'FixedSizeBinary(20)')
-      AND l.topic0 = evm_topic('AllocationClosed(address indexed indexer, bytes32 indexed subgraphDeploymentID, uint256 epoch, uint256 tokens, address indexed allocationID, uint256 effectiveAllocation, address sender, bytes32 poi, bool isPublic)')
-)
-SELECT event['allocationID'] AS allocation_id, timestamp
-FROM arbitrum_staking.allocation_closed
-UNION ALL
-SELECT event['allocationID'] AS allocation_id, timestamp
-FROM legacy_closed
-"""
-
-logger.info("Querying allocation closures...")
-closed_events_df = process_query(client, allocation_closed_query)
-logger.info("Fetched %s allocation close events.", len(closed_events_df))
-
-allocation_collected_query = """
-SELECT
-    event['allocationID'] AS allocation_id,
-    SUM(arrow_cast(event['rebateFees'], 'Float64')) AS rebate_fees_raw
-FROM arbitrum_staking.allocation_collected
-GROUP BY 1
-"""
-logger.info("Aggregating allocation_collected fees...")
-allocation_collected_df = process_query(client, allocation_collected_query)
-
-rebate_collected_query = """
-SELECT
-    event['allocationID'] AS allocation_id,
-    SUM(arrow_cast(event['queryFees'], 'Float64')) AS query_fees_raw,
-    SUM(arrow_cast(event['queryRebates'], 'Float64')) AS query_rebates_raw
-FROM arbitrum_staking.rebate_collected
-GROUP BY 1
-"""
-logger.info("Aggregating rebate_collected fees...")
-rebate_collected_df = process_query(client, rebate_collected_query)
-
-rebate_claimed_query = """
-SELECT
-    event['allocationID'] AS allocation_id,
-    SUM(arrow_cast(event['tokens'], 'Float64')) AS legacy_rebates_raw
-FROM arbitrum_staking.rebate_claimed
-GROUP BY 1
-"""
-logger.info("Aggregating legacy rebate_claimed events...")
-rebate_claimed_df = process_query(client, rebate_claimed_query)
+# Creations, resizes, closes, fees and rewards of both protocol generations
+# come pre-decoded from the allocation-economics stream (built first).
+logger.info("Loading the allocation-economics stream...")
+stream_df = load_entity_table(ECONOMICS_TABLE, columns=STREAM_COLUMNS)
+created_df = stream_df[stream_df["event_type"] == "AllocationCreated"].drop_duplicates("allocation")
+logger.info("Loaded %s events covering %s allocations.", len(stream_df), len(created_df))
 
 if created_df.empty:
     logger.warning("No allocations found; emitting empty table.")
@@ -137,91 +89,59 @@ if created_df.empty:
             "allocated_tokens",
             "created_at",
             "closed_at",
+            "created_at_epoch",
+            "closed_at_epoch",
+            "is_legacy",
             "status",
             "active_for_indexer",
-            "query_fees_collected",
-            "query_fee_rebates",
+        ]
+        + FEE_FIELDS
+    )
+    intervals_df = pd.DataFrame(
+        columns=[
+            "allocation_id", "indexer", "subgraph_deployment", "reason",
+            "start_block", "end_block", "start_at", "end_at", "allocated_tokens",
         ]
     )
 else:
-    created_df["created_at"] = pd.to_datetime(created_df["created_timestamp"], unit="s", utc=True)
-    created_df["allocated_tokens"] = created_df["tokens_raw"] / 1e18
+    intervals_df = build_intervals(lifecycle_events(stream_df))
 
-    allocations_df = created_df.rename(
-        columns={
-            "allocation_id": "id",
-            "indexer_id": "indexer",
-            "subgraph_deployment_id": "subgraph_deployment",
-        }
-    )[
-        ["id", "indexer", "subgraph_deployment", "allocated_tokens", "created_at"]
+    # Each allocation's last interval holds its current tokens and its close.
+    last_state = intervals_df.drop_duplicates("allocation_id", keep="last").set_index("allocation_id")
+    allocations_df = created_df.rename(columns={"allocation": "id"})[
+        ["id", "indexer", "subgraph_deployment", "source", "timestamp", "block_num"]
     ].copy()
+    allocations_df["created_at"] = pd.to_datetime(allocations_df["timestamp"], unit="s", utc=True)
+    allocations_df["is_legacy"] = allocations_df["source"] == LEGACY
+    allocations_df["allocated_tokens"] = allocations_df["id"].map(last_state["allocated_tokens"])
+    allocations_df["closed_at"] = allocations_df["id"].map(last_state["end_at"])
+    allocations_df["closed_block"] = allocations_df["id"].map(last_state["end_block"])
+
+    epochs = EpochTable.load()
+    epochs.add_epoch_column(allocations_df, "block_num", "created_at_epoch")
+    epochs.add_epoch_column(allocations_df, "closed_block", "closed_at_epoch")
+    allocations_df = allocations_df[
+        [
+            "id",
+            "indexer",
+            "subgraph_deployment",
+            "allocated_tokens",
+            "created_at",
+            "closed_at",
+            "created_at_epoch",
+            "closed_at_epoch",
+            "is_legacy",
+        ]
+    ]
 
-    if not closed_events_df.empty:
-        closed_events_df["closed_at"] = pd.to_datetime(closed_events_df["timestamp"], unit="s", utc=True)
-        closed_df = closed_events_df.groupby("allocation_id", as_index=False)["closed_at"].min()
-        allocations_df = allocations_df.merge(
-            closed_df.rename(columns={"allocation_id": "id"}), on="id", how="left"
-        )
-    else:
-        allocations_df["closed_at"] = pd.NaT
-
-    allocations_df["status"] = allocations_df["closed_at"].apply(
-        lambda x: "Closed" if pd.notnull(x) else "Active"
-    )
-    allocations_df["active_for_indexer"] = allocations_df.apply(
-        lambda row: row["indexer"] if row["status"] == "Active" else None, axis=1
-    )
-
-    fee_df = allocations_df[["id"]].copy()
-    if not allocation_collected_df.empty:
-        allocation_collected_df["rebate_fees"] = allocation_collected_df["rebate_fees_raw"] / 1e18
-        fee_df = fee_df.merge(
-            allocation_collected_df.rename(columns={"allocation_id": "id", "rebate_fees": "collected_rebate_fees"}),
-            on="id",
-            how="left",
-        )
-    else:
-        fee_df["collected_rebate_fees"] = 0.0
-
-    if not rebate_collected_df.empty:
-        rebate_collected_df["query_fees"] = rebate_collected_df["query_fees_raw"] / 1e18
-        rebate_collected_df["query_rebates"] = rebate_collected_df["query_rebates_raw"] / 1e18
-        fee_df = fee_df.merge(
-            rebate_collected_df.rename(
-                columns={
-                    "allocation_id": "id",
-                    "query_fees": "rebate_query_fees",
-                    "query_rebates": "rebate_query_rebates",
-                }
-            ),
-            on="id",
-            how="left",
-        )
-    else:
-        fee_df["rebate_query_fees"] = 0.0
-        fee_df["rebate_query_rebates"] = 0.0
-
-    if not rebate_claimed_df.empty:
-        rebate_claimed_df["legacy_rebates"] = rebate_claimed_df["legacy_rebates_raw"] / 1e18
-        fee_df = fee_df.merge(
-            rebate_claimed_df.rename(columns={"allocation_id": "id", "legacy_rebates": "legacy_query_rebates"}),
-            on="id",
-            how="left",
-        )
-    else:
-        fee_df["legacy_query_rebates"] = 0.0
-
-    fee_df.fillna(0.0, inplace=True)
-    fee_df["query_fees_collected"] = fee_df["collected_rebate_fees"] + fee_df["rebate_query_fees"]
-    fee_df["query_fee_rebates"] = fee_df["rebate_query_rebates"] + fee_df["legacy_query_rebates"]
+    closed = allocations_df["closed_at"].notna()
+    allocations_df["status"] = "Active"
+    allocations_df.loc[closed, "status"] = "Closed"
+    allocations_df["active_for_indexer"] = allocations_df["indexer"].where(~closed, None)
 
-    allocations_df = allocations_df.merge(
-        fee_df[["id", "query_fees_collected", "query_fee_rebates"]], on="id", how="left"
-    )
-    allocations_df[["query_fees_collected", "query_fee_rebates"]] = allocations_df[
-        ["query_fees_collected", "query_fee_rebates"]
-    ].fillna(0.0)
+    fee_df = attribute_allocation_fees(allocation_fee_events(stream_df)).rename(columns={"allocation_id": "id"})
+    allocations_df = allocations_df.merge(fee_df, on="id", how="left")
+    allocations_df[FEE_FIELDS] = allocations_df[FEE_FIELDS].fillna(0.0)
 
 allocations_df.sort_values(["created_at", "id"], inplace=True)
 logger.info("Prepared %s allocation rows.", len(allocations_df))
@@ -229,27 +149,45 @@ logger.info("Prepared %s allocation rows.", len(allocations_df))
 verification_rows: List[Dict[str, str]] = [
     {
         "field": "allocated_tokens",
-        "script_logic": "Tokens from AllocationCreated divided by 1e18 (latest value).",
-        "subgraph_source": "staking.ts handleAllocationCreated / subgraphService.handleAllocationCreated",
-        "notes": "AllocationResized events not replayed yet (documented limitation).",
+        "script_logic": "Tokens of the allocation's last lifecycle interval (AllocationCreated.tokens or the latest AllocationResized.newTokens) / 1e18.",
+        "subgraph_source": "staking.ts handleAllocationCreated / subgraphService.handleAllocationCreated + handleAllocationResized",
+        "notes": "Intervals published as allocation_intervals_arbitrum; resizes of allocations with no creation row are dropped.",
     },
     {
         "field": "status / active_for_indexer",
-        "script_logic": "Mark Closed if any AllocationClosed event observed; otherwise Active and active_for_indexer=indexer.",
-        "subgraph_source": "staking.ts handleAllocationClosed / handleAllocationClosedCobbDouglas",
-        "notes": "Closures sourced from both horizon (arbitrum_staking) and legacy L1 events.",
+        "script_logic": "Closed when the last lifecycle interval ends at the first AllocationClosed; otherwise Active and active_for_indexer=indexer.",
+        "subgraph_source": "staking.ts handleAllocationClosed / handleAllocationClosedCobbDouglas; subgraphService.ts handleAllocationClosed",
+        "notes": "Closures of both generations from the economics stream.",
+    },
+    {
+        "field": "created_at_epoch / closed_at_epoch",
+        "script_logic": "Creation / close block_num mapped to its epoch by binary search over epoch_arbitrum start blocks.",
+        "subgraph_source": "staking.ts / subgraphService.ts createOrLoadEpoch(getL1BlockNumber())",
+        "notes": "Requires network/epoch_arbitrum.py to have run first.",
     },
     {
         "field": "query_fees_collected",
-        "script_logic": "AllocationCollected.rebateFees + RebateCollected.queryFees (sum per allocation).",
-        "subgraph_source": "staking.ts handleAllocationCollected + handleRebateCollected",
-        "notes": "Matches allocation.queryFeesCollected updates; curator rewards not materialized here.",
+        "script_logic": "AllocationCollected.rebateFees + RebateCollected.queryFees + QueryFeesCollected tokensRemaining (sum per allocation).",
+        "subgraph_source": "staking.ts handleAllocationCollected + handleRebateCollected; subgraphService.ts handleQueryFeesCollected",
+        "notes": "tokensRemaining uses economics.PROTOCOL_FEE_PPM.",
     },
     {
         "field": "query_fee_rebates",
-        "script_logic": "RebateCollected.queryRebates + legacy RebateClaimed.tokens.",
-        "subgraph_source": "staking.ts handleRebateCollected + handleRebateClaimed",
-        "notes": "Delegation rewards excluded to stay aligned with allocation.queryFeeRebates.",
+        "script_logic": "Last RebateCollected.queryRebates / legacy RebateClaimed.tokens in block order, plus QueryFeesCollected indexer shares.",
+        "subgraph_source": "staking.ts handleRebateCollected + handleRebateClaimed; subgraphService.ts handleQueryFeesCollected",
+        "notes": "Legacy handlers overwrite the field, Horizon adds to it; distributed_rebates holds the running sum.",
+    },
+    {
+        "field": "curator_rewards / distributed_rebates / delegation_fees",
+        "script_logic": "Sum of curationFees; sum of RebateCollected.queryRebates; last delegationRewards / delegationFees.",
+        "subgraph_source": "staking.ts handleAllocationCollected + handleRebateCollected + handleRebateClaimed",
+        "notes": "",
+    },
+    {
+        "field": "indexing_rewards (+ indexer / delegator split)",
+        "script_logic": "Sum RewardsAssigned / HorizonRewardsAssigned amount (indexer share = amount * indexingRewardCut / 1e6) and IndexingRewardsCollected.",
+        "subgraph_source": "rewardsManager.ts processRewardsAssigned; subgraphService.ts handleIndexingRewardsCollected",
+        "notes": "Does not model the all-to-indexer case when the delegation pool is empty.",
     },
 ]
 
@@ -264,4 +202,17 @@ bq_client.delete_table(bq_table, not_found_ok=True)
 destination_blob_name = "path/in/bucket/allocations_arbitrum.parquet"
 table_id = "allocations_arbitrum"
 save_or_upload_parquet(allocations_df, destination_blob_name, "upload", table_id, project_id="graph-mainnet")
+serve(allocations_df, table_id)
 logger.info("Allocations upload complete.")
+
+logger.info("Uploading allocation lifecycle intervals to BigQuery...")
+bq_client.delete_table("graph-mainnet.nozzle.allocation_intervals_arbitrum", not_found_ok=True)
+save_or_upload_parquet(
+    intervals_df,
+    "path/in/bucket/allocation_intervals_arbitrum.parquet",
+    "upload",
+    "allocation_intervals_arbitrum",
+    project_id="graph-mainnet",
+)
+serve(intervals_df, "allocation_intervals_arbitrum")
+logger.info("Allocation intervals upload complete.")
@@ -14,13 +14,25 @@ except NameError:
 project_root = os.path.abspath(os.path.join(script_dir, '..', '..'))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
+pipeline_root = os.path.abspath(os.path.join(script_dir, '..'))
+if pipeline_root not in sys.path:
+    sys.path.insert(0, pipeline_root)
 
 from nozzle.client import Client
 from nozzle.util import process_query
 from nozzle.util import save_or_upload_parquet
+from pipeline.checkpoints import CheckpointStore
+from pipeline.economics import ECONOMICS_TABLE, economics_totals, legacy_pool_inflows
+from pipeline.partitioned import partitioned_query
+from pipeline.rollups import allocations_to_indexers
+from pipeline.serving import serve
+from pipeline.tables import load_entity_table
 import pandas as pd
 client_url = "grpc+tls://gateway.amp.staging.thegraph.com:443"
 client = Client(client_url)
+# Query results are checkpointed locally (pipeline/checkpoints.py); after a
+# failed upload, rerun with --resume to skip the finished queries.
+checkpoints = CheckpointStore.from_argv('indexer_arbitrum')
 
 
 
@@ -133,78 +145,6 @@ indexer_geohash AS (
     WHERE su.indexer_id IS NULL
 ),
 
-            allocations AS (
-                SELECT 
-                    event['indexer'] AS indexer_id,
-                    COUNT(event['allocationID']) AS total_allocations,
-                    SUM(arrow_cast(event['tokens'], 'Float64')) AS allocated_tokens,
-                    COUNT(event['allocationID']) AS allocation_count
-                FROM arbitrum_staking.allocation_created
-                GROUP BY 1
-        
-                UNION ALL
-        
-                SELECT 
-                    event['indexer'] AS indexer_id,
-                    -COUNT(event['allocationID']) AS total_allocations,
-                    -SUM(arrow_cast(event['tokens'], 'Float64')) AS allocated_tokens,
-                    0 AS allocation_count
-                FROM arbitrum_staking.allocation_closed
-                GROUP BY 1
-                UNION ALL 
-                SELECT 
-                    event['indexer'] AS indexer_id,
-                    -COUNT(event['allocationID']) AS total_allocations,
-                    -SUM(arrow_cast(event['tokens'], 'Float64')) AS allocated_tokens,
-                    0 AS allocation_count
-                FROM (
-                    SELECT 
-                        evm_decode(l.topic1, l.topic2, l.topic3, l.data, 'AllocationClosed(address indexed indexer, bytes32 indexed subgraphDeploymentID, uint256 epoch, uint256 tokens, address indexed allocationID, uint256 effectiveAllocation, address sender, bytes32 poi, bool isPublic)') AS event,
-                        l.address
-                    FROM
-                        "edgeandnode/arbitrum_one@0.0.1".logs l
-                    WHERE
-                        l.address = arrow_cast(x'00669A4CF01450B64E8A2A20E9b1FCB71E61eF03', 'FixedSizeBinary(20)')
-                        AND l.topic0 = evm_topic(
-                        'AllocationClosed(address indexed indexer, bytes32 indexed subgraphDeploymentID, uint256 epoch, uint256 tokens, address indexed allocationID, uint256 effectiveAllocation, address sender, bytes32 poi, bool isPublic)')
-                )
-                GROUP BY 1
-            ),
-      allocations_final AS (
-            SELECT
-                indexer_id, 
-                SUM(total_allocations) AS total_allocations,
-                SUM(allocated_tokens) AS allocated_tokens,
-                SUM(allocation_count) AS allocation_count
-            FROM allocations
-            GROUP BY 1
-        ),
-query_fee AS (
-    SELECT 
-        indexer AS indexer_id, 
-        SUM(queryFeeRebates) AS query_fee_rebates,
-        SUM(queryFeesCollected) AS query_fees_collected
-    FROM (
-        SELECT 
-            event['indexer'] AS indexer,
-            arrow_cast(event['tokens'], 'Float64') AS queryFeeRebates,
-            0 AS queryFeesCollected
-        FROM arbitrum_staking.rebate_claimed
-        UNION ALL 
-        SELECT 
-            event['indexer'] AS indexer,
-            arrow_cast(event['queryRebates'], 'Float64') AS queryFeeRebates,
-            arrow_cast(event['queryFees'], 'Float64') AS queryFeesCollected
-        FROM arbitrum_staking.rebate_collected
-        UNION ALL 
-        SELECT 
-            event['indexer'] AS indexer,
-            0 AS queryFeeRebates,
-            arrow_cast(event['rebateFees'], 'Float64') AS queryFeesCollected
-        FROM arbitrum_staking.allocation_collected
-    ) AS fees
-    GROUP BY indexer
-),
 stakedTokens_1 AS (
     SELECT 
         event['indexer'] AS indexer,
@@ -323,142 +263,116 @@ locked_tokens_final AS (
         locked_tokens_1 a 
     LEFT JOIN 
         locked_tokens_2 b ON a.indexer = b.indexer
-),
-rewards_earned AS (
-    SELECT 
-        event['indexer'] AS indexer, 
-        SUM(arrow_cast(event['amount'], 'Float64')) AS rewards_earned
-    FROM arbitrum_rewards_manager.rewards_assigned
-    GROUP BY 1)
+)
 
 SELECT 
     a.indexer_id AS indexer_wallet,
     a.timestamp AS created_at,
-    b.allocated_tokens/ POWER(10, 18) AS allocated_tokens,
-    b.total_allocations AS allocation_count,
-    b.allocation_count AS total_allocation_count,
-    c.query_fee_rebates / POWER(10, 18) AS query_fee_rebates,
-    c.query_fees_collected / POWER(10, 18) AS query_fees_collected,
     d.staked_tokens / POWER(10, 18) AS staked_tokens,
     f.locked_tokens / POWER(10, 18) AS locked_tokens,
-    g.rewards_earned / POWER(10, 18) AS rewards_earned,
     0 AS unstaked_tokens
 FROM 
     indexer_geohash a
-LEFT JOIN allocations_final b ON a.indexer_id = b.indexer_id
-LEFT JOIN query_fee c ON a.indexer_id = c.indexer_id
 LEFT JOIN stakedTokens_final d ON a.indexer_id = d.indexer
 LEFT JOIN delegated_tokens e ON a.indexer_id = e.indexer
 LEFT JOIN locked_tokens_final f ON a.indexer_id = f.indexer
-LEFT JOIN rewards_earned g ON a.indexer_id = g.indexer
 
 '''
-part_1_query_res = process_query(client, part_1_query)
+part_1_query_res = checkpoints.stage('part_1', part_1_query, lambda: process_query(client, part_1_query))
 
 
 # In[23]:
 
 
 # attribute indexer exchange rate 
-part_2_query = f''' 
-WITH delegation_params AS (
-    SELECT 
-        event['indexer'] AS indexer_id,
-        timestamp,
-        event['indexingRewardCut']::integer as indexing_reward_cut,
-        LEAD(timestamp) OVER (
-            PARTITION BY event['indexer'] 
-            ORDER BY timestamp ASC
-        ) as next_update
-    FROM (
-    SELECT
-        l.timestamp,
-        evm_decode(l.topic1, l.topic2, l.topic3, l.data, 'DelegationParametersUpdated(address indexed indexer, uint32 indexingRewardCut, uint32 queryFeeCut, uint32 cooldownBlocks)') AS event
-    FROM
-        "edgeandnode/arbitrum_one@0.0.1".logs l
-WHERE
-    l.address = arrow_cast(x'00669A4CF01450B64E8A2A20E9b1FCB71E61eF03', 'FixedSizeBinary(20)')
-    AND l.topic0 = evm_topic('DelegationParametersUpdated(address indexed indexer, uint32 indexingRewardCut, uint32 queryFeeCut, uint32 cooldownBlocks)')
-    )
-),
-all_events AS (
-    -- RewardsAssigned events with reward cut applied
-    SELECT 
-        e.event['indexer'] AS indexer_id,
-        arrow_cast(e.event['amount'], 'Float64') - (arrow_cast(e.event['amount'], 'Float64') * COALESCE(d.indexing_reward_cut, 0) / 1000000)as tokens,
-        0 as shares
-    FROM arbitrum_rewards_manager.rewards_assigned e
-    LEFT JOIN delegation_params d 
-        ON e.event['indexer'] = d.indexer_id
-        AND e.timestamp >= d.timestamp 
-        AND (e.timestamp < d.next_update OR d.next_update IS NULL)
-
-
-    UNION ALL
-
+# Full-history StakeDelegated / StakeDelegatedLocked sums, run as parallel
+# block_num partitions (see pipeline/partitioned.py).  The legacy pool's
+# reward and rebate inflows (RewardsAssigned / legacy-allocation
+# HorizonRewardsAssigned delegator shares, RebateClaimed.delegationFees,
+# RebateCollected.delegationRewards) come from the allocation-economics
+# stream below.
+part_2_query = ''' 
+SELECT 
+    indexer_wallet,
+    SUM(tokens) as delegated_tokens,
+    SUM(shares) as delegator_shares
+FROM (
     -- StakeDelegated events 
     SELECT 
-        a.event['indexer'] AS indexer_id,
+        a.event['indexer'] AS indexer_wallet,
         arrow_cast(a.event['tokens'], 'Float64') as tokens,
         arrow_cast(a.event['shares'], 'Float64') as shares
     FROM arbitrum_staking.stake_delegated a
+    WHERE {block_range:a}
 
     UNION ALL
 
     -- StakeDelegatedLocked events
     SELECT 
-        a.event['indexer'] AS indexer_id,
+        a.event['indexer'] AS indexer_wallet,
         -arrow_cast(a.event['tokens'], 'Float64') as tokens,
         -arrow_cast(a.event['shares'], 'Float64') as shares
     FROM arbitrum_staking.stake_delegated_locked a
-
-    UNION ALL
-
-    -- RebateClaimed events
-    SELECT 
-        event['indexer'] AS indexer_id,
-        arrow_cast(event['delegationFees'], 'Float64') as tokens,
-        0 as shares
-    FROM arbitrum_staking.rebate_claimed
-
-    UNION ALL
-
-    -- RebateCollected events
-    SELECT 
-        event['indexer'] AS indexer_id,
-        arrow_cast(event['delegationRewards'], 'Float64') as tokens,
-        0 as shares
-    FROM arbitrum_staking.rebate_collected
-),
-final_balances AS (
-    SELECT 
-        indexer_id,
-        SUM(tokens) as delegated_tokens,
-        SUM(shares) as delegator_shares
-    FROM all_events
-    GROUP BY indexer_id
-)
-SELECT 
-    indexer_id as indexer_wallet,
-    delegated_tokens / POWER(10, 18) as delegated_tokens,
-    delegator_shares / POWER(10, 18) as delegator_shares,
-    CASE 
-        WHEN delegator_shares = 0 THEN 1.0
-        ELSE delegated_tokens/delegator_shares
-    END as delegation_exchange_rate
-FROM final_balances
+    WHERE {block_range:a}
+) AS all_events
+GROUP BY indexer_wallet
 '''
 
-
-part_2_query_res = process_query(client, part_2_query)
+part_2_query_res = checkpoints.stage('part_2', part_2_query, lambda: partitioned_query(
+    client_url,
+    part_2_query,
+    keys=['indexer_wallet'],
+    aggregates={'delegated_tokens': 'sum', 'delegator_shares': 'sum'},
+    tables=[
+        'arbitrum_staking.stake_delegated',
+        'arbitrum_staking.stake_delegated_locked',
+    ],
+))
+
+# Rewards and query fees of both protocol generations, pre-decoded by
+# network/allocation_economics_arbitrum.py (pipeline/economics.py).
+indexer_amounts = [
+    'indexing_rewards', 'indexing_indexer_rewards', 'indexing_delegator_rewards',
+    'query_fees_collected', 'query_fee_rebates', 'delegation_fees',
+]
+stream = load_entity_table(ECONOMICS_TABLE, ['source', 'indexer', *indexer_amounts])
+economics_res = economics_totals(stream, 'indexer', indexer_amounts[:-1]).rename(columns={
+    'indexer': 'indexer_wallet',
+    'indexing_rewards': 'rewards_earned',
+    'indexing_indexer_rewards': 'indexer_indexing_rewards',
+    'indexing_delegator_rewards': 'delegator_indexing_rewards',
+})
+# Only legacy allocations pay into the indexer's own delegation pool.
+pool_inflows = legacy_pool_inflows(stream, 'indexer', scale=1).rename(columns={'indexer': 'indexer_wallet'})
+part_2_query_res = pd.merge(part_2_query_res, pool_inflows, on=['indexer_wallet'], how='outer')
+part_2_query_res[['delegated_tokens', 'delegator_shares', 'pool_inflow']] = part_2_query_res[
+    ['delegated_tokens', 'delegator_shares', 'pool_inflow']
+].fillna(0)
+part_2_query_res['delegated_tokens'] += part_2_query_res.pop('pool_inflow')
+
+# The exchange rate is only valid on full-history totals, so it is taken
+# after the partitions are merged.
+part_2_query_res['delegation_exchange_rate'] = (
+    part_2_query_res['delegated_tokens'] / part_2_query_res['delegator_shares'].where(part_2_query_res['delegator_shares'] != 0)
+).fillna(1.0)
+part_2_query_res[['delegated_tokens', 'delegator_shares']] = part_2_query_res[['delegated_tokens', 'delegator_shares']] / 10**18
 
 
 # In[24]:
 
 
+# allocatedTokens, allocationCount and totalAllocationCount are rolled up
+# from allocations_arbitrum (built first) instead of rescanning
+# AllocationCreated/AllocationClosed.  See pipeline/rollups.py.
+allocations = load_entity_table('allocations_arbitrum', ['indexer', 'allocated_tokens', 'status'])
+allocation_rollup = allocations_to_indexers(allocations).rename(columns={'indexer': 'indexer_wallet'})
+
 result = pd.merge(part_1_query_res, part_2_query_res, on=['indexer_wallet'], how='left')
+result = pd.merge(result, economics_res, on=['indexer_wallet'], how='left')
+result = pd.merge(result, allocation_rollup, on=['indexer_wallet'], how='left')
 
 result.fillna(0, inplace=True)
+result[['allocation_count', 'total_allocation_count']] = result[['allocation_count', 'total_allocation_count']].astype(int)
 result['delegation_exchange_rate'] = result['delegation_exchange_rate'].replace(0, 1)
 
 # # In[25]:
@@ -474,4 +388,6 @@ destination_blob_name = 'path/in/bucket/indexer_arbitrum.parquet'
 table_id = 'indexer_arbitrum'
 
 save_or_upload_parquet(result, destination_blob_name, "upload", table_id, project_id='graph-mainnet')
+serve(result, table_id)
+checkpoints.complete()
 
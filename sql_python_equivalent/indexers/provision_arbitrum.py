@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Horizon Provision and ThawRequest flat tables for Arbitrum (graph-network subgraph).
+
+Output provision_arbitrum, one row per (indexer, data_service) provision:
+- id: indexerAddress-verifierAddress (createOrLoadProvision joinID).
+- tokens_provisioned / tokens_thawing / tokens_slashed_*: ProvisionCreated,
+  ProvisionIncreased, ProvisionThawed, TokensDeprovisioned, ProvisionSlashed.
+- delegated_tokens / delegated_thawing_tokens / delegator_shares:
+  TokensToDelegationPoolAdded, TokensDelegated, DelegationSlashed,
+  TokensUndelegated, DelegatedTokensWithdrawn; SubgraphService provisions
+  start from the indexer's pool before their first event and also take the
+  later legacy reward inflows (processRewardsAssigned).
+- max_verifier_cut(_pending) / thawing_period(_pending): ProvisionCreated,
+  ProvisionParametersSet / ProvisionParametersStaged.
+- query_fee_cut / indexing_fee_cut / indexing_rewards_cut: DelegationFeeCutSet,
+  inverted to 1M - feeCut as in handleDelegationFeeCutSet.
+- thawing_until: latest Provision-type ThawRequestCreated.thawingUntil.
+- created_at (unix seconds) and block_hi, the highest block folded in.
+- synced_block: the block this refresh read every staking event up to.
+
+Output thaw_request_arbitrum, one row per ThawRequest (horizonStaking.ts
+handleThawRequestCreated / handleThawRequestFulfilled).
+
+Each run loads both published tables, reads the blocks after their
+synced_block up to the current log head (one to_block for every query, so no
+query runs ahead of another) and folds them in (pipeline/provisions.py): balances add,
+parameters take the latest write, and fulfilments resolve against every
+known request through the ThawQueue id index.
+"""
+
+import logging
+import os
+import sys
+from typing import List, Dict
+
+import pandas as pd
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+from nozzle.util import save_or_upload_parquet
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+try:
+    SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+except NameError:  # pragma: no cover
+    SCRIPT_DIR = os.path.dirname(os.path.abspath(sys.argv[0]))
+PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, "..", ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+PIPELINE_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, ".."))
+if PIPELINE_ROOT not in sys.path:
+    sys.path.insert(0, PIPELINE_ROOT)
+
+from pipeline.addresses import ADDRESSES, decode_columns, encode_columns
+from pipeline.delegation import ExchangeRateTimeline, delegation_deltas_query, pool_deltas, position
+from pipeline.economics import ECONOMICS_TABLE, POOL_STREAM_COLUMNS, legacy_pool_inflow_events
+from pipeline.executor import shared_executor
+from pipeline.partitioned import block_bounds
+from pipeline.provisions import (
+    PROVISION_COLUMNS,
+    PROVISION_KEYS,
+    SUBGRAPH_SERVICE_ADDRESS,
+    SYNCED_COLUMN,
+    THAW_REQUEST_COLUMNS,
+    ThawQueue,
+    first_events,
+    fold_pool_rewards,
+    high_water,
+    indexer_pool_moves_query,
+    merge_provisions,
+    pool_moves_before,
+    provision_deltas_query,
+    provision_parameters_query,
+    seed_legacy_pool,
+    thaw_fulfilments_query,
+    thaw_requests_query,
+)
+from pipeline.serving import serve
+from pipeline.tables import load_entity_table
+
+CLIENT_URL = "grpc+tls://gateway.amp.staging.thegraph.com:443"
+WEI = 1e18
+LOGS_TABLE = '"edgeandnode/arbitrum_one@0.0.1".logs'
+executor = shared_executor(CLIENT_URL)
+
+logger.info("Starting Provision / ThawRequest refresh for Arbitrum.")
+
+
+def load_published(table_id: str, columns: List[str], addresses: List[str]):
+    try:
+        frame = load_entity_table(table_id, columns=[*columns, SYNCED_COLUMN])
+    except NotFound:
+        logger.info("No published %s table yet; building from the full history.", table_id)
+        return None
+    return encode_columns(frame, addresses)
+
+
+existing_provisions = load_published("provision_arbitrum", PROVISION_COLUMNS, PROVISION_KEYS)
+existing_requests = load_published(
+    "thaw_request_arbitrum", THAW_REQUEST_COLUMNS, ["id", *PROVISION_KEYS, "owner"]
+)
+after_block = high_water(existing_provisions, existing_requests)
+_, to_block = block_bounds(executor, [LOGS_TABLE])
+logger.info("Reading Horizon staking events in blocks %s-%s...", after_block + 1, to_block)
+
+deltas_df = encode_columns(executor.run(provision_deltas_query(after_block, to_block)), PROVISION_KEYS)
+deltas_df["first_at"] = deltas_df["first_at"].astype("float64")
+parameters_df = encode_columns(executor.run(provision_parameters_query(after_block, to_block)), PROVISION_KEYS)
+parameters_df["timestamp"] = parameters_df["timestamp"].astype("float64")
+created_df = encode_columns(
+    executor.run(thaw_requests_query(after_block, to_block)), ["id", *PROVISION_KEYS, "owner"]
+)
+fulfilled_df = encode_columns(executor.run(thaw_fulfilments_query(after_block, to_block)), ["id"])
+logger.info(
+    "Fetched %s balance sums, %s parameter writes, %s thaw requests and %s fulfilments.",
+    len(deltas_df), len(parameters_df), len(created_df), len(fulfilled_df),
+)
+
+# %%
+# ThawRequests: new requests join the queue, then fulfilments resolve by id.
+queue = ThawQueue(existing_requests) if existing_requests is not None else ThawQueue.empty()
+queue = queue.extend(created_df, scale=WEI)
+queue.fulfil(fulfilled_df, scale=WEI)
+logger.info("%s thaw requests, %s still pending.", len(queue.requests), len(queue.pending()))
+
+# %%
+# Provisions: stored rows plus this refresh's balances, parameters and thaws.
+provisions_df = merge_provisions(existing_provisions, deltas_df, parameters_df, queue.thawing_until(), scale=WEI)
+
+known = (
+    pd.MultiIndex.from_frame(existing_provisions[PROVISION_KEYS])
+    if existing_provisions is not None else pd.MultiIndex.from_arrays([[], []], names=PROVISION_KEYS)
+)
+new_keys = pd.MultiIndex.from_frame(provisions_df[PROVISION_KEYS]).difference(known)
+subgraph_service = ADDRESSES.intern(SUBGRAPH_SERVICE_ADDRESS)
+if (provisions_df["data_service"] == subgraph_service).any():
+    # The legacy pool as indexer_arbitrum and the exchange-rate timeline see
+    # it: delegations plus the economics stream's pool inflows, up to to_block,
+    # with indexers encoded like the provision keys.
+    stream_df = load_entity_table(ECONOMICS_TABLE, columns=POOL_STREAM_COLUMNS)
+    timeline = ExchangeRateTimeline.from_deltas(pool_deltas(
+        encode_columns(executor.run(delegation_deltas_query(to_block=to_block)), ["indexer"]),
+        encode_columns(legacy_pool_inflow_events(stream_df[stream_df["block_num"] <= to_block]), ["indexer"]),
+    ))
+    created_df = first_events(deltas_df, parameters_df)
+    created_df = created_df[
+        pd.MultiIndex.from_frame(created_df[PROVISION_KEYS]).isin(new_keys)
+        & (created_df["data_service"] == subgraph_service).to_numpy()
+    ]
+    if not created_df.empty:
+        # createOrLoadProvision copies the Indexer's pool as it stood before
+        # the provision's first event: the legacy pool plus the Horizon moves
+        # on other verifiers, thawing tokens included.
+        moves_df = encode_columns(executor.run(indexer_pool_moves_query(to_block)), ["indexer"])
+        seeds_df = pool_moves_before(moves_df, created_df)
+        legacy = timeline.pool_before(
+            created_df["indexer"].to_numpy(), position(created_df["block_num"], created_df["log_index"])
+        )
+        seeds_df["delegated_tokens"] += legacy["tokens"].to_numpy()
+        seeds_df["delegator_shares"] += legacy["shares"].to_numpy()
+        provisions_df = seed_legacy_pool(provisions_df, seeds_df, scale=WEI)
+    provisions_df = fold_pool_rewards(
+        provisions_df, timeline.rewards, subgraph_service, after_block, created_df, scale=WEI
+    )
+
+# %%
+provisions_df["created_at"] = provisions_df["created_at"].astype("Int64")
+decode_columns(provisions_df, PROVISION_KEYS)
+provisions_df.insert(0, "id", provisions_df["indexer"] + "-" + provisions_df["data_service"])
+provisions_df.sort_values(PROVISION_KEYS, inplace=True, ignore_index=True)
+provisions_df[SYNCED_COLUMN] = to_block
+
+requests_df = queue.requests.copy()
+decode_columns(requests_df, ["id", *PROVISION_KEYS, "owner"])
+requests_df[SYNCED_COLUMN] = to_block
+logger.info("Prepared %s provisions and %s thaw requests.", len(provisions_df), len(requests_df))
+
+verification_rows: List[Dict[str, str]] = [
+    {
+        "field": "tokens_* / delegated_* / delegator_shares",
+        "script_logic": "Signed per-event amounts (PROVISION_DELTAS) summed per provision and added to the stored balances.",
+        "subgraph_source": "horizonStaking.ts provision and delegation handlers",
+        "notes": "New SubgraphService provisions seeded with the indexer pool before their first event, then credited the legacy reward inflows; delegationExchangeRate and advanced metrics not included.",
+    },
+    {
+        "field": "max_verifier_cut / thawing_period / *_fee_cut",
+        "script_logic": "Latest write per field by (block_num, log_index); cuts stored as 1M - feeCut.",
+        "subgraph_source": "handleProvisionCreated / ParametersSet / ParametersStaged / DelegationFeeCutSet",
+        "notes": "Fields never written keep createOrLoadProvision defaults.",
+    },
+    {
+        "field": "thaw_request_arbitrum",
+        "script_logic": "ThawRequestCreated rows; ThawRequestFulfilled resolved by id with a binary search over the queue index.",
+        "subgraph_source": "handleThawRequestCreated / handleThawRequestFulfilled",
+        "notes": "Delegation-type requests do not update DelegatedStake.lockedUntil here.",
+    },
+]
+
+verification_table = pd.DataFrame(verification_rows)
+logger.info("Verification table:\n%s", verification_table.to_string(index=False))
+
+logger.info("Uploading Provision and ThawRequest tables to BigQuery...")
+bq_client = bigquery.Client(project="graph-mainnet")
+for table_id, frame in (("provision_arbitrum", provisions_df), ("thaw_request_arbitrum", requests_df)):
+    bq_client.delete_table(f"graph-mainnet.nozzle.{table_id}", not_found_ok=True)
+    save_or_upload_parquet(frame, f"path/in/bucket/{table_id}.parquet", "upload", table_id, project_id="graph-mainnet")
+    serve(frame, table_id)
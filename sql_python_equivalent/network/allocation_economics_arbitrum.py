@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Allocation-economics event stream for Arbitrum (legacy staking + Horizon).
+
+Output allocation_economics_arbitrum, one row per decoded log
+(pipeline/economics.py):
+- source / event_type: 'legacy' or 'horizon' and the contract event name.
+- indexer, allocation, subgraph_deployment, tx_hash, block_num, log_index,
+  timestamp (unix seconds).
+- allocated_tokens: signed delta (created +tokens, resized newTokens - oldTokens,
+  closed -tokens).
+- indexing_rewards / indexing_indexer_rewards / indexing_delegator_rewards:
+  RewardsAssigned and legacy-allocation HorizonRewardsAssigned split by
+  indexingRewardCut; IndexingRewardsCollected as emitted.
+- query_fees_collected, curator_rewards, distributed_rebates,
+  total_query_fees, taxed_query_fees, query_fee_rebates, delegation_fees:
+  AllocationCollected, RebateCollected, RebateClaimed and QueryFeesCollected
+  in the amounts their handlers apply.
+
+Amounts stay in wei.  This is built first each run; allocations_arbitrum,
+indexer_arbitrum, subgraph_deployment_arbitrum and graph_network_arbitrum
+aggregate it instead of decoding either protocol generation themselves.
+Each run loads the published stream and appends only blocks after its
+highest block_num, up to the logs head; rows are unique on (tx_hash, log_index).
+Hashes of the last REORG_WINDOW_BLOCKS blocks are kept in
+allocation_economics_block_hashes_arbitrum; when one changes, the stream
+drops its rows above the fork and re-reads from there (pipeline/reorgs.py).
+"""
+
+import logging
+import os
+import sys
+from typing import List, Dict
+
+import pandas as pd
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+from nozzle.util import save_or_upload_parquet
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+try:
+    SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+except NameError:  # pragma: no cover
+    SCRIPT_DIR = os.path.dirname(os.path.abspath(sys.argv[0]))
+PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, "..", ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+PIPELINE_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, ".."))
+if PIPELINE_ROOT not in sys.path:
+    sys.path.insert(0, PIPELINE_ROOT)
+
+from pipeline.economics import ECONOMICS_TABLE, STREAM_COLUMNS, build_stream, economics_query, high_water
+from pipeline.executor import shared_executor
+from pipeline.partitioned import block_bounds
+from pipeline.reorgs import HASH_COLUMNS, ReorgLog, block_hashes_query, truncate_rows
+from pipeline.serving import serve
+from pipeline.tables import load_entity_table
+
+CLIENT_URL = "grpc+tls://gateway.amp.staging.thegraph.com:443"
+LOGS_TABLE = '"edgeandnode/arbitrum_one@0.0.1".logs'
+HASHES_TABLE = "allocation_economics_block_hashes_arbitrum"
+executor = shared_executor(CLIENT_URL)
+
+logger.info("Starting allocation-economics stream refresh for Arbitrum.")
+
+try:
+    existing_df = load_entity_table(ECONOMICS_TABLE, columns=STREAM_COLUMNS)
+except NotFound:
+    logger.info("No published %s table yet; decoding the full history.", ECONOMICS_TABLE)
+    existing_df = None
+
+after_block = high_water(existing_df)
+_, head = block_bounds(executor, [LOGS_TABLE])
+
+# The stream is append-only, so a reorg only truncates it back to the fork.
+try:
+    logged_hashes = load_entity_table(HASHES_TABLE, columns=HASH_COLUMNS)
+except NotFound:
+    logged_hashes = None
+reorg_log = ReorgLog(logged_hashes)
+current_hashes = executor.run(block_hashes_query(*reorg_log.check_range(head)))
+fork = reorg_log.fork_point(current_hashes)
+if fork is not None:
+    existing_df = truncate_rows(existing_df, fork)
+    after_block = min(after_block, fork)
+reorg_log.record(current_hashes, head)
+
+logger.info("Decoding legacy and Horizon allocation events in blocks %s-%s...", after_block + 1, head)
+new_df = executor.run(economics_query(after_block, head))
+logger.info("Fetched %s new events.", len(new_df))
+
+stream_df = build_stream(existing_df, new_df)
+logger.info(
+    "Stream holds %s events (%s legacy, %s horizon).",
+    len(stream_df), int((stream_df["source"] == "legacy").sum()), int((stream_df["source"] == "horizon").sum()),
+)
+
+verification_rows: List[Dict[str, str]] = [
+    {
+        "field": "allocated_tokens",
+        "script_logic": "Signed token delta per AllocationCreated / AllocationResized / AllocationClosed, both generations.",
+        "subgraph_source": "staking.ts handleAllocationCreated / Closed; subgraphService.ts handleAllocationCreated / Resized / Closed",
+        "notes": "Running sum per allocation gives the lifecycle states (economics.lifecycle_events).",
+    },
+    {
+        "field": "indexing_* rewards",
+        "script_logic": "RewardsAssigned / HorizonRewardsAssigned split by indexingRewardCut at the event; IndexingRewardsCollected as emitted.",
+        "subgraph_source": "rewardsManager.ts processRewardsAssigned / handleHorizonRewardsAssigned; subgraphService.ts handleIndexingRewardsCollected",
+        "notes": "HorizonRewardsAssigned kept for legacy allocations only; the all-to-indexer case for an empty delegation pool is not modelled.",
+    },
+    {
+        "field": "query fee columns",
+        "script_logic": "Legacy AllocationCollected / RebateCollected / RebateClaimed amounts; QueryFeesCollected tokensRemaining split by queryFeeCut.",
+        "subgraph_source": "staking.ts handleAllocationCollected / handleRebateCollected / handleRebateClaimed; subgraphService.ts handleQueryFeesCollected",
+        "notes": "protocolFeePercentage fixed at economics.PROTOCOL_FEE_PPM; the all-to-indexer case for an empty provision pool is not modelled.",
+    },
+]
+
+verification_table = pd.DataFrame(verification_rows)
+logger.info("Verification table:\n%s", verification_table.to_string(index=False))
+
+logger.info("Uploading allocation-economics stream to BigQuery...")
+bq_client = bigquery.Client(project="graph-mainnet")
+for table_id, frame in ((ECONOMICS_TABLE, stream_df), (HASHES_TABLE, reorg_log.hashes)):
+    bq_client.delete_table(f"graph-mainnet.nozzle.{table_id}", not_found_ok=True)
+    save_or_upload_parquet(frame, f"path/in/bucket/{table_id}.parquet", "upload", table_id, project_id="graph-mainnet")
+    serve(frame, table_id)
+logger.info("Allocation-economics upload complete.")
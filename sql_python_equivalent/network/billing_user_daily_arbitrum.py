@@ -21,6 +21,11 @@ Event sources:
 
 Pre-built nozzle tables for these GraphPayments events are not yet available on Arbitrum,
 so we decode the canonical log stream from edgeandnode/arbitrum_one@0.0.1 as a fallback.
+
+With PIPELINE_MEMORY_BUDGET set, events are fetched in block ranges, spilled to
+disk by user_id and aggregated one batch of users at a time (pipeline/spill.py);
+the output is the same as the in-memory path.  The per-user aggregation
+(pipeline/billing.py) is sharded across cores by user_id (pipeline/shards.py).
 """
 
 import logging
@@ -43,6 +48,16 @@ except NameError:  # pragma: no cover
 PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, "..", ".."))
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
+PIPELINE_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, ".."))
+if PIPELINE_ROOT not in sys.path:
+    sys.path.insert(0, PIPELINE_ROOT)
+
+from pipeline.billing import DAILY_COLUMNS, billing_daily_for_users
+from pipeline.executor import QueryExecutor
+from pipeline.partitioned import block_bounds, render_partition
+from pipeline.serving import serve
+from pipeline.shards import shard_by_key
+from pipeline.spill import MEMORY_BUDGET, ranged_chunks, run_by_key
 
 CLIENT_URL = "grpc+tls://gateway.amp.staging.thegraph.com:443"
 client = Client(CLIENT_URL)
@@ -62,6 +77,7 @@ WITH tokens_added AS (
     FROM "edgeandnode/arbitrum_one@0.0.1".logs l
     WHERE l.address = arrow_cast(x'{_GRAPH_PAYMENTS_HEX}', 'FixedSizeBinary(20)')
       AND l.topic0 = evm_topic('TokensAdded(address indexed user, uint256 amount)')
+      AND {{block_range:l}}
 ),
 tokens_removed AS (
     SELECT
@@ -71,6 +87,7 @@ tokens_removed AS (
     FROM "edgeandnode/arbitrum_one@0.0.1".logs l
     WHERE l.address = arrow_cast(x'{_GRAPH_PAYMENTS_HEX}', 'FixedSizeBinary(20)')
       AND l.topic0 = evm_topic('TokensRemoved(address indexed from, address indexed to, uint256 amount)')
+      AND {{block_range:l}}
 ),
 tokens_pulled AS (
     SELECT
@@ -80,6 +97,7 @@ tokens_pulled AS (
     FROM "edgeandnode/arbitrum_one@0.0.1".logs l
     WHERE l.address = arrow_cast(x'{_GRAPH_PAYMENTS_HEX}', 'FixedSizeBinary(20)')
       AND l.topic0 = evm_topic('TokensPulled(address indexed user, uint256 amount)')
+      AND {{block_range:l}}
 ),
 combined AS (
     SELECT
@@ -107,79 +125,31 @@ SELECT user_id, timestamp, event_type, amount_raw
 FROM combined
 """
 
-logger.info("Querying GraphPayments billing events...")
-billing_events = process_query(client, billing_events_query)
-logger.info("Fetched %s raw billing rows.", len(billing_events))
-
-if billing_events.empty:
-    logger.warning("No billing events returned; emitting empty table.")
-    daily_df = pd.DataFrame(
-        columns=[
-            "id",
-            "user_id",
-            "event_date",
-            "billing_balance",
-            "total_tokens_added",
-            "total_tokens_pulled",
-            "total_tokens_removed",
-            "accumulated_tokens_added",
-            "delta_tokens_added",
-        ]
-    )
-else:
-    billing_events["timestamp"] = pd.to_datetime(billing_events["timestamp"], unit="s", utc=True)
-    billing_events["tokens"] = billing_events["amount_raw"] / 1e18
-
-    billing_events["added_tokens"] = billing_events["tokens"].where(
-        billing_events["event_type"] == "added", 0.0
-    )
-    billing_events["total_tokens_pulled"] = billing_events["tokens"].where(
-        billing_events["event_type"] == "pulled", 0.0
-    )
-    billing_events["total_tokens_removed"] = billing_events["tokens"].where(
-        billing_events["event_type"] == "removed", 0.0
-    )
-    billing_events["net_tokens"] = (
-        billing_events["added_tokens"]
-        - billing_events["total_tokens_pulled"]
-        - billing_events["total_tokens_removed"]
-    )
-
-    billing_events["event_date"] = billing_events["timestamp"].dt.floor("D")
+LOGS_TABLE = '"edgeandnode/arbitrum_one@0.0.1".logs'
+SPILL_CHUNKS = 64
+_OPEN_END = 1 << 62
 
-    logger.info("Aggregating per (user, event_date)...")
-    grouped = (
-        billing_events.groupby(["user_id", "event_date"], as_index=False)[
-            ["added_tokens", "total_tokens_pulled", "total_tokens_removed", "net_tokens"]
-        ].sum()
-    )
 
-    grouped = grouped.sort_values(["user_id", "event_date"])
-    grouped["accumulated_tokens_added"] = grouped.groupby("user_id")["added_tokens"].cumsum()
-    grouped["delta_tokens_added"] = grouped.groupby("user_id")["added_tokens"].diff().fillna(
-        grouped["added_tokens"]
-    )
+def build_billing_user_daily(frames: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    if frames["events"].empty:
+        return pd.DataFrame(columns=DAILY_COLUMNS)
+    return shard_by_key(frames["events"], ["user_id"], billing_daily_for_users)
 
-    grouped["billing_balance"] = grouped["net_tokens"]
-    grouped.rename(columns={"added_tokens": "total_tokens_added"}, inplace=True)
 
-    grouped["id"] = grouped.apply(
-        lambda row: f"{row['user_id']}-{row['event_date'].strftime('%Y-%m-%d')}", axis=1
+logger.info("Querying GraphPayments billing events...")
+if MEMORY_BUDGET is None:
+    billing_source = process_query(client, render_partition(billing_events_query, 0, _OPEN_END))
+    logger.info("Fetched %s raw billing rows.", len(billing_source))
+else:
+    executor = QueryExecutor(CLIENT_URL)
+    billing_source = ranged_chunks(
+        executor, billing_events_query, block_bounds(executor, [LOGS_TABLE]), SPILL_CHUNKS
     )
 
-    daily_df = grouped[
-        [
-            "id",
-            "user_id",
-            "event_date",
-            "billing_balance",
-            "total_tokens_added",
-            "total_tokens_pulled",
-            "total_tokens_removed",
-            "accumulated_tokens_added",
-            "delta_tokens_added",
-        ]
-    ].copy()
+daily_df = run_by_key({"events": billing_source}, ["user_id"], build_billing_user_daily)
+if daily_df.empty:
+    logger.warning("No billing events returned; emitting empty table.")
+daily_df = daily_df.sort_values(["user_id", "event_date"], ignore_index=True)
 
 logger.info("Prepared %s BillingUserDaily rows.", len(daily_df))
 
@@ -233,4 +203,5 @@ bq_client.delete_table(bq_table, not_found_ok=True)
 destination_blob_name = "path/in/bucket/billing_user_daily_arbitrum.parquet"
 table_id = "billing_user_daily_arbitrum"
 save_or_upload_parquet(daily_df, destination_blob_name, "upload", table_id, project_id="graph-mainnet")
+serve(daily_df, table_id)
 logger.info("Upload complete. Rows written: %s", len(daily_df))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Streaming refresh of signal_arbitrum, delegated_stake_arbitrum and
+allocations_arbitrum (pipeline/streaming.py).
+
+Runs until interrupted.  Every STREAM_POLL_SECONDS it folds the blocks up to
+head - STREAM_CONFIRMATIONS into the in-memory state of each table; every
+STREAM_FLUSH_SECONDS it republishes the tables that changed since the last
+flush, so they trail the chain by about the flush cadence instead of a day.
+Each poll logs head_lag_seconds (nozzle behind the wall clock),
+folded_lag_seconds and flushed_lag_seconds.
+
+The first poll folds each table's whole history, as its build does; the
+allocations start from the published allocation_economics_arbitrum stream
+and the epochs from epoch_arbitrum, so network/allocation_economics_arbitrum.py
+and network/epoch_arbitrum.py must have run at least once; allocations created
+or closed past the epoch table's synced_block publish a <NA> epoch until the
+stream is restarted on a refreshed table.  While the stream
+runs it owns the three tables: run it instead of
+curators/signal_arbitrum_amp.py, delegators/delegated_stake_arbitrum.py and
+indexers/allocations_arbitrum.py, not alongside them.
+allocation_intervals_arbitrum is left to the build.
+"""
+
+import logging
+import os
+import sys
+from typing import List
+
+import pandas as pd
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+from nozzle.util import save_or_upload_parquet
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+try:
+    SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+except NameError:  # pragma: no cover
+    SCRIPT_DIR = os.path.dirname(os.path.abspath(sys.argv[0]))
+PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, "..", ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+PIPELINE_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, ".."))
+if PIPELINE_ROOT not in sys.path:
+    sys.path.insert(0, PIPELINE_ROOT)
+
+from pipeline.economics import ECONOMICS_TABLE, STREAM_COLUMNS
+from pipeline.epochs import EpochTable
+from pipeline.executor import shared_executor
+from pipeline.serving import serve
+from pipeline.streaming import AllocationFeed, DelegatedStakeFeed, EntityStream, Feed, SignalFeed
+from pipeline.tables import load_entity_table
+
+CLIENT_URL = "grpc+tls://gateway.amp.staging.thegraph.com:443"
+executor = shared_executor(CLIENT_URL)
+bq_client = bigquery.Client(project="graph-mainnet")
+
+
+def build_feeds() -> List[Feed]:
+    try:
+        stream_df = load_entity_table(ECONOMICS_TABLE, columns=STREAM_COLUMNS)
+    except NotFound:
+        logger.info("No published %s table yet; allocations fold the full history.", ECONOMICS_TABLE)
+        stream_df = None
+    return [SignalFeed(), DelegatedStakeFeed(), AllocationFeed(EpochTable.load(), stream_df)]
+
+
+def publish(feed: Feed, changed: pd.DataFrame) -> None:
+    """Republish a table with changed rows from the stream's full state."""
+    table_id = feed.table_id
+    snapshot = feed.rows()
+    logger.info("Publishing %s: %s rows (%s changed).", table_id, len(snapshot), len(changed))
+    bq_client.delete_table(f"graph-mainnet.nozzle.{table_id}", not_found_ok=True)
+    save_or_upload_parquet(snapshot, f"path/in/bucket/{table_id}.parquet", "upload", table_id, project_id="graph-mainnet")
+    serve(snapshot, table_id)
+
+
+logger.info("Starting entity stream for Arbitrum.")
+EntityStream(executor, build_feeds).run(publish)
+logger.info("Entity stream stopped.")
@@ -13,6 +13,7 @@ Fields covered (schema.graphql lines 234-308):
 Balance source:
 - graphToken.handleTransfer updates GraphAccount.balance on each Transfer; we
   replicate the same netting logic by summing incoming and outgoing transfers.
+  The netting happens in the query (one row per account), not in pandas.
 
 Creation sources consulted for created_at:
 - GraphToken transfers (graphToken.ts)
@@ -24,6 +25,9 @@ Creation sources consulted for created_at:
 Pre-built nozzle tables for GraphToken transfers on Arbitrum are not yet
 available, so we decode edgeandnode/arbitrum_one@0.0.1 logs for that component.
 All other activity sources rely on curated event tables.
+
+With PIPELINE_MEMORY_BUDGET set, the per-account merge and post-processing run
+one spilled batch of accounts at a time (pipeline/spill.py).
 """
 
 import logging
@@ -33,8 +37,7 @@ from typing import List, Dict
 
 import pandas as pd
 from google.cloud import bigquery
-from nozzle.client import Client
-from nozzle.util import process_query, save_or_upload_parquet
+from nozzle.util import save_or_upload_parquet
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -46,9 +49,18 @@ except NameError:  # pragma: no cover
 PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, "..", ".."))
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
+PIPELINE_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, ".."))
+if PIPELINE_ROOT not in sys.path:
+    sys.path.insert(0, PIPELINE_ROOT)
+
+from pipeline.addresses import decode_columns, encode_columns
+from pipeline.executor import QueryExecutor
+from pipeline.partitioned import partitioned_query
+from pipeline.serving import serve
+from pipeline.spill import run_by_key
 
 CLIENT_URL = "grpc+tls://gateway.amp.staging.thegraph.com:443"
-client = Client(CLIENT_URL)
+executor = QueryExecutor(CLIENT_URL)
 
 GRAPH_TOKEN_ADDRESS = "0x9623063377AD1B27544C965CCD7342F7EA7E88C7"
 ZERO_ADDRESS_HEX = "0000000000000000000000000000000000000000"
@@ -57,7 +69,10 @@ _GRAPH_TOKEN_HEX = GRAPH_TOKEN_ADDRESS.replace("0x", "")
 
 logger.info("Starting GraphAccount extraction for Arbitrum.")
 
-graph_token_transfers_query = f"""
+# Transfers are reduced to one row per account at the source: net balance,
+# first-seen timestamp and in/out leg counts.  The SUM / MIN / COUNT partials
+# merge across block ranges, so the logs decode also runs partitioned.
+graph_token_accounts_query = f"""
 WITH decoded_transfers AS (
     SELECT
         evm_decode(l.topic1, l.topic2, l.topic3, l.data,
@@ -66,93 +81,114 @@ WITH decoded_transfers AS (
     FROM "edgeandnode/arbitrum_one@0.0.1".logs l
     WHERE l.address = arrow_cast(x'{_GRAPH_TOKEN_HEX}', 'FixedSizeBinary(20)')
       AND l.topic0 = evm_topic('Transfer(address indexed from, address indexed to, uint256 value)')
+      AND {{block_range:l}}
+),
+legs AS (
+    SELECT
+        event['to'] AS account_id,
+        timestamp,
+        arrow_cast(event['value'], 'Float64') AS token_delta,
+        1 AS in_legs,
+        0 AS out_legs
+    FROM decoded_transfers
+    WHERE event['to'] <> arrow_cast(x'{ZERO_ADDRESS_HEX}', 'FixedSizeBinary(20)')
+    UNION ALL
+    SELECT
+        event['from'] AS account_id,
+        timestamp,
+        -arrow_cast(event['value'], 'Float64') AS token_delta,
+        0 AS in_legs,
+        1 AS out_legs
+    FROM decoded_transfers
+    WHERE event['from'] <> arrow_cast(x'{ZERO_ADDRESS_HEX}', 'FixedSizeBinary(20)')
 )
 SELECT
-    event['to'] AS account_id,
-    timestamp,
-    arrow_cast(event['value'], 'Float64') AS token_delta
-FROM decoded_transfers
-WHERE event['to'] <> arrow_cast(x'{ZERO_ADDRESS_HEX}', 'FixedSizeBinary(20)')
-UNION ALL
-SELECT
-    event['from'] AS account_id,
-    timestamp,
-    -arrow_cast(event['value'], 'Float64') AS token_delta
-FROM decoded_transfers
-WHERE event['from'] <> arrow_cast(x'{ZERO_ADDRESS_HEX}', 'FixedSizeBinary(20)')
+    account_id,
+    SUM(token_delta) AS balance,
+    MIN(timestamp) AS token_created_at,
+    SUM(in_legs) AS in_legs,
+    SUM(out_legs) AS out_legs
+FROM legs
+GROUP BY account_id
 """
 
-logger.info("Querying GraphToken transfers...")
-token_events = process_query(client, graph_token_transfers_query)
-logger.info("Fetched %s token transfer legs.", len(token_events))
-
-activity_events_query = """
-SELECT event['indexer'] AS account_id, timestamp
-FROM arbitrum_service_registry.service_registered
-UNION ALL
-SELECT event['indexer'] AS account_id, timestamp
-FROM arbitrum_staking.stake_deposited
-UNION ALL
-SELECT delegator_id AS account_id, timestamp
-FROM "delegators/event_arbitrum_staking_stake_delegated@0.0.1"."event_arbitrum_staking_stake_delegated"
-UNION ALL
-SELECT curator_id AS account_id, timestamp
-FROM "data_science/event_arbitrum_curation_signalled@0.0.2"."event_arbitrum_curation_signalled"
-UNION ALL
-SELECT curator_id AS account_id, timestamp
-FROM "data_science/event_arbitrum_gns_signal_minted@0.0.2"."event_arbitrum_gns_signal_minted"
-UNION ALL
-SELECT curator_id AS account_id, timestamp
-FROM "data_science/event_arbitrum_gns_signal_burned@0.0.2"."event_arbitrum_gns_signal_burned"
+logger.info("Aggregating GraphToken transfers per account...")
+token_accounts = partitioned_query(
+    CLIENT_URL,
+    graph_token_accounts_query,
+    keys=["account_id"],
+    aggregates={"balance": "sum", "token_created_at": "min", "in_legs": "sum", "out_legs": "sum"},
+    tables=['"edgeandnode/arbitrum_one@0.0.1".logs'],
+    executor=executor,
+)
+logger.info(
+    "Reduced %s transfer legs (%s in, %s out) to %s accounts.",
+    int(token_accounts["in_legs"].sum() + token_accounts["out_legs"].sum()),
+    int(token_accounts["in_legs"].sum()),
+    int(token_accounts["out_legs"].sum()),
+    len(token_accounts),
+)
+
+activity_accounts_query = """
+SELECT account_id, MIN(timestamp) AS activity_created_at
+FROM (
+    SELECT event['indexer'] AS account_id, timestamp
+    FROM arbitrum_service_registry.service_registered
+    UNION ALL
+    SELECT event['indexer'] AS account_id, timestamp
+    FROM arbitrum_staking.stake_deposited
+    UNION ALL
+    SELECT delegator_id AS account_id, timestamp
+    FROM "delegators/event_arbitrum_staking_stake_delegated@0.0.1"."event_arbitrum_staking_stake_delegated"
+    UNION ALL
+    SELECT curator_id AS account_id, timestamp
+    FROM "data_science/event_arbitrum_curation_signalled@0.0.2"."event_arbitrum_curation_signalled"
+    UNION ALL
+    SELECT curator_id AS account_id, timestamp
+    FROM "data_science/event_arbitrum_gns_signal_minted@0.0.2"."event_arbitrum_gns_signal_minted"
+    UNION ALL
+    SELECT curator_id AS account_id, timestamp
+    FROM "data_science/event_arbitrum_gns_signal_burned@0.0.2"."event_arbitrum_gns_signal_burned"
+) activity
+GROUP BY account_id
 """
 
-logger.info("Querying auxiliary activity events for created_at...")
-activity_events = process_query(client, activity_events_query)
-logger.info("Fetched %s activity events.", len(activity_events))
+logger.info("Querying first activity per account for created_at...")
+activity_accounts = executor.run(activity_accounts_query)
+logger.info("Fetched first activity for %s accounts.", len(activity_accounts))
 
-if token_events.empty and activity_events.empty:
-    logger.warning("No GraphAccount activity detected; emitting empty table.")
-    graph_accounts_df = pd.DataFrame(columns=["id", "balance", "created_at"])
-else:
-    balance_series = pd.Series(dtype=float)
-    token_created_series = pd.Series(dtype="datetime64[ns, UTC]")
-
-    if not token_events.empty:
-        token_events["timestamp"] = pd.to_datetime(token_events["timestamp"], unit="s", utc=True)
-        token_events["token_delta"] = token_events["token_delta"] / 1e18
-        balance_series = token_events.groupby("account_id")["token_delta"].sum()
-        token_created_series = token_events.groupby("account_id")["timestamp"].min()
-
-    activity_created_series = pd.Series(dtype="datetime64[ns, UTC]")
-    if not activity_events.empty:
-        activity_events["timestamp"] = pd.to_datetime(activity_events["timestamp"], unit="s", utc=True)
-        activity_created_series = activity_events.groupby("account_id")["timestamp"].min()
-
-    all_account_ids = sorted(set(balance_series.index).union(activity_created_series.index))
-    graph_accounts_df = pd.DataFrame({"id": all_account_ids})
-
-    graph_accounts_df = graph_accounts_df.merge(
-        balance_series.reset_index().rename(columns={"account_id": "id", "token_delta": "balance"}),
-        on="id",
-        how="left",
-    )
-    graph_accounts_df["balance"] = graph_accounts_df["balance"].fillna(0.0)
-
-    created_df = (
-        pd.concat(
-            [
-                token_created_series.rename("token_created_at"),
-                activity_created_series.rename("activity_created_at"),
-            ],
-            axis=1,
-        )
-        .min(axis=1)
-        .rename("created_at")
-        .rename_axis("id")
-        .reset_index()
+# Both sides are already one row per account, so a single outer merge on the
+# int32 account codes (pipeline/addresses.py) builds the table; ids are
+# decoded back to hex afterwards.
+encode_columns(token_accounts, ["account_id"])
+encode_columns(activity_accounts, ["account_id"])
+
+
+def build_graph_accounts(frames: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    accounts = frames["token"][["account_id", "balance", "token_created_at"]].merge(
+        frames["activity"], on="account_id", how="outer"
     )
+    if accounts.empty:
+        return pd.DataFrame(columns=["id", "balance", "created_at"])
+    accounts["balance"] = accounts["balance"].fillna(0.0) / 1e18
+    accounts["created_at"] = pd.concat(
+        [
+            pd.to_datetime(accounts["token_created_at"], unit="s", utc=True),
+            pd.to_datetime(accounts["activity_created_at"], unit="s", utc=True),
+        ],
+        axis=1,
+    ).min(axis=1)
+    return accounts.rename(columns={"account_id": "id"})[["id", "balance", "created_at"]]
+
+
+graph_accounts_df = run_by_key(
+    {"token": token_accounts, "activity": activity_accounts}, ["account_id"], build_graph_accounts
+)
 
-    graph_accounts_df = graph_accounts_df.merge(created_df, on="id", how="left")
+if graph_accounts_df.empty:
+    logger.warning("No GraphAccount activity detected; emitting empty table.")
+else:
+    decode_columns(graph_accounts_df, ["id"])
 
 graph_accounts_df["created_at"] = pd.to_datetime(graph_accounts_df["created_at"], utc=True)
 graph_accounts_df.sort_values("id", inplace=True)
@@ -162,7 +198,7 @@ logger.info("Prepared %s GraphAccount rows.", len(graph_accounts_df))
 verification_rows: List[Dict[str, str]] = [
     {
         "field": "balance",
-        "script_logic": "Net sum of GraphToken Transfer legs (credits - debits) converted from wei",
+        "script_logic": "Net sum of GraphToken Transfer legs (credits - debits), aggregated per account at the source, converted from wei",
         "subgraph_source": "graphToken.handleTransfer updates GraphAccount.balance",
         "notes": "Relies on L2 log stream; excludes zero-address legs to match subgraph behavior.",
     },
@@ -191,4 +227,5 @@ schema = [
 ]
 
 save_or_upload_parquet(graph_accounts_df, destination_blob_name, "upload", table_id, schema=schema, project_id="graph-mainnet")
+serve(graph_accounts_df, table_id)
 logger.info("GraphAccount upload complete.")
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+PaymentsEscrow and GraphTally collection tables for Arbitrum (graph-network subgraph).
+
+Outputs (pipeline/escrow.py):
+- payments_escrow_account_arbitrum: id (payer ++ collector ++ receiver),
+  payer, collector, receiver, balance, total_amount_thawing,
+  thaw_end_timestamp; Deposit / Withdraw / Thaw / CancelThaw /
+  EscrowCollected (paymentsEscrow.ts).
+- payments_escrow_transaction_arbitrum: id (tx hash ++ log index as in
+  concatI32), transaction_group_id, type deposit / withdraw / redeem, payer,
+  collector, receiver, escrow_account, allocation_id (redeem only), amount,
+  timestamp.
+- graph_tally_tokens_collected_arbitrum: id (payer ++ receiver ++
+  collectionId), tokens summed over PaymentCollected (graphTallyCollector.ts).
+- signer_arbitrum: is_authorized, payer, thaw_end_timestamp from the Signer*
+  events.
+- payer_arbitrum / receiver_arbitrum: addresses seen in a transaction, as
+  createOrLoadPayer / createOrLoadReceiver run only there.
+- payments_escrow_daily_arbitrum: per account and UTC day with activity,
+  deposits, withdrawals, escrow_collected, payments_collected and the
+  closing balance.
+
+The store is incremental: each run loads the published tables, reads the
+blocks after their highest block_hi in windows of ESCROW_BATCH_BLOCKS and
+folds each window in before fetching the next, so an hourly schedule reads
+about an hour of logs.  The last REORG_WINDOW_BLOCKS blocks are logged in
+payments_escrow_block_hashes_arbitrum and the *_undo_arbitrum tables
+(pipeline/reorgs.py); when a logged hash changes the store rolls back to the
+fork and the refresh resumes from there.  Set PAYMENTS_ESCROW_ADDRESS /
+GRAPH_TALLY_COLLECTOR_ADDRESS to point at another deployment.
+"""
+
+import logging
+import os
+import sys
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+from nozzle.util import save_or_upload_parquet
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+try:
+    SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+except NameError:  # pragma: no cover
+    SCRIPT_DIR = os.path.dirname(os.path.abspath(sys.argv[0]))
+PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, "..", ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+PIPELINE_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, ".."))
+if PIPELINE_ROOT not in sys.path:
+    sys.path.insert(0, PIPELINE_ROOT)
+
+from pipeline.addresses import decode_columns, encode_columns
+from pipeline.escrow import (
+    ACCOUNT_COLUMNS,
+    ACCOUNT_KEYS,
+    ADDRESS_COLUMNS,
+    DAILY_COLUMNS,
+    SIGNER_COLUMNS,
+    TALLY_COLUMNS,
+    TALLY_KEYS,
+    TRANSACTION_COLUMNS,
+    UNDO_TABLES,
+    EscrowStore,
+    batch_windows,
+    escrow_events_query,
+)
+from pipeline.executor import shared_executor
+from pipeline.partitioned import block_bounds
+from pipeline.provisions import high_water
+from pipeline.reorgs import HASH_COLUMNS, UNDO_COLUMNS, ReorgLog, block_hashes_query
+from pipeline.serving import serve
+from pipeline.tables import load_entity_table
+
+CLIENT_URL = "grpc+tls://gateway.amp.staging.thegraph.com:443"
+WEI = 1e18
+LOGS_TABLE = '"edgeandnode/arbitrum_one@0.0.1".logs'
+BATCH_BLOCKS = int(os.environ.get("ESCROW_BATCH_BLOCKS", "200000"))
+executor = shared_executor(CLIENT_URL)
+
+TABLES = {
+    "accounts": "payments_escrow_account_arbitrum",
+    "signers": "signer_arbitrum",
+    "tallies": "graph_tally_tokens_collected_arbitrum",
+    "transactions": "payments_escrow_transaction_arbitrum",
+    "daily": "payments_escrow_daily_arbitrum",
+}
+HASHES_TABLE = "payments_escrow_block_hashes_arbitrum"
+UNDO_TABLE_IDS = {name: TABLES[name].replace("_arbitrum", "_undo_arbitrum") for name in UNDO_TABLES}
+STORED_COLUMNS = {
+    "accounts": (ACCOUNT_COLUMNS, ACCOUNT_KEYS),
+    "signers": (SIGNER_COLUMNS, ["signer", "payer"]),
+    "tallies": (TALLY_COLUMNS, TALLY_KEYS),
+    "transactions": (
+        TRANSACTION_COLUMNS, ["payer", "collector", "receiver", "account_collector", "collection_id"]
+    ),
+    "daily": (DAILY_COLUMNS, ACCOUNT_KEYS),
+}
+
+logger.info("Starting PaymentsEscrow / GraphTally refresh for Arbitrum.")
+
+
+def load_published(name: str, table_id: Optional[str] = None, extra: Sequence[str] = ()):
+    columns, addresses = STORED_COLUMNS[name]
+    table_id = table_id or TABLES[name]
+    try:
+        frame = load_entity_table(table_id, columns=[*columns, *extra])
+    except NotFound:
+        logger.info("No published %s table yet; building from the full history.", table_id)
+        return None
+    return encode_columns(frame, addresses)
+
+
+stored = {name: load_published(name) for name in TABLES}
+store = EscrowStore(**stored)
+after_block = high_water(stored["accounts"], stored["signers"])
+_, head = block_bounds(executor, [LOGS_TABLE])
+
+# %%
+# Reorg check: compare the logged tail's hashes with the chain before reading events.
+try:
+    logged_hashes = load_entity_table(HASHES_TABLE, columns=HASH_COLUMNS)
+except NotFound:
+    logged_hashes = None
+undo = {name: load_published(name, UNDO_TABLE_IDS[name], UNDO_COLUMNS) for name in UNDO_TABLES}
+reorg_log = ReorgLog(logged_hashes, {name: frame for name, frame in undo.items() if frame is not None})
+current_hashes = executor.run(block_hashes_query(*reorg_log.check_range(head)))
+fork = reorg_log.fork_point(current_hashes)
+if fork is not None:
+    store.rollback(reorg_log, fork)
+    after_block = min(after_block, fork)
+
+windows = batch_windows(after_block, head, BATCH_BLOCKS)
+logger.info("Folding blocks %s-%s in %s micro-batches.", after_block + 1, head, len(windows))
+
+# %%
+# Micro-batches: each window is decoded, folded and released before the next.
+for lo, hi in windows:
+    batch = encode_columns(executor.run(escrow_events_query(lo, hi)), ADDRESS_COLUMNS)
+    store.apply(batch, scale=WEI, log=reorg_log, confirmed=head - reorg_log.window)
+    logger.info("Blocks (%s, %s]: %s events.", lo, hi, len(batch))
+
+reorg_log.record(current_hashes, head)
+tables = store.tables()
+logger.info(
+    "Store holds %s accounts, %s signers, %s tallies, %s transactions and %s daily rows.",
+    *(len(tables[name]) for name in TABLES),
+)
+
+# %%
+# Publishable frames: hex ids, concatenated like the handlers' Bytes ids.
+accounts_df = decode_columns(tables["accounts"], ACCOUNT_KEYS)
+accounts_df.insert(
+    0, "id", accounts_df["payer"] + accounts_df["collector"].str[2:] + accounts_df["receiver"].str[2:]
+)
+accounts_df["thaw_end_timestamp"] = accounts_df["thaw_end_timestamp"].astype("int64")
+
+signers_df = decode_columns(tables["signers"], ["signer", "payer"])
+signers_df.insert(0, "id", signers_df["signer"])
+signers_df["thaw_end_timestamp"] = signers_df["thaw_end_timestamp"].astype("int64")
+
+tallies_df = decode_columns(tables["tallies"], TALLY_KEYS)
+tallies_df.insert(
+    0, "id", tallies_df["payer"] + tallies_df["receiver"].str[2:] + tallies_df["collection_id"].str[2:]
+)
+
+transactions_df = tables["transactions"].copy()
+tx_hash = transactions_df["tx_hash"].map(lambda value: "0x" + bytes(value).hex() if not isinstance(value, str) else value)
+decode_columns(transactions_df, ["payer", "collector", "receiver", "account_collector", "collection_id"])
+transactions_df.insert(
+    0, "id", tx_hash + transactions_df["log_index"].map(lambda index: int(index).to_bytes(4, "little").hex())
+)
+transactions_df.insert(1, "transaction_group_id", tx_hash)
+transactions_df["tx_hash"] = tx_hash
+transactions_df["escrow_account"] = (
+    transactions_df["payer"] + transactions_df["account_collector"].str[2:] + transactions_df["receiver"].str[2:]
+)
+# allocationId is the collection id's low 20 bytes.
+transactions_df["allocation_id"] = transactions_df["collection_id"].map(
+    lambda value: "0x" + value[-40:] if isinstance(value, str) else None
+)
+
+payers_df = pd.DataFrame({"id": sorted(transactions_df["payer"].dropna().unique())})
+receivers_df = pd.DataFrame({"id": sorted(transactions_df["receiver"].dropna().unique())})
+
+daily_df = decode_columns(tables["daily"], ACCOUNT_KEYS)
+daily_df.insert(
+    0, "id",
+    daily_df["payer"] + daily_df["collector"].str[2:] + daily_df["receiver"].str[2:]
+    + "-" + daily_df["event_date"].dt.strftime("%Y-%m-%d"),
+)
+
+undo_dfs = {
+    name: decode_columns(frame.copy(), STORED_COLUMNS[name][1])
+    for name, frame in reorg_log.undo_tables(UNDO_TABLES).items()
+}
+
+verification_rows: List[Dict[str, str]] = [
+    {
+        "field": "PaymentsEscrowAccount.balance / totalAmountThawing / thawEndTimestamp",
+        "script_logic": "Per-window balance sums added to the stored balance; thaw fields from the window's last Thaw / Withdraw / CancelThaw.",
+        "subgraph_source": "paymentsEscrow.ts handleDeposit / handleWithdraw / handleThaw / handleCancelThaw / handleEscrowCollected",
+        "notes": "PaymentCollected creates the GraphTallyCollector account without moving its balance, as in the handler.",
+    },
+    {
+        "field": "PaymentsEscrowTransaction / GraphTallyTokensCollected",
+        "script_logic": "Deposit, Withdraw and PaymentCollected rows appended; PaymentCollected tokens summed per (payer, receiver, collectionId).",
+        "subgraph_source": "paymentsEscrow.ts handleDeposit / handleWithdraw; graphTallyCollector.ts handlePaymentCollected",
+        "notes": "Transaction ids follow Bytes.concatI32 (little-endian log index).",
+    },
+    {
+        "field": "Signer",
+        "script_logic": "Last event per signer sets payer / isAuthorized; last SignerThawing / ThawCanceled / Revoked sets thawEndTimestamp.",
+        "subgraph_source": "graphTallyCollector.ts signer handlers",
+        "notes": "",
+    },
+    {
+        "field": "payments_escrow_daily_arbitrum",
+        "script_logic": "Per (account, UTC day) sums and the balance after the day's last event.",
+        "subgraph_source": "derived from the same events",
+        "notes": "Not a subgraph entity; days without activity have no row.",
+    },
+    {
+        "field": "reorg log",
+        "script_logic": "Hashes of the last REORG_WINDOW_BLOCKS blocks and undo images of the rows each of them touched.",
+        "subgraph_source": "graph-node reverts entity changes above the fork block the same way",
+        "notes": "Bookkeeping tables only; confirmed blocks keep no history.",
+    },
+]
+
+verification_table = pd.DataFrame(verification_rows)
+logger.info("Verification table:\n%s", verification_table.to_string(index=False))
+
+logger.info("Uploading PaymentsEscrow / GraphTally tables to BigQuery...")
+bq_client = bigquery.Client(project="graph-mainnet")
+for table_id, frame in (
+    (TABLES["accounts"], accounts_df),
+    (TABLES["transactions"], transactions_df),
+    (TABLES["tallies"], tallies_df),
+    (TABLES["signers"], signers_df),
+    ("payer_arbitrum", payers_df),
+    ("receiver_arbitrum", receivers_df),
+    (TABLES["daily"], daily_df),
+    (HASHES_TABLE, reorg_log.hashes),
+    *((UNDO_TABLE_IDS[name], frame) for name, frame in undo_dfs.items()),
+):
+    bq_client.delete_table(f"graph-mainnet.nozzle.{table_id}", not_found_ok=True)
+    save_or_upload_parquet(frame, f"path/in/bucket/{table_id}.parquet", "upload", table_id, project_id="graph-mainnet")
+    serve(frame, table_id)
+logger.info("PaymentsEscrow / GraphTally upload complete.")
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Per-day and per-epoch reward / fee rollups for indexers and deployments on Arbitrum.
+
+Output (reward_rollups_arbitrum), one row per (dimension, key, period_type, period):
+- dimension: 'indexer' or 'deployment'; key: indexer address / deployment id.
+- period_type: 'day' (UTC day number) or 'epoch'; period: the day / epoch number.
+- rewards: RewardsAssigned.amount (rewardsManager.ts handleRewardsAssigned).
+- query_fees: AllocationCollected.rebateFees + RebateCollected.queryFees.
+- rebates: RebateCollected.queryRebates.
+- curation_fees: AllocationCollected.curationFees + RebateCollected.curationFees.
+- block_hi: highest block_num folded into the row.
+- synced_block: the block every source table had reached when the run read them.
+
+Each run loads the published table and rolls up only events after its
+synced_block, up to the last block all four source tables and the epoch table
+have reached (so a lagging dataset is not skipped past), and adds them to the stored rows (pipeline/windows.py), so a daily
+refresh scans one day of events.  Trailing-window totals come from
+RollingWindows(load_entity_table("reward_rollups_arbitrum")).trailing(...).
+
+Rewards are keyed to a deployment through arbitrum_staking.allocation_created;
+rewards for allocations without a creation row count only for the indexer.
+Epochs require network/epoch_arbitrum.py to have run first.
+"""
+
+import logging
+import os
+import sys
+from typing import List, Dict
+
+import pandas as pd
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+from nozzle.util import save_or_upload_parquet
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+try:
+    SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+except NameError:  # pragma: no cover
+    SCRIPT_DIR = os.path.dirname(os.path.abspath(sys.argv[0]))
+PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, "..", ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+PIPELINE_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, ".."))
+if PIPELINE_ROOT not in sys.path:
+    sys.path.insert(0, PIPELINE_ROOT)
+
+from pipeline.epochs import EpochTable
+from pipeline.executor import shared_executor
+from pipeline.partitioned import synced_block
+from pipeline.serving import serve
+from pipeline.tables import load_entity_table
+from pipeline.windows import ROLLUP_COLUMNS, SYNCED_COLUMN, high_water, merge_rollups, rollup_events
+
+CLIENT_URL = "grpc+tls://gateway.amp.staging.thegraph.com:443"
+executor = shared_executor(CLIENT_URL)
+SOURCE_TABLES = [
+    "arbitrum_staking.allocation_collected",
+    "arbitrum_staking.rebate_collected",
+    "arbitrum_rewards_manager.rewards_assigned",
+    "arbitrum_staking.allocation_created",
+]
+
+logger.info("Starting reward rollup refresh for Arbitrum.")
+
+try:
+    existing_df = load_entity_table("reward_rollups_arbitrum", columns=[*ROLLUP_COLUMNS, SYNCED_COLUMN])
+except NotFound:
+    logger.info("No published rollup table yet; rolling up the full history.")
+    existing_df = None
+after_block = high_water(existing_df)
+epochs = EpochTable.load()
+# Events past the epoch table would get no epoch and never be rolled into one.
+to_block = min(synced_block(executor, SOURCE_TABLES), epochs.synced_block)
+
+events_query = f"""
+SELECT
+    event['indexer'] AS indexer,
+    event['subgraphDeploymentID'] AS subgraph_deployment,
+    block_num,
+    timestamp,
+    0.0 AS rewards,
+    arrow_cast(event['rebateFees'], 'Float64') AS query_fees,
+    0.0 AS rebates,
+    arrow_cast(event['curationFees'], 'Float64') AS curation_fees
+FROM arbitrum_staking.allocation_collected
+WHERE block_num > {after_block} AND block_num <= {to_block}
+UNION ALL
+SELECT
+    event['indexer'] AS indexer,
+    event['subgraphDeploymentID'] AS subgraph_deployment,
+    block_num,
+    timestamp,
+    0.0 AS rewards,
+    arrow_cast(event['queryFees'], 'Float64') AS query_fees,
+    arrow_cast(event['queryRebates'], 'Float64') AS rebates,
+    arrow_cast(event['curationFees'], 'Float64') AS curation_fees
+FROM arbitrum_staking.rebate_collected
+WHERE block_num > {after_block} AND block_num <= {to_block}
+UNION ALL
+SELECT
+    r.event['indexer'] AS indexer,
+    a.event['subgraphDeploymentID'] AS subgraph_deployment,
+    r.block_num,
+    r.timestamp,
+    arrow_cast(r.event['amount'], 'Float64') AS rewards,
+    0.0 AS query_fees,
+    0.0 AS rebates,
+    0.0 AS curation_fees
+FROM arbitrum_rewards_manager.rewards_assigned r
+LEFT JOIN arbitrum_staking.allocation_created a
+    ON r.event['allocationID'] = a.event['allocationID']
+WHERE r.block_num > {after_block} AND r.block_num <= {to_block}
+"""
+
+logger.info("Querying reward and fee events in blocks %s-%s...", after_block + 1, to_block)
+events_df = executor.run(events_query)
+logger.info("Fetched %s reward and fee events.", len(events_df))
+
+new_rollups = rollup_events(events_df, epochs)
+rollups_df = merge_rollups(existing_df, new_rollups)
+rollups_df.sort_values(["dimension", "period_type", "key", "period"], inplace=True)
+rollups_df[SYNCED_COLUMN] = to_block
+logger.info("Prepared %s rollup rows (%s touched this run).", len(rollups_df), len(new_rollups))
+
+verification_rows: List[Dict[str, str]] = [
+    {
+        "field": "rewards",
+        "script_logic": "Sum of RewardsAssigned.amount per (indexer | deployment, day | epoch), converted from wei.",
+        "subgraph_source": "rewardsManager.ts handleRewardsAssigned (Indexer / SubgraphDeployment / Epoch totalRewards)",
+        "notes": "Deployment via the allocation's AllocationCreated; Horizon IndexingRewardsCollected not included.",
+    },
+    {
+        "field": "query_fees / rebates / curation_fees",
+        "script_logic": "AllocationCollected.rebateFees + RebateCollected.queryFees; RebateCollected.queryRebates; curationFees from both.",
+        "subgraph_source": "staking.ts handleAllocationCollected + handleRebateCollected",
+        "notes": "Additive, so incremental runs only add events after synced_block, up to the slowest source's head.",
+    },
+]
+
+verification_table = pd.DataFrame(verification_rows)
+logger.info("Verification table:\n%s", verification_table.to_string(index=False))
+
+logger.info("Uploading reward rollups to BigQuery...")
+bq_client = bigquery.Client(project="graph-mainnet")
+bq_table = "graph-mainnet.nozzle.reward_rollups_arbitrum"
+bq_client.delete_table(bq_table, not_found_ok=True)
+
+destination_blob_name = "path/in/bucket/reward_rollups_arbitrum.parquet"
+table_id = "reward_rollups_arbitrum"
+save_or_upload_parquet(rollups_df, destination_blob_name, "upload", table_id, project_id="graph-mainnet")
+serve(rollups_df, table_id)
+logger.info("Reward rollups upload complete.")
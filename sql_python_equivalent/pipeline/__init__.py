@@ -0,0 +1,33 @@
+"""
+Shared helpers for the *_arbitrum entity builds in sql_python_equivalent/.
+
+Scripts put sql_python_equivalent/ on sys.path (next to the nozzle project
+root) and import from here, e.g. ``from pipeline.rollups import ...``.
+
+Modules:
+- tables:      load already-published entity tables back from BigQuery.
+- rollups:     derive parent entity aggregates from child entity tables.
+- addresses:   intern addresses / deployment ids as int32 codes for joins.
+- partitioned: run aggregate queries as parallel block_num range partitions.
+- executor:    query deadlines, cancellation and p95-triggered hedging.
+- aio:         asyncio run() / gather_queries() with a global concurrency budget.
+- sketches:    HyperLogLog distinct-count sketches merged per source up to a high-water block.
+- fees:        per-allocation fee / reward attribution from one long event frame.
+- epochs:      block_num / L1 block -> epoch lookup table and its incremental refresh.
+- lifecycle:   allocation create / resize / close intervals and point-in-time lookups.
+- shards:      per-key work sharded over a process pool via shared-memory Arrow.
+- billing:     BillingUserDaily per-user daily GraphPayments aggregation.
+- spill:       out-of-core per-key execution with Arrow IPC spill files under a memory budget.
+- windows:     per-day / per-epoch reward and fee rollups with prefix-sum rolling windows.
+- checkpoints: per-run Arrow IPC checkpoints of query results, resumed with --resume.
+- replay:      ordered per-key event replay over NumPy state columns.
+- curation:    Signal / NameSignal replay steps mirroring the curation.ts and gns.ts handlers.
+- curve:       per-deployment bonding-curve state and run-length pricePerShare history.
+- delegation:  indexer delegation exchange-rate timeline and the DelegatedStake replay step.
+- provisions:  Horizon Provision balances / parameters and the indexed ThawRequest queue.
+- economics:   legacy + Horizon allocation-economics event stream and its aggregations.
+- escrow:      PaymentsEscrow / GraphTally keyed state store folded in block micro-batches.
+- reorgs:      tail block hashes and per-block undo images for rolling incremental state back to a fork.
+- streaming:   long-running micro-batch refresh of signal / delegated stake / allocation tables.
+- serving:     local SQLite copy of built tables indexed on key columns for point / range lookups.
+"""
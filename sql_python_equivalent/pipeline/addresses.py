@@ -0,0 +1,132 @@
+"""
+Compact address / deployment-id representation shared by the entity builds.
+
+Addresses (20 bytes) and deployment ids (32 bytes) arrive from nozzle either
+as FixedSizeBinary values or as 42/66-character hex strings in object-dtype
+columns.  Keeping them as Python strings makes every merge and groupby hash
+and compare long strings, and every script lowercases them again.
+
+AddressTable interns each distinct value once as raw bytes and hands out
+int32 codes.  Scripts encode their key columns right after process_query,
+run all joins and groupbys on the codes, and decode back to lowercase
+(or EIP-55 checksummed) hex only when building the frame to publish.
+
+One process-wide table (ADDRESSES) is shared so codes from different
+queries are directly comparable.  NULL_CODE marks missing values.
+"""
+
+import logging
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    from eth_utils import to_checksum_address
+except ImportError:  # pragma: no cover
+    to_checksum_address = None
+
+logger = logging.getLogger(__name__)
+
+NULL_CODE = -1
+
+
+def _to_bytes(value) -> bytes:
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value)
+    text = str(value)
+    if text[:2] in ("0x", "0X"):
+        text = text[2:]
+    return bytes.fromhex(text)
+
+
+class AddressTable:
+    """Interned byte table mapping distinct addresses/ids to int32 codes."""
+
+    def __init__(self) -> None:
+        self._codes: Dict[bytes, int] = {}
+        self._values: List[bytes] = []
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def intern(self, value) -> int:
+        """Return the code for one value, adding it to the table if new."""
+        raw = _to_bytes(value)
+        code = self._codes.get(raw)
+        if code is None:
+            code = len(self._values)
+            self._codes[raw] = code
+            self._values.append(raw)
+        return code
+
+    def _map_uniques(self, uniques: Iterable) -> np.ndarray:
+        return np.fromiter((self.intern(u) for u in uniques), dtype=np.int32)
+
+    def encode(self, values) -> np.ndarray:
+        """Encode a Series / array of bytes or hex strings to int32 codes.
+
+        Only the distinct values are hashed and normalised; the per-row work
+        is a vectorised factorize + take.
+        """
+        local_codes, uniques = pd.factorize(pd.Series(values, copy=False), use_na_sentinel=True)
+        mapping = self._map_uniques(uniques)
+        codes = np.full(len(local_codes), NULL_CODE, dtype=np.int32)
+        valid = local_codes >= 0
+        codes[valid] = mapping[local_codes[valid]]
+        return codes
+
+    def encode_arrow(self, array) -> np.ndarray:
+        """Encode a pyarrow FixedSizeBinary / binary / string array to int32 codes."""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        if isinstance(array, pa.ChunkedArray):
+            array = array.combine_chunks()
+        encoded = pc.dictionary_encode(array)
+        mapping = self._map_uniques(encoded.dictionary.to_pylist())
+        indices = encoded.indices.to_numpy(zero_copy_only=False)
+        codes = np.full(len(encoded), NULL_CODE, dtype=np.int32)
+        valid = encoded.is_valid().to_numpy(zero_copy_only=False)
+        codes[valid] = mapping[indices[valid].astype(np.int64)]
+        return codes
+
+    def decode(self, codes, checksum: bool = False) -> np.ndarray:
+        """Decode int32 codes back to '0x'-prefixed hex (lowercase unless checksum)."""
+        if checksum and to_checksum_address is None:
+            raise ImportError("checksum=True requires eth_utils (pip install eth-utils)")
+        codes = np.asarray(codes, dtype=np.int32)
+        uniques, inverse = np.unique(codes, return_inverse=True)
+        rendered = np.empty(len(uniques), dtype=object)
+        for i, code in enumerate(uniques):
+            if code == NULL_CODE:
+                rendered[i] = None
+                continue
+            text = "0x" + self._values[code].hex()
+            rendered[i] = to_checksum_address(text) if checksum and len(self._values[code]) == 20 else text
+        return rendered[inverse.reshape(-1)]
+
+
+ADDRESSES = AddressTable()
+
+
+def encode_columns(df: pd.DataFrame, columns: List[str], table: Optional[AddressTable] = None) -> pd.DataFrame:
+    """Replace address/id columns of df with int32 codes in place; returns df."""
+    table = table or ADDRESSES
+    for column in columns:
+        df[column] = table.encode(df[column])
+    logger.debug("Encoded %s; address table holds %s values.", columns, len(table))
+    return df
+
+
+def decode_columns(
+    df: pd.DataFrame,
+    columns: List[str],
+    checksum: bool = False,
+    table: Optional[AddressTable] = None,
+) -> pd.DataFrame:
+    """Replace int32 code columns of df with hex strings in place; returns df."""
+    table = table or ADDRESSES
+    for column in columns:
+        df[column] = table.decode(df[column].to_numpy(), checksum=checksum)
+    return df
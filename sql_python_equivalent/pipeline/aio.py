@@ -0,0 +1,157 @@
+"""
+asyncio front end for nozzle queries with a process-wide concurrency budget.
+
+Scripts, the validator and notebooks can overlap gateway I/O with
+
+    df = await run(sql)
+    frames = await gather_queries({"supply": supply_sql, "fees": fees_sql})
+
+All callers in a process share one AsyncQueryExecutor per gateway URL.  It
+sits on the shared QueryExecutor (pipeline/executor.py), so the same Client
+pool, deadlines and hedging apply, and adds:
+
+- a global max_concurrency cap on queries in flight;
+- a per-dataset budget, so one dataset (e.g. raw logs) cannot take every
+  slot.  A query holds a slot for each dataset it references;
+- back-pressure: at most max_pending queries may be admitted (waiting or
+  running), further run() calls wait for room, and ``pending`` /
+  ``in_flight`` / ``saturated`` let producers throttle themselves.
+
+Cancelling the awaiting task cancels the underlying query.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from pipeline.executor import shared_executor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLIENT_URL = "grpc+tls://gateway.amp.staging.thegraph.com:443"
+MAX_CONCURRENCY = int(os.environ.get("NOZZLE_MAX_CONCURRENCY", "8"))
+PER_DATASET = int(os.environ.get("NOZZLE_PER_DATASET", "4"))
+MAX_PENDING = int(os.environ.get("NOZZLE_MAX_PENDING", "64"))
+
+# "namespace/name@version" datasets and bare schemas such as arbitrum_staking.
+_QUOTED_DATASET = re.compile(r'"([\w.-]+/[\w.-]+@[\w.]+)"')
+_SCHEMA_DATASET = re.compile(r"\b(arbitrum_[a-z_]+|eth_firehose)\.", re.IGNORECASE)
+
+
+def datasets(sql: str) -> List[str]:
+    """Datasets a query reads, used as its fairness keys (sorted, unique)."""
+    found = set(_QUOTED_DATASET.findall(sql))
+    found.update(name.lower() for name in _SCHEMA_DATASET.findall(sql))
+    return sorted(found) or ["<none>"]
+
+
+class AsyncQueryExecutor:
+    """Admission control and fairness around a shared QueryExecutor."""
+
+    def __init__(
+        self,
+        client_url: str,
+        max_concurrency: int = MAX_CONCURRENCY,
+        per_dataset: int = PER_DATASET,
+        max_pending: int = MAX_PENDING,
+    ) -> None:
+        self.executor = shared_executor(client_url)
+        self.max_concurrency = max_concurrency
+        self.per_dataset = per_dataset
+        self.max_pending = max_pending
+        self.pending = 0
+        self.in_flight = 0
+        # Created lazily (and again for a new event loop) so they bind to
+        # the loop that uses them.
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._admission: Optional[asyncio.Semaphore] = None
+        self._global: Optional[asyncio.Semaphore] = None
+        self._datasets: Dict[str, asyncio.Semaphore] = {}
+        # Worker threads only wait on QueryExecutor.run; one per slot.
+        self._threads = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="nozzle-aio")
+
+    @property
+    def saturated(self) -> bool:
+        return self.pending >= self.max_pending
+
+    def _semaphores(self, keys: List[str]) -> List[asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._datasets = {}
+            self._admission = asyncio.Semaphore(self.max_pending)
+            self._global = asyncio.Semaphore(self.max_concurrency)
+        for key in keys:
+            self._datasets.setdefault(key, asyncio.Semaphore(self.per_dataset))
+        # Always acquired in sorted-key order, so two queries over the same
+        # datasets cannot each hold a slot the other is waiting for.
+        return [self._datasets[key] for key in keys] + [self._global]
+
+    async def run(self, sql: str, deadline: Optional[float] = None) -> pd.DataFrame:
+        keys = datasets(sql)
+        slots = self._semaphores(keys)
+        async with self._admission:
+            self.pending += 1
+            acquired: List[asyncio.Semaphore] = []
+            try:
+                # A cancel part-way through releases only the slots already taken.
+                for slot in slots:
+                    await slot.acquire()
+                    acquired.append(slot)
+                return await self._execute(sql, deadline)
+            finally:
+                for slot in reversed(acquired):
+                    slot.release()
+                self.pending -= 1
+
+    async def _execute(self, sql: str, deadline: Optional[float]) -> pd.DataFrame:
+        cancel = threading.Event()
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        try:
+            return await loop.run_in_executor(self._threads, lambda: self.executor.run(sql, deadline, cancel))
+        except asyncio.CancelledError:
+            cancel.set()
+            raise
+        finally:
+            self.in_flight -= 1
+
+
+_executors: Dict[str, AsyncQueryExecutor] = {}
+
+
+def get_executor(client_url: str = DEFAULT_CLIENT_URL) -> AsyncQueryExecutor:
+    """The process-wide AsyncQueryExecutor for a gateway URL."""
+    if client_url not in _executors:
+        _executors[client_url] = AsyncQueryExecutor(client_url)
+    return _executors[client_url]
+
+
+async def run(sql: str, client_url: str = DEFAULT_CLIENT_URL, deadline: Optional[float] = None) -> pd.DataFrame:
+    return await get_executor(client_url).run(sql, deadline)
+
+
+async def gather_queries(
+    queries: Dict[str, str],
+    client_url: str = DEFAULT_CLIENT_URL,
+    deadline: Optional[float] = None,
+) -> Dict[str, pd.DataFrame]:
+    """Run named queries concurrently; results keep the input order.
+
+    If any query fails the others are cancelled and the error is raised.
+    """
+    executor = get_executor(client_url)
+    tasks = {name: asyncio.ensure_future(executor.run(sql, deadline)) for name, sql in queries.items()}
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    return {name: task.result() for name, task in tasks.items()}
@@ -0,0 +1,72 @@
+"""
+BillingUserDaily rows from decoded GraphPayments events.
+
+network/billing_user_daily_arbitrum.py fetches TokensAdded / TokensPulled /
+TokensRemoved as (user_id, timestamp, event_type, amount_raw) rows and hands
+them to billing_daily_for_users() one shard of users at a time
+(pipeline/shards.py), so the function lives here where pool workers can
+import it without re-running the build script.
+"""
+
+import logging
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DAILY_COLUMNS = [
+    "id",
+    "user_id",
+    "event_date",
+    "billing_balance",
+    "total_tokens_added",
+    "total_tokens_pulled",
+    "total_tokens_removed",
+    "accumulated_tokens_added",
+    "delta_tokens_added",
+]
+
+
+def billing_daily_for_users(billing_events: pd.DataFrame) -> pd.DataFrame:
+    """BillingUserDaily rows for the GraphPayments events of a set of users."""
+    billing_events["timestamp"] = pd.to_datetime(billing_events["timestamp"], unit="s", utc=True)
+    billing_events["tokens"] = billing_events["amount_raw"] / 1e18
+
+    billing_events["added_tokens"] = billing_events["tokens"].where(
+        billing_events["event_type"] == "added", 0.0
+    )
+    billing_events["total_tokens_pulled"] = billing_events["tokens"].where(
+        billing_events["event_type"] == "pulled", 0.0
+    )
+    billing_events["total_tokens_removed"] = billing_events["tokens"].where(
+        billing_events["event_type"] == "removed", 0.0
+    )
+    billing_events["net_tokens"] = (
+        billing_events["added_tokens"]
+        - billing_events["total_tokens_pulled"]
+        - billing_events["total_tokens_removed"]
+    )
+
+    billing_events["event_date"] = billing_events["timestamp"].dt.floor("D")
+
+    logger.debug("Aggregating %s events per (user, event_date)...", len(billing_events))
+    grouped = (
+        billing_events.groupby(["user_id", "event_date"], as_index=False)[
+            ["added_tokens", "total_tokens_pulled", "total_tokens_removed", "net_tokens"]
+        ].sum()
+    )
+
+    grouped = grouped.sort_values(["user_id", "event_date"])
+    grouped["accumulated_tokens_added"] = grouped.groupby("user_id")["added_tokens"].cumsum()
+    grouped["delta_tokens_added"] = grouped.groupby("user_id")["added_tokens"].diff().fillna(
+        grouped["added_tokens"]
+    )
+
+    grouped["billing_balance"] = grouped["net_tokens"]
+    grouped.rename(columns={"added_tokens": "total_tokens_added"}, inplace=True)
+
+    grouped["id"] = grouped.apply(
+        lambda row: f"{row['user_id']}-{row['event_date'].strftime('%Y-%m-%d')}", axis=1
+    )
+
+    return grouped[DAILY_COLUMNS].copy()
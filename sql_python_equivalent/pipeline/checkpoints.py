@@ -0,0 +1,126 @@
+"""
+Local Arrow IPC checkpoints of a script's query results.
+
+The builds upload once, at the very end, so a failed upload used to mean
+re-running every gateway query.  CheckpointStore.stage(name, sql, compute)
+instead writes each stage's result to
+
+    PIPELINE_CHECKPOINT_DIR/<script>/<run id>/<name>-<fingerprint(sql)>.arrow
+
+and, when that file already exists, reads it back through a memory map
+instead of calling compute().  A rerun therefore skips every stage that
+finished and resumes at the first one that did not:
+
+- run ids are UTC timestamps (or PIPELINE_RUN_ID).  A script run with
+  --resume reuses its latest unfinished run; without it a new run starts;
+- the file name carries the query fingerprint (pipeline/executor.py) and the
+  exact SQL digest is kept in the file's schema metadata, so a checkpoint
+  written for different SQL or block literals is recomputed, not reused;
+- files are written to a temporary name and renamed, so a crash mid-write
+  never leaves a truncated checkpoint behind;
+- complete() removes the run once the upload succeeded.
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from pipeline.executor import fingerprint
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = os.environ.get("PIPELINE_CHECKPOINT_DIR") or os.path.join(
+    tempfile.gettempdir(), "pipeline-checkpoints"
+)
+_SQL_KEY = b"pipeline.checkpoint.sql"
+
+
+def _sql_digest(sql: str) -> bytes:
+    return hashlib.sha1(" ".join(sql.split()).encode()).hexdigest().encode()
+
+
+class CheckpointStore:
+    """Per-run directory of stage results, keyed by stage name and query."""
+
+    def __init__(
+        self,
+        script: str,
+        run_id: Optional[str] = None,
+        resume: bool = False,
+        root: str = CHECKPOINT_DIR,
+    ) -> None:
+        self.base = os.path.join(root, script)
+        run_id = run_id or os.environ.get("PIPELINE_RUN_ID")
+        if run_id is None and resume:
+            run_id = self.latest_run()
+            if run_id is None:
+                logger.info("No checkpointed run of %s to resume; starting a new run.", script)
+        self.run_id = run_id or time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+        self.path = os.path.join(self.base, self.run_id)
+        os.makedirs(self.path, exist_ok=True)
+        logger.info("Checkpoints for %s run %s under %s.", script, self.run_id, self.path)
+
+    @classmethod
+    def from_argv(cls, script: str, argv: Optional[List[str]] = None) -> "CheckpointStore":
+        """Store for a script, honouring --resume / --run-id on its command line."""
+        parser = argparse.ArgumentParser(add_help=False)
+        parser.add_argument("--resume", action="store_true")
+        parser.add_argument("--run-id")
+        args, _ = parser.parse_known_args(argv)
+        return cls(script, run_id=args.run_id, resume=args.resume)
+
+    def latest_run(self) -> Optional[str]:
+        if not os.path.isdir(self.base):
+            return None
+        runs = sorted(entry for entry in os.listdir(self.base) if os.path.isdir(os.path.join(self.base, entry)))
+        return runs[-1] if runs else None
+
+    def _file(self, name: str, sql: str) -> str:
+        return os.path.join(self.path, f"{name}-{fingerprint(sql)}.arrow")
+
+    def stage(self, name: str, sql: str, compute: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """compute()'s result for this stage, from its checkpoint when one exists."""
+        path = self._file(name, sql)
+        if os.path.exists(path):
+            frame = self._read(path, _sql_digest(sql))
+            if frame is not None:
+                logger.info("Stage %s resumed from checkpoint (%s rows).", name, len(frame))
+                return frame
+            logger.warning("Checkpoint %s was written for different SQL; recomputing.", path)
+
+        frame = compute()
+        self._write(path, frame, _sql_digest(sql))
+        logger.info("Stage %s checkpointed (%s rows).", name, len(frame))
+        return frame
+
+    @staticmethod
+    def _read(path: str, digest: bytes) -> Optional[pd.DataFrame]:
+        # Not closed explicitly: the record batches reference the mapped file
+        # rather than a copy of it, and keep the mapping alive while in use.
+        reader = ipc.open_file(pa.memory_map(path))
+        if (reader.schema.metadata or {}).get(_SQL_KEY) != digest:
+            return None
+        return reader.read_all().to_pandas(split_blocks=True)
+
+    @staticmethod
+    def _write(path: str, frame: pd.DataFrame, digest: bytes) -> None:
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), _SQL_KEY: digest})
+        partial = f"{path}.partial"
+        with pa.OSFile(partial, "wb") as sink, ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(partial, path)
+
+    def complete(self) -> None:
+        """Drop this run's checkpoints once its output has been published."""
+        shutil.rmtree(self.path, ignore_errors=True)
+        logger.info("Run %s complete; checkpoints removed.", self.run_id)
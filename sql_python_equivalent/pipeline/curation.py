@@ -0,0 +1,187 @@
+"""
+Replay steps for the Signal and NameSignal entities (see pipeline/replay.py).
+
+Each step mirrors its subgraph handlers' arithmetic on a round of events:
+
+- signal_step:      curation.ts handleSignalled / handleBurned.
+- name_signal_step: gns.ts handleNSignalMintedV2 / handleNSignalBurnedV2 /
+                    handleGRTWithdrawnV2.
+
+signal_events_query() selects signal_step's events for a block window; the
+signal_arbitrum build reads all of them, the stream (pipeline/streaming.py)
+one micro-batch at a time.
+
+Amounts stay in wei as float64, as the SQL sums do; scripts divide token
+columns by 1e18 afterwards.  Cost basis per signal is tokens / signal, so it
+is the same in wei and GRT.  Balances that a full burn should take to zero
+can keep a few wei of float rounding, which would leave a tiny cost basis
+behind instead of the handler's exact zero; balances within DUST of the
+pre-burn balance are snapped to zero.
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+
+from pipeline.replay import Columns
+
+DUST = 1e-9
+
+# Event kinds, as the `kind` column of the replayed events.
+SIGNALLED, BURNED = 0, 1
+MINTED, NAME_BURNED, WITHDRAWN = 0, 1, 2
+
+SIGNAL_STATE: Dict[str, float] = {
+    "signalled_tokens": 0.0,
+    "unsignalled_tokens": 0.0,
+    "signal": 0.0,
+    "average_cost_basis": 0.0,
+    "average_cost_basis_per_signal": 0.0,
+    "created_at": np.nan,
+    "last_updated_at": np.nan,
+}
+SIGNAL_EVENT_COLUMNS = ["kind", "tokens", "curation_tax", "signal", "timestamp"]
+
+NAME_SIGNAL_STATE: Dict[str, float] = {
+    "signalled_tokens": 0.0,
+    "unsignalled_tokens": 0.0,
+    "withdrawn_tokens": 0.0,
+    "name_signal": 0.0,
+    "signal": 0.0,
+    "name_signal_average_cost_basis": 0.0,
+    "name_signal_average_cost_basis_per_signal": 0.0,
+    "signal_average_cost_basis": 0.0,
+    "signal_average_cost_basis_per_signal": 0.0,
+    "last_name_signal_change": np.nan,
+}
+NAME_SIGNAL_EVENT_COLUMNS = ["kind", "tokens", "name_signal", "signal", "timestamp"]
+
+CURATION_ADDRESS = "22d78fb4bc72e191C765807f8891B5e1785C8014"
+SIGNALLED_EVENT = 'Signalled(address indexed curator, bytes32 indexed subgraphDeploymentID, uint256 tokens, uint256 signal, uint256 curationTax)'
+BURNED_EVENT = 'Burned(address indexed curator, bytes32 indexed subgraphDeploymentID, uint256 tokens, uint256 signal)'
+
+
+def signal_events_query(after_block: int = -1, to_block: Optional[int] = None) -> str:
+    """Signalled / Burned events for signal_step, in blocks (after_block, to_block].
+
+    Decoded from the Curation contract's logs with log_index, which the
+    replay needs to order two events of one (curator, deployment) in the same
+    block.
+    """
+    upper = f"\n      AND l.block_num <= {to_block}" if to_block is not None else ""
+    return f'''
+WITH curation_logs AS (
+    SELECT l.topic0, l.topic1, l.topic2, l.topic3, l.data, l.block_num, l.log_index, l.timestamp
+    FROM "edgeandnode/arbitrum_one@0.0.1".logs l
+    WHERE l.address = arrow_cast(x'{CURATION_ADDRESS}', 'FixedSizeBinary(20)')
+      AND l.block_num > {after_block}{upper}
+),
+signalled AS (
+    SELECT
+        evm_decode(topic1, topic2, topic3, data, '{SIGNALLED_EVENT}') AS event,
+        block_num, log_index, timestamp
+    FROM curation_logs
+    WHERE topic0 = evm_topic('{SIGNALLED_EVENT}')
+),
+burned AS (
+    SELECT
+        evm_decode(topic1, topic2, topic3, data, '{BURNED_EVENT}') AS event,
+        block_num, log_index, timestamp
+    FROM curation_logs
+    WHERE topic0 = evm_topic('{BURNED_EVENT}')
+)
+SELECT
+    event['curator'] AS curator_id,
+    event['subgraphDeploymentID'] AS subgraph_deployment_id,
+    {SIGNALLED} AS kind,
+    arrow_cast(event['tokens'], 'Float64') AS tokens,
+    arrow_cast(event['curationTax'], 'Float64') AS curation_tax,
+    arrow_cast(event['signal'], 'Float64') AS signal,
+    block_num, log_index, timestamp
+FROM signalled
+UNION ALL
+SELECT
+    event['curator'] AS curator_id,
+    event['subgraphDeploymentID'] AS subgraph_deployment_id,
+    {BURNED} AS kind,
+    arrow_cast(event['tokens'], 'Float64') AS tokens,
+    0.0 AS curation_tax,
+    arrow_cast(event['signal'], 'Float64') AS signal,
+    block_num, log_index, timestamp
+FROM burned
+'''
+
+
+def _burn(balance: np.ndarray, amount: np.ndarray) -> np.ndarray:
+    remaining = balance - amount
+    return np.where(np.abs(remaining) <= DUST * np.abs(balance), 0.0, remaining)
+
+
+def _per_signal(basis: np.ndarray, balance: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    """basis / balance, keeping the previous value where balance is zero."""
+    out = previous.copy()
+    np.divide(basis, balance, out=out, where=balance != 0)
+    return out
+
+
+def _rescale(balance: np.ndarray, per_signal: np.ndarray):
+    """Cost basis after a burn, and its per-signal rate (zeroed with it)."""
+    basis = balance * per_signal
+    return basis, np.where(basis == 0, 0.0, per_signal)
+
+
+def signal_step(state: Columns, event: Columns) -> None:
+    signalled = event["kind"] == SIGNALLED
+    tokens = event["tokens"]
+
+    state["created_at"] = np.where(np.isnan(state["created_at"]), event["timestamp"], state["created_at"])
+    state["last_updated_at"] = event["timestamp"]
+    state["signalled_tokens"] = state["signalled_tokens"] + np.where(signalled, tokens - event["curation_tax"], 0.0)
+    state["unsignalled_tokens"] = state["unsignalled_tokens"] + np.where(signalled, 0.0, tokens)
+
+    # handleSignalled: basis += tokens (tax included), rate = basis / signal.
+    signal = np.where(signalled, state["signal"] + event["signal"], _burn(state["signal"], event["signal"]))
+    minted_basis = state["average_cost_basis"] + tokens
+    minted_rate = _per_signal(minted_basis, signal, state["average_cost_basis_per_signal"])
+    # handleBurned: basis = remaining signal * rate; rate resets once basis is 0.
+    burned_basis, burned_rate = _rescale(signal, state["average_cost_basis_per_signal"])
+
+    state["signal"] = signal
+    state["average_cost_basis"] = np.where(signalled, minted_basis, burned_basis)
+    state["average_cost_basis_per_signal"] = np.where(signalled, minted_rate, burned_rate)
+
+
+def name_signal_step(state: Columns, event: Columns) -> None:
+    kind = event["kind"]
+    minted = kind == MINTED
+    burned = kind == NAME_BURNED
+    withdrawn = kind == WITHDRAWN
+    tokens = event["tokens"]
+
+    state["last_name_signal_change"] = event["timestamp"]
+    state["signalled_tokens"] = state["signalled_tokens"] + np.where(minted, tokens, 0.0)
+    state["unsignalled_tokens"] = state["unsignalled_tokens"] + np.where(burned, tokens, 0.0)
+    # GRTWithdrawn sets withdrawnTokens rather than adding to it.
+    state["withdrawn_tokens"] = np.where(withdrawn, tokens, state["withdrawn_tokens"])
+
+    name_signal = np.where(
+        minted, state["name_signal"] + event["name_signal"], _burn(state["name_signal"], event["name_signal"])
+    )
+    # GRTWithdrawn resets vSignal to 0 ("it should be 0 anyways").
+    signal = np.where(
+        minted,
+        state["signal"] + event["signal"],
+        np.where(withdrawn, 0.0, _burn(state["signal"], event["signal"])),
+    )
+
+    for prefix, balance in (("name_signal", name_signal), ("signal", signal)):
+        basis_col = f"{prefix}_average_cost_basis"
+        rate_col = f"{basis_col}_per_signal"
+        minted_basis = state[basis_col] + tokens
+        minted_rate = _per_signal(minted_basis, balance, state[rate_col])
+        burned_basis, burned_rate = _rescale(balance, state[rate_col])
+        state[basis_col] = np.where(minted, minted_basis, np.where(withdrawn, 0.0, burned_basis))
+        state[rate_col] = np.where(minted, minted_rate, np.where(withdrawn, 0.0, burned_rate))
+
+    state["name_signal"] = name_signal
+    state["signal"] = signal
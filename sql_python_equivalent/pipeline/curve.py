@@ -0,0 +1,116 @@
+"""
+Per-deployment bonding-curve state and its pricePerShare history.
+
+SubgraphDeployment.signalledTokens / signalAmount move on Signalled,
+Burned, AllocationCollected and RebateCollected, and each of those handlers
+recomputes pricePerShare with calculatePricePerShare (helpers.ts):
+
+    signalledTokens / signalAmount * (1M / reserveRatio)
+
+where 1M / reserveRatio is integer division, a reserveRatio of 0 uses the
+hotfix multiplier 2, and a zero signalAmount prices at 0.
+
+curve_state() takes per-(deployment, block) deltas -- the SQL already sums
+the events of one block, so no per-event rows reach Python -- runs one
+cumulative sum per deployment over block order and returns:
+
+- the final state per deployment (signalled_tokens, signal_amount,
+  reserve_ratio, price_per_share);
+- the price history in run-length form: one row per run of consecutive
+  blocks with the same end-of-block price, [start_block, end_block), with
+  end_block null for the current run.
+
+Amounts stay in wei; scripts scale token columns afterwards.
+"""
+
+import logging
+from typing import Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+MAX_WEIGHT = 1_000_000
+# calculatePricePerShare's "known previous default" for a reserveRatio of 0.
+ZERO_RATIO_MULTIPLIER = 2
+# deployment.reserveRatio copies graphNetwork.defaultReserveRatio, which is
+# only ever read by contract call on a Curation ParameterUpdated and stays
+# at its createOrLoadGraphNetwork value of 0 on Arbitrum; calculatePricePerShare
+# then uses ZERO_RATIO_MULTIPLIER.
+DEFAULT_RESERVE_RATIO = 0
+
+STATE_COLUMNS = ["deployment", "signalled_tokens", "signal_amount", "reserve_ratio", "price_per_share"]
+HISTORY_COLUMNS = ["deployment", "start_block", "end_block", "start_at", "price_per_share"]
+
+Ratio = Union[int, np.ndarray]
+
+
+def reserve_ratio_multiplier(reserve_ratio: Ratio) -> np.ndarray:
+    ratio = np.asarray(reserve_ratio, dtype=np.int64)
+    return np.where(ratio == 0, ZERO_RATIO_MULTIPLIER, MAX_WEIGHT // np.maximum(ratio, 1))
+
+
+def price_per_share(signalled_tokens: np.ndarray, signal_amount: np.ndarray, reserve_ratio: Ratio) -> np.ndarray:
+    """calculatePricePerShare over arrays."""
+    price = np.zeros(len(signalled_tokens), dtype=np.float64)
+    np.divide(signalled_tokens, signal_amount, out=price, where=signal_amount != 0)
+    return price * reserve_ratio_multiplier(reserve_ratio)
+
+
+def curve_state(
+    deltas: pd.DataFrame, reserve_ratio: Ratio = DEFAULT_RESERVE_RATIO
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Final curve state and run-length price history per deployment.
+
+    deltas has one row per (deployment, block_num) with the block's summed
+    tokens (signalledTokens delta) and signal (signalAmount delta), and its
+    timestamp.  reserve_ratio is one value for every deployment.
+    """
+    if deltas.empty:
+        return pd.DataFrame(columns=STATE_COLUMNS), pd.DataFrame(columns=HISTORY_COLUMNS)
+
+    deltas = deltas.sort_values(["deployment", "block_num"], kind="stable", ignore_index=True)
+    deployment = deltas["deployment"].to_numpy()
+    block = deltas["block_num"].to_numpy(dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, deployment[1:] != deployment[:-1]])
+    ends = np.r_[starts[1:], len(deltas)]
+    group_start = np.repeat(starts, ends - starts)
+
+    def running(column: str) -> np.ndarray:
+        total = np.cumsum(deltas[column].to_numpy(dtype=np.float64))
+        offset = np.r_[0.0, total][group_start]
+        return total - offset
+
+    signalled = running("tokens")
+    signal = running("signal")
+    price = price_per_share(signalled, signal, reserve_ratio)
+
+    last = ends - 1
+    state = pd.DataFrame({
+        "deployment": deployment[last],
+        "signalled_tokens": signalled[last],
+        "signal_amount": signal[last],
+        "reserve_ratio": np.broadcast_to(np.asarray(reserve_ratio, dtype=np.int64), len(last)),
+        "price_per_share": price[last],
+    })
+
+    # A run starts at each deployment's first block and wherever the price changes.
+    run_start = np.r_[True, (deployment[1:] != deployment[:-1]) | (price[1:] != price[:-1])]
+    rows = np.flatnonzero(run_start)
+    next_row = np.r_[rows[1:], len(deltas)]
+    same_deployment = np.r_[deployment[rows[1:]] == deployment[rows[:-1]], False]
+    end_block = pd.array(block[np.minimum(next_row, len(deltas) - 1)], dtype="Int64")
+    end_block[~same_deployment] = pd.NA
+    history = pd.DataFrame({
+        "deployment": deployment[rows],
+        "start_block": block[rows],
+        "end_block": end_block,
+        "start_at": deltas["timestamp"].to_numpy()[rows],
+        "price_per_share": price[rows],
+    })
+    logger.info(
+        "Curve state for %s deployments; %s blocks folded into %s price runs.",
+        len(state), len(deltas), len(history),
+    )
+    return state, history
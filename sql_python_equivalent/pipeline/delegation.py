@@ -0,0 +1,314 @@
+"""
+Indexer delegation exchange-rate timeline and the DelegatedStake replay step.
+
+DelegatedStake.realizedRewards grows on every StakeDelegatedLocked by
+
+    shares * (indexer.delegationExchangeRate - delegatedStake.personalExchangeRate)
+
+with the indexer's rate as it stood *before* the undelegation updated the
+pool (staking.ts handleStakeDelegatedLocked).  The rate is
+delegatedTokens / delegatorShares (updateDelegationExchangeRate, helpers.ts),
+recomputed after every pool change while shares are non-zero and otherwise
+left as it was; a new indexer starts at 1.
+
+ExchangeRateTimeline holds the pool and that rate after every pool change as
+sorted arrays per indexer.  It is built from pool_deltas(): StakeDelegated /
+StakeDelegatedLocked rows (delegation_deltas_query) plus the legacy pool
+inflows of the economics stream (economics.legacy_pool_inflow_events) -- the
+same inflows indexer_arbitrum adds to delegated_tokens, including
+HorizonRewardsAssigned on legacy allocations.  Rewards that reach an empty
+pool are dropped there, as processRewardsAssigned gives them all to the
+indexer.  rate_before() / pool_before() look up the as-of rate or pool for
+any batch of events with one binary search per indexer.  A timeline keeps
+each pool's closing totals, so one built from a later block window can be
+seeded with them and continue where the previous one stopped.
+
+delegated_stake_step then replays each (delegator, indexer)'s events
+(pipeline/replay.py) with the attached rate, so realized rewards come out of
+the same pass as personalExchangeRate; delegated_stake_metrics() runs that
+replay for the build's shards.
+
+Positions are (block_num, log_index) packed by position(); amounts stay in wei.
+"""
+
+import logging
+from typing import TYPE_CHECKING, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from pipeline.economics import legacy_pool_inflow_events
+from pipeline.replay import Columns, replay
+
+if TYPE_CHECKING:  # the replay steps and timeline math run without nozzle
+    from pipeline.executor import QueryExecutor
+
+logger = logging.getLogger(__name__)
+
+INITIAL_RATE = 1.0
+LOG_INDEX_BITS = 16
+# Event kinds, as the `kind` column of the replayed DelegatedStake events.
+DELEGATED, LOCKED = 0, 1
+OPENING_COLUMNS = ["indexer", "tokens", "shares", "rate"]
+REWARD_COLUMNS = ["indexer", "block_num", "log_index", "tokens"]
+# Relative to the shares a pool has moved, what still counts as 0 shares.
+EMPTY_POOL_TOLERANCE = 1e-9
+
+
+def _window(column: str, after_block: int, to_block: Optional[int]) -> str:
+    upper = f" AND {column} <= {to_block}" if to_block is not None else ""
+    return f"{column} > {after_block}{upper}"
+
+
+def delegation_deltas_query(after_block: int = -1, to_block: Optional[int] = None) -> str:
+    """StakeDelegated / StakeDelegatedLocked pool token / share deltas for blocks in (after_block, to_block]."""
+    return f"""
+SELECT event['indexer'] AS indexer, block_num, log_index,
+    arrow_cast(event['tokens'], 'Float64') AS tokens, arrow_cast(event['shares'], 'Float64') AS shares
+FROM arbitrum_staking.stake_delegated
+WHERE {_window("block_num", after_block, to_block)}
+UNION ALL
+SELECT event['indexer'] AS indexer, block_num, log_index,
+    -arrow_cast(event['tokens'], 'Float64') AS tokens, -arrow_cast(event['shares'], 'Float64') AS shares
+FROM arbitrum_staking.stake_delegated_locked
+WHERE {_window("block_num", after_block, to_block)}
+"""
+
+
+DELEGATION_DELTAS_QUERY = delegation_deltas_query()
+
+
+def pool_deltas(delegations: pd.DataFrame, inflows: pd.DataFrame) -> pd.DataFrame:
+    """delegation_deltas_query() rows plus economics.legacy_pool_inflow_events() rows.
+
+    The result is what from_deltas() takes: indexer, block_num, log_index,
+    tokens, shares and `reward`, which marks the reward inflows an empty pool
+    does not get.
+    """
+    columns = ["indexer", "block_num", "log_index", "tokens", "shares"]
+    return pd.concat(
+        [delegations[columns].assign(reward=False), inflows[[*columns, "reward"]]], ignore_index=True
+    )
+
+
+# StakeDelegated / StakeDelegatedLocked per (delegator, indexer), with
+# {block_range} placeholders (pipeline/partitioned.render_partition).
+DELEGATED_STAKE_EVENTS_QUERY = f'''
+SELECT event['delegator'] AS delegator_id, event['indexer'] AS indexer_id, {DELEGATED} AS kind,
+    arrow_cast(event['tokens'], 'Float64') AS tokens, arrow_cast(event['shares'], 'Float64') AS shares,
+    block_num, log_index, timestamp
+FROM arbitrum_staking.stake_delegated d
+WHERE {{block_range:d}}
+
+UNION ALL
+
+SELECT event['delegator'] AS delegator_id, event['indexer'] AS indexer_id, {LOCKED} AS kind,
+    arrow_cast(event['tokens'], 'Float64') AS tokens, arrow_cast(event['shares'], 'Float64') AS shares,
+    block_num, log_index, timestamp
+FROM arbitrum_staking.stake_delegated_locked u
+WHERE {{block_range:u}}
+'''
+
+
+def position(block_num, log_index) -> np.ndarray:
+    """(block_num, log_index) packed into one sortable int64."""
+    return (np.asarray(block_num, dtype=np.int64) << LOG_INDEX_BITS) | np.asarray(log_index, dtype=np.int64)
+
+
+class ExchangeRateTimeline:
+    """Per-indexer delegation pool and delegationExchangeRate after each change, as sorted arrays."""
+
+    def __init__(
+        self,
+        indexers: np.ndarray,
+        positions: np.ndarray,
+        rates: np.ndarray,
+        closing: Optional[pd.DataFrame] = None,
+        tokens: Optional[np.ndarray] = None,
+        shares: Optional[np.ndarray] = None,
+        rewards: Optional[pd.DataFrame] = None,
+    ) -> None:
+        order = np.lexsort((positions, indexers))
+        self.positions = positions[order]
+        self.rates = rates[order]
+        # Pool totals after each change (zeros when only rates are given).
+        self.tokens = tokens[order] if tokens is not None else np.zeros(len(order))
+        self.shares = shares[order] if shares is not None else np.zeros(len(order))
+        self.indexers, starts = np.unique(indexers[order], return_index=True)
+        self.bounds = np.append(starts, len(order))
+        # Each indexer's pool after its last change (indexer, tokens, shares, rate).
+        self.closing = closing if closing is not None else pd.DataFrame(columns=OPENING_COLUMNS)
+        # Reward inflows as paid into the pool (indexer, block_num, log_index, tokens).
+        self.rewards = rewards if rewards is not None else pd.DataFrame(columns=REWARD_COLUMNS)
+
+    @classmethod
+    def from_deltas(cls, deltas: pd.DataFrame, opening: Optional[pd.DataFrame] = None) -> "ExchangeRateTimeline":
+        """Timeline from pool token / share deltas (indexer, block_num, log_index, tokens, shares).
+
+        opening, a previous timeline's closing, seeds every indexer's pool so
+        that deltas after it continue the running totals and held rates.
+        Rows with a true `reward` column (pool_deltas()) are dropped while
+        the pool is empty, as processRewardsAssigned gives the indexer the
+        whole amount when delegatedTokens is 0.
+        """
+        reward = deltas["reward"].to_numpy(dtype=bool) if "reward" in deltas.columns else False
+        deltas = deltas[["indexer", "block_num", "log_index", "tokens", "shares"]].assign(seed_rate=np.nan, reward=reward)
+        if opening is not None and not opening.empty:
+            seeds = pd.DataFrame({
+                "indexer": opening["indexer"].to_numpy(),
+                "block_num": -1,
+                "log_index": 0,
+                "tokens": opening["tokens"].to_numpy(dtype=np.float64),
+                "shares": opening["shares"].to_numpy(dtype=np.float64),
+                "seed_rate": opening["rate"].to_numpy(dtype=np.float64),
+                "reward": False,
+            })
+            deltas = pd.concat([seeds, deltas], ignore_index=True)
+        deltas = deltas.sort_values(["indexer", "block_num", "log_index"], kind="stable", ignore_index=True)
+        indexers = deltas["indexer"].to_numpy()
+        starts = np.flatnonzero(np.r_[True, indexers[1:] != indexers[:-1]][: len(indexers)])
+        group_start = np.repeat(starts, np.diff(np.append(starts, len(deltas))))
+
+        def running(values: np.ndarray) -> np.ndarray:
+            return pd.Series(values).groupby(group_start, sort=False).cumsum().to_numpy(dtype=np.float64)
+
+        # Tokens and shares only reach 0 together (undelegating every share
+        # takes every token), so the pool counts as empty where the shares
+        # are 0, up to float64 rounding of the shares moved so far.  Inflows
+        # move no shares, so a reward row sees the pool as it was before it.
+        share_deltas = deltas["shares"].to_numpy(dtype=np.float64)
+        shares = running(share_deltas)
+        reward = deltas["reward"].to_numpy(dtype=bool)
+        empty = reward & (np.abs(shares) <= EMPTY_POOL_TOLERANCE * running(np.abs(share_deltas)))
+        tokens = running(np.where(empty, 0.0, deltas["tokens"].to_numpy(dtype=np.float64)))
+
+        seed_rate = deltas["seed_rate"].to_numpy(dtype=np.float64)
+        seeded = ~np.isnan(seed_rate)
+        # Recomputed only while shares are non-zero; otherwise the last rate
+        # (or the seeded one) holds.
+        updated = (shares != 0) | seeded
+        last = np.where(updated, np.arange(len(deltas)), -1)
+        last = np.maximum.accumulate(last)
+        rate = np.full(len(deltas), INITIAL_RATE)
+        holds = last >= group_start
+        at = last[holds]
+        held = seed_rate[at]
+        plain = ~seeded[at]
+        held[plain] = tokens[at][plain] / shares[at][plain]
+        rate[holds] = held
+        logger.info(
+            "Exchange-rate timeline: %s pool changes over %s indexers, %s rewards to empty pools skipped.",
+            int((~seeded).sum()), len(starts), int(empty.sum()),
+        )
+
+        ends = np.append(starts[1:], len(deltas)) - 1 if len(deltas) else np.zeros(0, dtype=np.int64)
+        closing = pd.DataFrame({
+            "indexer": indexers[ends], "tokens": tokens[ends], "shares": shares[ends], "rate": rate[ends],
+        })
+        rewards = deltas.loc[reward & ~empty, REWARD_COLUMNS].reset_index(drop=True)
+        return cls(
+            indexers, position(deltas["block_num"], deltas["log_index"]), rate, closing, tokens, shares, rewards
+        )
+
+    @classmethod
+    def load(cls, executor: "QueryExecutor", stream: pd.DataFrame) -> "ExchangeRateTimeline":
+        """Timeline of the full history: delegations from the gateway, inflows from the economics stream."""
+        return cls.from_deltas(pool_deltas(executor.run(DELEGATION_DELTAS_QUERY), legacy_pool_inflow_events(stream)))
+
+    def _before(self, indexers, positions, values: np.ndarray, default: float) -> np.ndarray:
+        """values as of just before each position(), per indexer (default before any change)."""
+        indexers = np.asarray(indexers)
+        positions = np.asarray(positions, dtype=np.int64)
+        out = np.full(len(indexers), default)
+        slot = np.searchsorted(self.indexers, indexers)
+        known = slot < len(self.indexers)
+        known[known] = self.indexers[slot[known]] == indexers[known]
+
+        order = np.flatnonzero(known)[np.argsort(slot[known], kind="stable")]
+        groups = np.flatnonzero(np.diff(slot[order], prepend=-1) != 0)
+        for lo, hi in zip(groups, np.append(groups[1:], len(order))):
+            rows = order[lo:hi]
+            first, end = self.bounds[slot[rows[0]]], self.bounds[slot[rows[0]] + 1]
+            # side="left": the event's own pool change is not yet applied.
+            i = np.searchsorted(self.positions[first:end], positions[rows], side="left")
+            out[rows] = np.where(i > 0, values[first:end][np.maximum(i - 1, 0)], default)
+        return out
+
+    def rate_before(self, indexers, positions) -> np.ndarray:
+        """Each event's indexer rate as of just before its position()."""
+        return self._before(indexers, positions, self.rates, INITIAL_RATE)
+
+    def pool_before(self, indexers, positions) -> pd.DataFrame:
+        """Each indexer's pool (tokens, shares, rate) as of just before a position()."""
+        return pd.DataFrame({
+            "tokens": self._before(indexers, positions, self.tokens, 0.0),
+            "shares": self._before(indexers, positions, self.shares, 0.0),
+            "rate": self.rate_before(indexers, positions),
+        })
+
+
+DELEGATED_STAKE_STATE: Dict[str, float] = {
+    "personal_exchange_rate": 1.0,
+    "shares": 0.0,
+    "total_staked": 0.0,
+    "total_unstaked": 0.0,
+    "realized_rewards": 0.0,
+    "created_at": np.nan,
+    "last_delegated_at": np.nan,
+    "last_undelegated_at": np.nan,
+}
+DELEGATED_STAKE_EVENT_COLUMNS = ["kind", "tokens", "shares", "exchange_rate", "timestamp"]
+
+
+def delegated_stake_step(state: Columns, event: Columns) -> None:
+    """handleStakeDelegated / handleStakeDelegatedLocked (staking.ts) for one round."""
+    delegated = event["kind"] == DELEGATED
+    tokens, shares = event["tokens"], event["shares"]
+
+    # Delegation: weighted-average cost basis, only for non-zero shares.
+    new_shares = state["shares"] + shares
+    basis = state["personal_exchange_rate"] * state["shares"] + tokens
+    rate = state["personal_exchange_rate"].copy()
+    np.divide(basis, new_shares, out=rate, where=delegated & (shares != 0) & (new_shares > 0))
+
+    # Undelegation: shares * (pool rate before the event - personal rate).
+    realized = np.where(delegated, 0.0, shares * (event["exchange_rate"] - state["personal_exchange_rate"]))
+
+    state["personal_exchange_rate"] = rate
+    state["shares"] = np.where(delegated, new_shares, state["shares"] - shares)
+    state["total_staked"] = state["total_staked"] + np.where(delegated, tokens, 0.0)
+    state["total_unstaked"] = state["total_unstaked"] + np.where(delegated, 0.0, tokens)
+    state["realized_rewards"] = state["realized_rewards"] + realized
+    first_delegation = delegated & np.isnan(state["created_at"])
+    state["created_at"] = np.where(first_delegation, event["timestamp"], state["created_at"])
+    state["last_delegated_at"] = np.where(delegated, event["timestamp"], state["last_delegated_at"])
+    state["last_undelegated_at"] = np.where(delegated, state["last_undelegated_at"], event["timestamp"])
+
+
+def delegated_stake_metrics(events: pd.DataFrame) -> pd.DataFrame:
+    """DelegatedStake fields per (delegator_id, indexer_id), tokens in GRT.
+
+    Every pair's events must be in the frame; a shard_by_key worker
+    (pipeline/shards.py) gets one shard of pairs.
+    """
+    state = replay(
+        events,
+        keys=["delegator_id", "indexer_id"],
+        order=["block_num", "log_index"],
+        step=delegated_stake_step,
+        state=DELEGATED_STAKE_STATE,
+        columns=DELEGATED_STAKE_EVENT_COLUMNS,
+    )
+    return pd.DataFrame({
+        "delegator_id": state["delegator_id"],
+        "indexer_id": state["indexer_id"],
+        "personal_exchange_rate": state["personal_exchange_rate"],
+        "share_amount": state["shares"] / 1e18,
+        "total_staked_tokens": state["total_staked"] / 1e18,
+        "total_unstaked_tokens": state["total_unstaked"] / 1e18,
+        "staked_tokens": (state["total_staked"] - state["total_unstaked"]) / 1e18,
+        "realized_rewards": state["realized_rewards"] / 1e18,
+        "created_at": state["created_at"],
+        "last_delegated_at": state["last_delegated_at"].astype("Int64"),
+        "last_undelegated_at": state["last_undelegated_at"].astype("Int64"),
+    })
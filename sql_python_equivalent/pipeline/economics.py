@@ -0,0 +1,498 @@
+"""
+One allocation-economics event stream for both protocol generations.
+
+Rewards, query fees and allocated tokens reach Allocation, Indexer,
+SubgraphDeployment and GraphNetwork through two sets of handlers:
+
+- legacy:  staking.ts AllocationCreated / AllocationClosed (both variants) /
+           AllocationCollected / RebateCollected / RebateClaimed, and
+           rewardsManager.ts RewardsAssigned / HorizonRewardsAssigned;
+- horizon: subgraphService.ts AllocationCreated / AllocationResized /
+           AllocationClosed / IndexingRewardsCollected / QueryFeesCollected.
+
+economics_query() decodes all of them from the raw logs into one schema,
+one row per log, with every amount already in the entity fields it moves
+(wei, float64):
+
+    source ('legacy' | 'horizon'), event_type, indexer, allocation,
+    subgraph_deployment, tx_hash, block_num, log_index, timestamp,
+    allocated_tokens (signed delta), indexing_rewards,
+    indexing_indexer_rewards, indexing_delegator_rewards,
+    query_fees_collected, curator_rewards, distributed_rebates,
+    total_query_fees, taxed_query_fees, query_fee_rebates, delegation_fees
+
+The per-event splits are resolved in SQL: legacy rewards by the indexer's
+indexingRewardCut in effect at the event (processRewardsAssigned), Horizon
+query fees by the SubgraphService provision's queryFeeCut
+(handleQueryFeesCollected).  query_fee_rebates / delegation_fees are NULL on
+rows that do not touch them; RebateCollected / RebateClaimed overwrite the
+Allocation fields while QueryFeesCollected adds to them (SET_EVENTS).
+
+build_stream() appends a refresh to the stored stream, dedupes on
+(tx_hash, log_index), keeps HorizonRewardsAssigned only for legacy
+allocations (handleHorizonRewardsAssigned; Horizon allocations are paid
+through IndexingRewardsCollected) and fills reward rows' deployment from the
+allocation's creation.  network/allocation_economics_arbitrum.py publishes it
+once per run and the entity builds aggregate it with economics_totals(),
+legacy_pool_inflows(), graph_network_totals(), allocation_fee_events() and
+lifecycle_events(); legacy_pool_inflow_events() feeds the same pool inflows
+to the delegation exchange-rate timeline (pipeline/delegation.py).  allocation_events() / allocation_step instead fold the
+stream into Allocation fields one event at a time (pipeline/replay.py), for
+the stream's micro-batches (pipeline/streaming.py).
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from pipeline.fees import CUMULATIVE_FIELDS, FEE_FIELDS, SET_FIELDS
+from pipeline.provisions import DELEGATION_FEE_CUT_SET, STAKING_ADDRESS, SUBGRAPH_SERVICE_ADDRESS
+from pipeline.replay import Columns
+
+logger = logging.getLogger(__name__)
+
+ECONOMICS_TABLE = "allocation_economics_arbitrum"
+REWARDS_MANAGER_ADDRESS = "971b9d3d0ae3eca029cab5ea1fb0f72c85e6a525"
+# GraphNetwork.protocolFeePercentage (staking.protocolPercentage(), in PPM)
+# as set on Arbitrum; the handler reads it from the entity, not the event.
+PROTOCOL_FEE_PPM = 10_000
+
+LEGACY, HORIZON = "legacy", "horizon"
+
+KEY_COLUMNS: List[str] = [
+    "source", "event_type", "indexer", "allocation", "subgraph_deployment",
+    "tx_hash", "block_num", "log_index", "timestamp",
+]
+CUMULATIVE_COLUMNS: List[str] = [
+    "allocated_tokens",
+    "indexing_rewards",
+    "indexing_indexer_rewards",
+    "indexing_delegator_rewards",
+    "query_fees_collected",
+    "curator_rewards",
+    "distributed_rebates",
+    "total_query_fees",
+    "taxed_query_fees",
+]
+SET_COLUMNS: List[str] = ["query_fee_rebates", "delegation_fees"]
+AMOUNT_COLUMNS: List[str] = CUMULATIVE_COLUMNS + SET_COLUMNS
+STREAM_COLUMNS: List[str] = KEY_COLUMNS + AMOUNT_COLUMNS
+# Legacy handlers overwrite Allocation.queryFeeRebates / delegationFees.
+SET_EVENTS = {"RebateCollected", "RebateClaimed"}
+# processRewardsAssigned; an empty legacy delegation pool gets none of these.
+REWARD_EVENTS = {"RewardsAssigned", "HorizonRewardsAssigned"}
+# What legacy events pay into Indexer.delegatedTokens.
+POOL_INFLOW_COLUMNS: List[str] = ["indexing_delegator_rewards", "delegation_fees"]
+POOL_STREAM_COLUMNS: List[str] = ["source", "event_type", "indexer", "block_num", "log_index", *POOL_INFLOW_COLUMNS]
+LIFECYCLE_KINDS = {"AllocationCreated": "created", "AllocationResized": "resized", "AllocationClosed": "closed"}
+# Event kinds, as the `kind` column of allocation_events().
+CREATED, RESIZED, CLOSED, FEES = 0, 1, 2, 3
+_ALLOCATION_KINDS = {"AllocationCreated": CREATED, "AllocationResized": RESIZED, "AllocationClosed": CLOSED}
+
+ALLOCATION_STATE: Dict[str, float] = {
+    "allocated_tokens": 0.0,
+    "created_at": np.nan,
+    "created_block": np.nan,
+    "closed_at": np.nan,
+    "closed_block": np.nan,
+    **{field: 0.0 for field in FEE_FIELDS},
+}
+ALLOCATION_EVENT_COLUMNS = ["kind", "allocated_tokens", "block_num", "timestamp", "additive", *FEE_FIELDS]
+
+LEGACY_ALLOCATION_CREATED = "AllocationCreated(address indexed indexer, bytes32 indexed subgraphDeploymentID, uint256 epoch, uint256 tokens, address indexed allocationID, bytes32 metadata)"
+LEGACY_ALLOCATION_CLOSED = "AllocationClosed(address indexed indexer, bytes32 indexed subgraphDeploymentID, uint256 epoch, uint256 tokens, address indexed allocationID, address sender, bytes32 poi, bool isPublic)"
+LEGACY_ALLOCATION_CLOSED_COBB_DOUGLAS = "AllocationClosed(address indexed indexer, bytes32 indexed subgraphDeploymentID, uint256 epoch, uint256 tokens, address indexed allocationID, uint256 effectiveAllocation, address sender, bytes32 poi, bool isPublic)"
+ALLOCATION_COLLECTED = "AllocationCollected(address indexed indexer, bytes32 indexed subgraphDeploymentID, uint256 epoch, uint256 tokens, address indexed allocationID, address from, uint256 curationFees, uint256 rebateFees)"
+REBATE_COLLECTED = "RebateCollected(address assetHolder, address indexed indexer, bytes32 indexed subgraphDeploymentID, address indexed allocationID, uint256 epoch, uint256 tokens, uint256 protocolTax, uint256 curationFees, uint256 queryFees, uint256 queryRebates, uint256 delegationRewards)"
+REBATE_CLAIMED = "RebateClaimed(address indexed indexer, bytes32 indexed subgraphDeploymentID, address indexed allocationID, uint256 epoch, uint256 forEpoch, uint256 tokens, uint256 unclaimedAllocationsCount, uint256 delegationFees)"
+REWARDS_ASSIGNED = "RewardsAssigned(address indexed indexer, address indexed allocationID, uint256 epoch, uint256 amount)"
+HORIZON_REWARDS_ASSIGNED = "HorizonRewardsAssigned(address indexed indexer, address indexed allocationID, uint256 amount)"
+ALLOCATION_CREATED = "AllocationCreated(address indexed indexer, address indexed allocationId, bytes32 indexed subgraphDeploymentId, uint256 tokens, uint256 currentEpoch)"
+ALLOCATION_RESIZED = "AllocationResized(address indexed indexer, address indexed allocationId, bytes32 indexed subgraphDeploymentId, uint256 newTokens, uint256 oldTokens)"
+ALLOCATION_CLOSED = "AllocationClosed(address indexed indexer, address indexed allocationId, bytes32 indexed subgraphDeploymentId, uint256 tokens, bool forceClosed)"
+INDEXING_REWARDS_COLLECTED = "IndexingRewardsCollected(address indexed indexer, address indexed allocationId, bytes32 indexed subgraphDeploymentId, uint256 tokensRewards, uint256 tokensIndexerRewards, uint256 tokensDelegationRewards, bytes32 poi, bytes poiMetadata, uint256 currentEpoch)"
+QUERY_FEES_COLLECTED = "QueryFeesCollected(address indexed serviceProvider, address indexed payer, address indexed allocationId, bytes32 subgraphDeploymentId, uint256 tokensCollected, uint256 tokensCurators)"
+DELEGATION_PARAMETERS_UPDATED = "DelegationParametersUpdated(address indexed indexer, uint32 indexingRewardCut, uint32 queryFeeCut, uint32 cooldownBlocks)"
+
+
+def _amount(field: str) -> str:
+    return f"arrow_cast(event['{field}'], 'Float64')"
+
+
+# tokensCollected minus the protocol tax and the curators' share.
+_TOKENS_REMAINING = (
+    f"{_amount('tokensCollected')} * (1 - {PROTOCOL_FEE_PPM} / 1000000.0) - {_amount('tokensCurators')}"
+)
+_LEGACY_KEYS = {
+    "indexer": "event['indexer']",
+    "allocation": "event['allocationID']",
+    "subgraph_deployment": "event['subgraphDeploymentID']",
+}
+_HORIZON_KEYS = {
+    "indexer": "event['indexer']",
+    "allocation": "event['allocationId']",
+    "subgraph_deployment": "event['subgraphDeploymentId']",
+}
+_REWARD_KEYS = {"indexer": "event['indexer']", "allocation": "event['allocationID']"}
+
+# (source, contract, event, split, columns): one entry per decoded event.
+# split names the per-event cut the final SELECT applies ('rewards' /
+# 'query_fees'); columns not listed are 0 (cumulative) or NULL (set).
+ECONOMICS_EVENTS: List[Tuple[str, str, str, Optional[str], Dict[str, str]]] = [
+    (LEGACY, STAKING_ADDRESS, LEGACY_ALLOCATION_CREATED, None, {
+        **_LEGACY_KEYS, "allocated_tokens": _amount("tokens"),
+    }),
+    (LEGACY, STAKING_ADDRESS, LEGACY_ALLOCATION_CLOSED, None, {
+        **_LEGACY_KEYS, "allocated_tokens": f"-{_amount('tokens')}",
+    }),
+    (LEGACY, STAKING_ADDRESS, LEGACY_ALLOCATION_CLOSED_COBB_DOUGLAS, None, {
+        **_LEGACY_KEYS, "allocated_tokens": f"-{_amount('tokens')}",
+    }),
+    (LEGACY, STAKING_ADDRESS, ALLOCATION_COLLECTED, None, {
+        **_LEGACY_KEYS,
+        "query_fees_collected": _amount("rebateFees"),
+        "curator_rewards": _amount("curationFees"),
+        "total_query_fees": _amount("tokens"),
+        "taxed_query_fees": f"{_amount('tokens')} - {_amount('rebateFees')} - {_amount('curationFees')}",
+    }),
+    (LEGACY, STAKING_ADDRESS, REBATE_COLLECTED, None, {
+        **_LEGACY_KEYS,
+        "query_fees_collected": _amount("queryFees"),
+        "curator_rewards": _amount("curationFees"),
+        "distributed_rebates": _amount("queryRebates"),
+        "total_query_fees": _amount("tokens"),
+        "taxed_query_fees": _amount("protocolTax"),
+        "query_fee_rebates": _amount("queryRebates"),
+        "delegation_fees": _amount("delegationRewards"),
+    }),
+    (LEGACY, STAKING_ADDRESS, REBATE_CLAIMED, None, {
+        **_LEGACY_KEYS,
+        "query_fee_rebates": _amount("tokens"),
+        "delegation_fees": _amount("delegationFees"),
+    }),
+    (LEGACY, REWARDS_MANAGER_ADDRESS, REWARDS_ASSIGNED, "rewards", {
+        **_REWARD_KEYS, "indexing_rewards": _amount("amount"),
+    }),
+    (LEGACY, REWARDS_MANAGER_ADDRESS, HORIZON_REWARDS_ASSIGNED, "rewards", {
+        **_REWARD_KEYS, "indexing_rewards": _amount("amount"),
+    }),
+    (HORIZON, SUBGRAPH_SERVICE_ADDRESS, ALLOCATION_CREATED, None, {
+        **_HORIZON_KEYS, "allocated_tokens": _amount("tokens"),
+    }),
+    (HORIZON, SUBGRAPH_SERVICE_ADDRESS, ALLOCATION_RESIZED, None, {
+        **_HORIZON_KEYS, "allocated_tokens": f"{_amount('newTokens')} - {_amount('oldTokens')}",
+    }),
+    (HORIZON, SUBGRAPH_SERVICE_ADDRESS, ALLOCATION_CLOSED, None, {
+        **_HORIZON_KEYS, "allocated_tokens": f"-{_amount('tokens')}",
+    }),
+    (HORIZON, SUBGRAPH_SERVICE_ADDRESS, INDEXING_REWARDS_COLLECTED, None, {
+        **_HORIZON_KEYS,
+        "indexing_rewards": _amount("tokensRewards"),
+        "indexing_indexer_rewards": _amount("tokensIndexerRewards"),
+        "indexing_delegator_rewards": _amount("tokensDelegationRewards"),
+    }),
+    (HORIZON, SUBGRAPH_SERVICE_ADDRESS, QUERY_FEES_COLLECTED, "query_fees", {
+        "indexer": "event['serviceProvider']",
+        "allocation": "event['allocationId']",
+        "subgraph_deployment": "event['subgraphDeploymentId']",
+        "query_fees_collected": _TOKENS_REMAINING,
+        "curator_rewards": _amount("tokensCurators"),
+        "distributed_rebates": _TOKENS_REMAINING,
+        "total_query_fees": f"{_TOKENS_REMAINING} + {_amount('tokensCurators')}",
+    }),
+]
+
+
+def _event_name(signature: str) -> str:
+    return signature.split("(", 1)[0]
+
+
+def _decoded_select(source: str, address: str, signature: str, split: Optional[str], columns: Dict[str, str]) -> str:
+    values = [
+        f"'{source}' AS source",
+        f"'{_event_name(signature)}' AS event_type",
+        f"{columns['indexer']} AS indexer",
+        f"{columns['allocation']} AS allocation",
+        f"{columns.get('subgraph_deployment', 'NULL')} AS subgraph_deployment",
+        "tx_hash", "block_num", "log_index", "timestamp",
+    ]
+    values += [f"{columns.get(name, '0.0')} AS {name}" for name in CUMULATIVE_COLUMNS]
+    values += [f"{columns.get(name, 'CAST(NULL AS DOUBLE)')} AS {name}" for name in SET_COLUMNS]
+    values.append(f"'{split}' AS split" if split else "CAST(NULL AS VARCHAR) AS split")
+    select = ",\n        ".join(values)
+    return f"""    SELECT
+        {select}
+    FROM (
+        SELECT evm_decode(topic1, topic2, topic3, data, '{signature}') AS event, tx_hash, block_num, log_index, timestamp
+        FROM economics_logs
+        WHERE address = arrow_cast(x'{address}', 'FixedSizeBinary(20)')
+          AND topic0 = evm_topic('{signature}')
+    ) e"""
+
+
+def economics_query(after_block: int = -1, to_block: Optional[int] = None) -> str:
+    """The unified stream for blocks in (after_block, to_block], splits applied."""
+    contracts = ", ".join(
+        f"arrow_cast(x'{address}', 'FixedSizeBinary(20)')"
+        for address in dict.fromkeys(address for _, address, _, _, _ in ECONOMICS_EVENTS)
+    )
+    decoded = "\n    UNION ALL\n".join(_decoded_select(*entry) for entry in ECONOMICS_EVENTS)
+    passthrough = ",\n    ".join(
+        f"e.{name}" for name in KEY_COLUMNS + CUMULATIVE_COLUMNS
+        if name not in ("indexing_indexer_rewards", "indexing_delegator_rewards")
+    )
+    upper = f"\n      AND l.block_num <= {to_block}" if to_block is not None else ""
+    return f"""
+WITH economics_logs AS (
+    SELECT l.address, l.topic0, l.topic1, l.topic2, l.topic3, l.data, l.tx_hash, l.block_num, l.log_index, l.timestamp
+    FROM "edgeandnode/arbitrum_one@0.0.1".logs l
+    WHERE l.address IN ({contracts})
+      AND l.block_num > {after_block}{upper}
+),
+delegation_params AS (
+    SELECT
+        event['indexer'] AS indexer,
+        timestamp,
+        event['indexingRewardCut']::integer AS indexing_reward_cut,
+        LEAD(timestamp) OVER (PARTITION BY event['indexer'] ORDER BY timestamp ASC) AS next_update
+    FROM (
+        SELECT l.timestamp, evm_decode(l.topic1, l.topic2, l.topic3, l.data, '{DELEGATION_PARAMETERS_UPDATED}') AS event
+        FROM "edgeandnode/arbitrum_one@0.0.1".logs l
+        WHERE l.address = arrow_cast(x'{STAKING_ADDRESS}', 'FixedSizeBinary(20)')
+          AND l.topic0 = evm_topic('{DELEGATION_PARAMETERS_UPDATED}')
+    )
+),
+query_fee_cuts AS (
+    SELECT
+        event['serviceProvider'] AS indexer,
+        timestamp,
+        1000000.0 - arrow_cast(event['feeCut'], 'Float64') AS query_fee_cut,
+        LEAD(timestamp) OVER (PARTITION BY event['serviceProvider'] ORDER BY timestamp ASC) AS next_update
+    FROM (
+        SELECT l.timestamp, evm_decode(l.topic1, l.topic2, l.topic3, l.data, '{DELEGATION_FEE_CUT_SET}') AS event
+        FROM "edgeandnode/arbitrum_one@0.0.1".logs l
+        WHERE l.address = arrow_cast(x'{STAKING_ADDRESS}', 'FixedSizeBinary(20)')
+          AND l.topic0 = evm_topic('{DELEGATION_FEE_CUT_SET}')
+    )
+    WHERE event['verifier'] = arrow_cast(x'{SUBGRAPH_SERVICE_ADDRESS}', 'FixedSizeBinary(20)')
+      AND event['paymentType'] = 0
+),
+decoded AS (
+{decoded}
+)
+SELECT
+    {passthrough},
+    CASE WHEN e.split = 'rewards'
+        THEN e.indexing_rewards * COALESCE(d.indexing_reward_cut, 0) / 1000000.0
+        ELSE e.indexing_indexer_rewards END AS indexing_indexer_rewards,
+    CASE WHEN e.split = 'rewards'
+        THEN e.indexing_rewards * (1 - COALESCE(d.indexing_reward_cut, 0) / 1000000.0)
+        ELSE e.indexing_delegator_rewards END AS indexing_delegator_rewards,
+    CASE WHEN e.split = 'query_fees'
+        THEN e.query_fees_collected * COALESCE(f.query_fee_cut, 1000000.0) / 1000000.0
+        ELSE e.query_fee_rebates END AS query_fee_rebates,
+    CASE WHEN e.split = 'query_fees'
+        THEN e.query_fees_collected * (1 - COALESCE(f.query_fee_cut, 1000000.0) / 1000000.0)
+        ELSE e.delegation_fees END AS delegation_fees
+FROM decoded e
+LEFT JOIN delegation_params d
+    ON e.split = 'rewards'
+    AND e.indexer = d.indexer
+    AND e.timestamp >= d.timestamp
+    AND (e.timestamp < d.next_update OR d.next_update IS NULL)
+LEFT JOIN query_fee_cuts f
+    ON e.split = 'query_fees'
+    AND e.indexer = f.indexer
+    AND e.timestamp >= f.timestamp
+    AND (e.timestamp < f.next_update OR f.next_update IS NULL)
+"""
+
+
+def legacy_allocations(rows: pd.DataFrame) -> pd.Series:
+    """Allocations created through the legacy Staking contract in rows."""
+    return rows.loc[(rows["event_type"] == "AllocationCreated") & (rows["source"] == LEGACY), "allocation"]
+
+
+def rewards_handled(rows: pd.DataFrame, legacy) -> np.ndarray:
+    """Rows a handler applies: HorizonRewardsAssigned only on the legacy allocations given."""
+    return ((rows["event_type"] != "HorizonRewardsAssigned") | rows["allocation"].isin(legacy)).to_numpy()
+
+
+def high_water(stream: Optional[pd.DataFrame]) -> int:
+    """Highest block_num already in the stored stream (-1 when empty)."""
+    if stream is None or stream.empty:
+        return -1
+    return int(stream["block_num"].max())
+
+
+def build_stream(existing: Optional[pd.DataFrame], new: pd.DataFrame) -> pd.DataFrame:
+    """Stored stream plus a refresh, deduped and filtered as the handlers see it."""
+    frames = [frame[STREAM_COLUMNS] for frame in (existing, new) if frame is not None and not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=STREAM_COLUMNS)
+    stream = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0].copy()
+    stream["timestamp"] = stream["timestamp"].astype("float64")
+
+    before = len(stream)
+    stream = stream.drop_duplicates(["tx_hash", "log_index"], keep="first")
+    duplicates = before - len(stream)
+    created = stream[stream["event_type"] == "AllocationCreated"].drop_duplicates("allocation")
+    keep = rewards_handled(stream, legacy_allocations(stream))
+    logger.info(
+        "Economics stream: %s duplicate logs dropped, %s HorizonRewardsAssigned on Horizon allocations skipped.",
+        duplicates, int((~keep).sum()),
+    )
+    stream = stream[keep].copy()
+
+    # Reward events name only the allocation; its deployment is the creation's.
+    deployment = created.set_index("allocation")["subgraph_deployment"]
+    stream["subgraph_deployment"] = stream["subgraph_deployment"].fillna(stream["allocation"].map(deployment))
+    stream.sort_values(["block_num", "log_index"], kind="stable", inplace=True, ignore_index=True)
+    return stream
+
+
+def economics_totals(
+    stream: pd.DataFrame, key: Optional[str], columns: List[str], source: Optional[str] = None, scale: float = 1e18
+) -> pd.DataFrame:
+    """Per-key sums of amount columns (one row when key is None), scaled from wei."""
+    rows = stream if source is None else stream[stream["source"] == source]
+    amounts = rows[columns].astype(float).fillna(0.0) / scale
+    if key is None:
+        return amounts.sum().to_frame().T
+    return amounts.groupby(rows[key], sort=False).sum().reset_index()
+
+
+def legacy_pool_inflows(stream: pd.DataFrame, key: Optional[str], scale: float = 1e18) -> pd.DataFrame:
+    """Rewards and rebates paid into indexers' legacy delegation pools (Indexer.delegatedTokens).
+
+    Horizon delegators are paid through the provision instead
+    (TokensToDelegationPoolAdded, pipeline/provisions.py).
+    """
+    totals = economics_totals(stream, key, POOL_INFLOW_COLUMNS, source=LEGACY, scale=scale)
+    totals["pool_inflow"] = totals.pop("indexing_delegator_rewards") + totals.pop("delegation_fees")
+    return totals
+
+
+def legacy_pool_inflow_events(stream: pd.DataFrame) -> pd.DataFrame:
+    """legacy_pool_inflows() one event at a time, as pool deltas in wei.
+
+    Rows are (indexer, block_num, log_index, tokens, shares=0, reward) for
+    delegation.pool_deltas(); `reward` marks the RewardsAssigned /
+    HorizonRewardsAssigned rows, which an empty pool does not get.  The
+    stream's reward split assumes a non-empty pool; the exchange-rate
+    timeline drops those rows where the pool is empty.
+    """
+    rows = stream[stream["source"] == LEGACY]
+    tokens = rows[POOL_INFLOW_COLUMNS].astype(float).fillna(0.0).sum(axis=1)
+    rows, tokens = rows[(tokens != 0).to_numpy()], tokens[tokens != 0]
+    return pd.DataFrame({
+        "indexer": rows["indexer"].to_numpy(),
+        "block_num": rows["block_num"].to_numpy(dtype=np.int64),
+        "log_index": rows["log_index"].to_numpy(dtype=np.int64),
+        "tokens": tokens.to_numpy(dtype=np.float64),
+        "shares": 0.0,
+        "reward": rows["event_type"].isin(REWARD_EVENTS).to_numpy(),
+    })
+
+
+def graph_network_totals(stream: pd.DataFrame, scale: float = 1e18) -> pd.DataFrame:
+    """Single-row GraphNetwork reward and query-fee totals."""
+    columns = [column for column in AMOUNT_COLUMNS if column != "allocated_tokens"]
+    totals = economics_totals(stream, None, columns, scale=scale).iloc[0]
+    return pd.DataFrame([{
+        "total_indexing_rewards": totals["indexing_rewards"],
+        "total_indexing_indexer_rewards": totals["indexing_indexer_rewards"],
+        "total_indexing_delegator_rewards": totals["indexing_delegator_rewards"],
+        "total_curator_query_fees": totals["curator_rewards"],
+        "total_indexer_query_fee_rebates": totals["query_fee_rebates"],
+        "total_delegator_query_fee_rebates": totals["delegation_fees"],
+        # Collected minus what was paid out; QueryFeesCollected pays out in full.
+        "total_unclaimed_query_fee_rebates": (
+            totals["query_fees_collected"] - totals["query_fee_rebates"] - totals["delegation_fees"]
+        ),
+        "total_indexer_query_fees_collected": totals["query_fees_collected"],
+        "total_query_fees": totals["total_query_fees"],
+        "total_taxed_query_fees": totals["taxed_query_fees"],
+    }])
+
+
+def allocation_fee_events(stream: pd.DataFrame) -> pd.DataFrame:
+    """Fee / reward rows in the pipeline/fees.py layout; only SET_EVENTS overwrite.
+
+    block_num and log_index stay, so two SET events of one block resolve in chain order.
+    """
+    rows = stream[~stream["event_type"].isin(LIFECYCLE_KINDS)]
+    return rows.rename(columns={"allocation": "allocation_id"}).assign(
+        additive=~rows["event_type"].isin(SET_EVENTS)
+    )[["allocation_id", "block_num", "log_index", "additive", *FEE_FIELDS]]
+
+
+def lifecycle_events(stream: pd.DataFrame) -> pd.DataFrame:
+    """Create / resize / close rows for pipeline/lifecycle.build_intervals.
+
+    A state's tokens are the running sum of allocated_tokens deltas, so a
+    resize lands on newTokens.
+    """
+    rows = stream[stream["event_type"].isin(LIFECYCLE_KINDS)].sort_values(["block_num", "log_index"], kind="stable")
+    return pd.DataFrame({
+        "allocation_id": rows["allocation"].to_numpy(),
+        "kind": rows["event_type"].map(LIFECYCLE_KINDS).to_numpy(),
+        "indexer": rows["indexer"].to_numpy(),
+        "subgraph_deployment": rows["subgraph_deployment"].to_numpy(),
+        "block_num": rows["block_num"].to_numpy(),
+        "timestamp": rows["timestamp"].to_numpy(),
+        "tokens": rows["allocated_tokens"].astype(float).groupby(rows["allocation"], sort=False).cumsum().to_numpy(),
+    })
+
+
+def allocation_events(stream: pd.DataFrame) -> pd.DataFrame:
+    """Stream rows as allocation_step events keyed by allocation, amounts as float64 wei."""
+    events = pd.DataFrame({
+        "allocation": stream["allocation"].to_numpy(),
+        "kind": stream["event_type"].map(_ALLOCATION_KINDS).fillna(FEES).to_numpy(dtype=np.float64),
+        "block_num": stream["block_num"].to_numpy(dtype=np.int64),
+        "log_index": stream["log_index"].to_numpy(dtype=np.int64),
+        "timestamp": stream["timestamp"].to_numpy(dtype=np.float64),
+        "allocated_tokens": stream["allocated_tokens"].astype(float).fillna(0.0).to_numpy(),
+        "additive": (~stream["event_type"].isin(SET_EVENTS)).to_numpy(dtype=np.float64),
+    })
+    for field in CUMULATIVE_FIELDS:
+        events[field] = stream[field].astype(float).fillna(0.0).to_numpy()
+    for field in SET_FIELDS:
+        events[field] = stream[field].astype(float).to_numpy()
+    return events
+
+
+def allocation_step(state: Columns, event: Columns) -> None:
+    """Allocation create / resize / close and fee handlers of both generations for one round.
+
+    Tokens follow creations and resizes until the first close, as the
+    lifecycle intervals do; fee fields follow pipeline/fees.py, applied in
+    event order: SET_EVENTS overwrite the set fields when they carry a value,
+    every other row adds to them.
+    """
+    kind = event["kind"]
+    is_open = np.isnan(state["closed_block"])
+    bonded = ((kind == CREATED) | (kind == RESIZED)) & is_open
+    created = (kind == CREATED) & np.isnan(state["created_block"])
+    closing = (kind == CLOSED) & is_open
+
+    state["allocated_tokens"] = state["allocated_tokens"] + np.where(bonded, event["allocated_tokens"], 0.0)
+    state["created_at"] = np.where(created, event["timestamp"], state["created_at"])
+    state["created_block"] = np.where(created, event["block_num"], state["created_block"])
+    state["closed_at"] = np.where(closing, event["timestamp"], state["closed_at"])
+    state["closed_block"] = np.where(closing, event["block_num"], state["closed_block"])
+
+    for field in CUMULATIVE_FIELDS:
+        state[field] = state[field] + event[field]
+    additive = event["additive"] != 0
+    for field in SET_FIELDS:
+        value = event[field]
+        present = ~np.isnan(value)
+        state[field] = np.where(
+            additive,
+            state[field] + np.where(present, value, 0.0),
+            np.where(present, value, state[field]),
+        )
@@ -0,0 +1,213 @@
+"""
+Block -> epoch mapping for Arbitrum.
+
+The EpochManager on Arbitrum counts epochs in L1 blocks: blockNum() returns
+the L1 block number and the subgraph feeds that to createOrLoadEpoch
+(helpers.ts getL1BlockNumber).  Epochs are fixed-length runs of L1 blocks
+between EpochLengthUpdate events (epochManager.ts), so within the segment
+that starts at an update
+
+    epoch = first_epoch + (l1_block - start_block) // epoch_length
+
+Event tables carry L2 block_num.  Every Arbitrum block header records the L1
+block it was sequenced against (mix_hash bytes 8-16), so the epoch table keeps
+one row per epoch with the first L2 block seen in it:
+
+    epoch, start_block, end_block, epoch_length   (L1, as Epoch.startBlock / endBlock)
+    l2_start_block, start_at
+    synced_block                                  (last L2 block the refresh scanned)
+
+EpochTable maps any number of L2 block_nums (epoch_of_block) or L1 block
+numbers (epoch_of_l1_block) with one np.searchsorted.  L2 blocks past
+synced_block may already be in a later epoch, so they map to <NA> until the
+table is refreshed.  refresh_epochs() only
+scans blocks from the last known epoch start onwards, so the table is built
+once and extended incrementally; network/epoch_arbitrum.py publishes it as
+epoch_arbitrum.
+"""
+
+import logging
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from pipeline.executor import QueryExecutor
+from pipeline.partitioned import DEFAULT_STREAMS, block_bounds, merge_partials, partitioned_query
+
+logger = logging.getLogger(__name__)
+
+EPOCH_MANAGER_ADDRESS = "5A843145c43d328B9bB7a4401d94918f131bB281"
+BLOCKS_TABLE = '"edgeandnode/arbitrum_one@0.0.1".blocks'
+LOGS_TABLE = '"edgeandnode/arbitrum_one@0.0.1".logs'
+EPOCH_COLUMNS = [
+    "epoch", "start_block", "end_block", "epoch_length", "l2_start_block", "start_at", "synced_block",
+]
+
+_EPOCH_LENGTH_UPDATE = "EpochLengthUpdate(uint256 indexed epoch, uint256 epochLength)"
+_HEX_DIGITS = "0123456789abcdef"
+_BOUNDARY_MERGES = {"l2_start_block": "min", "start_at": "min"}
+
+
+def l1_block_sql(mix_hash: str) -> str:
+    """SQL expression for the L1 block number held in an Arbitrum mix_hash.
+
+    Bytes 8-16 are the big-endian L1 block number; it fits in the low four
+    bytes (hex characters 25-32), decoded digit by digit.
+    """
+    hex_expr = f"encode({mix_hash}, 'hex')"
+    digits = [
+        f"(strpos('{_HEX_DIGITS}', substr({hex_expr}, {25 + i}, 1)) - 1) * {16 ** (7 - i)}"
+        for i in range(8)
+    ]
+    return f"CAST({' + '.join(digits)} AS BIGINT)"
+
+
+SEGMENTS_QUERY = f"""
+SELECT
+    arrow_cast(e.event['epoch'], 'Int64') AS epoch,
+    arrow_cast(e.event['epochLength'], 'Int64') AS epoch_length,
+    e.block_num,
+    {l1_block_sql('b.mix_hash')} AS l1_block_num
+FROM (
+    SELECT
+        evm_decode(l.topic1, l.topic2, l.topic3, l.data, '{_EPOCH_LENGTH_UPDATE}') AS event,
+        l.block_num
+    FROM {LOGS_TABLE} l
+    WHERE l.address = arrow_cast(x'{EPOCH_MANAGER_ADDRESS}', 'FixedSizeBinary(20)')
+      AND l.topic0 = evm_topic('{_EPOCH_LENGTH_UPDATE}')
+) e
+JOIN {BLOCKS_TABLE} b ON b.block_num = e.block_num
+ORDER BY e.block_num
+"""
+
+
+def epoch_segments(updates: pd.DataFrame) -> pd.DataFrame:
+    """Epoch schedule segments (first_epoch, start_block, epoch_length) in L1 blocks.
+
+    The first EpochLengthUpdate (constructor) starts at the L1 block it was
+    emitted in; each later one starts at the current epoch's start block under
+    the previous length, as EpochManager.setEpochLength records it.
+    """
+    if updates.empty:
+        raise ValueError("No EpochLengthUpdate events found; cannot build the epoch schedule.")
+    rows = []
+    for update in updates.itertuples(index=False):
+        if not rows:
+            start = int(update.l1_block_num)
+        else:
+            prev = rows[-1]
+            start = prev["start_block"] + (int(update.epoch) - prev["first_epoch"]) * prev["epoch_length"]
+        rows.append({"first_epoch": int(update.epoch), "start_block": start, "epoch_length": int(update.epoch_length)})
+    return pd.DataFrame(rows)
+
+
+def _epoch_case_sql(segments: pd.DataFrame, l1: str) -> str:
+    branches = [
+        f"WHEN {l1} >= {s.start_block} THEN {s.first_epoch} + ({l1} - {s.start_block}) / {s.epoch_length}"
+        for s in segments.iloc[::-1].itertuples(index=False)
+    ]
+    return "CASE " + " ".join(branches) + " END"
+
+
+def boundaries_query(segments: pd.DataFrame) -> str:
+    """Partitioned query: first L2 block and timestamp of every epoch."""
+    return f"""
+SELECT epoch, MIN(block_num) AS l2_start_block, MIN(timestamp) AS start_at
+FROM (
+    SELECT block_num, timestamp, {_epoch_case_sql(segments, 'l1_block_num')} AS epoch
+    FROM (
+        SELECT b.block_num, b.timestamp, {l1_block_sql('b.mix_hash')} AS l1_block_num
+        FROM {BLOCKS_TABLE} b
+        WHERE {{block_range:b}}
+    ) blocks
+    WHERE l1_block_num >= {int(segments['start_block'].iloc[0])}
+) epochs
+GROUP BY epoch
+"""
+
+
+def refresh_epochs(
+    executor: QueryExecutor,
+    existing: Optional[pd.DataFrame] = None,
+    max_streams: int = DEFAULT_STREAMS,
+) -> pd.DataFrame:
+    """Epoch table extended with every block after existing's last epoch start."""
+    segments = epoch_segments(executor.run(SEGMENTS_QUERY))
+    has_existing = existing is not None and not existing.empty
+    from_block = int(existing["l2_start_block"].max()) if has_existing else 0
+    to_block = block_bounds(executor, [BLOCKS_TABLE])[1]
+    logger.info("Scanning blocks %s-%s for epoch boundaries (%s schedule segments).", from_block, to_block, len(segments))
+
+    found = partitioned_query(
+        executor.client_url,
+        boundaries_query(segments),
+        keys=["epoch"],
+        aggregates=_BOUNDARY_MERGES,
+        tables=[BLOCKS_TABLE],
+        bounds=(from_block, to_block),
+        max_streams=max_streams,
+        executor=executor,
+    )
+    partials = [existing[["epoch"] + list(_BOUNDARY_MERGES)], found] if has_existing else [found]
+    epochs = merge_partials(partials, ["epoch"], _BOUNDARY_MERGES)
+
+    # Epoch.startBlock / endBlock follow the contract schedule, not the first
+    # L1 block an L2 block happened to reference.
+    epochs["epoch"] = epochs["epoch"].astype(np.int64)
+    seg = segments.iloc[np.searchsorted(segments["first_epoch"], epochs["epoch"], side="right") - 1]
+    epochs["epoch_length"] = seg["epoch_length"].to_numpy()
+    epochs["start_block"] = seg["start_block"].to_numpy() + (
+        epochs["epoch"].to_numpy() - seg["first_epoch"].to_numpy()
+    ) * epochs["epoch_length"]
+    epochs["end_block"] = epochs["start_block"] + epochs["epoch_length"]
+    epochs["synced_block"] = to_block
+    epochs = epochs.sort_values("epoch").reset_index(drop=True)
+    logger.info("Epoch table covers epochs %s-%s.", epochs["epoch"].iloc[0], epochs["epoch"].iloc[-1])
+    return epochs[EPOCH_COLUMNS]
+
+
+class EpochTable:
+    """Vectorised block -> epoch lookups over the published epoch table."""
+
+    def __init__(self, epochs: pd.DataFrame) -> None:
+        self.epochs = epochs.sort_values("epoch").reset_index(drop=True)
+        self._epoch = self.epochs["epoch"].to_numpy(dtype=np.int64)
+        self._l2_start = self.epochs["l2_start_block"].to_numpy(dtype=np.int64)
+        self._l1_start = self.epochs["start_block"].to_numpy(dtype=np.int64)
+        self._length = self.epochs["epoch_length"].to_numpy(dtype=np.int64)
+        self.synced_block = int(self.epochs["synced_block"].max()) if len(self.epochs) else -1
+
+    @classmethod
+    def load(cls, table_id: str = "epoch_arbitrum") -> "EpochTable":
+        from pipeline.tables import load_entity_table
+
+        return cls(load_entity_table(table_id, columns=EPOCH_COLUMNS))
+
+    def epoch_of_block(self, block_nums) -> pd.array:
+        """Epoch of each L2 block_num; <NA> before the first epoch and after synced_block."""
+        blocks = np.asarray(block_nums, dtype=np.int64)
+        i = np.searchsorted(self._l2_start, blocks, side="right") - 1
+        return pd.arrays.IntegerArray(self._epoch[np.maximum(i, 0)], (i < 0) | (blocks > self.synced_block))
+
+    def epoch_of_l1_block(self, l1_blocks) -> pd.array:
+        """Epoch of each L1 block number (getL1BlockNumber semantics); <NA> before the first."""
+        l1 = np.asarray(l1_blocks, dtype=np.int64)
+        i = np.searchsorted(self._l1_start, l1, side="right") - 1
+        j = np.maximum(i, 0)
+        return pd.arrays.IntegerArray(self._epoch[j] + (l1 - self._l1_start[j]) // self._length[j], i < 0)
+
+    def add_epoch_column(self, df: pd.DataFrame, block_col: str = "block_num", epoch_col: str = "epoch") -> pd.DataFrame:
+        """Set df[epoch_col] from df[block_col] in place; null blocks get <NA>."""
+        blocks = df[block_col]
+        missing = blocks.isna().to_numpy()
+        unsynced = int((blocks[~missing] > self.synced_block).sum())
+        if unsynced:
+            logger.warning(
+                "%s %s values are past the epoch table's block %s; their %s is <NA> until epoch_arbitrum is refreshed.",
+                unsynced, block_col, self.synced_block, epoch_col,
+            )
+        epochs = self.epoch_of_block(blocks.fillna(0).astype(np.int64))
+        epochs[missing] = pd.NA
+        df[epoch_col] = epochs
+        return df
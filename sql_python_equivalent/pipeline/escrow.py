@@ -0,0 +1,385 @@
+"""
+PaymentsEscrow / GraphTallyCollector state, kept as a keyed store and folded
+forward one micro-batch of blocks at a time.
+
+The handlers (paymentsEscrow.ts, graphTallyCollector.ts) touch four keyed
+entities and append one:
+
+- PaymentsEscrowAccount, keyed by (payer, collector, receiver): Deposit adds
+  to balance, Withdraw and EscrowCollected subtract; Thaw overwrites
+  totalAmountThawing / thawEndTimestamp and Withdraw / CancelThaw reset them
+  to 0.  PaymentCollected only creates the (payer, GraphTallyCollector,
+  receiver) account;
+- Signer, keyed by signer: every event sets payer and isAuthorized (false
+  only on SignerRevoked); SignerThawing sets thawEndTimestamp,
+  SignerThawCanceled / SignerRevoked reset it, SignerAuthorized keeps it;
+- GraphTallyTokensCollected, keyed by (payer, receiver, collectionId):
+  PaymentCollected adds tokens;
+- PaymentsEscrowTransaction rows for Deposit ('deposit'), Withdraw
+  ('withdraw') and PaymentCollected ('redeem'; its collector is the data
+  service, its account the GraphTallyCollector one).
+
+escrow_events_query() decodes all of them for one block window into a single
+frame (EVENT_COLUMNS).  EscrowStore holds the entity tables indexed by their
+keys and apply() folds one window in: balances and tallies add the window's
+per-key sums, overwritten fields take the window's last write per key, and
+transactions append.  It also keeps a daily aggregate per account and UTC day
+(deposits, withdrawals, escrow / tally collections and the closing balance),
+so a refresh that lands mid-day adds to that day's row.
+
+Every table but the transactions carries block_hi; a refresh resumes after
+high_water() of the published accounts and signers and walks the remaining
+blocks in batch_windows(), so an hourly run reads only that hour's logs.
+Blocks within REORG_WINDOW_BLOCKS of the head are folded one block at a time
+under a ReorgLog (pipeline/reorgs.py); rollback() returns the store to a
+fork block when a later run finds their hashes changed.
+Addresses and ids are int32 codes (pipeline/addresses.py) inside the store;
+token amounts are divided by `scale` on the way in.
+"""
+
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from pipeline.reorgs import ReorgLog, truncate_rows
+
+logger = logging.getLogger(__name__)
+
+# Arbitrum One deployments (address-book horizon/addresses.json, chain 42161).
+PAYMENTS_ESCROW_ADDRESS = os.environ.get("PAYMENTS_ESCROW_ADDRESS", "8f477709eF277d4A880801D01A140a9CF88bA0d3")
+GRAPH_TALLY_COLLECTOR_ADDRESS = os.environ.get(
+    "GRAPH_TALLY_COLLECTOR_ADDRESS", "8f69F5C07477Ac46FBc491B1E6D91E2bE0111A9e"
+)
+
+DEPOSIT = "Deposit(address indexed payer, address indexed collector, address indexed receiver, uint256 tokens)"
+WITHDRAW = "Withdraw(address indexed payer, address indexed collector, address indexed receiver, uint256 tokens)"
+THAW = "Thaw(address indexed payer, address indexed collector, address indexed receiver, uint256 tokens, uint256 thawEndTimestamp)"
+CANCEL_THAW = "CancelThaw(address indexed payer, address indexed collector, address indexed receiver, uint256 tokensThawing, uint256 thawEndTimestamp)"
+ESCROW_COLLECTED = "EscrowCollected(uint8 indexed paymentType, address indexed payer, address indexed collector, address receiver, uint256 tokens, address receiverDestination)"
+PAYMENT_COLLECTED = "PaymentCollected(uint8 paymentType, bytes32 indexed collectionId, address indexed payer, address receiver, address indexed dataService, uint256 tokens)"
+SIGNER_AUTHORIZED = "SignerAuthorized(address indexed authorizer, address indexed signer)"
+SIGNER_THAWING = "SignerThawing(address indexed authorizer, address indexed signer, uint256 thawEndTimestamp)"
+SIGNER_THAW_CANCELED = "SignerThawCanceled(address indexed authorizer, address indexed signer, uint256 thawEndTimestamp)"
+SIGNER_REVOKED = "SignerRevoked(address indexed authorizer, address indexed signer)"
+
+_TOKENS = "arrow_cast(event['tokens'], 'Float64')"
+_THAW_END = "arrow_cast(event['thawEndTimestamp'], 'Float64')"
+_ACCOUNT = {"payer": "event['payer']", "collector": "event['collector']", "receiver": "event['receiver']"}
+_SIGNER = {"payer": "event['authorizer']", "signer": "event['signer']"}
+
+# (contract, event, columns): one entry per decoded event; columns not listed are NULL.
+ESCROW_EVENTS: List[Tuple[str, str, Dict[str, str]]] = [
+    (PAYMENTS_ESCROW_ADDRESS, DEPOSIT, {**_ACCOUNT, "tokens": _TOKENS}),
+    (PAYMENTS_ESCROW_ADDRESS, WITHDRAW, {**_ACCOUNT, "tokens": _TOKENS}),
+    (PAYMENTS_ESCROW_ADDRESS, THAW, {**_ACCOUNT, "tokens": _TOKENS, "thaw_end": _THAW_END}),
+    (PAYMENTS_ESCROW_ADDRESS, CANCEL_THAW, _ACCOUNT),
+    (PAYMENTS_ESCROW_ADDRESS, ESCROW_COLLECTED, {**_ACCOUNT, "tokens": _TOKENS}),
+    (GRAPH_TALLY_COLLECTOR_ADDRESS, PAYMENT_COLLECTED, {
+        "payer": "event['payer']",
+        # The handler books the payment against the GraphTallyCollector account.
+        "collector": f"arrow_cast(x'{GRAPH_TALLY_COLLECTOR_ADDRESS}', 'FixedSizeBinary(20)')",
+        "receiver": "event['receiver']",
+        "data_service": "event['dataService']",
+        "collection_id": "event['collectionId']",
+        "tokens": _TOKENS,
+    }),
+    (GRAPH_TALLY_COLLECTOR_ADDRESS, SIGNER_AUTHORIZED, _SIGNER),
+    (GRAPH_TALLY_COLLECTOR_ADDRESS, SIGNER_THAWING, {**_SIGNER, "thaw_end": _THAW_END}),
+    (GRAPH_TALLY_COLLECTOR_ADDRESS, SIGNER_THAW_CANCELED, _SIGNER),
+    (GRAPH_TALLY_COLLECTOR_ADDRESS, SIGNER_REVOKED, _SIGNER),
+]
+
+ADDRESS_COLUMNS = ["payer", "collector", "receiver", "signer", "data_service", "collection_id"]
+EVENT_COLUMNS = ["event_type", *ADDRESS_COLUMNS, "tokens", "thaw_end", "tx_hash", "block_num", "log_index", "timestamp"]
+
+# Signed balance move per event; Thaw's tokens only overwrite totalAmountThawing.
+BALANCE_SIGNS = {"Deposit": 1.0, "Withdraw": -1.0, "EscrowCollected": -1.0}
+ACCOUNT_EVENTS = {"Deposit", "Withdraw", "Thaw", "CancelThaw", "EscrowCollected", "PaymentCollected"}
+ACCOUNT_THAW_WRITES = {"Thaw", "Withdraw", "CancelThaw"}
+SIGNER_EVENTS = {"SignerAuthorized", "SignerThawing", "SignerThawCanceled", "SignerRevoked"}
+SIGNER_THAW_WRITES = {"SignerThawing", "SignerThawCanceled", "SignerRevoked"}
+TRANSACTION_TYPES = {"Deposit": "deposit", "Withdraw": "withdraw", "PaymentCollected": "redeem"}
+
+ACCOUNT_KEYS = ["payer", "collector", "receiver"]
+ACCOUNT_COLUMNS = [*ACCOUNT_KEYS, "balance", "total_amount_thawing", "thaw_end_timestamp", "block_hi"]
+SIGNER_COLUMNS = ["signer", "payer", "is_authorized", "thaw_end_timestamp", "block_hi"]
+TALLY_KEYS = ["payer", "receiver", "collection_id"]
+TALLY_COLUMNS = [*TALLY_KEYS, "tokens", "block_hi"]
+# collector is the data service for 'redeem'; account_collector names the escrow account.
+TRANSACTION_COLUMNS = [
+    "tx_hash", "log_index", "type", "payer", "collector", "receiver", "account_collector",
+    "collection_id", "amount", "timestamp", "block_num",
+]
+DAILY_KEYS = [*ACCOUNT_KEYS, "event_date"]
+DAILY_SUMS = ["deposits", "withdrawals", "escrow_collected", "payments_collected"]
+DAILY_COLUMNS = [*DAILY_KEYS, *DAILY_SUMS, "closing_balance", "block_hi"]
+# Keyed tables with undo images near the head; transactions are append-only.
+UNDO_TABLES = {"accounts": ACCOUNT_COLUMNS, "signers": SIGNER_COLUMNS, "tallies": TALLY_COLUMNS, "daily": DAILY_COLUMNS}
+
+
+def _event_name(signature: str) -> str:
+    return signature.split("(", 1)[0]
+
+
+def _decoded_select(address: str, signature: str, columns: Dict[str, str]) -> str:
+    values = [f"'{_event_name(signature)}' AS event_type"]
+    values += [f"{columns.get(name, 'NULL')} AS {name}" for name in ADDRESS_COLUMNS]
+    values += [f"{columns.get(name, 'CAST(NULL AS DOUBLE)')} AS {name}" for name in ("tokens", "thaw_end")]
+    values += ["tx_hash", "block_num", "log_index", "timestamp"]
+    select = ",\n    ".join(values)
+    return f"""SELECT
+    {select}
+FROM (
+    SELECT evm_decode(topic1, topic2, topic3, data, '{signature}') AS event, tx_hash, block_num, log_index, timestamp
+    FROM escrow_logs
+    WHERE address = arrow_cast(x'{address}', 'FixedSizeBinary(20)')
+      AND topic0 = evm_topic('{signature}')
+) e"""
+
+
+def escrow_events_query(after_block: int, to_block: int) -> str:
+    """Every PaymentsEscrow / GraphTallyCollector event in (after_block, to_block]."""
+    contracts = ", ".join(
+        f"arrow_cast(x'{address}', 'FixedSizeBinary(20)')"
+        for address in (PAYMENTS_ESCROW_ADDRESS, GRAPH_TALLY_COLLECTOR_ADDRESS)
+    )
+    decoded = "\nUNION ALL\n".join(_decoded_select(*entry) for entry in ESCROW_EVENTS)
+    return f"""
+WITH escrow_logs AS (
+    SELECT l.address, l.topic0, l.topic1, l.topic2, l.topic3, l.data, l.tx_hash, l.block_num, l.log_index, l.timestamp
+    FROM "edgeandnode/arbitrum_one@0.0.1".logs l
+    WHERE l.address IN ({contracts})
+      AND l.block_num > {after_block}
+      AND l.block_num <= {to_block}
+)
+{decoded}
+"""
+
+
+def batch_windows(after_block: int, head: int, size: int) -> List[Tuple[int, int]]:
+    """(after, to] block windows of at most size blocks covering (after_block, head]."""
+    edges = list(range(after_block, head, max(1, size))) + [head]
+    return [(lo, hi) for lo, hi in zip(edges[:-1], edges[1:]) if hi > lo]
+
+
+def _last_per_key(rows: pd.DataFrame, keys: List[str]) -> pd.DataFrame:
+    """Each key's last row; rows are already in (block_num, log_index) order."""
+    return rows.drop_duplicates(keys, keep="last").set_index(keys)
+
+
+def _indexed(frame: Optional[pd.DataFrame], columns: List[str], keys: List[str]) -> pd.DataFrame:
+    if frame is None:
+        frame = pd.DataFrame(columns=columns)
+    return frame[columns].set_index(keys)
+
+
+class EscrowStore:
+    """Escrow accounts, signers, tallies, transactions and daily rows, keyed for micro-batch folds."""
+
+    def __init__(
+        self,
+        accounts: Optional[pd.DataFrame] = None,
+        signers: Optional[pd.DataFrame] = None,
+        tallies: Optional[pd.DataFrame] = None,
+        transactions: Optional[pd.DataFrame] = None,
+        daily: Optional[pd.DataFrame] = None,
+    ) -> None:
+        self.accounts = _indexed(accounts, ACCOUNT_COLUMNS, ACCOUNT_KEYS)
+        self.signers = _indexed(signers, SIGNER_COLUMNS, ["signer"])
+        self.tallies = _indexed(tallies, TALLY_COLUMNS, TALLY_KEYS)
+        self.daily = _indexed(daily, DAILY_COLUMNS, DAILY_KEYS)
+        self._transactions = [transactions[TRANSACTION_COLUMNS]] if transactions is not None else []
+        self.batches = 0
+
+    @property
+    def transactions(self) -> pd.DataFrame:
+        if not self._transactions:
+            return pd.DataFrame(columns=TRANSACTION_COLUMNS)
+        if len(self._transactions) > 1:
+            self._transactions = [pd.concat(self._transactions, ignore_index=True)]
+        return self._transactions[0]
+
+    def apply(
+        self,
+        batch: pd.DataFrame,
+        scale: float = 1.0,
+        log: Optional[ReorgLog] = None,
+        confirmed: Optional[int] = None,
+    ) -> None:
+        """Fold one escrow_events_query() window (address columns encoded) into the store.
+
+        With a ReorgLog, blocks above confirmed are folded one at a time with
+        undo images of the rows each one touches, so rollback() can restore
+        the state after any of them.
+        """
+        self.batches += 1
+        if batch.empty:
+            return
+        batch = batch.sort_values(["block_num", "log_index"], kind="stable", ignore_index=True)
+        batch["tokens"] = batch["tokens"].astype(np.float64) / scale
+        batch["timestamp"] = batch["timestamp"].astype(np.int64)
+        if log is None:
+            self._fold(batch)
+            return
+        tail = batch["block_num"] > confirmed
+        if not tail.all():
+            self._fold(batch[~tail])
+        for block, rows in batch[tail].groupby("block_num", sort=True):
+            self._capture(rows, log, int(block))
+            self._fold(rows)
+
+    def rollback(self, log: ReorgLog, fork: int) -> None:
+        """Restore the state after block fork from log, dropping later transactions."""
+        for name in UNDO_TABLES:
+            setattr(self, name, log.rollback(name, getattr(self, name), fork))
+        self._transactions = [truncate_rows(self.transactions, fork)]
+        log.truncate(fork)
+
+    def _capture(self, rows: pd.DataFrame, log: ReorgLog, block: int) -> None:
+        kind = rows["event_type"]
+        accounts = rows[kind.isin(ACCOUNT_EVENTS)]
+        log.capture("accounts", self.accounts, pd.MultiIndex.from_frame(accounts[ACCOUNT_KEYS]), block)
+        days = accounts[ACCOUNT_KEYS].assign(
+            event_date=pd.to_datetime(accounts["timestamp"], unit="s", utc=True).dt.floor("D")
+        )
+        log.capture("daily", self.daily, pd.MultiIndex.from_frame(days), block)
+        log.capture("signers", self.signers, pd.Index(rows.loc[kind.isin(SIGNER_EVENTS), "signer"], name="signer"), block)
+        tallies = rows[kind == "PaymentCollected"]
+        log.capture("tallies", self.tallies, pd.MultiIndex.from_frame(tallies[TALLY_KEYS]), block)
+
+    def _fold(self, batch: pd.DataFrame) -> None:
+        kind = batch["event_type"]
+
+        accounts = batch[kind.isin(ACCOUNT_EVENTS)].copy()
+        accounts["delta"] = accounts["tokens"].fillna(0.0) * accounts["event_type"].map(BALANCE_SIGNS).fillna(0.0)
+        # Daily rows need the balance as it stood before the window.
+        self._fold_daily(accounts)
+        self._fold_accounts(accounts)
+        self._fold_signers(batch[kind.isin(SIGNER_EVENTS)])
+        self._fold_tallies(batch[kind == "PaymentCollected"])
+        self._append_transactions(batch[kind.isin(TRANSACTION_TYPES)])
+        logger.debug("Folded %s escrow events up to block %s.", len(batch), int(batch["block_num"].max()))
+
+    def _fold_accounts(self, rows: pd.DataFrame) -> None:
+        if rows.empty:
+            return
+        touched = rows.groupby(ACCOUNT_KEYS).agg(delta=("delta", "sum"), block_hi=("block_num", "max"))
+        index = self.accounts.index.union(touched.index)
+        accounts = self.accounts.reindex(index)
+        accounts["balance"] = accounts["balance"].fillna(0.0) + touched["delta"].reindex(index).fillna(0.0)
+
+        thaws = _last_per_key(rows[rows["event_type"].isin(ACCOUNT_THAW_WRITES)], ACCOUNT_KEYS)
+        is_thaw = thaws["event_type"] == "Thaw"
+        accounts.loc[thaws.index, "total_amount_thawing"] = thaws["tokens"].where(is_thaw, 0.0).to_numpy()
+        accounts.loc[thaws.index, "thaw_end_timestamp"] = thaws["thaw_end"].where(is_thaw, 0.0).to_numpy()
+        accounts[["total_amount_thawing", "thaw_end_timestamp"]] = (
+            accounts[["total_amount_thawing", "thaw_end_timestamp"]].fillna(0.0)
+        )
+        accounts["block_hi"] = np.fmax(
+            accounts["block_hi"].to_numpy(dtype=np.float64),
+            touched["block_hi"].reindex(index).to_numpy(dtype=np.float64),
+        )
+        self.accounts = accounts
+
+    def _fold_daily(self, rows: pd.DataFrame) -> None:
+        if rows.empty:
+            return
+        keys = pd.MultiIndex.from_frame(rows[ACCOUNT_KEYS])
+        opening = self.accounts["balance"].reindex(keys).fillna(0.0).to_numpy()
+        running = opening + rows.groupby(ACCOUNT_KEYS, sort=False)["delta"].cumsum().to_numpy()
+        kind, tokens = rows["event_type"], rows["tokens"].fillna(0.0)
+        events = rows[ACCOUNT_KEYS].assign(
+            event_date=pd.to_datetime(rows["timestamp"], unit="s", utc=True).dt.floor("D"),
+            deposits=tokens.where(kind == "Deposit", 0.0),
+            withdrawals=tokens.where(kind == "Withdraw", 0.0),
+            escrow_collected=tokens.where(kind == "EscrowCollected", 0.0),
+            payments_collected=tokens.where(kind == "PaymentCollected", 0.0),
+            closing_balance=running,
+            block_hi=rows["block_num"],
+        )
+        days = events.groupby(DAILY_KEYS).agg(
+            **{column: (column, "sum") for column in DAILY_SUMS},
+            closing_balance=("closing_balance", "last"),
+            block_hi=("block_hi", "max"),
+        )
+        index = self.daily.index.union(days.index)
+        daily = self.daily.reindex(index)
+        for column in DAILY_SUMS:
+            daily[column] = daily[column].fillna(0.0) + days[column].reindex(index).fillna(0.0)
+        # The window is later than everything stored, so its closing balance wins.
+        daily["closing_balance"] = days["closing_balance"].reindex(index).fillna(daily["closing_balance"])
+        daily["block_hi"] = np.fmax(
+            daily["block_hi"].to_numpy(dtype=np.float64), days["block_hi"].reindex(index).to_numpy(dtype=np.float64)
+        )
+        self.daily = daily
+
+    def _fold_signers(self, rows: pd.DataFrame) -> None:
+        if rows.empty:
+            return
+        last = _last_per_key(rows, ["signer"])
+        index = self.signers.index.union(last.index)
+        signers = self.signers.reindex(index)
+        signers.loc[last.index, "payer"] = last["payer"].to_numpy()
+        signers.loc[last.index, "is_authorized"] = (last["event_type"] != "SignerRevoked").to_numpy()
+
+        thaws = _last_per_key(rows[rows["event_type"].isin(SIGNER_THAW_WRITES)], ["signer"])
+        signers.loc[thaws.index, "thaw_end_timestamp"] = (
+            thaws["thaw_end"].where(thaws["event_type"] == "SignerThawing", 0.0).to_numpy()
+        )
+        signers["thaw_end_timestamp"] = signers["thaw_end_timestamp"].fillna(0.0)
+        block_hi = rows.groupby("signer")["block_num"].max()
+        signers["block_hi"] = np.fmax(
+            signers["block_hi"].to_numpy(dtype=np.float64), block_hi.reindex(index).to_numpy(dtype=np.float64)
+        )
+        self.signers = signers
+
+    def _fold_tallies(self, rows: pd.DataFrame) -> None:
+        if rows.empty:
+            return
+        touched = rows.groupby(TALLY_KEYS).agg(tokens=("tokens", "sum"), block_hi=("block_num", "max"))
+        index = self.tallies.index.union(touched.index)
+        tallies = self.tallies.reindex(index)
+        tallies["tokens"] = tallies["tokens"].fillna(0.0) + touched["tokens"].reindex(index).fillna(0.0)
+        tallies["block_hi"] = np.fmax(
+            tallies["block_hi"].to_numpy(dtype=np.float64), touched["block_hi"].reindex(index).to_numpy(dtype=np.float64)
+        )
+        self.tallies = tallies
+
+    def _append_transactions(self, rows: pd.DataFrame) -> None:
+        if rows.empty:
+            return
+        redeem = (rows["event_type"] == "PaymentCollected").to_numpy()
+        self._transactions.append(pd.DataFrame({
+            "tx_hash": rows["tx_hash"].to_numpy(),
+            "log_index": rows["log_index"].to_numpy(dtype=np.int64),
+            "type": rows["event_type"].map(TRANSACTION_TYPES).to_numpy(),
+            "payer": rows["payer"].to_numpy(),
+            "collector": np.where(redeem, rows["data_service"].to_numpy(), rows["collector"].to_numpy()),
+            "receiver": rows["receiver"].to_numpy(),
+            "account_collector": rows["collector"].to_numpy(),
+            "collection_id": rows["collection_id"].to_numpy(),
+            "amount": rows["tokens"].to_numpy(),
+            "timestamp": rows["timestamp"].to_numpy(),
+            "block_num": rows["block_num"].to_numpy(dtype=np.int64),
+        }))
+
+    def tables(self) -> Dict[str, pd.DataFrame]:
+        """The store's tables with their keys as columns, in publishable order."""
+        def flat(frame: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+            flat_frame = frame.reset_index()[columns]
+            flat_frame["block_hi"] = flat_frame["block_hi"].fillna(-1).astype(np.int64)
+            return flat_frame
+
+        signers = flat(self.signers, SIGNER_COLUMNS)
+        signers["is_authorized"] = signers["is_authorized"].fillna(False).astype(bool)
+        daily = flat(self.daily, DAILY_COLUMNS).sort_values(DAILY_KEYS, ignore_index=True)
+        return {
+            "accounts": flat(self.accounts, ACCOUNT_COLUMNS),
+            "signers": signers,
+            "tallies": flat(self.tallies, TALLY_COLUMNS),
+            "transactions": self.transactions,
+            "daily": daily,
+        }
@@ -0,0 +1,210 @@
+"""
+Deadline-bounded, hedged execution of nozzle queries.
+
+process_query() blocks until the gateway finishes, so one slow or stuck
+Flight stream holds up a whole script.  QueryExecutor runs each query on a
+pooled Client in a worker thread and waits with a deadline:
+
+- Every query has a deadline (QueryTimeout when it passes) and may be given
+  a threading.Event to cancel it from elsewhere (QueryCancelled).
+- Latency is tracked per query fingerprint (SQL with whitespace collapsed and
+  numeric literals masked, so block-range partitions of one query share
+  history).  Once an attempt runs past the fingerprint's p95, one hedged
+  duplicate is sent on a second Client and whichever finishes first wins.
+- Losing or abandoned attempts have their Client closed, which aborts the
+  underlying Flight stream, instead of being left to run.
+
+This is not a retry loop: a query that fails outright fails the caller.  A
+hedge only goes out while the first attempt is still running.  Latency
+history can be persisted with stats_path (NOZZLE_QUERY_STATS for
+shared_executor()): it is read on start and written back at exit, so nightly
+runs start with the previous run's percentiles.
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Deque, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from nozzle.client import Client
+from nozzle.util import process_query
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEADLINE = float(os.environ.get("NOZZLE_QUERY_DEADLINE", "3600"))
+STATS_PATH = os.environ.get("NOZZLE_QUERY_STATS")
+HEDGE_QUANTILE = 95
+MIN_SAMPLES = 5
+HISTORY = 50
+
+_NUMBER = re.compile(r"\b\d+\b")
+_SPACE = re.compile(r"\s+")
+
+
+class QueryTimeout(TimeoutError):
+    """A query did not finish before its deadline."""
+
+
+class QueryCancelled(RuntimeError):
+    """A query was cancelled through its cancel event."""
+
+
+def fingerprint(sql: str) -> str:
+    """Stable id for a query shape, ignoring whitespace and numeric literals."""
+    shape = _NUMBER.sub("?", _SPACE.sub(" ", sql).strip())
+    return hashlib.sha1(shape.encode()).hexdigest()[:16]
+
+
+class QueryExecutor:
+    """Runs queries with deadlines, cancellation and p95-triggered hedging."""
+
+    def __init__(
+        self,
+        client_url: str,
+        deadline: float = DEFAULT_DEADLINE,
+        stats_path: Optional[str] = None,
+    ) -> None:
+        self.client_url = client_url
+        self.deadline = deadline
+        self.stats_path = stats_path
+        self._lock = threading.Lock()
+        self._idle: List[Client] = []
+        self._latencies: Dict[str, Deque[float]] = {}
+        if stats_path and os.path.exists(stats_path):
+            with open(stats_path) as f:
+                for key, values in json.load(f).items():
+                    self._latencies[key] = deque(values, maxlen=HISTORY)
+        if stats_path:
+            atexit.register(self.save_stats)
+
+    # -- client pool -------------------------------------------------------
+    def _acquire(self) -> Client:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return Client(self.client_url)
+
+    def _release(self, client: Client) -> None:
+        with self._lock:
+            self._idle.append(client)
+
+    @staticmethod
+    def _discard(client: Client) -> None:
+        close = getattr(client, "close", None)
+        if close is None:
+            return
+        try:
+            close()
+        except Exception:  # the stream may already be torn down
+            logger.debug("Closing abandoned client failed.", exc_info=True)
+
+    # -- latency tracking --------------------------------------------------
+    def hedge_after(self, key: str) -> Optional[float]:
+        """Seconds after which a hedge is sent, or None without enough history."""
+        with self._lock:
+            samples = list(self._latencies.get(key, ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return float(np.percentile(samples, HEDGE_QUANTILE))
+
+    def _record(self, key: str, seconds: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(key, deque(maxlen=HISTORY)).append(seconds)
+
+    def save_stats(self) -> None:
+        """Write the latency history to stats_path (no-op without one)."""
+        if not self.stats_path:
+            return
+        with self._lock:
+            snapshot = {key: list(values) for key, values in self._latencies.items()}
+        with open(self.stats_path, "w") as f:
+            json.dump(snapshot, f)
+
+    # -- execution ---------------------------------------------------------
+    def _launch(self, sql: str, attempts: Dict[Future, Client]) -> None:
+        client = self._acquire()
+        future: Future = Future()
+        attempts[future] = client
+
+        def target() -> None:
+            try:
+                future.set_result(process_query(client, sql))
+            except BaseException as exc:  # surfaced to the caller via the future
+                future.set_exception(exc)
+
+        threading.Thread(target=target, daemon=True).start()
+
+    def run(
+        self,
+        sql: str,
+        deadline: Optional[float] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> pd.DataFrame:
+        """Run sql and return the first successful attempt's DataFrame."""
+        key = fingerprint(sql)
+        budget = self.deadline if deadline is None else deadline
+        started = time.monotonic()
+        hedge_at = self.hedge_after(key)
+        attempts: Dict[Future, Client] = {}
+        self._launch(sql, attempts)
+        error: Optional[BaseException] = None
+
+        try:
+            while attempts:
+                elapsed = time.monotonic() - started
+                if cancel is not None and cancel.is_set():
+                    raise QueryCancelled(f"Query {key} cancelled after {elapsed:.1f}s.")
+                if elapsed >= budget:
+                    raise QueryTimeout(f"Query {key} exceeded its {budget:.1f}s deadline.")
+
+                if hedge_at is not None and elapsed >= hedge_at:
+                    logger.info("Query %s passed its p95 (%.1fs); sending a hedged request.", key, hedge_at)
+                    self._launch(sql, attempts)
+                    hedge_at = None
+
+                # Wake up for the hedge point, the deadline, or a cancel poll.
+                timeout = budget - elapsed
+                if hedge_at is not None:
+                    timeout = min(timeout, hedge_at - elapsed)
+                if cancel is not None:
+                    timeout = min(timeout, 1.0)
+                done, _ = wait(list(attempts), timeout=max(timeout, 0.0), return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    client = attempts.pop(future)
+                    if future.exception() is not None:
+                        error = future.exception()
+                        logger.warning("Query %s attempt failed: %s", key, error)
+                        self._discard(client)
+                        continue
+                    self._record(key, time.monotonic() - started)
+                    self._release(client)
+                    return future.result()
+                # Every attempt failed without a hedge still pending.
+                if not attempts and error is not None:
+                    raise error
+        finally:
+            for client in attempts.values():
+                self._discard(client)
+        raise RuntimeError(f"Query {key} finished without a result.")
+
+
+_shared: Dict[str, QueryExecutor] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_executor(client_url: str) -> QueryExecutor:
+    """Process-wide executor per gateway URL, so callers share one client pool."""
+    with _shared_lock:
+        if client_url not in _shared:
+            _shared[client_url] = QueryExecutor(client_url, stats_path=STATS_PATH)
+        return _shared[client_url]
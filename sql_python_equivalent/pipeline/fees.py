@@ -0,0 +1,58 @@
+"""
+Per-allocation fee and reward attribution from one long event frame.
+
+Every fee- or reward-bearing allocation event (AllocationCollected,
+RebateCollected, RebateClaimed, RewardsAssigned, and Horizon's
+IndexingRewardsCollected / QueryFeesCollected) is selected into a single
+frame with one column per Allocation field it touches, zero / NULL where it
+does not.  attribute_allocation_fees() then builds all fields in one groupby.
+
+Fields follow the subgraph's update semantics:
+
+- cumulative (``.plus``): queryFeesCollected, curatorRewards,
+  distributedRebates, indexingRewards, indexingIndexerRewards,
+  indexingDelegatorRewards -- summed.
+- set (``=``): queryFeeRebates and delegationFees are overwritten by each
+  RebateCollected / RebateClaimed (staking.ts handleRebateCollected,
+  handleRebateClaimed) -- the last non-null value in (block_num, log_index)
+  order wins.
+  Rows flagged ``additive`` (subgraphService.ts handleQueryFeesCollected,
+  which ``.plus``-es both fields) are summed on top of that value instead.
+"""
+
+import logging
+from typing import List
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CUMULATIVE_FIELDS: List[str] = [
+    "query_fees_collected",
+    "curator_rewards",
+    "distributed_rebates",
+    "indexing_rewards",
+    "indexing_indexer_rewards",
+    "indexing_delegator_rewards",
+]
+SET_FIELDS: List[str] = ["query_fee_rebates", "delegation_fees"]
+FEE_FIELDS: List[str] = CUMULATIVE_FIELDS + SET_FIELDS
+
+
+def attribute_allocation_fees(events: pd.DataFrame, scale: float = 1e18) -> pd.DataFrame:
+    """One row per allocation_id with every fee field, converted from wei."""
+    if events.empty:
+        return pd.DataFrame(columns=["allocation_id"] + FEE_FIELDS)
+
+    ordered = events.sort_values(["block_num", "log_index"], kind="stable")
+    additive = ordered["additive"].astype(bool) if "additive" in ordered else pd.Series(False, index=ordered.index)
+    grouped = ordered.groupby("allocation_id", sort=False)
+    result = grouped[CUMULATIVE_FIELDS].sum()
+    # GroupBy.last() skips nulls, so rows that do not set a field leave the
+    # previous value in place, as the handlers do.
+    result[SET_FIELDS] = ordered[SET_FIELDS].where(~additive).groupby(ordered["allocation_id"], sort=False).last()
+    added = ordered[SET_FIELDS].where(additive).groupby(ordered["allocation_id"], sort=False).sum()
+    result[SET_FIELDS] = result[SET_FIELDS].astype(float).fillna(0.0) + added
+    result[FEE_FIELDS] = result[FEE_FIELDS].astype(float).fillna(0.0) / scale
+    logger.info("Attributed %s fee events to %s allocations.", len(events), len(result))
+    return result.reset_index()
@@ -0,0 +1,176 @@
+"""
+Allocation lifecycle intervals and point-in-time lookups.
+
+Allocation.allocatedTokens changes on AllocationCreated, on every
+AllocationResized (subgraphService.ts handleAllocationResized sets it to
+newTokens) and drops out of Indexer / SubgraphDeployment totals on
+AllocationClosed.  build_intervals() turns those events into one row per
+allocation state:
+
+    allocation_id, indexer, subgraph_deployment, reason ('created' | 'resized'),
+    start_block, end_block, start_at, end_at, allocated_tokens
+
+end_block / end_at are null while the state is current.  allocations_arbitrum
+publishes this as allocation_intervals_arbitrum, and AllocationLifecycle loads
+it back to answer questions without rescanning events:
+
+- allocated_tokens(block, indexer=..., deployment=...) -- binary search over a
+  per-indexer / per-deployment cumulative step function;
+- open_at(block) -- the allocation states live at a block;
+- active_at(timestamps) -- vectorised network-wide allocated tokens and
+  active allocation count for a whole time series.
+
+Lookups are "after every event in that block / at that second".
+"""
+
+import logging
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Within one block an allocation is created before it is resized or closed.
+_KIND_ORDER = {"created": 0, "resized": 1, "closed": 2}
+
+
+def build_intervals(events: pd.DataFrame) -> pd.DataFrame:
+    """Interval table from lifecycle events.
+
+    events columns: allocation_id, kind ('created' | 'resized' | 'closed'),
+    block_num, timestamp, tokens (raw wei; ignored for closes), and indexer /
+    subgraph_deployment on 'created' rows.
+    """
+    created = events[events["kind"] == "created"].drop_duplicates("allocation_id")
+    meta = created.set_index("allocation_id")[["indexer", "subgraph_deployment"]]
+    known = events["allocation_id"].isin(meta.index)
+    if not known.all():
+        logger.warning("Dropping %s lifecycle events for allocations with no creation.", int((~known).sum()))
+
+    ordered = events[known].assign(_rank=events["kind"].map(_KIND_ORDER))
+    ordered = ordered.sort_values(["allocation_id", "block_num", "_rank"], kind="stable")
+    grouped = ordered.groupby("allocation_id", sort=False)
+    ordered["end_block"] = grouped["block_num"].shift(-1)
+    ordered["end_at"] = grouped["timestamp"].shift(-1)
+    # Anything after the first close is a duplicate close (legacy + Horizon
+    # sources) and must not reopen the allocation.
+    is_close = (ordered["kind"] == "closed").astype(int)
+    closes_before = is_close.groupby(ordered["allocation_id"], sort=False).cumsum() - is_close
+    states = ordered[(ordered["kind"] != "closed") & (closes_before == 0)]
+
+    intervals = pd.DataFrame({
+        "allocation_id": states["allocation_id"].to_numpy(),
+        "reason": states["kind"].to_numpy(),
+        "start_block": states["block_num"].astype("int64").to_numpy(),
+        "end_block": states["end_block"].astype("Int64").to_numpy(),
+        "start_at": pd.to_datetime(states["timestamp"], unit="s", utc=True).to_numpy(),
+        "end_at": pd.to_datetime(states["end_at"], unit="s", utc=True).to_numpy(),
+        "allocated_tokens": states["tokens"].astype(float).to_numpy() / 1e18,
+    })
+    intervals = intervals.join(meta, on="allocation_id")
+    intervals = intervals.sort_values(["start_block", "allocation_id"], kind="stable").reset_index(drop=True)
+    logger.info("Built %s lifecycle intervals for %s allocations.", len(intervals), len(meta))
+    return intervals[[
+        "allocation_id", "indexer", "subgraph_deployment", "reason",
+        "start_block", "end_block", "start_at", "end_at", "allocated_tokens",
+    ]]
+
+
+class _StepIndex:
+    """Per-key cumulative step function with binary-search lookups."""
+
+    def __init__(self, keys: np.ndarray, positions: np.ndarray, deltas: np.ndarray) -> None:
+        order = np.lexsort((positions, keys))
+        keys, self.positions, deltas = keys[order], positions[order], deltas[order]
+        self.keys, starts = np.unique(keys, return_index=True)
+        running = np.cumsum(deltas)
+        # Restart the running sum at each key.
+        base = np.repeat(running[starts] - deltas[starts], np.diff(np.append(starts, len(keys))))
+        self.values = running - base
+        self.bounds: Dict[object, Tuple[int, int]] = dict(
+            zip(self.keys, zip(starts, np.append(starts[1:], len(keys))))
+        )
+
+    def at(self, key, points) -> np.ndarray:
+        points = np.asarray(points)
+        lo, hi = self.bounds.get(key, (0, 0))
+        if hi == lo:
+            return np.zeros(len(points))
+        idx = np.searchsorted(self.positions[lo:hi], points, side="right") - 1
+        return np.where(idx >= 0, self.values[lo:hi][np.maximum(idx, 0)], 0.0)
+
+
+def _steps(key: np.ndarray, start: np.ndarray, end: np.ndarray, amount: np.ndarray) -> _StepIndex:
+    """+amount at start, -amount at end (end is NaN while open)."""
+    closed = ~np.isnan(end)
+    return _StepIndex(
+        np.concatenate([key, key[closed]]),
+        np.concatenate([start, end[closed].astype(np.int64)]),
+        np.concatenate([amount, -amount[closed]]),
+    )
+
+
+def _epoch_seconds(values: pd.Series) -> np.ndarray:
+    """Float seconds since epoch, NaN for missing timestamps."""
+    ts = pd.to_datetime(values, utc=True)
+    return np.where(ts.isna(), np.nan, (ts - pd.Timestamp(0, tz="UTC")).dt.total_seconds())
+
+
+class AllocationLifecycle:
+    """Point-in-time views over an allocation interval table."""
+
+    def __init__(self, intervals: pd.DataFrame) -> None:
+        self.intervals = intervals.sort_values("start_block", kind="stable").reset_index(drop=True)
+        iv = self.intervals
+        start = iv["start_block"].to_numpy(dtype=np.int64)
+        end = iv["end_block"].astype(float).to_numpy()
+        tokens = iv["allocated_tokens"].to_numpy(dtype=float)
+        self._by_indexer = _steps(iv["indexer"].to_numpy(dtype=object), start, end, tokens)
+        self._by_deployment = _steps(iv["subgraph_deployment"].to_numpy(dtype=object), start, end, tokens)
+
+        # Network-wide series over time: tokens follow every interval, the
+        # allocation count one +1 per creation and one -1 per final close.
+        network = np.zeros(len(iv), dtype=np.int64)
+        start_ts = _epoch_seconds(iv["start_at"]).astype(np.int64)
+        end_ts = _epoch_seconds(iv["end_at"])
+        self._tokens_over_time = _steps(network, start_ts, end_ts, tokens)
+        # The last state of an allocation (by start block) carries its close.
+        last = ~iv.duplicated("allocation_id", keep="last").to_numpy()
+        closed_at = pd.Series(end_ts[last], index=iv.loc[last, "allocation_id"])
+        created = (iv["reason"] == "created").to_numpy()
+        self._count_over_time = _steps(
+            network[created],
+            start_ts[created],
+            iv.loc[created, "allocation_id"].map(closed_at).to_numpy(dtype=float),
+            np.ones(int(created.sum())),
+        )
+
+    @classmethod
+    def load(cls, table_id: str = "allocation_intervals_arbitrum") -> "AllocationLifecycle":
+        from pipeline.tables import load_entity_table
+
+        return cls(load_entity_table(table_id))
+
+    def allocated_tokens(self, block: int, indexer: Optional[str] = None, deployment: Optional[str] = None) -> float:
+        """Open allocated tokens of one indexer or deployment after block."""
+        if (indexer is None) == (deployment is None):
+            raise ValueError("Pass exactly one of indexer or deployment.")
+        index, key = (self._by_indexer, indexer) if indexer is not None else (self._by_deployment, deployment)
+        return float(index.at(key, [block])[0])
+
+    def open_at(self, block: int) -> pd.DataFrame:
+        """Allocation states live after block (start <= block < end)."""
+        candidates = self.intervals.iloc[: np.searchsorted(self.intervals["start_block"].to_numpy(), block, side="right")]
+        end = candidates["end_block"]
+        return candidates[end.isna() | (end > block)]
+
+    def active_at(self, timestamps) -> pd.DataFrame:
+        """Network allocated tokens and active allocation count at each timestamp."""
+        ts = pd.to_datetime(pd.Series(timestamps), utc=True)
+        points = _epoch_seconds(ts).astype(np.int64)
+        return pd.DataFrame({
+            "timestamp": ts.to_numpy(),
+            "allocated_tokens": self._tokens_over_time.at(0, points),
+            "active_allocation_count": self._count_over_time.at(0, points).astype(int),
+        })
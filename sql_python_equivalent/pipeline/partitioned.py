@@ -0,0 +1,171 @@
+"""
+Range-partitioned parallel scans with client-side merge of partial aggregates.
+
+A full-history aggregate over arbitrum_staking.* or raw logs runs as one
+serial Flight stream.  partitioned_query() splits such a query into block_num
+ranges, runs each range through a QueryExecutor (pipeline/executor.py) from a
+thread pool -- each in-flight range holds its own pooled Client and so its
+own Flight stream, with deadlines and hedging -- and merges the per-range
+partial aggregates here.
+
+The query is written once with a ``{block_range}`` placeholder in the WHERE
+clause of every fact-table scan; ``{block_range:e}`` qualifies the column with
+a table alias (``e.block_num``) and ``{block_range:s.block_number}`` names the
+column outright for tables that use a different block column.  Reference data the query needs in full
+(e.g. the DelegationParametersUpdated history used for a LEAD window) must be
+left unfiltered.  Each output column is declared with how its partials merge:
+
+- sum / count    → summed across partitions
+- min / max      → min / max across partitions
+- distinct       → ARRAY_AGG(DISTINCT x) per partition, unioned into a list
+- distinct_count → same partial as distinct, reported as the union's size
+
+AVG is not mergeable; select SUM and COUNT and divide after the merge.
+Non-aggregate post-processing (HAVING-style filters, ratios, unit scaling)
+likewise belongs after the merge, since it is only valid on full totals.
+"""
+
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from pipeline.executor import QueryExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STREAMS = int(os.environ.get("NOZZLE_MAX_STREAMS", "4"))
+# More partitions than streams so a dense block range does not leave the
+# other streams idle while it finishes.
+PARTITIONS_PER_STREAM = 4
+
+_PLACEHOLDER = re.compile(r"\{block_range(?::([\w.]+))?\}")
+_SCALAR_MERGES = {"sum": "sum", "count": "sum", "min": "min", "max": "max"}
+_SET_MERGES = ("distinct", "distinct_count")
+
+
+def block_bounds(executor: QueryExecutor, tables: Sequence[str]) -> Tuple[int, int]:
+    """Smallest and largest block_num across the given tables."""
+    per_table = "\nUNION ALL\n".join(
+        f"SELECT MIN(block_num) AS lo, MAX(block_num) AS hi FROM {table}" for table in tables
+    )
+    bounds = executor.run(f"SELECT MIN(lo) AS lo, MAX(hi) AS hi FROM ({per_table}) b")
+    lo, hi = bounds["lo"].iloc[0], bounds["hi"].iloc[0]
+    if pd.isna(lo) or pd.isna(hi):
+        raise ValueError(f"No rows found in {', '.join(tables)} to partition on.")
+    return int(lo), int(hi)
+
+
+def synced_block(executor: QueryExecutor, tables: Sequence[str]) -> int:
+    """Last block every one of the given tables has reached (the smallest per-table max)."""
+    per_table = "\nUNION ALL\n".join(f"SELECT MAX(block_num) AS hi FROM {table}" for table in tables)
+    hi = executor.run(f"SELECT MIN(hi) AS hi FROM ({per_table}) b")["hi"].iloc[0]
+    if pd.isna(hi):
+        raise ValueError(f"No rows found in {', '.join(tables)}.")
+    return int(hi)
+
+
+def block_partitions(start: int, end: int, partitions: int) -> List[Tuple[int, int]]:
+    """Split the inclusive block range [start, end] into half-open ranges."""
+    edges = np.linspace(start, end + 1, num=max(1, partitions) + 1).astype(np.int64)
+    return [(int(lo), int(hi)) for lo, hi in zip(edges[:-1], edges[1:]) if hi > lo]
+
+
+def render_partition(sql: str, lo: int, hi: int) -> str:
+    """Substitute every {block_range[:alias|:alias.column]} placeholder for one range."""
+    def predicate(match: "re.Match") -> str:
+        target = match.group(1)
+        if not target:
+            column = "block_num"
+        else:
+            column = target if "." in target else f"{target}.block_num"
+        return f"({column} >= {lo} AND {column} < {hi})"
+
+    return _PLACEHOLDER.sub(predicate, sql)
+
+
+def _union(values: pd.Series) -> List:
+    merged = set()
+    for value in values:
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            continue
+        merged.update(value)
+    return sorted(merged)
+
+
+def merge_partials(
+    partials: Sequence[pd.DataFrame],
+    keys: List[str],
+    aggregates: Dict[str, str],
+) -> pd.DataFrame:
+    """Combine per-partition aggregate frames into full-range aggregates."""
+    unknown = {kind for kind in aggregates.values() if kind not in _SCALAR_MERGES and kind not in _SET_MERGES}
+    if unknown:
+        raise ValueError(f"Unsupported merge kind(s): {', '.join(sorted(unknown))}")
+
+    non_empty = [p for p in partials if not p.empty]
+    if not non_empty:
+        return pd.DataFrame(columns=keys + list(aggregates))
+    frame = pd.concat(non_empty, ignore_index=True)
+
+    group_keys = keys or ["_all"]
+    if not keys:
+        frame["_all"] = 0
+    grouped = frame.groupby(group_keys, sort=False, dropna=False)
+
+    merged = {}
+    for column, kind in aggregates.items():
+        if kind in _SCALAR_MERGES:
+            merged[column] = grouped[column].agg(_SCALAR_MERGES[kind])
+        else:
+            union = grouped[column].agg(_union)
+            merged[column] = union.map(len) if kind == "distinct_count" else union
+    result = pd.DataFrame(merged).reset_index()
+    return result.drop(columns=["_all"]) if not keys else result
+
+
+def partitioned_query(
+    client_url: str,
+    sql: str,
+    keys: List[str],
+    aggregates: Dict[str, str],
+    tables: Sequence[str],
+    bounds: Optional[Tuple[int, int]] = None,
+    partitions: Optional[int] = None,
+    max_streams: int = DEFAULT_STREAMS,
+    executor: Optional[QueryExecutor] = None,
+) -> pd.DataFrame:
+    """Run an aggregate query as parallel block_num partitions and merge them.
+
+    sql must select exactly keys + aggregates' columns, grouped by keys, with
+    a {block_range} placeholder on every fact-table scan.  bounds defaults to
+    the block span of tables.  Pass a shared executor to keep its latency
+    history across calls.
+    """
+    if not _PLACEHOLDER.search(sql):
+        raise ValueError("Partitioned query has no {block_range} placeholder.")
+
+    executor = executor or QueryExecutor(client_url)
+    if bounds is None:
+        bounds = block_bounds(executor, tables)
+    ranges = block_partitions(bounds[0], bounds[1], partitions or max_streams * PARTITIONS_PER_STREAM)
+    logger.info(
+        "Scanning blocks %s-%s as %s partitions over %s streams...",
+        bounds[0], bounds[1], len(ranges), max_streams,
+    )
+
+    def run(block_range: Tuple[int, int]) -> pd.DataFrame:
+        partial = executor.run(render_partition(sql, *block_range))
+        logger.debug("Blocks %s-%s: %s partial rows.", block_range[0], block_range[1], len(partial))
+        return partial
+
+    with ThreadPoolExecutor(max_workers=max_streams) as pool:
+        partials = list(pool.map(run, ranges))
+
+    result = merge_partials(partials, keys, aggregates)
+    logger.info("Merged %s partial rows into %s rows.", sum(len(p) for p in partials), len(result))
+    return result
@@ -0,0 +1,467 @@
+"""
+Horizon Provision and ThawRequest state, refreshed from a block watermark.
+
+A Provision (createOrLoadProvision in helpers.ts, horizonStaking.ts handlers)
+is keyed by (service provider, verifier) and holds three kinds of fields:
+
+- balances the handlers only add to or subtract from (tokensProvisioned,
+  tokensThawing, delegatedTokens, ...).  PROVISION_DELTAS lists which event
+  moves which balance by how much; the SQL sums them per (service provider,
+  verifier, field), so a refresh adds the new blocks' sums to the stored
+  balances;
+- parameters the handlers overwrite (thawingPeriod, maxVerifierCut, their
+  pending values and the three delegation fee cuts).  PROVISION_PARAMETERS
+  lists them; the latest value per field wins;
+- thawingUntil, the largest thawingUntil of the provision's Provision-type
+  thaw requests.
+
+ThawQueue keeps every ThawRequest ordered per (service provider, verifier)
+by thawingUntil, with a sorted index of request ids, so each
+ThawRequestFulfilled resolves with one binary search -- including requests
+created in an earlier refresh.
+
+Both tables carry block_hi, the highest block folded into a row, and
+synced_block, the to_block of the refresh that published them: every query of
+a refresh reads the same (after_block, to_block] window, and the next one
+resumes after high_water() of the published tables.
+SubgraphService provisions start from the indexer's delegation pool as it
+stood before their first event (createOrLoadProvision): seed_legacy_pool()
+adds it to provisions first seen in a refresh, and fold_pool_rewards() adds
+the legacy reward inflows processRewardsAssigned pays them afterwards.
+
+Addresses and ids are int32 codes (pipeline/addresses.py); token and share
+columns are scaled by `scale` before they are merged into stored rows.
+"""
+
+import logging
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+STAKING_ADDRESS = "00669A4CF01450B64E8A2A20E9b1FCB71E61eF03"
+SUBGRAPH_SERVICE_ADDRESS = "b2Bb92d0DE618878E438b55D5846cfecD9301105"
+
+PROVISION_CREATED = "ProvisionCreated(address indexed serviceProvider, address indexed verifier, uint256 tokens, uint32 maxVerifierCut, uint64 thawingPeriod)"
+PROVISION_INCREASED = "ProvisionIncreased(address indexed serviceProvider, address indexed verifier, uint256 tokens)"
+PROVISION_THAWED = "ProvisionThawed(address indexed serviceProvider, address indexed verifier, uint256 tokens)"
+TOKENS_DEPROVISIONED = "TokensDeprovisioned(address indexed serviceProvider, address indexed verifier, uint256 tokens)"
+PROVISION_SLASHED = "ProvisionSlashed(address indexed serviceProvider, address indexed verifier, uint256 tokens)"
+PARAMETERS_SET = "ProvisionParametersSet(address indexed serviceProvider, address indexed verifier, uint32 maxVerifierCut, uint64 thawingPeriod)"
+PARAMETERS_STAGED = "ProvisionParametersStaged(address indexed serviceProvider, address indexed verifier, uint32 maxVerifierCut, uint64 thawingPeriod)"
+DELEGATION_FEE_CUT_SET = "DelegationFeeCutSet(address indexed serviceProvider, address indexed verifier, uint8 indexed paymentType, uint256 feeCut)"
+POOL_TOKENS_ADDED = "TokensToDelegationPoolAdded(address indexed serviceProvider, address indexed verifier, uint256 tokens)"
+TOKENS_DELEGATED = "TokensDelegated(address indexed serviceProvider, address indexed verifier, address indexed delegator, uint256 tokens, uint256 shares)"
+DELEGATION_SLASHED = "DelegationSlashed(address indexed serviceProvider, address indexed verifier, uint256 tokens)"
+TOKENS_UNDELEGATED = "TokensUndelegated(address indexed serviceProvider, address indexed verifier, address indexed delegator, uint256 tokens, uint256 shares)"
+DELEGATED_TOKENS_WITHDRAWN = "DelegatedTokensWithdrawn(address indexed serviceProvider, address indexed verifier, address indexed delegator, uint256 tokens)"
+THAW_REQUEST_CREATED = "ThawRequestCreated(uint8 indexed requestType, address indexed serviceProvider, address indexed verifier, address owner, uint256 shares, uint64 thawingUntil, bytes32 thawRequestId, uint256 nonce)"
+THAW_REQUEST_FULFILLED = "ThawRequestFulfilled(uint8 indexed requestType, bytes32 indexed thawRequestId, uint256 tokens, uint256 shares, uint64 thawingUntil, bool valid)"
+
+TOKENS = "arrow_cast(event['tokens'], 'Float64')"
+SHARES = "arrow_cast(event['shares'], 'Float64')"
+# Horizon fee cuts are what the delegators get; the subgraph stores 1M - feeCut.
+INVERTED_CUT = "1000000.0 - arrow_cast(event['feeCut'], 'Float64')"
+
+# (event, balance, signed amount): one entry per balance a handler moves.
+PROVISION_DELTAS: List[Tuple[str, str, str]] = [
+    (PROVISION_CREATED, "tokens_provisioned", TOKENS),
+    (PROVISION_INCREASED, "tokens_provisioned", TOKENS),
+    (PROVISION_THAWED, "tokens_thawing", TOKENS),
+    (TOKENS_DEPROVISIONED, "tokens_provisioned", f"-{TOKENS}"),
+    (TOKENS_DEPROVISIONED, "tokens_thawing", f"-{TOKENS}"),
+    (PROVISION_SLASHED, "tokens_provisioned", f"-{TOKENS}"),
+    (PROVISION_SLASHED, "tokens_slashed_service_provider", TOKENS),
+    (POOL_TOKENS_ADDED, "delegated_tokens", TOKENS),
+    (TOKENS_DELEGATED, "delegated_tokens", TOKENS),
+    (TOKENS_DELEGATED, "delegator_shares", SHARES),
+    (DELEGATION_SLASHED, "delegated_tokens", f"-{TOKENS}"),
+    (DELEGATION_SLASHED, "tokens_slashed_delegation_pool", TOKENS),
+    (TOKENS_UNDELEGATED, "delegator_shares", f"-{SHARES}"),
+    (TOKENS_UNDELEGATED, "delegated_thawing_tokens", TOKENS),
+    (DELEGATED_TOKENS_WITHDRAWN, "delegated_tokens", f"-{TOKENS}"),
+    (DELEGATED_TOKENS_WITHDRAWN, "delegated_thawing_tokens", f"-{TOKENS}"),
+]
+
+# (event, parameter, value, condition): one entry per field a handler overwrites.
+PROVISION_PARAMETERS: List[Tuple[str, str, str, str]] = [
+    (PROVISION_CREATED, "max_verifier_cut", "event['maxVerifierCut']", "TRUE"),
+    (PROVISION_CREATED, "max_verifier_cut_pending", "event['maxVerifierCut']", "TRUE"),
+    (PROVISION_CREATED, "thawing_period", "event['thawingPeriod']", "TRUE"),
+    (PROVISION_CREATED, "thawing_period_pending", "event['thawingPeriod']", "TRUE"),
+    (PARAMETERS_SET, "max_verifier_cut", "event['maxVerifierCut']", "TRUE"),
+    (PARAMETERS_SET, "thawing_period", "event['thawingPeriod']", "TRUE"),
+    (PARAMETERS_STAGED, "max_verifier_cut_pending", "event['maxVerifierCut']", "TRUE"),
+    (PARAMETERS_STAGED, "thawing_period_pending", "event['thawingPeriod']", "TRUE"),
+    (DELEGATION_FEE_CUT_SET, "query_fee_cut", INVERTED_CUT, "event['paymentType'] = 0"),
+    (DELEGATION_FEE_CUT_SET, "indexing_fee_cut", INVERTED_CUT, "event['paymentType'] = 1"),
+    (DELEGATION_FEE_CUT_SET, "indexing_rewards_cut", INVERTED_CUT, "event['paymentType'] = 2"),
+]
+
+BALANCE_COLUMNS = list(dict.fromkeys(field for _, field, _ in PROVISION_DELTAS))
+# The balances the handlers also keep on the Indexer, across every verifier.
+POOL_COLUMNS = ["delegated_tokens", "delegated_thawing_tokens", "delegator_shares"]
+# createOrLoadProvision defaults; the cuts start at 1M (all to delegators).
+PARAMETER_DEFAULTS = {
+    "max_verifier_cut": 0.0,
+    "max_verifier_cut_pending": 0.0,
+    "thawing_period": 0.0,
+    "thawing_period_pending": 0.0,
+    "query_fee_cut": 1_000_000.0,
+    "indexing_fee_cut": 1_000_000.0,
+    "indexing_rewards_cut": 1_000_000.0,
+}
+PROVISION_KEYS = ["indexer", "data_service"]
+PROVISION_COLUMNS = [
+    *PROVISION_KEYS, *BALANCE_COLUMNS, *PARAMETER_DEFAULTS, "thawing_until", "created_at", "block_hi",
+]
+
+THAW_REQUEST_TYPES = {0: "Provision", 1: "Delegation"}
+THAW_REQUEST_COLUMNS = [
+    "id", "type", *PROVISION_KEYS, "owner", "shares", "tokens", "thawing_until",
+    "fulfilled", "fulfilled_as_valid", "block_hi",
+]
+# Last block every query of the publishing refresh had read up to.
+SYNCED_COLUMN = "synced_block"
+
+
+def _staking_events(selects: List[Tuple[str, str, str]], after_block: int, to_block: int) -> str:
+    """UNION ALL of (event signature, SELECT list, condition) over the staking logs in (after_block, to_block]."""
+    parts = [
+        f"""SELECT {select}
+FROM (
+    SELECT evm_decode(topic1, topic2, topic3, data, '{signature}') AS event, block_num, log_index, timestamp
+    FROM staking_logs
+    WHERE topic0 = evm_topic('{signature}')
+) e
+WHERE {condition}"""
+        for signature, select, condition in selects
+    ]
+    union = "\nUNION ALL\n".join(parts)
+    return f"""
+WITH staking_logs AS (
+    SELECT l.topic0, l.topic1, l.topic2, l.topic3, l.data, l.block_num, l.log_index, l.timestamp
+    FROM "edgeandnode/arbitrum_one@0.0.1".logs l
+    WHERE l.address = arrow_cast(x'{STAKING_ADDRESS}', 'FixedSizeBinary(20)')
+      AND l.block_num > {after_block}
+      AND l.block_num <= {to_block}
+)
+{union}
+"""
+
+
+_PROVISION_KEY_SELECT = "event['serviceProvider'] AS indexer, event['verifier'] AS data_service"
+
+
+def provision_deltas_query(after_block: int, to_block: int) -> str:
+    """Summed balance moves per (indexer, data_service, field) in (after_block, to_block]."""
+    events = _staking_events(
+        [
+            (
+                signature,
+                f"{_PROVISION_KEY_SELECT}, '{field}' AS field, {amount} AS amount, block_num, log_index, timestamp",
+                "TRUE",
+            )
+            for signature, field, amount in PROVISION_DELTAS
+        ],
+        after_block,
+        to_block,
+    )
+    return f"""
+SELECT indexer, data_service, field,
+    SUM(amount) AS amount, MIN(timestamp) AS first_at, MAX(block_num) AS block_hi,
+    MIN(block_num) AS first_block, MIN(CASE WHEN row_num = 1 THEN log_index END) AS first_log_index
+FROM (
+    SELECT *, ROW_NUMBER() OVER (PARTITION BY indexer, data_service, field ORDER BY block_num, log_index) AS row_num
+    FROM ({events}) e
+) d
+GROUP BY indexer, data_service, field
+"""
+
+
+def indexer_pool_moves_query(to_block: int) -> str:
+    """Every Horizon move of an indexer's POOL_COLUMNS up to to_block, on any verifier.
+
+    The handlers apply these to the Indexer as well as the provision, so they
+    are part of the pool createOrLoadProvision copies.
+    """
+    return _staking_events(
+        [
+            (
+                signature,
+                f"event['serviceProvider'] AS indexer, '{field}' AS field, {amount} AS amount, block_num, log_index",
+                "TRUE",
+            )
+            for signature, field, amount in PROVISION_DELTAS
+            if field in POOL_COLUMNS
+        ],
+        -1,
+        to_block,
+    )
+
+
+def provision_parameters_query(after_block: int, to_block: int) -> str:
+    """Every parameter write in (after_block, to_block], with its position for last-wins."""
+    return _staking_events(
+        [
+            (
+                signature,
+                f"{_PROVISION_KEY_SELECT}, '{field}' AS field, arrow_cast({value}, 'Float64') AS value, "
+                "block_num, log_index, timestamp",
+                condition,
+            )
+            for signature, field, value, condition in PROVISION_PARAMETERS
+        ],
+        after_block,
+        to_block,
+    )
+
+
+def thaw_requests_query(after_block: int, to_block: int) -> str:
+    return _staking_events(
+        [(
+            THAW_REQUEST_CREATED,
+            "event['thawRequestId'] AS id, event['requestType'] AS request_type, "
+            f"{_PROVISION_KEY_SELECT}, event['owner'] AS owner, {SHARES} AS shares, "
+            "arrow_cast(event['thawingUntil'], 'Int64') AS thawing_until, block_num",
+            "TRUE",
+        )],
+        after_block,
+        to_block,
+    )
+
+
+def thaw_fulfilments_query(after_block: int, to_block: int) -> str:
+    return _staking_events(
+        [(
+            THAW_REQUEST_FULFILLED,
+            f"event['thawRequestId'] AS id, {TOKENS} AS tokens, event['valid'] AS valid, block_num",
+            "TRUE",
+        )],
+        after_block,
+        to_block,
+    )
+
+
+def high_water(*tables: Optional[pd.DataFrame]) -> int:
+    """Block the published tables are synced to (-1 when there are none).
+
+    That is their synced_block where they carry one, else their highest block_hi.
+    """
+    marks = [
+        int(table[SYNCED_COLUMN if SYNCED_COLUMN in table.columns else "block_hi"].max())
+        for table in tables if table is not None and not table.empty
+    ]
+    return max(marks, default=-1)
+
+
+class ThawQueue:
+    """ThawRequests per (indexer, data_service) in thawingUntil order, indexed by id."""
+
+    def __init__(self, requests: pd.DataFrame) -> None:
+        self.requests = requests[THAW_REQUEST_COLUMNS].sort_values(
+            [*PROVISION_KEYS, "thawing_until", "id"], kind="stable", ignore_index=True
+        )
+        ids = self.requests["id"].to_numpy()
+        self._by_id = np.argsort(ids, kind="stable")
+        self._ids = ids[self._by_id]
+
+    @classmethod
+    def empty(cls) -> "ThawQueue":
+        return cls(pd.DataFrame(columns=THAW_REQUEST_COLUMNS))
+
+    def extend(self, created: pd.DataFrame, scale: float = 1.0) -> "ThawQueue":
+        """Queue with handleThawRequestCreated's new rows for thaw_requests_query() results."""
+        if created.empty:
+            return self
+        unknown = set(created["request_type"].unique()) - set(THAW_REQUEST_TYPES)
+        if unknown:
+            raise ValueError(f"Invalid thaw request type(s): {sorted(unknown)}")
+        rows = pd.DataFrame({
+            "id": created["id"].to_numpy(),
+            "type": created["request_type"].map(THAW_REQUEST_TYPES).to_numpy(),
+            "indexer": created["indexer"].to_numpy(),
+            "data_service": created["data_service"].to_numpy(),
+            "owner": created["owner"].to_numpy(),
+            "shares": created["shares"].to_numpy(dtype=np.float64) / scale,
+            "tokens": 0.0,
+            "thawing_until": created["thawing_until"].to_numpy(dtype=np.int64),
+            "fulfilled": False,
+            "fulfilled_as_valid": False,
+            "block_hi": created["block_num"].to_numpy(dtype=np.int64),
+        })
+        if self.requests.empty:
+            return ThawQueue(rows)
+        return ThawQueue(pd.concat([self.requests, rows], ignore_index=True))
+
+    def fulfil(self, fulfilments: pd.DataFrame, scale: float = 1.0) -> None:
+        """handleThawRequestFulfilled for thaw_fulfilments_query() results, in place."""
+        if fulfilments.empty:
+            return
+        ids = fulfilments["id"].to_numpy()
+        slot = np.searchsorted(self._ids, ids)
+        found = slot < len(self._ids)
+        found[found] = self._ids[slot[found]] == ids[found]
+        if not found.all():
+            logger.warning("%s ThawRequestFulfilled events have no known request.", int((~found).sum()))
+
+        rows = self._by_id[slot[found]]
+        requests = self.requests
+        requests.loc[rows, "tokens"] = fulfilments["tokens"].to_numpy(dtype=np.float64)[found] / scale
+        requests.loc[rows, "fulfilled_as_valid"] = fulfilments["valid"].to_numpy(dtype=bool)[found]
+        requests.loc[rows, "fulfilled"] = True
+        requests.loc[rows, "block_hi"] = np.maximum(
+            requests["block_hi"].to_numpy(dtype=np.int64)[rows],
+            fulfilments["block_num"].to_numpy(dtype=np.int64)[found],
+        )
+
+    def pending(self) -> pd.DataFrame:
+        return self.requests[~self.requests["fulfilled"].astype(bool)]
+
+    def thawing_until(self) -> pd.Series:
+        """Latest Provision-type thawingUntil per (indexer, data_service)."""
+        provision = self.requests[self.requests["type"] == "Provision"]
+        # Rows are in thawingUntil order within a provision, so its last row holds the max.
+        last = provision.drop_duplicates(PROVISION_KEYS, keep="last")
+        return last.set_index(PROVISION_KEYS)["thawing_until"].astype(np.int64)
+
+
+def _column(frame: pd.DataFrame, column: str, index: pd.Index) -> pd.Series:
+    if column in frame.columns:
+        return frame[column].reindex(index)
+    return pd.Series(np.nan, index=index)
+
+
+def merge_provisions(
+    existing: Optional[pd.DataFrame],
+    deltas: pd.DataFrame,
+    parameters: pd.DataFrame,
+    thawing_until: pd.Series,
+    scale: float = 1.0,
+) -> pd.DataFrame:
+    """Stored provisions updated with one refresh's deltas, parameters and thaw requests."""
+    stored = (
+        existing[PROVISION_COLUMNS].set_index(PROVISION_KEYS)
+        if existing is not None else pd.DataFrame(columns=PROVISION_COLUMNS).set_index(PROVISION_KEYS)
+    )
+    balances = deltas.pivot_table(index=PROVISION_KEYS, columns="field", values="amount", aggfunc="sum") / scale
+    latest = (
+        parameters.sort_values(["block_num", "log_index"], kind="stable")
+        .drop_duplicates([*PROVISION_KEYS, "field"], keep="last")
+        .pivot(index=PROVISION_KEYS, columns="field", values="value")
+    )
+    touched = pd.concat([
+        deltas.rename(columns={"first_at": "created_at"})[[*PROVISION_KEYS, "created_at", "block_hi"]],
+        parameters.rename(columns={"timestamp": "created_at", "block_num": "block_hi"})[
+            [*PROVISION_KEYS, "created_at", "block_hi"]
+        ],
+    ]).groupby(PROVISION_KEYS).agg(created_at=("created_at", "min"), block_hi=("block_hi", "max"))
+
+    index = stored.index.union(touched.index).union(thawing_until.index)
+    merged = pd.DataFrame(index=index)
+    for column in BALANCE_COLUMNS:
+        merged[column] = _column(stored, column, index).fillna(0.0) + _column(balances, column, index).fillna(0.0)
+    for column, default in PARAMETER_DEFAULTS.items():
+        merged[column] = _column(latest, column, index).fillna(_column(stored, column, index)).fillna(default)
+    merged["thawing_until"] = np.fmax(
+        _column(stored, "thawing_until", index).to_numpy(dtype=np.float64),
+        _column(thawing_until.to_frame(), "thawing_until", index).to_numpy(dtype=np.float64),
+    )
+    merged["thawing_until"] = merged["thawing_until"].fillna(0).astype(np.int64)
+    merged["created_at"] = np.fmin(
+        _column(stored, "created_at", index).to_numpy(dtype=np.float64),
+        _column(touched, "created_at", index).to_numpy(dtype=np.float64),
+    )
+    merged["block_hi"] = np.fmax(
+        _column(stored, "block_hi", index).to_numpy(dtype=np.float64),
+        _column(touched, "block_hi", index).to_numpy(dtype=np.float64),
+    )
+    merged["block_hi"] = merged["block_hi"].fillna(-1).astype(np.int64)
+    logger.info("Merged %s provisions (%s touched this refresh).", len(merged), len(touched))
+    return merged.reset_index()[PROVISION_COLUMNS]
+
+
+def first_events(deltas: pd.DataFrame, parameters: pd.DataFrame) -> pd.DataFrame:
+    """Earliest (block_num, log_index) per provision in one refresh's deltas and parameters."""
+    events = pd.concat([
+        deltas.rename(columns={"first_block": "block_num", "first_log_index": "log_index"})[
+            [*PROVISION_KEYS, "block_num", "log_index"]
+        ],
+        parameters[[*PROVISION_KEYS, "block_num", "log_index"]],
+    ], ignore_index=True).astype({"block_num": np.int64, "log_index": np.int64})
+    return (
+        events.sort_values(["block_num", "log_index"], kind="stable")
+        .drop_duplicates(PROVISION_KEYS)
+        .reset_index(drop=True)
+    )
+
+
+def _earlier(block_num: pd.Series, log_index: pd.Series, than_block: pd.Series, than_log_index: pd.Series) -> np.ndarray:
+    return ((block_num < than_block) | ((block_num == than_block) & (log_index < than_log_index))).to_numpy()
+
+
+def pool_moves_before(moves: pd.DataFrame, created: pd.DataFrame) -> pd.DataFrame:
+    """Each provision's indexer_pool_moves_query() sums before its first event.
+
+    created holds first_events() rows; the result has one row per created
+    row, in its order, with PROVISION_KEYS and POOL_COLUMNS.
+    """
+    joined = created.merge(moves, on="indexer", suffixes=("", "_move"))
+    earlier = _earlier(joined["block_num_move"], joined["log_index_move"], joined["block_num"], joined["log_index"])
+    sums = joined[earlier].pivot_table(index=PROVISION_KEYS, columns="field", values="amount", aggfunc="sum")
+    keys = pd.MultiIndex.from_frame(created[PROVISION_KEYS])
+    return sums.reindex(index=keys, columns=POOL_COLUMNS).fillna(0.0).rename_axis(columns=None).reset_index()
+
+
+def seed_legacy_pool(provisions: pd.DataFrame, seeds: pd.DataFrame, scale: float = 1.0) -> pd.DataFrame:
+    """Add the starting pool of the SubgraphService provisions in seeds.
+
+    seeds holds PROVISION_KEYS and POOL_COLUMNS: the indexer's
+    delegatedTokens, delegatedThawingTokens and delegatorShares just before
+    the provision's first event, i.e. its legacy pool
+    (delegation.ExchangeRateTimeline.pool_before()) plus pool_moves_before().
+    """
+    if seeds.empty:
+        return provisions
+    keys = pd.MultiIndex.from_frame(provisions[PROVISION_KEYS])
+    totals = seeds.set_index(PROVISION_KEYS)[POOL_COLUMNS].reindex(keys).fillna(0.0) / scale
+    provisions[POOL_COLUMNS] += totals.to_numpy()
+    logger.info("Seeded %s SubgraphService provisions from the indexer delegation pool.", len(seeds))
+    return provisions
+
+
+def fold_pool_rewards(
+    provisions: pd.DataFrame,
+    rewards: pd.DataFrame,
+    subgraph_service: int,
+    after_block: int,
+    created: pd.DataFrame,
+    scale: float = 1.0,
+) -> pd.DataFrame:
+    """Add the legacy-pool reward inflows after after_block to SubgraphService provisions.
+
+    rewards are delegation.ExchangeRateTimeline.rewards rows: processRewardsAssigned
+    adds them to delegatedTokens of the provision once it exists.  created
+    holds the first_events() of this refresh's new provisions; rewards before
+    those are already in their seed.
+    """
+    rewards = rewards[rewards["block_num"] > after_block].assign(data_service=subgraph_service)
+    rewards = rewards.merge(created, on=PROVISION_KEYS, how="left", suffixes=("", "_created"))
+    # Comparisons with a missing creation (a provision from an earlier refresh) are false.
+    rewards = rewards[~_earlier(
+        rewards["block_num"], rewards["log_index"], rewards["block_num_created"], rewards["log_index_created"]
+    )]
+    sums = rewards.groupby(PROVISION_KEYS).agg(tokens=("tokens", "sum"), block_hi=("block_num", "max"))
+    keys = pd.MultiIndex.from_frame(provisions[PROVISION_KEYS])
+    paid = keys.isin(sums.index)
+    if not paid.any():
+        return provisions
+    sums = sums.reindex(keys[paid])
+    provisions.loc[paid, "delegated_tokens"] += sums["tokens"].to_numpy(dtype=np.float64) / scale
+    provisions.loc[paid, "block_hi"] = np.maximum(
+        provisions.loc[paid, "block_hi"].to_numpy(dtype=np.int64), sums["block_hi"].to_numpy(dtype=np.int64)
+    )
+    logger.info("Folded legacy reward inflows into %s SubgraphService provisions.", int(paid.sum()))
+    return provisions
@@ -0,0 +1,172 @@
+"""
+Reorg-safe incremental state: block hashes and per-block undo images for the
+unconfirmed tail.
+
+An incremental refresh that folds blocks close to the chain head can pick up
+blocks that are later replaced.  ReorgLog keeps, for the last `window`
+blocks only:
+
+- hashes: block_num -> hash of every block in the tail, as seen by the run
+  that folded it;
+- undo: per keyed table, the before-image of each row a tail block touched
+  (table columns plus undo_block and existed), captured just before that
+  block was folded in.
+
+Everything at or below head - window is confirmed and carries no history,
+so the bulk of the state stays as it is published today and only the tail
+costs extra rows.
+
+Each refresh fetches the current hashes of the logged range
+(block_hashes_query over check_range()) before reading any events.
+fork_point() finds the last block whose hash still matches; rollback()
+restores every keyed table to its state after that block (the earliest
+before-image per key above the fork wins) and append-only tables drop their
+rows above it.  The refresh then resumes after the fork, so only the
+replaced range is read and folded again.  When the oldest logged block
+changed too, the fork may be deeper than the log; fork_point() raises
+ValueError and the store has to be rebuilt (or REORG_WINDOW_BLOCKS widened).
+
+Hashes are recorded from the fetch made before the events are read, so a
+reorg that lands mid-run shows up as a mismatch on the next run instead of
+being folded in silently.
+"""
+
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+BLOCKS_TABLE = '"edgeandnode/arbitrum_one@0.0.1".blocks'
+# About ten minutes of Arbitrum One blocks.
+REORG_WINDOW = int(os.environ.get("REORG_WINDOW_BLOCKS", "2400"))
+HASH_COLUMNS = ["block_num", "hash"]
+UNDO_COLUMNS = ["undo_block", "existed"]
+
+
+def block_hashes_query(after_block: int, to_block: int) -> str:
+    """block_num, hash for every block in (after_block, to_block]."""
+    return f"""
+SELECT b.block_num, b.hash
+FROM {BLOCKS_TABLE} b
+WHERE b.block_num > {after_block}
+  AND b.block_num <= {to_block}
+"""
+
+
+def hex_hashes(frame: pd.DataFrame) -> pd.DataFrame:
+    """A block_hashes_query() result with hashes as 0x-prefixed hex strings."""
+    hashes = frame[HASH_COLUMNS].copy()
+    hashes["block_num"] = hashes["block_num"].astype(np.int64)
+    hashes["hash"] = hashes["hash"].map(
+        lambda value: value if isinstance(value, str) else "0x" + bytes(value).hex()
+    )
+    return hashes.sort_values("block_num", ignore_index=True)
+
+
+def truncate_rows(frame: Optional[pd.DataFrame], fork: int, column: str = "block_num") -> Optional[pd.DataFrame]:
+    """Rows of an append-only table at or below the fork block."""
+    if frame is None:
+        return None
+    return frame[frame[column] <= fork].reset_index(drop=True)
+
+
+class ReorgLog:
+    """Tail block hashes and per-block undo images for a set of keyed tables."""
+
+    def __init__(
+        self,
+        hashes: Optional[pd.DataFrame] = None,
+        undo: Optional[Dict[str, pd.DataFrame]] = None,
+        window: int = REORG_WINDOW,
+    ) -> None:
+        self.window = window
+        if hashes is None:
+            hashes = pd.DataFrame({"block_num": pd.Series(dtype=np.int64), "hash": pd.Series(dtype=object)})
+        self.hashes = hex_hashes(hashes)
+        self.undo: Dict[str, pd.DataFrame] = dict(undo or {})
+
+    def check_range(self, head: int) -> Tuple[int, int]:
+        """(after, to] block range whose hashes a refresh fetches: the logged tail and the new one."""
+        first = int(self.hashes["block_num"].min()) if not self.hashes.empty else head - self.window
+        return min(first, head - self.window) - 1, head
+
+    def fork_point(self, current: pd.DataFrame) -> Optional[int]:
+        """Last logged block whose hash is unchanged, or None when the whole log still matches."""
+        if self.hashes.empty:
+            return None
+        now = hex_hashes(current).set_index("block_num")["hash"]
+        seen = self.hashes.set_index("block_num")["hash"]
+        changed = seen.index[now.reindex(seen.index).to_numpy() != seen.to_numpy()]
+        if changed.empty:
+            return None
+        fork = int(changed.min()) - 1
+        if fork < int(seen.index.min()):
+            # The oldest logged block changed too, so the fork may be deeper than the log.
+            raise ValueError(
+                f"Reorg reaches the oldest logged block {fork + 1}; "
+                "rebuild from scratch or widen REORG_WINDOW_BLOCKS."
+            )
+        logger.warning("Block %s changed hash; rolling back to block %s.", fork + 1, fork)
+        return fork
+
+    def capture(self, name: str, frame: pd.DataFrame, keys: pd.Index, block: int) -> None:
+        """Record the rows at keys as they stand before block is folded into frame."""
+        if keys.empty:
+            return
+        keys = keys.unique()
+        before = frame.reindex(keys)
+        before["existed"] = keys.isin(frame.index)
+        before["undo_block"] = block
+        before = before.reset_index()
+        previous = self.undo.get(name)
+        self.undo[name] = before if previous is None or previous.empty else pd.concat([previous, before], ignore_index=True)
+
+    def rollback(self, name: str, frame: pd.DataFrame, fork: int) -> pd.DataFrame:
+        """frame as it stood after block fork, from the earliest undo image per key above it."""
+        undo = self.undo.get(name)
+        if undo is None or undo.empty:
+            return frame
+        keys = list(frame.index.names)
+        images = (
+            undo[undo["undo_block"] > fork]
+            .sort_values("undo_block", kind="stable")
+            .drop_duplicates(keys, keep="first")
+            .set_index(keys)
+        )
+        if images.empty:
+            return frame
+        restored = images[images["existed"].astype(bool)][list(frame.columns)]
+        kept = frame.drop(images.index, errors="ignore")
+        logger.info(
+            "%s: restoring %s rows and dropping %s created after block %s.",
+            name, len(restored), len(images) - len(restored), fork,
+        )
+        return pd.concat([kept, restored]).sort_index()
+
+    def truncate(self, fork: int) -> None:
+        """Forget hashes and undo images above the fork once the tables are rolled back."""
+        self.hashes = self.hashes[self.hashes["block_num"] <= fork].reset_index(drop=True)
+        self.undo = {name: undo[undo["undo_block"] <= fork] for name, undo in self.undo.items()}
+
+    def record(self, current: pd.DataFrame, head: int) -> None:
+        """Keep the hashes of the tail ending at head; drop everything that is now confirmed."""
+        confirmed = head - self.window
+        hashes = hex_hashes(current)
+        hashes = hashes[(hashes["block_num"] > confirmed) & (hashes["block_num"] <= head)]
+        self.hashes = hashes.reset_index(drop=True)
+        self.undo = {
+            name: undo[undo["undo_block"] > confirmed].reset_index(drop=True) for name, undo in self.undo.items()
+        }
+
+    def undo_tables(self, columns: Dict[str, List[str]]) -> Dict[str, pd.DataFrame]:
+        """Undo images per table with the table's columns, ready to publish."""
+        return {
+            name: (self.undo[name] if name in self.undo else pd.DataFrame(columns=table_columns + UNDO_COLUMNS))[
+                table_columns + UNDO_COLUMNS
+            ]
+            for name, table_columns in columns.items()
+        }
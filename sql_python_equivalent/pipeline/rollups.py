@@ -0,0 +1,241 @@
+"""
+Hierarchical rollups: parent entity aggregates derived from child entity tables.
+
+Several parent entities in the subgraph are pure aggregates of child entities
+that another script already builds.  Instead of rescanning raw events, the
+parent builds load the child table and roll it up in memory:
+
+- Signal      → Curator             (signalCount, activeSignalCount)
+- NameSignal  → Curator             (consistency checks only, see below)
+- Allocation  → Indexer             (allocatedTokens, allocationCount, totalAllocationCount)
+- Allocation  → SubgraphDeployment  (stakedTokens, queryFeesAmount)
+- DelegatedStake → Delegator        (totalRealizedRewards)
+- Indexer / Curator / Delegator / DelegatedStake / Allocation → GraphNetwork counters
+
+Build order implied by the rollups:
+  allocation_economics_arbitrum
+  → signal_arbitrum, name_signal_arbitrum, allocations_arbitrum, delegated_stake_arbitrum
+  → curator_arbitrum, indexer_arbitrum, subgraph_deployment_arbitrum, delegator_arbitrum
+  → graph_network_arbitrum
+
+NameSignal cannot feed activeNameSignalCount: GRTWithdrawn lowers
+NameSignal.nameSignal but never decrements Curator.activeNameSignalCount
+(gns.ts handleGRTWithdrawn), so the curator scan keeps that count and the
+NameSignal rollup is only used to cross-check token totals.
+
+Each rollup checks its own invariants, and assert_consistent() compares a
+rollup against the totals an independent scan produced.
+"""
+
+import logging
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RTOL = 1e-6
+
+
+def _check(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(f"Rollup consistency check failed: {message}")
+
+
+def assert_consistent(
+    left: pd.DataFrame,
+    right: pd.DataFrame,
+    key: str,
+    columns: Dict[str, str],
+    label: str,
+    rtol: float = DEFAULT_RTOL,
+    max_mismatch_fraction: float = 0.0,
+) -> None:
+    """Assert that left[col] matches right[columns[col]] for every shared key.
+
+    Keys present on only one side are logged, not treated as mismatches,
+    since child tables legitimately cover a subset of parents (e.g. curators
+    with GNS-only activity have no Signal rows).  max_mismatch_fraction lets
+    callers comparing against a table published earlier in the run tolerate
+    the few keys touched by blocks that arrived in between.
+    """
+    right_cols = list(columns.values())
+    merged = left[[key] + list(columns.keys())].merge(
+        right[[key] + right_cols], on=key, how="outer", suffixes=("", "_rollup"), indicator=True
+    )
+    only_left = int((merged["_merge"] == "left_only").sum())
+    only_right = int((merged["_merge"] == "right_only").sum())
+    if only_left or only_right:
+        logger.info("%s: %s keys only in scan, %s keys only in rollup.", label, only_left, only_right)
+
+    both = merged[merged["_merge"] == "both"]
+    for left_col, right_col in columns.items():
+        right_name = right_col if right_col != left_col else f"{right_col}_rollup"
+        expected = both[left_col].astype(float).fillna(0.0).to_numpy()
+        actual = both[right_name].astype(float).fillna(0.0).to_numpy()
+        bad = ~np.isclose(actual, expected, rtol=rtol, atol=rtol)
+        if bad.any() and bad.sum() <= max_mismatch_fraction * len(both):
+            logger.warning("%s: %s keys differ on %s within the allowed fraction.", label, int(bad.sum()), left_col)
+        elif bad.any():
+            sample = both.loc[bad, [key, left_col, right_name]].head(5).to_string(index=False)
+            raise AssertionError(
+                f"Rollup consistency check failed: {label} {left_col} vs {right_col} "
+                f"differs for {int(bad.sum())} keys:\n{sample}"
+            )
+    logger.info("%s: %s keys consistent on %s.", label, len(both), ", ".join(columns))
+
+
+# =====================================================================
+# Signal / NameSignal → Curator
+# =====================================================================
+def signals_to_curators(signals: pd.DataFrame) -> pd.DataFrame:
+    """Per-curator counts and curation totals from signal_arbitrum rows."""
+    frame = signals[["curator_id", "signalled_tokens", "unsignalled_tokens", "signal", "created_at"]].assign(
+        active=(signals["signal"] > 0).astype(int)
+    )
+    grouped = frame.groupby("curator_id", sort=False)
+    result = pd.DataFrame({
+        "signal_count": grouped.size(),
+        "active_signal_count": grouped["active"].sum(),
+        "signalled_tokens": grouped["signalled_tokens"].sum(),
+        "unsignalled_tokens": grouped["unsignalled_tokens"].sum(),
+        "signal": grouped["signal"].sum(),
+        "created_at": grouped["created_at"].min(),
+    }).reset_index()
+
+    _check(bool((result["active_signal_count"] <= result["signal_count"]).all()),
+           "active_signal_count exceeds signal_count")
+    _check(int(result["signal_count"].sum()) == len(signals),
+           "signal_count does not add up to the Signal row count")
+    return result
+
+
+def name_signals_to_curators(name_signals: pd.DataFrame) -> pd.DataFrame:
+    """Per-curator GNS totals from name_signal_arbitrum rows."""
+    grouped = name_signals.groupby("curator_id", sort=False)
+    result = pd.DataFrame({
+        "name_signal_rows": grouped.size(),
+        "name_signalled_tokens": grouped["signalled_tokens"].sum(),
+        "name_unsignalled_tokens": grouped["unsignalled_tokens"].sum(),
+        "withdrawn_tokens": grouped["withdrawn_tokens"].sum(),
+    }).reset_index()
+    return result
+
+
+# =====================================================================
+# DelegatedStake → Delegator
+# =====================================================================
+def delegated_stakes_to_delegators(stakes: pd.DataFrame) -> pd.DataFrame:
+    """Per-delegator realized rewards from delegated_stake_arbitrum rows.
+
+    handleStakeDelegatedLocked adds the same realizedRewards amount to the
+    DelegatedStake and to its Delegator's totalRealizedRewards.
+    """
+    result = (
+        stakes.groupby("delegator", sort=False)["realized_rewards"].sum()
+        .rename("total_realized_rewards").reset_index()
+    )
+    _check(bool(np.isfinite(result["total_realized_rewards"]).all()),
+           "non-finite total_realized_rewards for a delegator")
+    return result
+
+
+# =====================================================================
+# Allocation → Indexer / SubgraphDeployment
+# =====================================================================
+def _active_mask(allocations: pd.DataFrame) -> pd.Series:
+    return allocations["status"] == "Active"
+
+
+def allocations_to_indexers(allocations: pd.DataFrame) -> pd.DataFrame:
+    """Per-indexer allocation aggregates from allocations_arbitrum rows.
+
+    allocatedTokens and allocationCount only cover open allocations
+    (staking.ts handleAllocationCreated adds, handleAllocationClosed subtracts);
+    totalAllocationCount counts every allocation ever created.
+    """
+    active = _active_mask(allocations)
+    frame = pd.DataFrame({
+        "indexer": allocations["indexer"],
+        "active_tokens": allocations["allocated_tokens"].where(active, 0.0),
+        "active": active.astype(int),
+    })
+    grouped = frame.groupby("indexer", sort=False)
+    result = pd.DataFrame({
+        "allocated_tokens": grouped["active_tokens"].sum(),
+        "allocation_count": grouped["active"].sum(),
+        "total_allocation_count": grouped.size(),
+    }).reset_index()
+
+    _check(bool((result["allocation_count"] <= result["total_allocation_count"]).all()),
+           "allocation_count exceeds total_allocation_count")
+    _check(bool((result["allocated_tokens"] >= 0).all()),
+           "negative allocated_tokens for an indexer")
+    return result
+
+
+def allocations_to_deployments(allocations: pd.DataFrame) -> pd.DataFrame:
+    """Per-deployment aggregates from allocations_arbitrum rows.
+
+    stakedTokens follows the same open-allocation rule as Indexer.allocatedTokens;
+    queryFeesAmount is the sum of Allocation.queryFeesCollected
+    (staking.ts handleAllocationCollected / handleRebateCollected).
+    """
+    active = _active_mask(allocations)
+    frame = pd.DataFrame({
+        "subgraph_deployment": allocations["subgraph_deployment"],
+        "active_tokens": allocations["allocated_tokens"].where(active, 0.0),
+        "query_fees_collected": allocations["query_fees_collected"],
+    })
+    grouped = frame.groupby("subgraph_deployment", sort=False)
+    result = pd.DataFrame({
+        "staked_tokens": grouped["active_tokens"].sum(),
+        "query_fees_amount": grouped["query_fees_collected"].sum(),
+    }).reset_index()
+
+    _check(bool((result["staked_tokens"] >= 0).all()),
+           "negative staked_tokens for a deployment")
+    return result
+
+
+# =====================================================================
+# Indexer / Curator / Delegator / DelegatedStake / Allocation → GraphNetwork
+# =====================================================================
+def entities_to_graph_network(
+    indexers: pd.DataFrame,
+    curators: pd.DataFrame,
+    delegators: pd.DataFrame,
+    delegated_stakes: pd.DataFrame,
+    allocations: pd.DataFrame,
+) -> pd.DataFrame:
+    """Single-row GraphNetwork counters rolled up from the entity tables."""
+    active_allocations = _active_mask(allocations)
+    row = {
+        "indexer_count": len(indexers),
+        "staked_indexers_count": int((indexers["staked_tokens"] > 0).sum()),
+        "curator_count": len(curators),
+        "active_curator_count": int((curators["active_combined_signal_count"] > 0).sum()),
+        "delegator_count": len(delegators),
+        "active_delegator_count": int((delegators["active_stakes_count"] > 0).sum()),
+        "delegation_count": len(delegated_stakes),
+        "active_delegation_count": int((delegated_stakes["share_amount"] > 0).sum()),
+        "allocation_count": len(allocations),
+        "active_allocation_count": int(active_allocations.sum()),
+        "total_tokens_allocated": float(allocations["allocated_tokens"].where(active_allocations, 0.0).sum()),
+    }
+
+    # Delegator.stakesCount is itself a count of DelegatedStake rows, so both
+    # tables must agree on the network total.  The active counts come from
+    # SQL share sums vs. a float replay and may differ on dust balances.
+    _check(int(delegators["stakes_count"].sum()) == row["delegation_count"],
+           "sum(Delegator.stakesCount) != DelegatedStake rows")
+    active_from_delegators = int(delegators["active_stakes_count"].sum())
+    if active_from_delegators != row["active_delegation_count"]:
+        logger.warning(
+            "sum(Delegator.activeStakesCount)=%s but %s DelegatedStake rows have shares > 0.",
+            active_from_delegators, row["active_delegation_count"],
+        )
+    _check(row["active_curator_count"] <= row["curator_count"], "active_curator_count exceeds curator_count")
+    _check(row["staked_indexers_count"] <= row["indexer_count"], "staked_indexers_count exceeds indexer_count")
+    return pd.DataFrame([row])
@@ -0,0 +1,223 @@
+"""
+Local serving copy of the built entity tables in one SQLite file.
+
+Ad-hoc lookups ("every delegation to indexer X", "every signal of curator
+Y") otherwise go to BigQuery and pay seconds of latency plus scanned bytes
+each time.  With PIPELINE_SERVING_DB set, every build also hands its output
+to serve(), which replaces that table in the file and indexes its key
+columns (the INDEXED_COLUMNS the table has), so a lookup is a B-tree search
+on local disk:
+
+    store = ServingStore("/data/entities.sqlite")
+    store.lookup("delegated_stake_arbitrum", indexer="0xabc...")
+    store.range("allocations_arbitrum", "created_at", lo="2024-01-01", indexer="0xabc...")
+    store.table("signal_arbitrum")
+
+A table is replaced inside one transaction and the file runs in WAL mode, so
+readers keep seeing the previous copy until a build commits the new one.
+Timestamps are stored as unix seconds and booleans as 0 / 1; the columns
+that need it have their pandas dtype kept in _serving_columns and restored
+on the way out, so table() returns what the build produced.
+tests/validate.py --local reads its "BQ side" from this file.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SERVING_DB = os.environ.get("PIPELINE_SERVING_DB")
+# Foreign keys (and ids) that lookups filter on, under the names the tables use.
+INDEXED_COLUMNS: List[str] = [
+    "id",
+    "indexer",
+    "delegator",
+    "curator_id",
+    "subgraph_deployment",
+    "subgraph_deployment_id",
+]
+SCHEMA_TABLE = "_serving_columns"
+DATETIME, BOOLEAN, JSON = "datetime", "boolean", "json"
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _json(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    return json.dumps(value.tolist() if isinstance(value, np.ndarray) else value)
+
+
+def _encode(frame: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, str]]:
+    """frame with SQLite-storable columns, and the kind of every column that needs decoding."""
+    stored = {}
+    kinds: Dict[str, str] = {}
+    for column in frame.columns:
+        values = frame[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            kinds[column] = DATETIME
+            values = (pd.to_datetime(values, utc=True) - pd.Timestamp(0, tz="UTC")).dt.total_seconds()
+        elif pd.api.types.is_bool_dtype(values):
+            kinds[column] = BOOLEAN
+            values = values.astype("Int64")
+        elif pd.api.types.is_extension_array_dtype(values) and pd.api.types.is_integer_dtype(values):
+            kinds[column] = str(values.dtype)
+        elif values.dtype == object:
+            present = values.dropna()
+            sample = present.iloc[0] if not present.empty else None
+            if isinstance(sample, (bytes, bytearray, memoryview)):
+                values = values.map(lambda value: value if value is None else "0x" + bytes(value).hex())
+            elif isinstance(sample, (list, tuple, dict, np.ndarray)):
+                kinds[column] = JSON
+                values = values.map(_json)
+        stored[column] = values
+    return pd.DataFrame(stored, index=frame.index), kinds
+
+
+def _decode(frame: pd.DataFrame, kinds: Dict[str, str]) -> pd.DataFrame:
+    """Undo _encode() on the columns of frame, in place."""
+    for column in frame.columns:
+        kind = kinds.get(column)
+        if kind == DATETIME:
+            frame[column] = pd.to_datetime(frame[column], unit="s", utc=True)
+        elif kind == BOOLEAN:
+            frame[column] = frame[column].astype("boolean")
+        elif kind == JSON:
+            frame[column] = frame[column].map(lambda value: value if value is None else json.loads(value))
+        elif kind is not None:
+            frame[column] = frame[column].astype(kind)
+    return frame
+
+
+def _bound(value: Any, kind: Optional[str]) -> Any:
+    """A lookup value in the column's stored form (timestamps to unix seconds)."""
+    if kind == DATETIME:
+        stamp = pd.Timestamp(value)
+        return (stamp.tz_localize("UTC") if stamp.tzinfo is None else stamp).timestamp()
+    if kind == BOOLEAN:
+        return int(bool(value))
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class ServingStore:
+    """Built entity tables in one local SQLite file, indexed on their key columns."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {SCHEMA_TABLE} (table_id TEXT, column_name TEXT, kind TEXT)"
+        )
+        self._kinds: Dict[str, Dict[str, str]] = {}
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def write(self, table_id: str, frame: pd.DataFrame) -> None:
+        """Replace table_id with frame and index its key columns."""
+        stored, kinds = _encode(frame)
+        indexed = [column for column in INDEXED_COLUMNS if column in frame.columns]
+        with self.connection:
+            self.connection.execute(f"DROP TABLE IF EXISTS {_quote(table_id)}")
+            stored.to_sql(table_id, self.connection, index=False)
+            for column in indexed:
+                self.connection.execute(
+                    f"CREATE INDEX {_quote(f'{table_id}__{column}')} ON {_quote(table_id)} ({_quote(column)})"
+                )
+            self.connection.execute(f"DELETE FROM {SCHEMA_TABLE} WHERE table_id = ?", (table_id,))
+            self.connection.executemany(
+                f"INSERT INTO {SCHEMA_TABLE} VALUES (?, ?, ?)",
+                [(table_id, column, kind) for column, kind in kinds.items()],
+            )
+        self._kinds.pop(table_id, None)
+        logger.info("Served %s rows of %s at %s (indexed on %s).", len(frame), table_id, self.path, indexed or "nothing")
+
+    def tables(self) -> List[str]:
+        rows = self.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name != ? ORDER BY name", (SCHEMA_TABLE,)
+        )
+        return [name for (name,) in rows]
+
+    def kinds(self, table_id: str) -> Dict[str, str]:
+        if table_id not in self._kinds:
+            rows = self.connection.execute(
+                f"SELECT column_name, kind FROM {SCHEMA_TABLE} WHERE table_id = ?", (table_id,)
+            )
+            self._kinds[table_id] = dict(rows.fetchall())
+        return self._kinds[table_id]
+
+    def _select(
+        self,
+        table_id: str,
+        where: Sequence[str],
+        params: Sequence[Any],
+        columns: Optional[Sequence[str]] = None,
+        order: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> pd.DataFrame:
+        if table_id not in self.tables():
+            raise KeyError(f"{table_id} is not in the serving store {self.path}.")
+        select = ", ".join(_quote(column) for column in columns) if columns else "*"
+        sql = f"SELECT {select} FROM {_quote(table_id)}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if order:
+            sql += f" ORDER BY {_quote(order)}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return _decode(pd.read_sql_query(sql, self.connection, params=list(params)), self.kinds(table_id))
+
+    def _equals(self, table_id: str, equals: Dict[str, Any]) -> Tuple[List[str], List[Any]]:
+        kinds = self.kinds(table_id)
+        where = [f"{_quote(column)} = ?" for column in equals]
+        return where, [_bound(value, kinds.get(column)) for column, value in equals.items()]
+
+    def table(self, table_id: str, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """Every row of a served table."""
+        return self._select(table_id, [], [], columns)
+
+    def lookup(self, table_id: str, columns: Optional[Sequence[str]] = None, **equals: Any) -> pd.DataFrame:
+        """Rows whose columns equal the given values, e.g. lookup("signal_arbitrum", curator_id="0x...")."""
+        where, params = self._equals(table_id, equals)
+        return self._select(table_id, where, params, columns)
+
+    def range(
+        self,
+        table_id: str,
+        column: str,
+        lo: Any = None,
+        hi: Any = None,
+        columns: Optional[Sequence[str]] = None,
+        limit: Optional[int] = None,
+        **equals: Any,
+    ) -> pd.DataFrame:
+        """Rows with lo <= column <= hi (either bound optional) and the given equalities, ordered by column."""
+        where, params = self._equals(table_id, equals)
+        kind = self.kinds(table_id).get(column)
+        for op, bound in ((">=", lo), ("<=", hi)):
+            if bound is not None:
+                where.append(f"{_quote(column)} {op} ?")
+                params.append(_bound(bound, kind))
+        return self._select(table_id, where, params, columns, order=column, limit=limit)
+
+
+def serve(frame: pd.DataFrame, table_id: str, path: Optional[str] = SERVING_DB) -> None:
+    """Write a build's output to the serving store when PIPELINE_SERVING_DB is set."""
+    if not path:
+        return
+    store = ServingStore(path)
+    try:
+        store.write(table_id, frame)
+    finally:
+        store.close()
@@ -0,0 +1,136 @@
+"""
+Process-pool sharding of per-key Python work.
+
+Per-key replays such as delegated_stake's compute_stake_metrics or the
+per-user cumulative sums in billing_user_daily run group by group on one
+core.  shard_by_key() hash-partitions a frame by its key columns into shards,
+runs fn(shard) on a ProcessPoolExecutor and concatenates the results in
+shard order:
+
+- each shard is written once as an Arrow IPC stream into a
+  multiprocessing.shared_memory block; workers attach to the block by name,
+  so only (name, size) goes through the pool's pipe instead of a pickled
+  DataFrame.  Results come back the same way;
+- every key lands in exactly one shard, so fn must only need its own keys'
+  rows (a groupby / per-key replay), exactly as with pipeline/spill.py;
+- fn must be importable by the workers: a module-level function of a
+  pipeline module, not of a build script, since a worker that re-imported
+  the script would re-run its queries and uploads;
+- workers are forked, so they never re-import __main__.  Where fork is not
+  available, fn runs in-process as with one worker;
+- PIPELINE_WORKERS sets the pool size (default: all cores).  With one
+  worker, or a frame below MIN_ROWS, fn runs in-process on the whole frame;
+  its input and output still go through the same Arrow conversion, so the
+  result's dtypes do not depend on the row count or the worker count.
+"""
+
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.environ.get("PIPELINE_WORKERS", os.cpu_count() or 1))
+# More shards than workers so one heavy shard does not leave the pool idle.
+SHARDS_PER_WORKER = 4
+MIN_ROWS = 50_000
+
+Block = Tuple[str, int]
+
+
+def _to_shared(frame: pd.DataFrame) -> Block:
+    """Write frame as an Arrow IPC stream into a new shared-memory block."""
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    data = sink.getvalue()
+    block = shared_memory.SharedMemory(create=True, size=max(data.size, 1))
+    block.buf[: data.size] = memoryview(data).cast("B")
+    block.close()
+    return block.name, data.size
+
+
+def _to_pandas(table: pa.Table) -> pd.DataFrame:
+    # Integer columns with nulls stay object ints, as the replays build them.
+    return table.to_pandas(integer_object_nulls=True)
+
+
+def _via_arrow(frame: pd.DataFrame) -> pd.DataFrame:
+    """frame as it would come back out of a shared-memory block."""
+    return _to_pandas(pa.Table.from_pandas(frame, preserve_index=False))
+
+
+def _from_shared(block: Block, unlink: bool) -> pd.DataFrame:
+    """Read a frame back from a shared-memory block."""
+    name, size = block
+    shm = shared_memory.SharedMemory(name=name)
+    if not unlink:
+        # Attached, not owned: the creating process unlinks it.
+        resource_tracker.unregister(shm._name, "shared_memory")
+    try:
+        # Copy the bytes out so no Arrow buffer pins the mapping past close().
+        data = bytes(shm.buf[:size])
+    finally:
+        shm.close()
+        if unlink:
+            shm.unlink()
+    return _to_pandas(ipc.open_stream(pa.py_buffer(data)).read_all())
+
+
+def _run_shard(fn: Callable[[pd.DataFrame], pd.DataFrame], block: Block) -> Block:
+    return _to_shared(fn(_from_shared(block, unlink=False)))
+
+
+def shard_by_key(
+    frame: pd.DataFrame,
+    keys: Sequence[str],
+    fn: Callable[[pd.DataFrame], pd.DataFrame],
+    workers: int = WORKERS,
+    shards: Optional[int] = None,
+) -> pd.DataFrame:
+    """fn over key-hash shards of frame on a process pool, results in shard order."""
+    forkable = "fork" in multiprocessing.get_all_start_methods()
+    if workers <= 1 or len(frame) < MIN_ROWS or not forkable:
+        if workers > 1 and not forkable:
+            logger.info("No fork start method on this platform; running %s rows in-process.", len(frame))
+        return _via_arrow(fn(_via_arrow(frame)))
+
+    shards = shards or workers * SHARDS_PER_WORKER
+    shard_of = pd.util.hash_pandas_object(frame[list(keys)], index=False).to_numpy() % np.uint64(shards)
+    inputs: List[Block] = [
+        _to_shared(part) for _, part in frame.groupby(shard_of.astype(np.int64), sort=True)
+    ]
+    logger.info("Sharded %s rows into %s shards over %s workers.", len(frame), len(inputs), workers)
+
+    futures: List[Future] = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as pool:
+            futures = [pool.submit(_run_shard, fn, block) for block in inputs]
+            outputs = [future.result() for future in futures]
+        return pd.concat([_from_shared(block, unlink=True) for block in outputs], ignore_index=True)
+    finally:
+        # The pool has shut down here, so every shard that succeeded has its
+        # output block; those not read back (a sibling raised) are unlinked too.
+        for name, _ in inputs:
+            _unlink(name)
+        for future in futures:
+            if not future.cancelled() and future.exception() is None:
+                _unlink(future.result()[0])
+
+
+def _unlink(name: str) -> None:
+    try:
+        block = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
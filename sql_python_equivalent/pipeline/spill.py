@@ -0,0 +1,191 @@
+"""
+Out-of-core, per-key execution under a memory budget.
+
+The largest entity builds hold every event in one DataFrame and then copy it
+several times through merge / rename / groupby.  When PIPELINE_MEMORY_BUDGET
+is set (bytes, or with a K / M / G suffix), run_by_key() instead:
+
+1. hash-partitions each input by the entity key columns into BUCKETS Arrow
+   IPC stream files under PIPELINE_SPILL_DIR.  Inputs may be DataFrames or
+   iterables of DataFrame chunks (e.g. ranged_chunks() over block ranges), so
+   the full event history never has to be in memory at once;
+2. packs buckets into batches whose on-disk size times EXPANSION fits in the
+   budget left above the current RSS, and loads one batch at a time;
+3. runs the same build(frames) function the in-memory path runs on each
+   batch and concatenates the outputs.
+
+Every key lands in exactly one bucket, and inputs are bucketed with the same
+hash, so per-key work (groupby, per-group replays, merges on the key) gives
+the same rows as one in-memory pass.  build() must not depend on row order
+across keys; callers sort the concatenated output as before.  Without a
+budget run_by_key() simply calls build() on the whole inputs.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from pipeline.executor import QueryExecutor
+from pipeline.partitioned import block_partitions, render_partition
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = 256
+# Peak working set of a merge / groupby pass relative to the Arrow size of its
+# inputs (decoded object columns plus a couple of intermediate copies).
+EXPANSION = 4.0
+_UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+Frames = Dict[str, pd.DataFrame]
+Source = Union[pd.DataFrame, Iterable[pd.DataFrame]]
+
+
+def parse_bytes(text: Optional[str]) -> Optional[int]:
+    """'8G' / '512M' / '1048576' -> bytes; empty or None -> None."""
+    if not text:
+        return None
+    text = text.strip().upper().rstrip("B")
+    if text and text[-1] in _UNITS:
+        return int(float(text[:-1]) * _UNITS[text[-1]])
+    return int(text)
+
+
+MEMORY_BUDGET = parse_bytes(os.environ.get("PIPELINE_MEMORY_BUDGET"))
+SPILL_DIR = os.environ.get("PIPELINE_SPILL_DIR") or None
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes (0 where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def ranged_chunks(
+    executor: QueryExecutor,
+    sql: str,
+    bounds: Tuple[int, int],
+    chunks: int,
+) -> Iterator[pd.DataFrame]:
+    """Run sql once per block range (its {block_range} placeholders) and yield each result."""
+    for lo, hi in block_partitions(bounds[0], bounds[1], chunks):
+        chunk = executor.run(render_partition(sql, lo, hi))
+        logger.debug("Blocks %s-%s: %s rows.", lo, hi, len(chunk))
+        yield chunk
+
+
+class SpillPartitioner:
+    """Hash-partitions named inputs by key into per-bucket Arrow IPC files."""
+
+    def __init__(self, keys: Sequence[str], buckets: int = BUCKETS, spill_dir: Optional[str] = SPILL_DIR) -> None:
+        self.keys = list(keys)
+        self.buckets = buckets
+        self.path = tempfile.mkdtemp(prefix="pipeline-spill-", dir=spill_dir)
+        self._schemas: Dict[str, pa.Schema] = {}
+        self._writers: Dict[Tuple[str, int], ipc.RecordBatchStreamWriter] = {}
+        self.rows = 0
+
+    def __enter__(self) -> "SpillPartitioner":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.cleanup()
+
+    def _file(self, name: str, bucket: int) -> str:
+        return os.path.join(self.path, f"{name}-{bucket:04d}.arrow")
+
+    def add(self, name: str, frame: pd.DataFrame) -> None:
+        """Append one chunk of input name to its bucket files."""
+        if frame.empty:
+            if name not in self._schemas:
+                self._schemas[name] = pa.Schema.from_pandas(frame, preserve_index=False)
+            return
+        bucket_of = pd.util.hash_pandas_object(frame[self.keys], index=False).to_numpy() % np.uint64(self.buckets)
+        for bucket, part in frame.groupby(bucket_of.astype(np.int64), sort=False):
+            schema = self._schemas.get(name)
+            table = pa.Table.from_pandas(part, schema=schema, preserve_index=False)
+            self._schemas.setdefault(name, table.schema)
+            key = (name, int(bucket))
+            if key not in self._writers:
+                self._writers[key] = ipc.new_stream(self._file(name, int(bucket)), table.schema)
+            self._writers[key].write_table(table)
+        self.rows += len(frame)
+
+    def close(self) -> None:
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+    def _bucket_bytes(self, bucket: int) -> int:
+        return sum(
+            os.path.getsize(self._file(name, bucket))
+            for name in self._schemas
+            if os.path.exists(self._file(name, bucket))
+        )
+
+    def _load(self, name: str, buckets: List[int]) -> pd.DataFrame:
+        tables = [
+            ipc.open_stream(self._file(name, bucket)).read_all()
+            for bucket in buckets
+            if os.path.exists(self._file(name, bucket))
+        ]
+        if not tables:
+            return self._schemas[name].empty_table().to_pandas()
+        return pa.concat_tables(tables).to_pandas()
+
+    def batches(self, budget: int) -> Iterator[Frames]:
+        """Load buckets a batch at a time, each batch sized to fit the budget."""
+        self.close()
+        batch: List[int] = []
+        batch_bytes = 0
+        for bucket in range(self.buckets):
+            size = self._bucket_bytes(bucket)
+            room = budget - current_rss()
+            if batch and (batch_bytes + size) * EXPANSION > room:
+                yield {name: self._load(name, batch) for name in self._schemas}
+                batch, batch_bytes = [], 0
+            if size * EXPANSION > budget:
+                logger.warning("Spill bucket %s (%s bytes) alone exceeds the memory budget.", bucket, size)
+            batch.append(bucket)
+            batch_bytes += size
+        if batch:
+            yield {name: self._load(name, batch) for name in self._schemas}
+
+    def cleanup(self) -> None:
+        self.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def run_by_key(
+    sources: Dict[str, Source],
+    keys: Sequence[str],
+    build: Callable[[Frames], pd.DataFrame],
+    budget: Optional[int] = MEMORY_BUDGET,
+) -> pd.DataFrame:
+    """build(frames) over whole inputs, or per key-partitioned batch under a budget."""
+    if budget is None:
+        frames = {
+            name: source if isinstance(source, pd.DataFrame) else pd.concat(list(source), ignore_index=True)
+            for name, source in sources.items()
+        }
+        return build(frames)
+
+    outputs = []
+    with SpillPartitioner(keys) as spill:
+        for name, source in sources.items():
+            for chunk in [source] if isinstance(source, pd.DataFrame) else source:
+                spill.add(name, chunk)
+        logger.info("Spilled %s rows into %s buckets under %s.", spill.rows, spill.buckets, spill.path)
+        for number, frames in enumerate(spill.batches(budget), start=1):
+            outputs.append(build(frames))
+            logger.info("Processed spill batch %s (RSS %.0f MB).", number, current_rss() / (1 << 20))
+    return pd.concat(outputs, ignore_index=True)
@@ -0,0 +1,480 @@
+"""
+Streaming mode: tail new blocks and keep signal_arbitrum,
+delegated_stake_arbitrum and allocations_arbitrum current in micro-batches.
+
+The builds re-read every event on each run, so their tables are as fresh as
+the last run.  EntityStream instead holds each table's replay state in
+memory, one row per key (KeyedState), and on every poll:
+
+- reads the chain head and targets head - STREAM_CONFIRMATIONS, leaving the
+  blocks most likely to be replaced for a later poll;
+- checks the hashes of the tail it already folded (ReorgLog,
+  pipeline/reorgs.py).  A changed hash means a reorg deeper than the
+  confirmations; the feeds are rebuilt from scratch, since the in-memory
+  state keeps no undo images;
+- has each feed fetch its events in (feed.block, target] and fold them with
+  the builds' own replay steps, every touched key resuming from its current
+  row (replay(initial=...)), and marks those keys dirty.
+
+A feed's first window is its whole history, so a stream starts from the same
+fold the build does.  Feeds:
+
+- SignalFeed:         signal_events_query() -> curation.signal_step;
+- DelegatedStakeFeed: DELEGATED_STAKE_EVENTS_QUERY -> delegated_stake_step,
+  with pool rates from an ExchangeRateTimeline of the window's delegations
+  and economics_query() pool inflows, seeded with the previous window's
+  closing pools, and lockedTokens from locks minus withdrawals;
+- AllocationFeed:     economics_query() -> economics.allocation_step, seeded
+  with the published allocation_economics_arbitrum stream.
+
+Every STREAM_FLUSH_SECONDS flush() hands each feed with dirty keys and those
+keys' rows, in the published layout, to a sink.  Each poll logs the
+freshness of the state: seconds from the folded block's timestamp, and from
+the last flushed one, to now.
+"""
+
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from pipeline.addresses import decode_columns, encode_columns
+from pipeline.curation import SIGNAL_EVENT_COLUMNS, SIGNAL_STATE, signal_events_query, signal_step
+from pipeline.delegation import (
+    DELEGATED_STAKE_EVENT_COLUMNS, DELEGATED_STAKE_EVENTS_QUERY, DELEGATED_STAKE_STATE, LOCKED,
+    OPENING_COLUMNS, ExchangeRateTimeline, delegated_stake_step, delegation_deltas_query, pool_deltas, position,
+)
+from pipeline.economics import (
+    ALLOCATION_EVENT_COLUMNS, ALLOCATION_STATE, LEGACY, allocation_events, allocation_step, economics_query,
+    high_water, legacy_allocations, legacy_pool_inflow_events, rewards_handled,
+)
+from pipeline.epochs import EpochTable
+from pipeline.executor import QueryExecutor
+from pipeline.fees import FEE_FIELDS
+from pipeline.partitioned import render_partition
+from pipeline.reorgs import BLOCKS_TABLE, REORG_WINDOW, ReorgLog, block_hashes_query
+from pipeline.replay import Step, replay
+
+logger = logging.getLogger(__name__)
+
+POLL_SECONDS = float(os.environ.get("STREAM_POLL_SECONDS", "5"))
+FLUSH_SECONDS = float(os.environ.get("STREAM_FLUSH_SECONDS", "60"))
+# About five seconds of Arbitrum One blocks.
+CONFIRMATIONS = int(os.environ.get("STREAM_CONFIRMATIONS", "20"))
+ORDER = ["block_num", "log_index"]
+
+DELEGATED_STAKE_WITHDRAWN_QUERY = '''
+SELECT event['delegator'] AS delegator_id, event['indexer'] AS indexer_id,
+    -arrow_cast(event['tokens'], 'Float64') AS tokens, block_num, log_index
+FROM arbitrum_staking.stake_delegated_withdrawn w
+WHERE {block_range:w}
+'''
+LOCKED_STATE: Dict[str, float] = {"locked_tokens": 0.0}
+
+SIGNAL_COLUMNS = [
+    "curator_id", "subgraph_deployment_id",
+    "signalled_tokens", "unsignalled_tokens", "signal",
+    "average_cost_basis", "average_cost_basis_per_signal",
+    "last_signal_change", "realized_rewards",
+    "created_at", "last_updated_at", "id",
+]
+DELEGATED_STAKE_COLUMNS = [
+    "indexer", "delegator",
+    "personal_exchange_rate", "share_amount", "current_delegation",
+    "realized_rewards", "created_at", "last_delegated_at",
+    "locked_tokens", "staked_tokens",
+    "total_staked_tokens", "total_unstaked_tokens",
+    "last_undelegated_at",
+]
+ALLOCATION_COLUMNS = [
+    "id", "indexer", "subgraph_deployment", "allocated_tokens", "created_at", "closed_at",
+    "created_at_epoch", "closed_at_epoch", "is_legacy", "status", "active_for_indexer",
+] + FEE_FIELDS
+
+
+def head_query(confirmations: int) -> str:
+    """block_num, timestamp of the last confirmations + 1 blocks, oldest first."""
+    return f"""
+SELECT b.block_num, b.timestamp
+FROM {BLOCKS_TABLE} b
+WHERE b.block_num >= (SELECT MAX(block_num) FROM {BLOCKS_TABLE}) - {confirmations}
+ORDER BY b.block_num
+"""
+
+
+def _seconds(value) -> float:
+    """A block timestamp as unix seconds, whether it arrives as a number or a timestamp."""
+    if isinstance(value, (int, float, np.number)):
+        return float(value)
+    return pd.Timestamp(value).timestamp()
+
+
+def locked_step(state, event) -> None:
+    """lockedTokens: StakeDelegatedLocked adds, StakeDelegatedWithdrawn (negative tokens) drains."""
+    state["locked_tokens"] = state["locked_tokens"] + event["tokens"]
+
+
+def _window(sql: str, after_block: int, to_block: int) -> str:
+    """A {block_range} query rendered for blocks (after_block, to_block]."""
+    return render_partition(sql, after_block + 1, to_block + 1)
+
+
+class KeyedState:
+    """One table's replay state, one row per key, and the keys touched since the last flush."""
+
+    def __init__(self, keys: Sequence[str], step: Step, state: Dict[str, float], columns: Sequence[str]) -> None:
+        self.keys = list(keys)
+        self.step = step
+        self.state = state
+        self.columns = list(columns)
+        self.frame = pd.DataFrame(columns=[*self.keys, *state])
+        self.dirty = pd.DataFrame(columns=self.keys)
+
+    def select(self, keys: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        """Rows for the given key frame, or every row when keys is None."""
+        if keys is None or self.frame.empty:
+            return self.frame
+        return self.frame.merge(keys[self.keys].drop_duplicates(), on=self.keys)
+
+    def apply(self, events: pd.DataFrame) -> None:
+        """Fold a window of events, each touched key resuming from its current row."""
+        if events.empty:
+            return
+        touched = events[self.keys].drop_duplicates()
+        updated = replay(events, self.keys, ORDER, self.step, self.state, self.columns, initial=self.select(touched))
+        if self.frame.empty:
+            self.frame = updated
+        else:
+            marked = self.frame.merge(touched, on=self.keys, how="left", indicator=True)
+            kept = self.frame[(marked["_merge"] == "left_only").to_numpy()]
+            self.frame = pd.concat([kept, updated], ignore_index=True)
+        self.dirty = touched if self.dirty.empty else pd.concat([self.dirty, touched]).drop_duplicates()
+
+    def take_dirty(self) -> pd.DataFrame:
+        """Keys touched since the last call."""
+        dirty, self.dirty = self.dirty, pd.DataFrame(columns=self.keys)
+        return dirty
+
+
+class Feed(ABC):
+    """One published table kept current from a block window at a time."""
+
+    table_id = ""
+    keys: List[str] = []
+
+    def __init__(self) -> None:
+        self.block = -1
+
+    @abstractmethod
+    def states(self) -> List[KeyedState]:
+        """The keyed states whose touched keys changes() reports."""
+
+    @abstractmethod
+    def fold(self, executor: QueryExecutor, after_block: int, to_block: int) -> int:
+        """Fetch and fold the events in (after_block, to_block]; returns the event count."""
+
+    @abstractmethod
+    def rows(self, keys: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        """Published rows for the given keys (every key when None)."""
+
+    def changes(self) -> Optional[pd.DataFrame]:
+        """Published rows of the keys touched since the last call, or None."""
+        dirty = [keys for keys in (state.take_dirty() for state in self.states()) if not keys.empty]
+        if not dirty:
+            return None
+        return self.rows(pd.concat(dirty).drop_duplicates())
+
+
+class SignalFeed(Feed):
+    """signal_arbitrum: Signal per (curator, deployment)."""
+
+    table_id = "signal_arbitrum"
+    keys = ["curator_id", "subgraph_deployment_id"]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.signals = KeyedState(self.keys, signal_step, SIGNAL_STATE, SIGNAL_EVENT_COLUMNS)
+
+    def states(self) -> List[KeyedState]:
+        return [self.signals]
+
+    def fold(self, executor: QueryExecutor, after_block: int, to_block: int) -> int:
+        events = executor.run(signal_events_query(after_block, to_block))
+        encode_columns(events, self.keys)
+        events["timestamp"] = events["timestamp"].astype("float64")
+        self.signals.apply(events)
+        return len(events)
+
+    def rows(self, keys: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        result = self.signals.select(keys).copy()
+        if result.empty:
+            return pd.DataFrame(columns=SIGNAL_COLUMNS)
+        decode_columns(result, self.keys)
+        token_cols = ["signalled_tokens", "unsignalled_tokens", "signal", "average_cost_basis"]
+        result[token_cols] = result[token_cols] / 10**18
+        result["last_signal_change"] = 0
+        result["realized_rewards"] = 0.0
+        result["id"] = result["curator_id"] + "-" + result["subgraph_deployment_id"]
+        result["created_at"] = pd.to_datetime(result["created_at"], unit="s", utc=True)
+        result["last_updated_at"] = pd.to_datetime(result["last_updated_at"], unit="s", utc=True)
+        return result[SIGNAL_COLUMNS]
+
+
+class DelegatedStakeFeed(Feed):
+    """delegated_stake_arbitrum: DelegatedStake per (delegator, indexer)."""
+
+    table_id = "delegated_stake_arbitrum"
+    keys = ["delegator_id", "indexer_id"]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.stakes = KeyedState(self.keys, delegated_stake_step, DELEGATED_STAKE_STATE, DELEGATED_STAKE_EVENT_COLUMNS)
+        self.locked = KeyedState(self.keys, locked_step, LOCKED_STATE, ["tokens"])
+        self.pools = pd.DataFrame(columns=OPENING_COLUMNS)
+        # Legacy allocations seen so far, for HorizonRewardsAssigned.
+        self.legacy = pd.Series(dtype=object)
+
+    def states(self) -> List[KeyedState]:
+        return [self.stakes, self.locked]
+
+    def fold(self, executor: QueryExecutor, after_block: int, to_block: int) -> int:
+        delegations = executor.run(delegation_deltas_query(after_block, to_block))
+        economics = executor.run(economics_query(after_block, to_block)).drop_duplicates(["tx_hash", "log_index"])
+        events = executor.run(_window(DELEGATED_STAKE_EVENTS_QUERY, after_block, to_block))
+        withdrawn = executor.run(_window(DELEGATED_STAKE_WITHDRAWN_QUERY, after_block, to_block))
+
+        self.legacy = pd.concat([self.legacy, legacy_allocations(economics)], ignore_index=True)
+        inflows = legacy_pool_inflow_events(economics[rewards_handled(economics, self.legacy)])
+        timeline = ExchangeRateTimeline.from_deltas(pool_deltas(delegations, inflows), opening=self.pools)
+        self.pools = timeline.closing
+        if not events.empty:
+            events["exchange_rate"] = timeline.rate_before(
+                events["indexer_id"].to_numpy(), position(events["block_num"], events["log_index"])
+            )
+        events["timestamp"] = events["timestamp"].astype("float64")
+        encode_columns(events, self.keys)
+        encode_columns(withdrawn, self.keys)
+        self.stakes.apply(events)
+
+        columns = [*self.keys, "tokens", *ORDER]
+        locks = events.loc[events["kind"] == LOCKED, columns]
+        self.locked.apply(pd.concat([locks, withdrawn[columns]], ignore_index=True))
+        return len(events) + len(withdrawn)
+
+    def rows(self, keys: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        state = self.stakes.select(keys)
+        if state.empty:
+            return pd.DataFrame(columns=DELEGATED_STAKE_COLUMNS)
+        state = state.merge(self.locked.select(keys), on=self.keys, how="left")
+        result = pd.DataFrame({
+            "indexer": state["indexer_id"],
+            "delegator": state["delegator_id"],
+            "personal_exchange_rate": state["personal_exchange_rate"],
+            "share_amount": state["shares"] / 1e18,
+            "realized_rewards": state["realized_rewards"] / 1e18,
+            "created_at": pd.to_datetime(state["created_at"], unit="s", utc=True),
+            "last_delegated_at": state["last_delegated_at"].astype("Int64"),
+            "locked_tokens": state["locked_tokens"].astype(float).fillna(0.0) / 1e18,
+            "staked_tokens": (state["total_staked"] - state["total_unstaked"]) / 1e18,
+            "total_staked_tokens": state["total_staked"] / 1e18,
+            "total_unstaked_tokens": state["total_unstaked"] / 1e18,
+            "last_undelegated_at": state["last_undelegated_at"].astype("Int64"),
+        })
+        result["current_delegation"] = result["personal_exchange_rate"] * result["share_amount"]
+        decode_columns(result, ["delegator", "indexer"])
+        return result[DELEGATED_STAKE_COLUMNS].sort_values(["indexer", "delegator"], ignore_index=True)
+
+
+class AllocationFeed(Feed):
+    """allocations_arbitrum: Allocation per allocation id, both protocol generations."""
+
+    table_id = "allocations_arbitrum"
+    keys = ["allocation"]
+    _ADDRESS_COLUMNS = ["allocation", "indexer", "subgraph_deployment"]
+
+    def __init__(self, epochs: EpochTable, stream: Optional[pd.DataFrame] = None) -> None:
+        super().__init__()
+        self.epochs = epochs
+        self.allocations = KeyedState(self.keys, allocation_step, ALLOCATION_STATE, ALLOCATION_EVENT_COLUMNS)
+        self.attributes = pd.DataFrame(columns=["indexer", "subgraph_deployment", "is_legacy"])
+        if stream is not None and not stream.empty:
+            self._apply(stream)
+            self.block = high_water(stream)
+
+    def states(self) -> List[KeyedState]:
+        return [self.allocations]
+
+    def fold(self, executor: QueryExecutor, after_block: int, to_block: int) -> int:
+        rows = executor.run(economics_query(after_block, to_block))
+        self._apply(rows)
+        return len(rows)
+
+    def _apply(self, rows: pd.DataFrame) -> None:
+        """Fold stream rows, filtered as economics.build_stream does."""
+        if rows.empty:
+            return
+        rows = rows.drop_duplicates(["tx_hash", "log_index"]).copy()
+        encode_columns(rows, self._ADDRESS_COLUMNS)
+        created = rows[rows["event_type"] == "AllocationCreated"].drop_duplicates("allocation")
+        created = created[~created["allocation"].isin(self.attributes.index)]
+        self.attributes = pd.concat([
+            self.attributes,
+            pd.DataFrame(
+                {
+                    "indexer": created["indexer"].to_numpy(),
+                    "subgraph_deployment": created["subgraph_deployment"].to_numpy(),
+                    "is_legacy": (created["source"] == LEGACY).to_numpy(),
+                },
+                index=pd.Index(created["allocation"].to_numpy(), name="allocation"),
+            ),
+        ])
+        legacy = self.attributes.index[self.attributes["is_legacy"].astype(bool)]
+        self.allocations.apply(allocation_events(rows[rewards_handled(rows, legacy)]))
+
+    def rows(self, keys: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        # Only allocations with a creation are published, as in the build.
+        state = self.allocations.select(keys).join(self.attributes, on="allocation", how="inner")
+        if state.empty:
+            return pd.DataFrame(columns=ALLOCATION_COLUMNS)
+        result = pd.DataFrame({
+            "id": state["allocation"].to_numpy(),
+            "indexer": state["indexer"].to_numpy(),
+            "subgraph_deployment": state["subgraph_deployment"].to_numpy(),
+            "allocated_tokens": state["allocated_tokens"].to_numpy() / 1e18,
+            "created_at": pd.to_datetime(state["created_at"], unit="s", utc=True).to_numpy(),
+            "closed_at": pd.to_datetime(state["closed_at"], unit="s", utc=True).to_numpy(),
+            "created_block": state["created_block"].to_numpy(),
+            "closed_block": state["closed_block"].to_numpy(),
+            "is_legacy": state["is_legacy"].astype(bool).to_numpy(),
+        })
+        self.epochs.add_epoch_column(result, "created_block", "created_at_epoch")
+        self.epochs.add_epoch_column(result, "closed_block", "closed_at_epoch")
+        closed = state["closed_block"].notna().to_numpy()
+        result["status"] = np.where(closed, "Closed", "Active")
+        for field in FEE_FIELDS:
+            result[field] = state[field].to_numpy() / 1e18
+        decode_columns(result, ["id", "indexer", "subgraph_deployment"])
+        result["active_for_indexer"] = result["indexer"].where(~closed, None)
+        return result[ALLOCATION_COLUMNS].sort_values(["created_at", "id"], ignore_index=True)
+
+
+Sink = Callable[[Feed, pd.DataFrame], None]
+
+
+class EntityStream:
+    """Polls the chain head and keeps every feed's table current in micro-batches."""
+
+    def __init__(
+        self,
+        executor: QueryExecutor,
+        build_feeds: Callable[[], List[Feed]],
+        confirmations: int = CONFIRMATIONS,
+        flush_seconds: float = FLUSH_SECONDS,
+        reorg_window: int = REORG_WINDOW,
+    ) -> None:
+        self.executor = executor
+        self.build_feeds = build_feeds
+        self.confirmations = confirmations
+        self.flush_seconds = flush_seconds
+        self.reorg_window = reorg_window
+        self.feeds = build_feeds()
+        self.reorg_log = ReorgLog(window=reorg_window)
+        self.folded: Optional[Dict[str, float]] = None
+        self.flushed: Optional[Dict[str, float]] = None
+        self.last_flush = time.monotonic()
+
+    def _rebuild(self, reason: str) -> None:
+        logger.warning("%s; rebuilding every feed from scratch.", reason)
+        self.feeds = self.build_feeds()
+        self.reorg_log = ReorgLog(window=self.reorg_window)
+
+    def poll(self) -> Optional[int]:
+        """Fold every feed up to the confirmed head; returns the folded block."""
+        blocks = self.executor.run(head_query(self.confirmations))
+        if blocks.empty:
+            return None
+        target = blocks.iloc[0]
+        to_block = int(target["block_num"])
+
+        current = self.executor.run(block_hashes_query(*self.reorg_log.check_range(to_block)))
+        try:
+            fork = self.reorg_log.fork_point(current)
+        except ValueError as error:
+            fork, reason = -1, str(error)
+        else:
+            reason = f"Reorg below the folded tail at block {fork}"
+        if fork is not None:
+            self._rebuild(reason)
+
+        for feed in self.feeds:
+            if feed.block >= to_block:
+                continue
+            started = time.monotonic()
+            count = feed.fold(self.executor, feed.block, to_block)
+            logger.info(
+                "%s: folded %s events in blocks %s-%s in %.2fs.",
+                feed.table_id, count, feed.block + 1, to_block, time.monotonic() - started,
+            )
+            feed.block = to_block
+        self.reorg_log.record(current, to_block)
+
+        self.folded = {"block_num": to_block, "timestamp": _seconds(target["timestamp"])}
+        head = blocks.iloc[-1]
+        self.report(int(head["block_num"]), _seconds(head["timestamp"]))
+        return to_block
+
+    def freshness(self, now: Optional[float] = None) -> Dict[str, float]:
+        """Seconds from the folded / last flushed block's timestamp to now (NaN before the first)."""
+        now = time.time() if now is None else now
+        return {
+            name: now - point["timestamp"] if point is not None else np.nan
+            for name, point in (("folded_lag_seconds", self.folded), ("flushed_lag_seconds", self.flushed))
+        }
+
+    def report(self, head_block: int, head_timestamp: float) -> Dict[str, float]:
+        now = time.time()
+        metrics = {"head_lag_seconds": now - head_timestamp, **self.freshness(now)}
+        logger.info(
+            "Stream freshness: head %s, folded %s, flushed %s; %s",
+            head_block,
+            self.folded["block_num"] if self.folded else None,
+            self.flushed["block_num"] if self.flushed else None,
+            ", ".join(f"{name}={value:.1f}" for name, value in metrics.items()),
+        )
+        return metrics
+
+    def flush(self, sink: Sink) -> int:
+        """Hand each feed's changed rows to sink; returns the number of rows flushed."""
+        flushed = 0
+        for feed in self.feeds:
+            changed = feed.changes()
+            if changed is None or changed.empty:
+                continue
+            logger.info("%s: flushing %s changed rows.", feed.table_id, len(changed))
+            sink(feed, changed)
+            flushed += len(changed)
+        self.flushed = self.folded
+        self.last_flush = time.monotonic()
+        return flushed
+
+    def run(self, sink: Sink, poll_seconds: float = POLL_SECONDS, polls: Optional[int] = None) -> None:
+        """Poll and flush on their cadences until interrupted (or for `polls` polls)."""
+        done = 0
+        try:
+            while polls is None or done < polls:
+                started = time.monotonic()
+                try:
+                    self.poll()
+                except Exception:  # a failed poll is retried on the next one
+                    logger.exception("Stream poll failed; retrying in %.0fs.", poll_seconds)
+                if time.monotonic() - self.last_flush >= self.flush_seconds:
+                    self.flush(sink)
+                done += 1
+                time.sleep(max(0.0, poll_seconds - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            logger.info("Stream interrupted.")
+        self.flush(sink)
@@ -0,0 +1,29 @@
+"""
+Loading of already-built entity tables.
+
+Every *_arbitrum script publishes its output to graph-mainnet.nozzle.<table_id>
+via save_or_upload_parquet.  Downstream builds (rollups, validation) read those
+tables back instead of re-deriving them from raw events.
+"""
+
+import logging
+from typing import List, Optional
+
+import pandas as pd
+from google.cloud import bigquery
+
+logger = logging.getLogger(__name__)
+
+BQ_PROJECT = "graph-mainnet"
+BQ_DATASET = "nozzle"
+
+
+def load_entity_table(table_id: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Load a published entity table (e.g. 'signal_arbitrum') into a DataFrame."""
+    ref = f"{BQ_PROJECT}.{BQ_DATASET}.{table_id}"
+    select = ", ".join(columns) if columns else "*"
+    logger.info("Loading %s (%s)...", ref, select)
+    client = bigquery.Client(project=BQ_PROJECT)
+    df = client.query(f"SELECT {select} FROM `{ref}`").to_dataframe()
+    logger.info("Loaded %s rows from %s.", len(df), ref)
+    return df
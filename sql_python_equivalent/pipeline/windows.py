@@ -0,0 +1,123 @@
+"""
+Per-day / per-epoch reward and fee rollups with prefix-sum rolling windows.
+
+Trailing-window questions ("indexing rewards over the last 30 days") read a
+small rollup table instead of rescanning rewards_assigned, rebate_collected
+and allocation_collected.  The table has one row per
+
+    dimension ('indexer' | 'deployment'), key, period_type ('day' | 'epoch'), period
+
+with METRICS summed over the events in that period and block_hi, the highest
+block_num folded in; every row also carries synced_block, the to_block the
+publishing refresh read all its sources up to.  Days are UTC day numbers (unix seconds // 86400), epochs
+come from the epoch table (pipeline/epochs.py).  Rollups are additive, so a
+refresh rolls up only events after high_water() and merge_rollups() adds
+them to the stored rows.
+
+RollingWindows holds per-key prefix sums over one (dimension, period_type)
+slice; window() / trailing() return every key's totals over a period range
+with two binary searches and one subtraction per key.
+"""
+
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from pipeline.epochs import EpochTable
+from pipeline.partitioned import merge_partials
+
+logger = logging.getLogger(__name__)
+
+METRICS: List[str] = ["rewards", "query_fees", "rebates", "curation_fees"]
+DIMENSIONS: Dict[str, str] = {"indexer": "indexer", "deployment": "subgraph_deployment"}
+ROLLUP_KEYS: List[str] = ["dimension", "key", "period_type", "period"]
+ROLLUP_COLUMNS: List[str] = ROLLUP_KEYS + ["block_hi"] + METRICS
+SYNCED_COLUMN = "synced_block"
+
+_MERGES = {"block_hi": "max", **{metric: "sum" for metric in METRICS}}
+SECONDS_PER_DAY = 86400
+
+
+def rollup_events(events: pd.DataFrame, epochs: EpochTable, scale: float = 1e18) -> pd.DataFrame:
+    """Rollup rows from a long event frame.
+
+    events columns: indexer, subgraph_deployment, block_num, timestamp (unix
+    seconds) and METRICS in wei.  Rows with no key for a dimension (e.g. a
+    reward whose allocation has no known deployment) are left out of it.
+    """
+    if events.empty:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+    frame = events.copy()
+    frame[METRICS] = frame[METRICS].astype(float).fillna(0.0) / scale
+    frame["day"] = frame["timestamp"].astype(np.int64) // SECONDS_PER_DAY
+    epochs.add_epoch_column(frame, "block_num", "epoch")
+
+    parts = []
+    for dimension, column in DIMENSIONS.items():
+        for period_type in ("day", "epoch"):
+            subset = frame[frame[column].notna() & frame[period_type].notna()]
+            grouped = subset.groupby([column, period_type], sort=False)
+            part = grouped[METRICS].sum()
+            part["block_hi"] = grouped["block_num"].max()
+            part = part.reset_index().rename(columns={column: "key", period_type: "period"})
+            part["dimension"] = dimension
+            part["period_type"] = period_type
+            parts.append(part)
+    rollups = pd.concat(parts, ignore_index=True)
+    rollups["period"] = rollups["period"].astype(np.int64)
+    logger.info("Rolled %s events into %s period rows.", len(events), len(rollups))
+    return rollups[ROLLUP_COLUMNS]
+
+
+def merge_rollups(existing: Optional[pd.DataFrame], new: pd.DataFrame) -> pd.DataFrame:
+    """Add newly rolled-up rows to a stored rollup table."""
+    partials = [new] if existing is None else [existing[ROLLUP_COLUMNS], new]
+    return merge_partials(partials, ROLLUP_KEYS, _MERGES)[ROLLUP_COLUMNS]
+
+
+def high_water(rollups: Optional[pd.DataFrame]) -> int:
+    """Block a rollup table is synced to: its synced_block, else its highest block_hi (-1 when empty)."""
+    if rollups is None or rollups.empty:
+        return -1
+    return int(rollups[SYNCED_COLUMN if SYNCED_COLUMN in rollups.columns else "block_hi"].max())
+
+
+class RollingWindows:
+    """Prefix sums over one (dimension, period_type) slice of the rollup table."""
+
+    def __init__(self, rollups: pd.DataFrame, dimension: str = "indexer", period_type: str = "day") -> None:
+        rows = rollups[(rollups["dimension"] == dimension) & (rollups["period_type"] == period_type)]
+        codes, self.keys = pd.factorize(rows["key"], sort=True)
+        periods = rows["period"].to_numpy(dtype=np.int64)
+        order = np.lexsort((periods, codes))
+        self._codes = codes[order]
+        self._periods = periods[order]
+        self._stride = int(self._periods.max()) + 2 if len(order) else 1
+        self._composite = self._codes * self._stride + self._periods
+
+        values = rows[METRICS].to_numpy(dtype=float)[order]
+        running = np.cumsum(values, axis=0)
+        # Key start offsets; prefix sums restart at each key.
+        self._starts = np.searchsorted(self._codes, np.arange(len(self.keys)), side="left")
+        before = np.vstack([np.zeros((1, len(METRICS))), running])[self._starts]
+        self._prefix = running - np.repeat(before, np.diff(np.append(self._starts, len(order))), axis=0)
+
+    def _prefix_at(self, period: int) -> np.ndarray:
+        """Every key's cumulative METRICS up to and including period."""
+        codes = np.arange(len(self.keys))
+        period = min(max(int(period), -1), self._stride - 1)
+        idx = np.searchsorted(self._composite, codes * self._stride + period, side="right") - 1
+        if not len(idx):
+            return np.zeros((0, len(METRICS)))
+        return np.where((idx >= self._starts)[:, None], self._prefix[np.maximum(idx, 0)], 0.0)
+
+    def window(self, first: int, last: int) -> pd.DataFrame:
+        """Per-key METRICS summed over periods first..last inclusive."""
+        totals = self._prefix_at(last) - self._prefix_at(first - 1)
+        return pd.DataFrame(totals, index=pd.Index(self.keys, name="key"), columns=METRICS)
+
+    def trailing(self, end: int, length: int) -> pd.DataFrame:
+        """Per-key METRICS over the length periods ending at end (inclusive)."""
+        return self.window(end - length + 1, end)
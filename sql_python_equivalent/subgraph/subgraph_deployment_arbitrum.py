@@ -2,7 +2,11 @@
 # coding: utf-8
 
 # Produces a flat table equivalent to the SubgraphDeployment entity from the
-# graph-network subgraph, limited to: id, ipfs_hash, subgraph_id, signalled_tokens, created_at.
+# graph-network subgraph, limited to: id, ipfs_hash, subgraph_id, signalled_tokens,
+# signal_amount, price_per_share, reserve_ratio, staked_tokens, query_fees_amount,
+# indexing_reward_amount, indexing_indexer_reward_amount,
+# indexing_delegator_reward_amount, curator_fee_rewards, query_fee_rebates,
+# delegators_query_fee_rebates, created_at.
 #
 # Deployment sources (matching createOrLoadSubgraphDeployment call sites):
 #   - SubgraphPublished   (gns.ts handleSubgraphPublished)
@@ -14,7 +18,22 @@
 #   2. Burned:              -= tokens                   [curation.ts handleBurned]
 #   3. AllocationCollected: += curationFees             [staking.ts handleAllocationCollected]
 #   4. RebateCollected:     += curationFees             [staking.ts handleRebateCollected]
-# [TODO: Not implemented yet]  5. QueryFeesCollected:  += tokensCurators           [subgraphService.ts handleQueryFeesCollected]
+#   5. QueryFeesCollected:  += tokensCurators           [subgraphService.ts handleQueryFeesCollected]
+# 3-5 are the curator_rewards of the allocation-economics stream
+# (network/allocation_economics_arbitrum.py, built first).
+#
+# signalAmount: Signalled += signal, Burned -= signal.  pricePerShare is
+# calculatePricePerShare (helpers.ts) on the final state; its history is
+# published in run-length form as deployment_price_history_arbitrum (one row
+# per run of blocks with an unchanged end-of-block price).  See pipeline/curve.py.
+#
+# stakedTokens / queryFeesAmount are rolled up from allocations_arbitrum
+# (built first): open allocations' allocatedTokens and the sum of
+# Allocation.queryFeesCollected.  See pipeline/rollups.py.
+#
+# indexingRewardAmount (+ indexer / delegator split), curatorFeeRewards,
+# queryFeeRebates and delegatorsQueryFeeRebates are summed per deployment
+# from the same stream, legacy and Horizon alike (pipeline/economics.py).
 #
 # Note: one deployment can be used by multiple subgraphs.  We keep the most
 # recent subgraph_id association per deployment for this flat output.
@@ -30,18 +49,25 @@ except NameError:
 project_root = os.path.abspath(os.path.join(script_dir, '..', '..'))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
+pipeline_root = os.path.abspath(os.path.join(script_dir, '..'))
+if pipeline_root not in sys.path:
+    sys.path.insert(0, pipeline_root)
 
 from nozzle.client import Client
 from nozzle.util import process_query
 from nozzle.util import save_or_upload_parquet, convert_bigint_subgraph_id_to_base58
 from nozzle.util import convert_to_base58
+from pipeline.curve import DEFAULT_RESERVE_RATIO, curve_state
+from pipeline.economics import ECONOMICS_TABLE, economics_totals
+from pipeline.rollups import allocations_to_deployments
+from pipeline.serving import serve
+from pipeline.tables import load_entity_table
 import pandas as pd
 
 client_url = "grpc+tls://gateway.amp.staging.thegraph.com:443"
 client = Client(client_url)
 
 GNS_ADDRESS = "ec9A7fb6CbC2E41926127929c2dcE6e9c5D33Bec"
-SUBGRAPH_SERVICE_ADDRESS = "b2Bb92d0DE618878E438b55D5846cfecD9301105"
 
 # %%
 # ============================================================
@@ -113,10 +139,14 @@ deployments = deployments.merge(created_at, on='id', how='left')
 
 # %%
 # ============================================================
-# Part 4: Calculate signalledTokens per deployment
+# Part 4: Bonding-curve state per deployment
 #
-# Matches the subgraph logic — five event sources that mutate
-# deployment.signalledTokens (see file header for references).
+# Matches the subgraph logic — the event sources that mutate
+# deployment.signalledTokens / signalAmount (see file header for
+# references).  Curation events are summed per (deployment, block) in
+# SQL and the stream's curator fees in pandas; the running totals,
+# pricePerShare and its history come from one cumulative pass over
+# those block deltas.
 #
 # The subgraph stores raw BigInt (wei).  We divide by 10^18 here
 # to produce GRT values for the output table.
@@ -125,53 +155,101 @@ signal_query = f'''
 WITH subgraph_signalled AS (
     SELECT
         subgraph_deployment_id,
-        tokens - curation_tax AS signalled_tokens
+        block_number,
+        timestamp,
+        tokens - curation_tax AS signalled_tokens,
+        signal AS signal_amount
     FROM "data_science/event_arbitrum_curation_signalled@0.0.2"."event_arbitrum_curation_signalled"
 ),
 subgraph_burned AS (
     SELECT
         subgraph_deployment_id,
-        -tokens AS signalled_tokens
+        block_number,
+        timestamp,
+        -tokens AS signalled_tokens,
+        -signal AS signal_amount
     FROM "data_science/event_arbitrum_curation_burned@0.0.2"."event_arbitrum_curation_burned"
-),
-allocation_collected AS (
-    SELECT
-        subgraph_deployment_id,
-        curation_fees AS signalled_tokens
-    FROM "data_science/event_arbitrum_staking_allocation_collected@0.0.2"."event_arbitrum_staking_allocation_collected"
-),
-rebate_collected AS (
-    SELECT
-        subgraph_deployment_id,
-        curation_fees AS signalled_tokens
-    FROM "data_science/event_arbitrum_staking_rebate_collected@0.0.2"."event_arbitrum_staking_rebate_collected"
 )
 
 SELECT
-    subgraph_deployment_id AS id,
-    SUM(signalled_tokens) / POWER(10, 18) AS signalled_tokens
+    subgraph_deployment_id AS deployment,
+    block_number AS block_num,
+    MIN(timestamp) AS timestamp,
+    SUM(signalled_tokens) AS tokens,
+    SUM(signal_amount) AS signal
 FROM (
-    SELECT subgraph_deployment_id, signalled_tokens FROM subgraph_signalled
+    SELECT * FROM subgraph_signalled
     UNION ALL
-    SELECT subgraph_deployment_id, signalled_tokens FROM subgraph_burned
-    UNION ALL
-    SELECT subgraph_deployment_id, signalled_tokens FROM allocation_collected
-    UNION ALL
-    SELECT subgraph_deployment_id, signalled_tokens FROM rebate_collected
- 
+    SELECT * FROM subgraph_burned
 ) AS combined
-GROUP BY 1
+GROUP BY 1, 2
 '''
-signal_res = process_query(client, signal_query)
+signal_deltas = process_query(client, signal_query)
+
+# Curator fees of both generations, from the allocation-economics stream.
+# Its amounts stay in wei like the curation events above.
+stream = load_entity_table(ECONOMICS_TABLE, [
+    'subgraph_deployment', 'block_num', 'timestamp', 'indexing_rewards', 'indexing_indexer_rewards',
+    'indexing_delegator_rewards', 'curator_rewards', 'query_fee_rebates', 'delegation_fees',
+])
+curator_fees = stream[stream['curator_rewards'] > 0]
+fee_deltas = curator_fees.groupby(['subgraph_deployment', 'block_num'], sort=False).agg(
+    timestamp=('timestamp', 'min'), tokens=('curator_rewards', 'sum'),
+).reset_index().rename(columns={'subgraph_deployment': 'deployment'}).assign(signal=0.0)
+signal_deltas = pd.concat([signal_deltas, fee_deltas], ignore_index=True).groupby(
+    ['deployment', 'block_num'], sort=False,
+).agg(timestamp=('timestamp', 'min'), tokens=('tokens', 'sum'), signal=('signal', 'sum')).reset_index()
+curve_res, price_history = curve_state(signal_deltas, DEFAULT_RESERVE_RATIO)
+
+signal_res = curve_res.rename(columns={'deployment': 'id'})
+signal_res[['signalled_tokens', 'signal_amount']] = signal_res[['signalled_tokens', 'signal_amount']] / 10**18
+
+price_history = price_history.rename(columns={'deployment': 'id'})
+price_history['start_at'] = pd.to_datetime(price_history['start_at'], unit='s', utc=True)
+
+# %%
+# ============================================================
+# Part 5: stakedTokens / queryFeesAmount rolled up from Allocation
+# ============================================================
+allocations = load_entity_table(
+    'allocations_arbitrum',
+    ['subgraph_deployment', 'allocated_tokens', 'status', 'query_fees_collected'],
+)
+allocation_res = allocations_to_deployments(allocations).rename(columns={'subgraph_deployment': 'id'})
 
 # %%
 # ============================================================
-# Join deployments with signalled tokens
+# Part 6: reward and fee amounts from the allocation-economics stream
+# ============================================================
+economics_res = economics_totals(
+    stream, 'subgraph_deployment',
+    ['indexing_rewards', 'indexing_indexer_rewards', 'indexing_delegator_rewards',
+     'curator_rewards', 'query_fee_rebates', 'delegation_fees'],
+).rename(columns={
+    'subgraph_deployment': 'id',
+    'indexing_rewards': 'indexing_reward_amount',
+    'indexing_indexer_rewards': 'indexing_indexer_reward_amount',
+    'indexing_delegator_rewards': 'indexing_delegator_reward_amount',
+    'curator_rewards': 'curator_fee_rewards',
+    'delegation_fees': 'delegators_query_fee_rebates',
+})
+economics_fields = [column for column in economics_res.columns if column != 'id']
+
+# %%
+# ============================================================
+# Join deployments with signalled tokens, allocation rollups and stream totals
 # ============================================================
 data = deployments.merge(signal_res, on='id', how='left')
-data['signalled_tokens'] = data['signalled_tokens'].fillna(0)
+data = data.merge(allocation_res, on='id', how='left')
+data = data.merge(economics_res, on='id', how='left')
+amount_columns = ['signalled_tokens', 'signal_amount', 'price_per_share', 'staked_tokens', 'query_fees_amount']
+data[amount_columns + economics_fields] = data[amount_columns + economics_fields].fillna(0)
+data['reserve_ratio'] = data['reserve_ratio'].fillna(DEFAULT_RESERVE_RATIO).astype(int)
 
-data = data[['id', 'ipfs_hash', 'subgraph_id', 'signalled_tokens', 'created_at']]
+data = data[[
+    'id', 'ipfs_hash', 'subgraph_id', 'signalled_tokens', 'signal_amount', 'price_per_share', 'reserve_ratio',
+    'staked_tokens', 'query_fees_amount', *economics_fields, 'created_at',
+]]
 
 # %%
 # ============================================================
@@ -187,3 +265,14 @@ destination_blob_name = 'path/in/bucket/subgraph_deployment_arbitrum.parquet'
 table_id = 'subgraph_deployment_arbitrum'
 project_id = 'graph-mainnet'
 save_or_upload_parquet(data, destination_blob_name, "upload", table_id, project_id=project_id)
+serve(data, table_id)
+
+bq_client.delete_table('graph-mainnet.nozzle.deployment_price_history_arbitrum', not_found_ok=True)
+save_or_upload_parquet(
+    price_history,
+    'path/in/bucket/deployment_price_history_arbitrum.parquet',
+    "upload",
+    'deployment_price_history_arbitrum',
+    project_id=project_id,
+)
+serve(price_history, 'deployment_price_history_arbitrum')
@@ -0,0 +1,770 @@
+#!/usr/bin/env python
+"""
+Reference replay of the graph-network subgraph mappings, for offline validation.
+
+A pure-Python port of the handlers our entity tables mirror, applied event by
+event in (block_num, log_index) order:
+
+  curation.ts   handleSignalled / handleBurned
+  gns.ts        handleNSignalMintedV2 / handleNSignalBurnedV2 / handleGRTWithdrawnV2
+  staking.ts    handleStakeDeposited (indexer creation only), handleStakeDelegated,
+                handleStakeDelegatedLocked, handleStakeDelegatedWithdrawn,
+                handleDelegationParametersUpdated (indexing reward cut only),
+                handleRebateClaimed / handleRebateCollected (delegation pool only),
+                handleAllocationCreated, handleAllocationClosed(CobbDouglas)
+  rewardsManager.ts  handleRewardsAssigned (delegation pool only)
+  helpers.ts    the createOrLoad* defaults and their count side effects
+
+BigInt fields are Python ints in wei; BigDecimal fields are Decimals with
+graph-node's 34-digit precision and the handlers' truncate(18).  Entities are
+__slots__ records in one dict per type, keyed by the subgraph id, so a replay
+holds no per-entity dict and no pandas objects.  Fields the port does not
+maintain (reward and fee totals, stakedTokens, GraphNetwork) are absent from the
+records, and validate.py only compares the fields a record has.
+
+Fixture: JSON Lines, one decoded event per line:
+
+    {"event": "Signalled", "block_num": 1, "log_index": 0, "timestamp": 1700000000,
+     "curator": "0x…", "subgraphDeploymentID": "0x…", "tokens": "1000…", ...}
+
+Parameter names are the ABI names in SIGNATURES; uint256 values may be JSON
+numbers or decimal strings (strings keep them exact).  Any evm_decode query
+over these signatures produces the columns directly.
+
+Usage:
+    from reference import load_fixture, replay
+    store = replay(load_fixture("events.jsonl"))
+    store.entities("signal")   # {id: {subgraphFieldName: value}}
+
+tests/check_replay.py replays tests/fixtures/replay_events.jsonl through
+both this port and the vectorised replay steps and compares them.
+"""
+
+import json
+import os
+import sys
+from decimal import ROUND_DOWN, ROUND_HALF_EVEN, Context, Decimal, localcontext
+from typing import Callable, Dict, Iterable, List, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")))
+from pipeline.curve import DEFAULT_RESERVE_RATIO, MAX_WEIGHT, ZERO_RATIO_MULTIPLIER
+
+# graph-node normalises every BigDecimal result to 34 significant digits.
+BIG_DECIMAL = Context(prec=34, rounding=ROUND_HALF_EVEN)
+ZERO = Decimal(0)
+ONE = Decimal(1)
+_EIGHTEEN = Decimal(1).scaleb(-18)
+_TRUNCATE = Context(prec=80, rounding=ROUND_DOWN)
+
+SUBGRAPH_SERVICE_ADDRESS = "0xb2bb92d0de618878e438b55d5846cfecd9301105"
+
+SIGNATURES = {
+    "Signalled": "Signalled(address indexed curator, bytes32 indexed subgraphDeploymentID, uint256 tokens, uint256 signal, uint256 curationTax)",
+    "Burned": "Burned(address indexed curator, bytes32 indexed subgraphDeploymentID, uint256 tokens, uint256 signal)",
+    "SignalMinted": "SignalMinted(uint256 indexed subgraphID, address indexed curator, uint256 nSignalCreated, uint256 vSignalCreated, uint256 tokensDeposited)",
+    "SignalBurned": "SignalBurned(uint256 indexed subgraphID, address indexed curator, uint256 nSignalBurnt, uint256 vSignalBurnt, uint256 tokensReceived)",
+    "GRTWithdrawn": "GRTWithdrawn(uint256 indexed subgraphID, address indexed curator, uint256 nSignalBurnt, uint256 withdrawnGRT)",
+    "StakeDeposited": "StakeDeposited(address indexed indexer, uint256 tokens)",
+    "StakeDelegated": "StakeDelegated(address indexed indexer, address indexed delegator, uint256 tokens, uint256 shares)",
+    "StakeDelegatedLocked": "StakeDelegatedLocked(address indexed indexer, address indexed delegator, uint256 tokens, uint256 shares, uint256 until)",
+    "StakeDelegatedWithdrawn": "StakeDelegatedWithdrawn(address indexed indexer, address indexed delegator, uint256 tokens)",
+    "AllocationCreated": "AllocationCreated(address indexed indexer, bytes32 indexed subgraphDeploymentID, uint256 epoch, uint256 tokens, address indexed allocationID, bytes32 metadata)",
+    "DelegationParametersUpdated": "DelegationParametersUpdated(address indexed indexer, uint32 indexingRewardCut, uint32 queryFeeCut, uint32 cooldownBlocks)",
+    "RewardsAssigned": "RewardsAssigned(address indexed indexer, address indexed allocationID, uint256 epoch, uint256 amount)",
+    "RebateClaimed": "RebateClaimed(address indexed indexer, bytes32 indexed subgraphDeploymentID, address indexed allocationID, uint256 epoch, uint256 forEpoch, uint256 tokens, uint256 unclaimedAllocationsCount, uint256 delegationFees)",
+    "RebateCollected": "RebateCollected(address assetHolder, address indexed indexer, bytes32 indexed subgraphDeploymentID, address indexed allocationID, uint256 epoch, uint256 tokens, uint256 protocolTax, uint256 curationFees, uint256 queryFees, uint256 queryRebates, uint256 delegationRewards)",
+    "AllocationClosed": "AllocationClosed(address indexed indexer, bytes32 indexed subgraphDeploymentID, uint256 epoch, uint256 tokens, address indexed allocationID, address sender, bytes32 poi, bool isPublic)",
+}
+
+_BASE58 = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+
+def truncate(value: Decimal) -> Decimal:
+    """BigDecimal.truncate(18)."""
+    if value.as_tuple().exponent >= -18:
+        return value
+    return value.quantize(_EIGHTEEN, context=_TRUNCATE)
+
+
+def base58(data: bytes) -> str:
+    number = int.from_bytes(data, "big")
+    encoded = ""
+    while number:
+        number, digit = divmod(number, 58)
+        encoded = _BASE58[digit] + encoded
+    return "1" * (len(data) - len(data.lstrip(b"\0"))) + encoded
+
+
+def subgraph_id(big_int: int) -> str:
+    """convertBigIntSubgraphIDToBase58."""
+    return base58(big_int.to_bytes(max(1, (big_int.bit_length() + 7) // 8), "big"))
+
+
+def ipfs_hash(deployment_id: str) -> str:
+    return base58(bytes.fromhex("1220" + deployment_id[2:]))
+
+
+def _camel(name: str) -> str:
+    head, *rest = name.split("_")
+    return head + "".join(part.title() for part in rest)
+
+
+# =====================================================================
+# Entity records
+# =====================================================================
+class Record:
+    """An entity with the createOrLoad defaults in DEFAULTS."""
+    __slots__ = ("id",)
+    DEFAULTS: Dict[str, object] = {}
+
+    def __init__(self, id: str, **values):
+        self.id = id
+        for name, value in self.DEFAULTS.items():
+            setattr(self, name, value)
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.FIELD_NAMES = {name: _camel(name) for name in cls.__slots__}
+
+    def entity(self) -> dict:
+        """Fields under their subgraph names, in raw units."""
+        return {camel: getattr(self, name) for name, camel in self.FIELD_NAMES.items()}
+
+
+class Curator(Record):
+    DEFAULTS = {
+        "created_at": 0,
+        "total_signalled_tokens": 0,
+        "total_unsignalled_tokens": 0,
+        "total_name_signalled_tokens": 0,
+        "total_name_unsignalled_tokens": 0,
+        "total_withdrawn_tokens": 0,
+        "total_signal_average_cost_basis": ZERO,
+        "total_signal": ZERO,
+        "total_average_cost_basis_per_signal": ZERO,
+        "total_name_signal_average_cost_basis": ZERO,
+        "total_name_signal": ZERO,
+        "total_average_cost_basis_per_name_signal": ZERO,
+        "signal_count": 0,
+        "active_signal_count": 0,
+        "name_signal_count": 0,
+        "active_name_signal_count": 0,
+        "combined_signal_count": 0,
+        "active_combined_signal_count": 0,
+    }
+    __slots__ = tuple(DEFAULTS)
+
+
+class Signal(Record):
+    DEFAULTS = {
+        "curator": None,
+        "subgraph_deployment": None,
+        "signalled_tokens": 0,
+        "unsignalled_tokens": 0,
+        "signal": 0,
+        "average_cost_basis": ZERO,
+        "average_cost_basis_per_signal": ZERO,
+        "last_signal_change": 0,
+        "realized_rewards": 0,
+        "created_at": 0,
+        "last_updated_at": 0,
+    }
+    __slots__ = tuple(DEFAULTS)
+
+
+class NameSignal(Record):
+    DEFAULTS = {
+        "curator": None,
+        "subgraph": None,
+        "signalled_tokens": 0,
+        "unsignalled_tokens": 0,
+        "withdrawn_tokens": 0,
+        "name_signal": 0,
+        "signal": ZERO,
+        "last_name_signal_change": 0,
+        "realized_rewards": 0,
+        "average_cost_basis": ZERO,
+        "average_cost_basis_per_signal": ZERO,
+        "name_signal_average_cost_basis": ZERO,
+        "name_signal_average_cost_basis_per_signal": ZERO,
+        "signal_average_cost_basis": ZERO,
+        "signal_average_cost_basis_per_signal": ZERO,
+    }
+    __slots__ = tuple(DEFAULTS)
+
+
+class SubgraphDeployment(Record):
+    DEFAULTS = {
+        "ipfs_hash": None,
+        "created_at": 0,
+        "staked_tokens": 0,
+        "signalled_tokens": 0,
+        "signal_amount": 0,
+        "price_per_share": ZERO,
+        "reserve_ratio": DEFAULT_RESERVE_RATIO,
+    }
+    __slots__ = tuple(DEFAULTS)
+
+
+class Delegator(Record):
+    DEFAULTS = {
+        "created_at": 0,
+        "total_staked_tokens": 0,
+        "total_unstaked_tokens": 0,
+        "total_realized_rewards": ZERO,
+        "stakes_count": 0,
+        "active_stakes_count": 0,
+    }
+    __slots__ = tuple(DEFAULTS)
+
+
+class DelegatedStake(Record):
+    DEFAULTS = {
+        "indexer": None,
+        "delegator": None,
+        "staked_tokens": 0,
+        "unstaked_tokens": 0,
+        "locked_tokens": 0,
+        "locked_until": 0,
+        "share_amount": 0,
+        "personal_exchange_rate": ONE,
+        "realized_rewards": ZERO,
+        "created_at": 0,
+        "last_delegated_at": None,
+        "last_undelegated_at": None,
+    }
+    __slots__ = tuple(DEFAULTS)
+
+
+class Indexer(Record):
+    DEFAULTS = {
+        "created_at": 0,
+        "is_legacy": False,
+        "allocated_tokens": 0,
+        "delegated_tokens": 0,
+        "delegated_thawing_tokens": 0,
+        "delegator_shares": 0,
+        "delegation_exchange_rate": ONE,
+        "legacy_indexing_reward_cut": 0,
+        "allocation_count": 0,
+        "total_allocation_count": 0,
+    }
+    __slots__ = tuple(DEFAULTS)
+
+
+class Allocation(Record):
+    DEFAULTS = {
+        "indexer": None,
+        "subgraph_deployment": None,
+        "allocated_tokens": 0,
+        "status": "Active",
+        "created_at": 0,
+        "closed_at": None,
+        "is_legacy": True,
+    }
+    __slots__ = tuple(DEFAULTS)
+
+
+# Entity-config name (validate.ENTITIES) → record type.
+RECORDS = {
+    "curator": Curator,
+    "signal": Signal,
+    "name_signal": NameSignal,
+    "subgraph_deployment": SubgraphDeployment,
+    "delegator": Delegator,
+    "delegated_stake": DelegatedStake,
+    "indexer": Indexer,
+    "allocation": Allocation,
+}
+
+
+# =====================================================================
+# Store and createOrLoad*
+# =====================================================================
+class Store:
+    """One dict of records per entity type, keyed by subgraph id."""
+
+    def __init__(self, reserve_ratio: int = DEFAULT_RESERVE_RATIO):
+        self.reserve_ratio = reserve_ratio
+        self.tables: Dict[str, dict] = {name: {} for name in RECORDS}
+
+    def entities(self, name: str) -> Dict[str, dict]:
+        return {key: record.entity() for key, record in self.tables[name].items()}
+
+    def curator(self, address: str, timestamp: int) -> Curator:
+        curators = self.tables["curator"]
+        curator = curators.get(address)
+        if curator is None:
+            curator = curators[address] = Curator(address, created_at=timestamp)
+        return curator
+
+    def signal(self, curator: str, deployment: str, timestamp: int) -> Signal:
+        key = f"{curator}-{deployment}"
+        signals = self.tables["signal"]
+        signal = signals.get(key)
+        if signal is None:
+            signal = signals[key] = Signal(
+                key, curator=curator, subgraph_deployment=deployment,
+                created_at=timestamp, last_updated_at=timestamp,
+            )
+            owner = self.tables["curator"][curator]
+            owner.signal_count += 1
+            owner.combined_signal_count += 1
+        return signal
+
+    def name_signal(self, curator: str, subgraph: str, timestamp: int) -> NameSignal:
+        key = f"{curator}-{subgraph}"
+        name_signals = self.tables["name_signal"]
+        name_signal = name_signals.get(key)
+        if name_signal is None:
+            owner = self.curator(curator, timestamp)
+            name_signal = name_signals[key] = NameSignal(key, curator=curator, subgraph=subgraph)
+            owner.name_signal_count += 1
+            owner.combined_signal_count += 1
+        return name_signal
+
+    def deployment(self, deployment_id: str, timestamp: int) -> SubgraphDeployment:
+        deployments = self.tables["subgraph_deployment"]
+        deployment = deployments.get(deployment_id)
+        if deployment is None:
+            deployment = deployments[deployment_id] = SubgraphDeployment(
+                deployment_id, ipfs_hash=ipfs_hash(deployment_id), created_at=timestamp,
+                reserve_ratio=self.reserve_ratio,
+            )
+        return deployment
+
+    def indexer(self, address: str, timestamp: int) -> Indexer:
+        """createOrLoadLegacyIndexer."""
+        indexers = self.tables["indexer"]
+        indexer = indexers.get(address)
+        if indexer is None:
+            indexer = indexers[address] = Indexer(address, created_at=timestamp)
+        indexer.is_legacy = True
+        return indexer
+
+    def delegator(self, address: str, timestamp: int) -> Delegator:
+        delegators = self.tables["delegator"]
+        delegator = delegators.get(address)
+        if delegator is None:
+            delegator = delegators[address] = Delegator(address, created_at=timestamp)
+        return delegator
+
+    def delegated_stake(self, delegator: str, indexer: str, timestamp: int) -> DelegatedStake:
+        key = delegated_stake_id(delegator, indexer)
+        stakes = self.tables["delegated_stake"]
+        stake = stakes.get(key)
+        if stake is None:
+            stake = stakes[key] = DelegatedStake(
+                key, indexer=indexer, delegator=delegator, created_at=timestamp
+            )
+            self.tables["delegator"][delegator].stakes_count += 1
+        return stake
+
+
+def delegated_stake_id(delegator: str, indexer: str) -> str:
+    """getHorizonDelegatedStakeIDFromLegacy."""
+    return f"{delegator}-{indexer}-{SUBGRAPH_SERVICE_ADDRESS}"
+
+
+def price_per_share(deployment: SubgraphDeployment) -> Decimal:
+    """calculatePricePerShare."""
+    if deployment.signal_amount == 0:
+        return ZERO
+    ratio = deployment.reserve_ratio
+    multiplier = ZERO_RATIO_MULTIPLIER if ratio == 0 else MAX_WEIGHT // ratio
+    return truncate(
+        Decimal(deployment.signalled_tokens) / Decimal(deployment.signal_amount) * multiplier
+    )
+
+
+# =====================================================================
+# Handlers
+# =====================================================================
+def handle_signalled(store: Store, e: dict) -> None:
+    curator_id, deployment_id, ts = e["curator"], e["subgraphDeploymentID"], e["timestamp"]
+    tokens, signal_minted = e["tokens"], e["signal"]
+    net = tokens - e["curationTax"]
+
+    curator = store.curator(curator_id, ts)
+    curator.total_signalled_tokens += net
+    curator.total_signal_average_cost_basis += tokens
+    curator.total_signal += signal_minted
+    if curator.total_signal != ZERO:
+        curator.total_average_cost_basis_per_signal = (
+            curator.total_signal_average_cost_basis / curator.total_signal
+        )
+
+    signal = store.signal(curator_id, deployment_id, ts)
+    becoming_active = signal.signal == 0 and signal_minted != 0
+    signal.signalled_tokens += net
+    signal.signal += signal_minted
+    signal.last_updated_at = ts
+    signal.average_cost_basis += tokens
+    if signal.signal != 0:
+        signal.average_cost_basis_per_signal = signal.average_cost_basis / signal.signal
+
+    if becoming_active:
+        curator.active_signal_count += 1
+        curator.active_combined_signal_count += 1
+
+    deployment = store.deployment(deployment_id, ts)
+    deployment.signalled_tokens += net
+    deployment.signal_amount += signal_minted
+    deployment.price_per_share = price_per_share(deployment)
+
+
+def handle_burned(store: Store, e: dict) -> None:
+    curator_id, deployment_id, ts = e["curator"], e["subgraphDeploymentID"], e["timestamp"]
+    tokens, signal_burnt = e["tokens"], e["signal"]
+
+    # A burn can follow a signal transfer the subgraph never saw, so the
+    # handler creates the curator (and the Signal's count side effect) here.
+    curator = store.curator(curator_id, ts)
+    signal = store.signal(curator_id, deployment_id, ts)
+    becoming_inactive = signal.signal != 0 and signal_burnt == signal.signal
+    signal.last_updated_at = ts
+    signal.unsignalled_tokens += tokens
+    signal.signal -= signal_burnt
+    previous_acb = signal.average_cost_basis
+    signal.average_cost_basis = truncate(signal.signal * signal.average_cost_basis_per_signal)
+    diff_acb = previous_acb - signal.average_cost_basis
+    if signal.average_cost_basis == ZERO:
+        signal.average_cost_basis_per_signal = ZERO
+
+    curator.total_unsignalled_tokens += tokens
+    curator.total_signal -= signal_burnt
+    curator.total_signal_average_cost_basis -= diff_acb
+    if curator.total_signal == ZERO:
+        curator.total_average_cost_basis_per_signal = ZERO
+    else:
+        curator.total_average_cost_basis_per_signal = (
+            curator.total_signal_average_cost_basis / curator.total_signal
+        )
+    if becoming_inactive:
+        curator.active_signal_count -= 1
+        curator.active_combined_signal_count -= 1
+
+    deployment = store.tables["subgraph_deployment"][deployment_id]
+    deployment.signalled_tokens -= tokens
+    deployment.signal_amount -= signal_burnt
+    deployment.price_per_share = price_per_share(deployment)
+
+
+def handle_signal_minted(store: Store, e: dict) -> None:
+    curator_id, ts = e["curator"], e["timestamp"]
+    n_signal, v_signal, tokens = e["nSignalCreated"], e["vSignalCreated"], e["tokensDeposited"]
+
+    curator = store.curator(curator_id, ts)
+    curator.total_name_signalled_tokens += tokens
+    curator.total_name_signal_average_cost_basis += tokens
+    curator.total_name_signal += n_signal
+    if curator.total_name_signal != ZERO:
+        curator.total_average_cost_basis_per_name_signal = truncate(
+            curator.total_name_signal_average_cost_basis / curator.total_name_signal
+        )
+    curator.total_signalled_tokens += tokens
+    curator.total_signal_average_cost_basis += tokens
+    curator.total_signal += v_signal
+    if curator.total_signal != ZERO:
+        curator.total_average_cost_basis_per_signal = truncate(
+            curator.total_signal_average_cost_basis / curator.total_signal
+        )
+
+    name_signal = store.name_signal(curator_id, subgraph_id(e["subgraphID"]), ts)
+    becoming_active = name_signal.name_signal == 0 and n_signal != 0
+    name_signal.name_signal += n_signal
+    name_signal.signal += v_signal
+    name_signal.signalled_tokens += tokens
+    name_signal.last_name_signal_change = ts
+    name_signal.name_signal_average_cost_basis += tokens
+    name_signal.average_cost_basis = name_signal.name_signal_average_cost_basis
+    if name_signal.name_signal != 0:
+        name_signal.name_signal_average_cost_basis_per_signal = truncate(
+            name_signal.name_signal_average_cost_basis / name_signal.name_signal
+        )
+        name_signal.average_cost_basis_per_signal = name_signal.name_signal_average_cost_basis_per_signal
+    name_signal.signal_average_cost_basis += tokens
+    if name_signal.signal != ZERO:
+        name_signal.signal_average_cost_basis_per_signal = truncate(
+            name_signal.signal_average_cost_basis / name_signal.signal
+        )
+
+    if becoming_active:
+        curator.active_name_signal_count += 1
+        curator.active_combined_signal_count += 1
+
+
+def handle_signal_burned(store: Store, e: dict) -> None:
+    curator_id, ts = e["curator"], e["timestamp"]
+    n_signal, v_signal, tokens = e["nSignalBurnt"], e["vSignalBurnt"], e["tokensReceived"]
+
+    name_signal = store.name_signal(curator_id, subgraph_id(e["subgraphID"]), ts)
+    becoming_inactive = name_signal.name_signal != 0 and n_signal == name_signal.name_signal
+    name_signal.name_signal -= n_signal
+    name_signal.signal -= v_signal
+    name_signal.unsignalled_tokens += tokens
+    name_signal.last_name_signal_change = ts
+
+    previous_name_acb = name_signal.name_signal_average_cost_basis
+    name_signal.name_signal_average_cost_basis = truncate(
+        name_signal.name_signal * name_signal.name_signal_average_cost_basis_per_signal
+    )
+    name_signal.average_cost_basis = name_signal.name_signal_average_cost_basis
+    diff_name_acb = previous_name_acb - name_signal.name_signal_average_cost_basis
+    if name_signal.name_signal_average_cost_basis == ZERO:
+        name_signal.name_signal_average_cost_basis_per_signal = ZERO
+        name_signal.average_cost_basis_per_signal = ZERO
+
+    curator = store.curator(curator_id, ts)
+    curator.total_name_unsignalled_tokens += tokens
+    curator.total_name_signal -= n_signal
+    curator.total_name_signal_average_cost_basis -= diff_name_acb
+    if curator.total_name_signal == ZERO:
+        curator.total_average_cost_basis_per_name_signal = ZERO
+    else:
+        curator.total_average_cost_basis_per_name_signal = truncate(
+            curator.total_name_signal_average_cost_basis / curator.total_name_signal
+        )
+
+    previous_acb = name_signal.signal_average_cost_basis
+    name_signal.signal_average_cost_basis = truncate(
+        name_signal.signal * name_signal.signal_average_cost_basis_per_signal
+    )
+    diff_acb = previous_acb - name_signal.signal_average_cost_basis
+    if name_signal.signal_average_cost_basis == ZERO:
+        name_signal.signal_average_cost_basis_per_signal = ZERO
+
+    curator.total_unsignalled_tokens += tokens
+    curator.total_signal -= v_signal
+    curator.total_signal_average_cost_basis -= diff_acb
+    if curator.total_signal == ZERO:
+        curator.total_average_cost_basis_per_signal = ZERO
+    else:
+        curator.total_average_cost_basis_per_signal = truncate(
+            curator.total_signal_average_cost_basis / curator.total_signal
+        )
+    if becoming_inactive:
+        curator.active_name_signal_count -= 1
+        curator.active_combined_signal_count -= 1
+
+
+def handle_grt_withdrawn(store: Store, e: dict) -> None:
+    curator_id, ts = e["curator"], e["timestamp"]
+    name_signal = store.name_signal(curator_id, subgraph_id(e["subgraphID"]), ts)
+    name_signal.withdrawn_tokens = e["withdrawnGRT"]
+    name_signal.name_signal -= e["nSignalBurnt"]
+    name_signal.last_name_signal_change = ts
+    # Withdrawal empties the signal, so every cost-basis field resets.
+    for name in (
+        "signal", "average_cost_basis", "average_cost_basis_per_signal",
+        "name_signal_average_cost_basis", "name_signal_average_cost_basis_per_signal",
+        "signal_average_cost_basis", "signal_average_cost_basis_per_signal",
+    ):
+        setattr(name_signal, name, ZERO)
+    store.curator(curator_id, ts).total_withdrawn_tokens += e["withdrawnGRT"]
+
+
+def handle_stake_deposited(store: Store, e: dict) -> None:
+    store.indexer(e["indexer"], e["timestamp"])
+
+
+def _update_exchange_rate(indexer: Indexer) -> None:
+    if indexer.delegator_shares != 0:
+        indexer.delegation_exchange_rate = truncate(
+            Decimal(indexer.delegated_tokens - indexer.delegated_thawing_tokens)
+            / Decimal(indexer.delegator_shares)
+        )
+
+
+def handle_stake_delegated(store: Store, e: dict) -> None:
+    indexer_id, delegator_id, ts = e["indexer"], e["delegator"], e["timestamp"]
+    tokens, shares = e["tokens"], e["shares"]
+
+    indexer = store.indexer(indexer_id, ts)
+    indexer.delegated_tokens += tokens
+    indexer.delegator_shares += shares
+    _update_exchange_rate(indexer)
+
+    delegator = store.delegator(delegator_id, ts)
+    delegator.total_staked_tokens += tokens
+
+    stake = store.delegated_stake(delegator_id, indexer_id, ts)
+    if shares != 0:
+        cost_basis_shares = stake.share_amount + shares
+        if cost_basis_shares > 0:
+            stake.personal_exchange_rate = truncate(
+                (stake.personal_exchange_rate * stake.share_amount + tokens) / Decimal(cost_basis_shares)
+            )
+    becoming_active = stake.share_amount == 0 and shares != 0
+    stake.staked_tokens += tokens
+    stake.share_amount += shares
+    stake.last_delegated_at = ts
+
+    if becoming_active:
+        delegator.active_stakes_count += 1
+
+
+def handle_stake_delegated_locked(store: Store, e: dict) -> None:
+    indexer_id, delegator_id, ts = e["indexer"], e["delegator"], e["timestamp"]
+    tokens, shares = e["tokens"], e["shares"]
+
+    indexer = store.tables["indexer"][indexer_id]
+    indexer.delegated_tokens -= tokens
+    indexer.delegator_shares -= shares
+    rate_before = indexer.delegation_exchange_rate
+    _update_exchange_rate(indexer)
+
+    stake = store.tables["delegated_stake"][delegated_stake_id(delegator_id, indexer_id)]
+    becoming_inactive = stake.share_amount != 0 and stake.share_amount == shares
+    stake.unstaked_tokens += tokens
+    stake.share_amount -= shares
+    stake.locked_tokens += tokens
+    stake.locked_until = e["until"]
+    stake.last_undelegated_at = ts
+    realized = shares * rate_before - shares * stake.personal_exchange_rate
+    stake.realized_rewards += realized
+
+    delegator = store.tables["delegator"][delegator_id]
+    delegator.total_unstaked_tokens += tokens
+    delegator.total_realized_rewards += realized
+    if becoming_inactive:
+        delegator.active_stakes_count -= 1
+
+
+def handle_stake_delegated_withdrawn(store: Store, e: dict) -> None:
+    stake = store.tables["delegated_stake"][delegated_stake_id(e["delegator"], e["indexer"])]
+    stake.locked_tokens = 0
+    stake.locked_until = 0
+
+
+def handle_delegation_parameters_updated(store: Store, e: dict) -> None:
+    store.indexer(e["indexer"], e["timestamp"]).legacy_indexing_reward_cut = e["indexingRewardCut"]
+
+
+def _add_to_delegation_pool(indexer: Indexer, tokens: int) -> None:
+    indexer.delegated_tokens += tokens
+    _update_exchange_rate(indexer)
+
+
+def handle_rewards_assigned(store: Store, e: dict) -> None:
+    """processRewardsAssigned: the delegators' share of the rewards joins the pool."""
+    indexer = store.tables["indexer"][e["indexer"]]
+    amount = e["amount"]
+    # If the delegation pool has zero tokens, the contracts don't give away any rewards.
+    if indexer.delegated_tokens == 0:
+        indexer_rewards = amount
+    else:
+        indexer_rewards = amount * indexer.legacy_indexing_reward_cut // 1000000
+    _add_to_delegation_pool(indexer, amount - indexer_rewards)
+
+
+def handle_rebate_claimed(store: Store, e: dict) -> None:
+    _add_to_delegation_pool(store.tables["indexer"][e["indexer"]], e["delegationFees"])
+
+
+def handle_rebate_collected(store: Store, e: dict) -> None:
+    _add_to_delegation_pool(store.tables["indexer"][e["indexer"]], e["delegationRewards"])
+
+
+def handle_allocation_created(store: Store, e: dict) -> None:
+    indexer_id, deployment_id, ts = e["indexer"], e["subgraphDeploymentID"], e["timestamp"]
+    tokens = e["tokens"]
+
+    indexer = store.tables["indexer"][indexer_id]
+    indexer.allocated_tokens += tokens
+    indexer.total_allocation_count += 1
+    indexer.allocation_count += 1
+
+    store.deployment(deployment_id, ts).staked_tokens += tokens
+
+    allocation_id = e["allocationID"]
+    store.tables["allocation"][allocation_id] = Allocation(
+        allocation_id, indexer=indexer_id, subgraph_deployment=deployment_id,
+        allocated_tokens=tokens, created_at=ts,
+    )
+
+
+def handle_allocation_closed(store: Store, e: dict) -> None:
+    ts, tokens = e["timestamp"], e["tokens"]
+
+    indexer = store.tables["indexer"][e["indexer"]]
+    indexer.allocated_tokens -= tokens
+    indexer.allocation_count -= 1
+
+    allocation = store.tables["allocation"][e["allocationID"]]
+    allocation.status = "Closed"
+    allocation.closed_at = ts
+
+    store.deployment(e["subgraphDeploymentID"], ts).staked_tokens -= tokens
+
+
+HANDLERS: Dict[str, Callable[[Store, dict], None]] = {
+    "Signalled": handle_signalled,
+    "Burned": handle_burned,
+    "SignalMinted": handle_signal_minted,
+    "SignalBurned": handle_signal_burned,
+    "GRTWithdrawn": handle_grt_withdrawn,
+    "StakeDeposited": handle_stake_deposited,
+    "StakeDelegated": handle_stake_delegated,
+    "StakeDelegatedLocked": handle_stake_delegated_locked,
+    "StakeDelegatedWithdrawn": handle_stake_delegated_withdrawn,
+    "DelegationParametersUpdated": handle_delegation_parameters_updated,
+    "RewardsAssigned": handle_rewards_assigned,
+    "RebateClaimed": handle_rebate_claimed,
+    "RebateCollected": handle_rebate_collected,
+    "AllocationCreated": handle_allocation_created,
+    "AllocationClosed": handle_allocation_closed,
+}
+
+_ADDRESS_PARAMS = ("curator", "indexer", "delegator", "allocationID", "subgraphDeploymentID")
+_AMOUNT_PARAMS = (
+    "tokens", "signal", "curationTax", "shares", "until", "subgraphID",
+    "nSignalCreated", "vSignalCreated", "tokensDeposited",
+    "nSignalBurnt", "vSignalBurnt", "tokensReceived", "withdrawnGRT",
+    "indexingRewardCut", "amount", "delegationFees", "delegationRewards",
+)
+
+
+# =====================================================================
+# Fixture loading and replay
+# =====================================================================
+def normalise(event: dict) -> dict:
+    """Lower-case hex ids and exact ints for amounts, as the handlers see them."""
+    for name in _ADDRESS_PARAMS:
+        if name in event:
+            event[name] = event[name].lower()
+    for name in _AMOUNT_PARAMS:
+        if name in event:
+            event[name] = int(event[name])
+    event["timestamp"] = int(event["timestamp"])
+    return event
+
+
+def load_fixture(path: str) -> List[dict]:
+    """Read a JSON Lines fixture and sort it into chain order."""
+    with open(path) as handle:
+        events = [normalise(json.loads(line)) for line in handle if line.strip()]
+    events.sort(key=lambda event: (int(event["block_num"]), int(event["log_index"])))
+    return events
+
+
+def replay(
+    events: Iterable[dict],
+    store: Optional[Store] = None,
+    reserve_ratio: int = DEFAULT_RESERVE_RATIO,
+) -> Store:
+    """Apply events (already in chain order) to store, or to an empty one."""
+    store = store if store is not None else Store(reserve_ratio)
+    with localcontext(BIG_DECIMAL):
+        for event in events:
+            handler = HANDLERS.get(event["event"])
+            if handler is not None:
+                handler(store, event)
+    return store
+
+
+def unsupported(events: Iterable[dict]) -> List[str]:
+    """Event names in a fixture that replay() skips."""
+    return sorted({event["event"] for event in events} - set(HANDLERS))
@@ -8,15 +8,23 @@ Usage:
     python validate.py curator delegator        # validate multiple
     python validate.py --samples 20 signal      # change sample size
     python validate.py --tolerance 0.02 curator # change tolerance (2%)
+    python validate.py --offline events.jsonl   # full tables vs the reference replay
+    python validate.py --local entities.sqlite  # read tables from the local serving store
 
-Two modes:
+Three modes:
   1. Schema coverage: list subgraph fields and whether your BQ table has a match.
   2. Value comparison: fetch a sample from the subgraph, load from BQ, compare.
+  3. Offline: replay an event fixture through reference.py and compare every
+     BQ row with the replayed entity, on the fields the replay maintains.
+
+With --local, every mode reads the "BQ side" from a serving store written by
+the builds (pipeline/serving.py, PIPELINE_SERVING_DB) instead of BigQuery.
 """
 
 import argparse
 import json
 import logging
+import os
 import sys
 import textwrap
 from dataclasses import dataclass, field
@@ -26,6 +34,11 @@ import pandas as pd
 import requests
 from google.cloud import bigquery
 
+from reference import RECORDS, delegated_stake_id, load_fixture, replay, unsupported
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")))
+from pipeline.serving import ServingStore
+
 logging.basicConfig(level=logging.INFO, format="%(levelname)s  %(message)s")
 logger = logging.getLogger(__name__)
 
@@ -78,6 +91,10 @@ ENTITIES = {
             Field("signalledTokens",  "signalled_tokens"),
             Field("unsignalledTokens", "unsignalled_tokens"),
             Field("signal",            "signal"),
+            Field("averageCostBasis",  "average_cost_basis"),
+            Field("averageCostBasisPerSignal", "average_cost_basis_per_signal", scale=1),  # ratio, no wei
+            Field("lastSignalChange",  "last_signal_change", scale=1, is_int=True),
+            Field("realizedRewards",   "realized_rewards"),
             Field("createdAt",         "created_at",      scale=1, is_timestamp=True),
             Field("lastUpdatedAt",     "last_updated_at", scale=1, is_timestamp=True),
         ],
@@ -95,6 +112,13 @@ ENTITIES = {
             Field("withdrawnTokens",     "withdrawn_tokens"),
             Field("nameSignal",          "name_signal"),
             Field("signal",              "signal"),          # BigDecimal in wei
+            Field("averageCostBasis",    "average_cost_basis"),
+            Field("averageCostBasisPerSignal", "average_cost_basis_per_signal", scale=1),
+            Field("nameSignalAverageCostBasis", "name_signal_average_cost_basis"),
+            Field("nameSignalAverageCostBasisPerSignal", "name_signal_average_cost_basis_per_signal", scale=1),
+            Field("signalAverageCostBasis", "signal_average_cost_basis"),
+            Field("signalAverageCostBasisPerSignal", "signal_average_cost_basis_per_signal", scale=1),
+            Field("realizedRewards",     "realized_rewards"),
             Field("lastNameSignalChange","last_name_signal_change", scale=1, is_timestamp=True),
         ],
         graphql_extra="curator { id } subgraph { id }",
@@ -133,6 +157,7 @@ ENTITIES = {
         fields=[
             Field("totalStakedTokens",   "total_staked_tokens"),
             Field("totalUnstakedTokens", "total_unstaked_tokens"),
+            Field("totalRealizedRewards", "total_realized_rewards"),
             Field("stakesCount",         "stakes_count",         scale=1, is_int=True),
             Field("activeStakesCount",   "active_stakes_count",  scale=1, is_int=True),
             Field("createdAt",           "created_at",           scale=1, is_timestamp=True),
@@ -151,6 +176,7 @@ ENTITIES = {
             Field("lockedTokens",         "locked_tokens"),
             Field("shareAmount",          "share_amount"),
             Field("personalExchangeRate", "personal_exchange_rate", scale=1),  # ratio, no wei
+            Field("realizedRewards",      "realized_rewards"),
             Field("createdAt",            "created_at",             scale=1, is_timestamp=True),
             Field("lastDelegatedAt",      "last_delegated_at",      scale=1, is_timestamp=True),
             Field("lastUndelegatedAt",    "last_undelegated_at",    scale=1, is_timestamp=True),
@@ -166,6 +192,13 @@ ENTITIES = {
         fields=[
             Field("ipfsHash",        "ipfs_hash",         scale=1, is_string=True),
             Field("signalledTokens", "signalled_tokens"),
+            Field("signalAmount",    "signal_amount"),
+            Field("pricePerShare",   "price_per_share",   scale=1),  # ratio, no wei
+            Field("reserveRatio",    "reserve_ratio",     scale=1, is_int=True),
+            Field("indexingRewardAmount",      "indexing_reward_amount"),
+            Field("curatorFeeRewards",         "curator_fee_rewards"),
+            Field("queryFeeRebates",           "query_fee_rebates"),
+            Field("delegatorsQueryFeeRebates", "delegators_query_fee_rebates"),
             Field("createdAt",       "created_at",        scale=1, is_timestamp=True),
         ],
     ),
@@ -181,7 +214,10 @@ ENTITIES = {
             Field("allocatedTokens",      "allocated_tokens"),
             Field("delegatedTokens",      "delegated_tokens"),
             Field("queryFeesCollected",   "query_fees_collected"),
+            Field("queryFeeRebates",      "query_fee_rebates"),
             Field("rewardsEarned",        "rewards_earned"),
+            Field("indexerIndexingRewards",   "indexer_indexing_rewards"),
+            Field("delegatorIndexingRewards", "delegator_indexing_rewards"),
             Field("delegatorShares",      "delegator_shares"),
             Field("allocationCount",      "allocation_count",  scale=1, is_int=True),
             Field("createdAt",            "created_at",        scale=1, is_timestamp=True),
@@ -199,9 +235,74 @@ ENTITIES = {
             Field("indexingRewards",    "indexing_rewards"),
             Field("createdAt",          "created_at",        scale=1, is_timestamp=True),
             Field("status",             "status",            scale=1, is_string=True),
+            Field("isLegacy",           "is_legacy",         scale=1, is_string=True),
         ],
         graphql_extra="indexer { id } subgraphDeployment { id }",
     ),
+
+    "provision": EntityConfig(
+        name="Provision",
+        graphql_type="provisions",
+        bq_table="provision_arbitrum",
+        order_by="tokensProvisioned",
+        fields=[
+            Field("tokensProvisioned",           "tokens_provisioned"),
+            Field("tokensThawing",               "tokens_thawing"),
+            Field("tokensSlashedServiceProvider", "tokens_slashed_service_provider"),
+            Field("tokensSlashedDelegationPool", "tokens_slashed_delegation_pool"),
+            Field("delegatedTokens",             "delegated_tokens"),
+            Field("delegatedThawingTokens",      "delegated_thawing_tokens"),
+            Field("delegatorShares",             "delegator_shares"),
+            Field("maxVerifierCut",              "max_verifier_cut",       scale=1, is_int=True),
+            Field("thawingPeriod",               "thawing_period",         scale=1, is_int=True),
+            Field("queryFeeCut",                 "query_fee_cut",          scale=1, is_int=True),
+            Field("indexingRewardsCut",          "indexing_rewards_cut",   scale=1, is_int=True),
+            Field("thawingUntil",                "thawing_until",          scale=1, is_int=True),
+            Field("createdAt",                   "created_at",             scale=1, is_timestamp=True),
+        ],
+        graphql_extra="indexer { id } dataService { id }",
+    ),
+
+    "thaw_request": EntityConfig(
+        name="ThawRequest",
+        graphql_type="thawRequests",
+        bq_table="thaw_request_arbitrum",
+        order_by="shares",
+        fields=[
+            Field("type",             "type",               scale=1, is_string=True),
+            Field("shares",           "shares"),
+            Field("tokens",           "tokens"),
+            Field("thawingUntil",     "thawing_until",      scale=1, is_int=True),
+            Field("fulfilled",        "fulfilled",          scale=1, is_string=True),
+        ],
+        graphql_extra="indexer { id } dataService { id } owner { id }",
+    ),
+
+    "payments_escrow_account": EntityConfig(
+        name="PaymentsEscrowAccount",
+        graphql_type="paymentsEscrowAccounts",
+        bq_table="payments_escrow_account_arbitrum",
+        order_by="balance",
+        fields=[
+            Field("balance",            "balance"),
+            Field("totalAmountThawing", "total_amount_thawing"),
+            Field("thawEndTimestamp",   "thaw_end_timestamp", scale=1, is_int=True),
+            Field("collector",          "collector",          scale=1, is_string=True),
+        ],
+        graphql_extra="payer { id } receiver { id }",
+    ),
+
+    "signer": EntityConfig(
+        name="Signer",
+        graphql_type="signers",
+        bq_table="signer_arbitrum",
+        order_by="thawEndTimestamp",
+        fields=[
+            Field("isAuthorized",     "is_authorized",      scale=1, is_string=True),
+            Field("thawEndTimestamp", "thaw_end_timestamp", scale=1, is_int=True),
+        ],
+        graphql_extra="payer { id }",
+    ),
 }
 
 
@@ -241,7 +342,16 @@ def fetch_subgraph_sample(cfg: EntityConfig, n: int = 10) -> list[dict]:
 # =====================================================================
 # BigQuery loading
 # =====================================================================
+# Set by --local: tables are read from this serving store instead of BigQuery.
+local_store: Optional[ServingStore] = None
+
+
 def load_bq_table(table: str) -> pd.DataFrame:
+    if local_store is not None:
+        logger.info(f"Loading {table} from {local_store.path} ...")
+        df = local_store.table(table)
+        logger.info(f"  → {len(df)} rows, columns: {list(df.columns)}")
+        return df
     client = bigquery.Client(project=BQ_PROJECT)
     ref = f"{BQ_PROJECT}.{BQ_DATASET}.{table}"
     logger.info(f"Loading {ref} ...")
@@ -338,6 +448,27 @@ SCHEMA_FIELDS: dict[str, list[str]] = {
         "delegationFees", "status", "poi",
         "isLegacy", "forceClosed",
     ],
+    "Provision": [
+        "id", "indexer", "dataService", "createdAt",
+        "tokensProvisioned", "tokensAllocated", "tokensThawing",
+        "tokensSlashedServiceProvider", "tokensSlashedDelegationPool",
+        "totalAllocationCount", "allocationCount",
+        "maxVerifierCut", "maxVerifierCutPending", "thawingPeriod", "thawingPeriodPending",
+        "queryFeeCut", "indexingFeeCut", "indexingRewardsCut",
+        "delegatedTokens", "delegatedThawingTokens", "delegatorShares", "delegationExchangeRate",
+        "thawingUntil",
+    ],
+    "ThawRequest": [
+        "id", "type", "indexer", "dataService", "owner",
+        "shares", "tokens", "thawingUntil", "fulfilledAsValid", "fulfilled",
+    ],
+    "PaymentsEscrowAccount": [
+        "id", "payer", "collector", "receiver",
+        "balance", "totalAmountThawing", "thawEndTimestamp",
+    ],
+    "Signer": [
+        "id", "isAuthorized", "payer", "thawEndTimestamp",
+    ],
 }
 
 
@@ -513,9 +644,12 @@ def validate_entity(
     total_failed = 0
     missing = 0
 
+    # Normalise the id column once instead of re-lowercasing it per entity.
+    bq_ids = bq_df[cfg.id_field].astype(str).str.lower()
+
     for entity in sample:
         eid = entity["id"]
-        bq_match = bq_df[bq_df[cfg.id_field].astype(str).str.lower() == eid.lower()]
+        bq_match = bq_df[bq_ids == eid.lower()]
         if bq_match.empty:
             print(f"\n  MISSING in BQ: {eid}")
             missing += 1
@@ -541,6 +675,62 @@ def validate_entity(
     return total_failed == 0 and missing == 0
 
 
+def offline_ids(name: str, cfg: EntityConfig, bq_df: pd.DataFrame) -> pd.Series:
+    """BQ row ids in the subgraph's id format, lower-cased."""
+    if name == "delegated_stake":
+        ids = [delegated_stake_id(d, i) for d, i in zip(bq_df["delegator"], bq_df["indexer"])]
+        return pd.Series(ids, index=bq_df.index).str.lower()
+    return bq_df[cfg.id_field].astype(str).str.lower()
+
+
+def validate_offline(name: str, cfg: EntityConfig, store, tolerance: float = 0.01, max_details: int = 20):
+    """Compare a whole BQ table with the reference replay of a fixture."""
+    print(f"\n{'#'*70}")
+    print(f"  Offline: {cfg.name}")
+    print(f"{'#'*70}")
+
+    try:
+        bq_df = load_bq_table(cfg.bq_table)
+    except Exception as e:
+        logger.error(f"Could not load BQ table {cfg.bq_table}: {e}")
+        return False
+
+    replayed = set(RECORDS[name].FIELD_NAMES.values())
+    fields = [f for f in cfg.fields if f.subgraph_name in replayed]
+    skipped = [f.subgraph_name for f in cfg.fields if f.subgraph_name not in replayed]
+    if skipped:
+        print(f"  Not replayed (skipped): {', '.join(skipped)}")
+
+    expected = store.entities(name)
+    rows = {eid: pos for pos, eid in enumerate(offline_ids(name, cfg, bq_df))}
+
+    total_passed = 0
+    total_failed = 0
+    missing = 0
+    shown = 0
+    for eid, entity in expected.items():
+        pos = rows.pop(eid.lower(), None)
+        if pos is None:
+            missing += 1
+            continue
+        p, f_count, details = compare_entity(eid, entity, bq_df.iloc[pos], fields, tolerance)
+        total_passed += p
+        total_failed += f_count
+        if f_count and shown < max_details:
+            shown += 1
+            print(f"\n  Entity: {eid[:60]}...  [{f_count} MISMATCHES]")
+            for d in details:
+                print(d)
+
+    print(f"\n  {'─'*50}")
+    total = total_passed + total_failed
+    print(f"  Summary: {len(expected)} replayed entities, {total_passed}/{total} fields passed, "
+          f"{total_failed} mismatches, {missing} missing in BQ, {len(rows)} only in BQ")
+    print(f"  Tolerance: {tolerance:.1%}")
+
+    return total_failed == 0 and missing == 0
+
+
 # =====================================================================
 # Main
 # =====================================================================
@@ -558,24 +748,52 @@ def main():
               python validate.py --samples 20       # more samples
               python validate.py --tolerance 0.02   # 2% tolerance
               python validate.py --coverage-only     # schema coverage only
+              python validate.py --offline ev.jsonl # full tables vs reference replay
+              python validate.py --local db.sqlite  # local serving store as the BQ side
         """),
     )
     parser.add_argument("entities", nargs="*", help="Entity names to validate (default: all)")
     parser.add_argument("--samples", type=int, default=10, help="Number of sample entities")
     parser.add_argument("--tolerance", type=float, default=0.01, help="Relative tolerance (0.01 = 1%%)")
     parser.add_argument("--coverage-only", action="store_true", help="Only show field coverage, skip value comparison")
+    parser.add_argument("--offline", metavar="FIXTURE", help="Compare full tables with a reference replay of this event fixture (JSON Lines)")
+    parser.add_argument("--local", metavar="DB", help="Read tables from this local serving store (pipeline/serving.py) instead of BigQuery")
     args = parser.parse_args()
 
-    targets = args.entities if args.entities else sorted(ENTITIES.keys())
+    global local_store
+    if args.local:
+        if not os.path.exists(args.local):
+            logger.error(f"No serving store at {args.local}")
+            sys.exit(1)
+        local_store = ServingStore(args.local)
+
+    default_targets = sorted(RECORDS) if args.offline else sorted(ENTITIES.keys())
+    targets = args.entities if args.entities else default_targets
     invalid = [t for t in targets if t not in ENTITIES]
     if invalid:
         logger.error(f"Unknown entities: {invalid}. Choose from: {sorted(ENTITIES.keys())}")
         sys.exit(1)
 
+    store = None
+    if args.offline:
+        invalid = [t for t in targets if t not in RECORDS]
+        if invalid:
+            logger.error(f"No reference replay for: {invalid}. Choose from: {sorted(RECORDS)}")
+            sys.exit(1)
+        events = load_fixture(args.offline)
+        skipped = unsupported(events)
+        if skipped:
+            logger.warning(f"Fixture events without a reference handler (skipped): {skipped}")
+        logger.info(f"Replaying {len(events)} events from {args.offline} ...")
+        store = replay(events)
+
     all_ok = True
     for name in targets:
         cfg = ENTITIES[name]
-        if args.coverage_only:
+        if store is not None:
+            if not validate_offline(name, cfg, store, args.tolerance):
+                all_ok = False
+        elif args.coverage_only:
             try:
                 bq_df = load_bq_table(cfg.bq_table)
                 print_schema_coverage(cfg, list(bq_df.columns))